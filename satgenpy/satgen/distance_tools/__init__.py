@@ -4,5 +4,9 @@ from .distance_tools import (
     geodesic_distance_m_between_ground_stations,
     straight_distance_m_between_ground_stations,
     create_basic_ground_station_for_satellite_shadow,
-    geodetic2cartesian
+    geodetic2cartesian,
+    ground_station_cartesian_positions_m,
+    distance_m_matrix_ground_stations_to_satellites,
+    satellites_in_range_of_ground_stations,
+    satellites_in_range_of_candidates
 )
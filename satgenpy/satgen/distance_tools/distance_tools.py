@@ -22,7 +22,9 @@
 
 import math
 import ephem
+import numpy as np
 from geopy.distance import great_circle
+from scipy.spatial import cKDTree
 
 
 def distance_m_between_satellites(sat1, sat2, epoch_str, date_str):
@@ -31,8 +33,8 @@ def distance_m_between_satellites(sat1, sat2, epoch_str, date_str):
 
     :param sat1:       The first satellite
     :param sat2:       The other satellite
-    :param epoch_str:  Epoch time of the observer (string)
-    :param date_str:   The time instant when the distance should be measured (string)
+    :param epoch_str:  Epoch time of the observer (string or ephem.Date)
+    :param date_str:   The time instant when the distance should be measured (string or ephem.Date)
 
     :return: The distance between the satellites in meters
     """
@@ -70,8 +72,8 @@ def distance_m_ground_station_to_satellite(ground_station, satellite, epoch_str,
 
     :param ground_station:  The ground station
     :param satellite:       The satellite
-    :param epoch_str:       Epoch time of the observer (ground station) (string)
-    :param date_str:        The time instant when the distance should be measured (string)
+    :param epoch_str:       Epoch time of the observer (ground station) (string or ephem.Date)
+    :param date_str:        The time instant when the distance should be measured (string or ephem.Date)
 
     :return: The distance between the ground station and the satellite in meters
     """
@@ -143,8 +145,8 @@ def create_basic_ground_station_for_satellite_shadow(satellite, epoch_str, date_
     Calculate the (latitude, longitude) of the satellite shadow on the Earth and creates a ground station there.
 
     :param satellite:   Satellite
-    :param epoch_str:   Epoch (string)
-    :param date_str:    Time moment (string)
+    :param epoch_str:   Epoch (string or ephem.Date)
+    :param date_str:    Time moment (string or ephem.Date)
 
     :return: Basic ground station
     """
@@ -196,3 +198,107 @@ def geodetic2cartesian(lat_degrees, lon_degrees, ele_m):
     z = (v * (1.0 - e * e) + ele_m) * math.sin(lat)
 
     return x, y, z
+
+
+def ground_station_cartesian_positions_m(ground_stations):
+    """
+    Gather the Cartesian coordinates of the extended ground stations.
+
+    :param ground_stations: List of extended ground stations (with cartesian_x/y/z)
+
+    :return: Numpy array of shape (number of ground stations, 3) with the (x, y, z) of each ground station in meters
+    """
+    positions_m = np.empty((len(ground_stations), 3))
+    for i in range(len(ground_stations)):
+        positions_m[i, 0] = ground_stations[i]["cartesian_x"]
+        positions_m[i, 1] = ground_stations[i]["cartesian_y"]
+        positions_m[i, 2] = ground_stations[i]["cartesian_z"]
+    return positions_m
+
+
+def distance_m_matrix_ground_stations_to_satellites(ground_station_positions_m, satellite_positions_m):
+    """
+    Computes the straight distance between every ground station and every satellite in meters.
+
+    :param ground_station_positions_m:  Numpy array of shape (number of ground stations, 3) of Cartesian coordinates
+    :param satellite_positions_m:       Numpy array of shape (number of satellites, 3) of Cartesian coordinates
+                                        (in the same frame, e.g., ECEF)
+
+    :return: Numpy array of shape (number of ground stations, number of satellites) of distances in meters
+    """
+    squared_distance_m2 = np.zeros((ground_station_positions_m.shape[0], satellite_positions_m.shape[0]))
+    for dim in range(3):
+        squared_distance_m2 += (
+            satellite_positions_m[np.newaxis, :, dim] - ground_station_positions_m[:, dim, np.newaxis]
+        ) ** 2
+    return np.sqrt(squared_distance_m2)
+
+
+def satellites_in_range_of_ground_stations(ground_station_positions_m, satellite_positions_m, max_distance_m):
+    """
+    Determine for each ground station which satellites are within a maximum straight distance.
+
+    A KD-tree is built over the satellite positions, such that each ground station only needs to look at
+    the satellites near it instead of at all of them. The tree radius is slightly enlarged and the candidates
+    are filtered again using the same distance calculation as distance_m_matrix_ground_stations_to_satellites(),
+    as such the result is exactly the same as when filtering the full distance matrix.
+
+    :param ground_station_positions_m:  Numpy array of shape (number of ground stations, 3) of Cartesian coordinates
+    :param satellite_positions_m:       Numpy array of shape (number of satellites, 3) of Cartesian coordinates
+                                        (in the same frame, e.g., ECEF)
+    :param max_distance_m:              Maximum distance in meters (inclusive)
+
+    :return: List with for each ground station a list of (distance in meters, satellite id) in ascending satellite id
+    """
+    if satellite_positions_m.shape[0] == 0 or ground_station_positions_m.shape[0] == 0:
+        return [[] for _ in range(ground_station_positions_m.shape[0])]
+    tree = cKDTree(satellite_positions_m)
+    candidates = tree.query_ball_point(
+        ground_station_positions_m, max_distance_m * (1.0 + 1e-9) + 1e-3, return_sorted=True
+    )
+    num_candidates = np.array([len(sids) for sids in candidates], dtype=int)
+    return satellites_in_range_of_candidates(
+        ground_station_positions_m,
+        satellite_positions_m,
+        np.repeat(np.arange(ground_station_positions_m.shape[0]), num_candidates),
+        np.fromiter((sid for sids in candidates for sid in sids), dtype=int, count=int(np.sum(num_candidates))),
+        max_distance_m
+    )
+
+
+def satellites_in_range_of_candidates(ground_station_positions_m, satellite_positions_m, candidate_gs_idxs,
+                                      candidate_sids, max_distance_m):
+    """
+    Determine which of the candidate (ground station, satellite) pairs are within a maximum straight distance.
+    The distances are calculated the same way as distance_m_matrix_ground_stations_to_satellites().
+
+    :param ground_station_positions_m:  Numpy array of shape (number of ground stations, 3) of Cartesian coordinates
+    :param satellite_positions_m:       Numpy array of shape (number of satellites, 3) of Cartesian coordinates
+                                        (in the same frame, e.g., ECEF)
+    :param candidate_gs_idxs:           Numpy array of the ground station index of each candidate pair
+    :param candidate_sids:              Numpy array of the satellite id of each candidate pair
+                                        (the pairs must be ordered by ground station index, then satellite id)
+    :param max_distance_m:              Maximum distance in meters (inclusive)
+
+    :return: List with for each ground station a list of (distance in meters, satellite id) in ascending satellite id
+    """
+
+    # Exact distances of all candidates at once
+    squared_distance_m2 = np.zeros(candidate_sids.shape[0])
+    for dim in range(3):
+        squared_distance_m2 += (
+            satellite_positions_m[candidate_sids, dim] - ground_station_positions_m[candidate_gs_idxs, dim]
+        ) ** 2
+    distance_m = np.sqrt(squared_distance_m2)
+
+    # Split the candidates which are in range per ground station
+    in_range = distance_m <= max_distance_m
+    distance_m_list = distance_m[in_range].tolist()
+    sid_list = candidate_sids[in_range].tolist()
+    num_in_range = np.bincount(candidate_gs_idxs[in_range], minlength=ground_station_positions_m.shape[0])
+    satellites_in_range = []
+    start = 0
+    for end in np.cumsum(num_in_range).tolist():
+        satellites_in_range.append(list(zip(distance_m_list[start:end], sid_list[start:end])))
+        start = end
+    return satellites_in_range
@@ -4,3 +4,92 @@ from .helper_dynamic_state import (
 from .generate_dynamic_state import (
     generate_dynamic_state
 )
+from .routing_options import (
+    destination_gids_of_traffic,
+    create_routing_options,
+    create_routing_state,
+    report_routing_state
+)
+from .dynamic_state_output import (
+    create_dynamic_state_output,
+    open_dynamic_state_output,
+    close_dynamic_state_output,
+    check_dynamic_state_output_opened,
+    open_dynamic_state_output_file
+)
+from .forwarding_state import (
+    FSTATE_FORMATS,
+    FSTATE_BINARY_DTYPE,
+    create_forwarding_state,
+    get_next_hop_decision,
+    get_next_hop,
+    set_next_hop_decision,
+    write_forwarding_state_delta,
+    read_forwarding_state_delta,
+    forwarding_state_filename,
+    forwarding_state_format_of,
+    encode_forwarding_state_entries,
+    decode_forwarding_state_entries,
+    apply_forwarding_state_entries,
+    write_forwarding_state_delta_file,
+    read_forwarding_state_delta_file,
+    write_forwarding_state_keyframes,
+    read_forwarding_state_keyframes,
+    create_multipath_forwarding_state,
+    write_multipath_forwarding_state_delta,
+    read_multipath_forwarding_state_delta
+)
+from .dynamic_state_archive import (
+    DYNAMIC_STATE_ARCHIVE_FILENAME,
+    DYNAMIC_STATE_ARCHIVE_INDEX_FILENAME,
+    create_dynamic_state_archive,
+    append_to_dynamic_state_archive,
+    close_dynamic_state_archive,
+    write_dynamic_state_content,
+    open_dynamic_state_file,
+    has_dynamic_state_archive,
+    read_dynamic_state_archive_index,
+    dynamic_state_file_exists,
+    find_dynamic_state_file,
+    read_dynamic_state_archive_file,
+    list_dynamic_state_files,
+    read_dynamic_state_file,
+    decompress_dynamic_state_files,
+    expand_dynamic_state_archive
+)
+from .dynamic_state_writer import (
+    DEFAULT_MAX_QUEUED_BYTES,
+    create_dynamic_state_writer,
+    submit_to_dynamic_state_writer,
+    close_dynamic_state_writer,
+    report_dynamic_state_writer
+)
+from .dynamic_state_compression import (
+    DYNAMIC_STATE_COMPRESSIONS,
+    zstandard_available,
+    check_dynamic_state_compression,
+    compression_of,
+    compressed_filename,
+    uncompressed_filename,
+    compress_content,
+    decompress_content,
+    open_compressed_file
+)
+from .incremental_shortest_paths import (
+    create_incremental_shortest_paths_state,
+    calculate_shortest_path_distances_to_incrementally,
+    repair_shortest_path_trees,
+    repair_shortest_path_trees_with_numpy,
+    report_incremental_shortest_paths
+)
+from .plus_grid_symmetry import (
+    DEFAULT_MAX_RELAXATION_SWEEPS,
+    detect_plus_grid_torus,
+    create_plus_grid_symmetry_state,
+    calculate_shortest_path_distances_to_with_symmetry,
+    report_plus_grid_symmetry
+)
+from .fewest_hops import (
+    create_fewest_hops_state,
+    calculate_fewest_hops_distances_to
+)
@@ -21,6 +21,7 @@
 # SOFTWARE.
 
 from .fstate_calculation import *
+from .dynamic_state_output import open_dynamic_state_output_file
 
 
 def algorithm_free_one_only_gs_relays(
@@ -32,7 +33,9 @@ def algorithm_free_one_only_gs_relays(
         num_isls_per_sat,
         list_gsl_interfaces_info,
         prev_output,
-        enable_verbose_logs
+        enable_verbose_logs,
+        routing_state,
+        dynamic_state_output
 ):
     """
     FREE-ONE ONLY OVER GROUND STATION RELAYS ALGORITHM
@@ -76,10 +79,10 @@ def algorithm_free_one_only_gs_relays(
     #
 
     # There is only one GSL interface for each node (pre-condition), which as-such will get the entire bandwidth
-    output_filename = output_dynamic_state_dir + "/gsl_if_bandwidth_" + str(time_since_epoch_ns) + ".txt"
+    output_filename = "gsl_if_bandwidth_" + str(time_since_epoch_ns) + ".txt"
     if enable_verbose_logs:
-        print("  > Writing interface bandwidth state to: " + output_filename)
-    with open(output_filename, "w+") as f_out:
+        print("  > Writing interface bandwidth state to: " + output_dynamic_state_dir + "/" + output_filename)
+    with open_dynamic_state_output_file(dynamic_state_output, output_dynamic_state_dir, output_filename) as f_out:
         if time_since_epoch_ns == 0:
             for node_id in range(len(satellites)):
                 f_out.write("%d,%d,%f\n" % (
@@ -117,7 +120,10 @@ def algorithm_free_one_only_gs_relays(
         gid_to_sat_gsl_if_idx,
         {},
         prev_fstate,
-        enable_verbose_logs
+        enable_verbose_logs,
+        routing_state["num_gs_relaying_threads"],
+        routing_state["dst_gids"],
+        dynamic_state_output
     )
 
     if enable_verbose_logs:
@@ -21,6 +21,7 @@
 # SOFTWARE.
 
 from .fstate_calculation import *
+from .dynamic_state_output import open_dynamic_state_output_file
 
 
 def algorithm_free_one_only_over_isls(
@@ -34,7 +35,9 @@ def algorithm_free_one_only_over_isls(
         sat_neighbor_to_if,
         list_gsl_interfaces_info,
         prev_output,
-        enable_verbose_logs
+        enable_verbose_logs,
+        routing_state,
+        dynamic_state_output
 ):
     """
     FREE-ONE ONLY OVER INTER-SATELLITE LINKS ALGORITHM
@@ -71,10 +74,10 @@ def algorithm_free_one_only_over_isls(
     #
 
     # There is only one GSL interface for each node (pre-condition), which as-such will get the entire bandwidth
-    output_filename = output_dynamic_state_dir + "/gsl_if_bandwidth_" + str(time_since_epoch_ns) + ".txt"
+    output_filename = "gsl_if_bandwidth_" + str(time_since_epoch_ns) + ".txt"
     if enable_verbose_logs:
-        print("  > Writing interface bandwidth state to: " + output_filename)
-    with open(output_filename, "w+") as f_out:
+        print("  > Writing interface bandwidth state to: " + output_dynamic_state_dir + "/" + output_filename)
+    with open_dynamic_state_output_file(dynamic_state_output, output_dynamic_state_dir, output_filename) as f_out:
         if time_since_epoch_ns == 0:
             for node_id in range(len(satellites)):
                 f_out.write("%d,%d,%f\n"
@@ -108,7 +111,13 @@ def algorithm_free_one_only_over_isls(
         ground_station_satellites_in_range,
         sat_neighbor_to_if,
         prev_fstate,
-        enable_verbose_logs
+        enable_verbose_logs,
+        routing_state["incremental_shortest_paths_state"],
+        routing_state["plus_grid_symmetry_state"],
+        routing_state["max_multipath_next_hops"],
+        routing_state["multipath_cost_tolerance"],
+        routing_state["dst_gids"],
+        dynamic_state_output
     )
 
     if enable_verbose_logs:
@@ -21,6 +21,12 @@
 # SOFTWARE.
 
 from .fstate_calculation import *
+from .dynamic_state_output import open_dynamic_state_output_file
+from .fstate_kernels import (
+    create_candidate_arrays,
+    select_nearest_satellites,
+    calculate_paired_gsl_if_bandwidth
+)
 
 
 def algorithm_paired_many_only_over_isls(
@@ -34,7 +40,9 @@ def algorithm_paired_many_only_over_isls(
         sat_neighbor_to_if,
         list_gsl_interfaces_info,
         prev_output,
-        enable_verbose_logs
+        enable_verbose_logs,
+        routing_state,
+        dynamic_state_output
 ):
     """
     PAIRED-MANY ONLY OVER INTER-SATELLITE LINKS ALGORITHM
@@ -83,98 +91,67 @@ def algorithm_paired_many_only_over_isls(
     # Select the nearest satellite for each ground station
     #
 
-    # Keep track of which satellite GSL interfaces (it has <n of ground stations> interfaces) are paired
-    # because it is the closest satellite to a ground station
-    satellite_gsl_ifs_paired = []
-    for sid in range(len(satellites)):
-        satellite_gsl_ifs_paired.append([])
-
-    # Go over each ground station
-    ground_station_satellites_in_range_select_one_at_most = []
-    for gid in range(len(ground_stations)):
-
-        # Find the closest satellite
-        chosen_sid = -1
-        best_distance_m = 1000000000000000
-        for (distance_m, sid) in ground_station_satellites_in_range[gid]:
-            if distance_m < best_distance_m:
-                chosen_sid = sid
-                best_distance_m = distance_m
-
-        # It is possible that a ground station does not have a single satellite in-range
-        if chosen_sid == -1:
-            ground_station_satellites_in_range_select_one_at_most.append([])
-        else:
-            ground_station_satellites_in_range_select_one_at_most.append([(best_distance_m, chosen_sid)])
-            satellite_gsl_ifs_paired[chosen_sid].append(gid)
+    # Go over each ground station, and find the closest satellite
+    # (it is possible that a ground station does not have a single satellite in-range, indicated by -1)
+    candidate_indptr, candidate_satellite_ids, candidate_distances_m = create_candidate_arrays(
+        ground_station_satellites_in_range, sort_by_satellite_id=False
+    )
+    paired_satellite_ids, paired_distances_m = select_nearest_satellites(
+        candidate_indptr, candidate_satellite_ids, candidate_distances_m
+    )
+    ground_station_satellites_in_range_select_one_at_most = [
+        [] if chosen_sid == -1 else [(best_distance_m, chosen_sid)]
+        for (chosen_sid, best_distance_m) in zip(paired_satellite_ids.tolist(), paired_distances_m.tolist())
+    ]
 
     ##################################################
     # Determine the new GSL interface bandwidth state
     #
 
     # Bandwidth state
-    gsl_if_bandwidth_state = {}
-
-    # For the satellite
-    for sid in range(len(satellites)):
-
-        # The paired GSL interfaces share the total bandwidth
-        # The other ones are not in use, but still need to flush out existing packets
-        satellite_frequency_chosen = len(satellite_gsl_ifs_paired[sid])
-        for gsl_if_idx in range(len(ground_stations)):
-
-            # If it is paired, it gets its fair share
-            if gsl_if_idx in satellite_gsl_ifs_paired[sid]:
-                gsl_if_bandwidth_state[(sid, num_isls_per_sat[sid] + gsl_if_idx)] = (
-                        1.0 / float(satellite_frequency_chosen)
-                )
-
-            # Else, it get the full bandwidth to get rid of the packets in it (it can also be kept, but then
-            # you cannot parallelize this generation process)
-            else:
-                gsl_if_bandwidth_state[(sid, num_isls_per_sat[sid] + gsl_if_idx)] = 1.0
-
-    # For the ground stations, the same principle applies
-    for gid in range(len(ground_stations)):
-
-        # Check if it is paired
-        if len(ground_station_satellites_in_range_select_one_at_most[gid]) == 1:
-
-            # Find the satellite it is paired to, and then only get its fair share
-            paired_satellite_id = ground_station_satellites_in_range_select_one_at_most[gid][0][1]
-            satellite_frequency_chosen = len(satellite_gsl_ifs_paired[paired_satellite_id])
-            gsl_if_bandwidth_state[(len(satellites) + gid, 0)] = 1.0 / float(satellite_frequency_chosen)
-
-        # If not paired, flush out the packets (it can also be kept, but then
-        # you cannot parallelize this generation process)
-        else:
-            gsl_if_bandwidth_state[(len(satellites) + gid, 0)] = 1.0
+    # For the satellite, the GSL interfaces which are paired (because it is the closest satellite to a ground
+    # station) share the total bandwidth. The other ones are not in use, but still need to flush out existing
+    # packets, as such they get the full bandwidth (it can also be kept, but then you cannot parallelize this
+    # generation process). For the ground stations, the same principle applies.
+    satellite_gsl_if_bandwidth, ground_station_gsl_if_bandwidth = calculate_paired_gsl_if_bandwidth(
+        len(satellites), paired_satellite_ids
+    )
+    gsl_if_bandwidth_state = {
+        "satellites": satellite_gsl_if_bandwidth,
+        "ground_stations": ground_station_gsl_if_bandwidth
+    }
 
     ######################################################
     # Write the new GSL interface bandwidth state (delta)
     #
 
     # Previous GSL interface bandwidth state (to only write delta)
-    prev_gsl_if_bandwidth_state = None
-    if prev_output is not None:
+    if prev_output is None:
+        sat_changed = np.ones(satellite_gsl_if_bandwidth.shape, dtype=bool)
+        gs_changed = np.ones(ground_station_gsl_if_bandwidth.shape, dtype=bool)
+    else:
         prev_gsl_if_bandwidth_state = prev_output["gsl_if_bandwidth_state"]
-
-    output_filename = output_dynamic_state_dir + "/gsl_if_bandwidth_" + str(time_since_epoch_ns) + ".txt"
-    print("  > Writing interface bandwidth state to: " + output_filename)
-    with open(output_filename, "w+") as f_out:
-        for (node_id, if_id) in gsl_if_bandwidth_state:
-
-            # Only delta if have previous bandwidth state
-            if (
-                    prev_gsl_if_bandwidth_state is None
-                    or
-                    prev_gsl_if_bandwidth_state[(node_id, if_id)] != gsl_if_bandwidth_state[(node_id, if_id)]
-            ):
-                f_out.write("%d,%d,%f\n" % (
-                    node_id,
-                    if_id,
-                    gsl_if_bandwidth_state[(node_id, if_id)]
-                ))
+        sat_changed = satellite_gsl_if_bandwidth != prev_gsl_if_bandwidth_state["satellites"]
+        gs_changed = ground_station_gsl_if_bandwidth != prev_gsl_if_bandwidth_state["ground_stations"]
+
+    output_filename = "gsl_if_bandwidth_" + str(time_since_epoch_ns) + ".txt"
+    print("  > Writing interface bandwidth state to: " + output_dynamic_state_dir + "/" + output_filename)
+    with open_dynamic_state_output_file(dynamic_state_output, output_dynamic_state_dir, output_filename) as f_out:
+        sids, gsl_if_idxs = np.nonzero(sat_changed)
+        gids = np.flatnonzero(gs_changed)
+        f_out.write("".join(
+            ["%d,%d,%f\n" % entry for entry in zip(
+                sids.tolist(),
+                (np.array(num_isls_per_sat)[sids] + gsl_if_idxs).tolist(),
+                satellite_gsl_if_bandwidth[sids, gsl_if_idxs].tolist()
+            )]
+            +
+            ["%d,%d,%f\n" % entry for entry in zip(
+                (len(satellites) + gids).tolist(),
+                [0] * len(gids),
+                ground_station_gsl_if_bandwidth[gids].tolist()
+            )]
+        ))
 
     #################################
 
@@ -202,7 +179,13 @@ def algorithm_paired_many_only_over_isls(
         ground_station_satellites_in_range_select_one_at_most,
         sat_neighbor_to_if,
         prev_fstate,
-        enable_verbose_logs
+        enable_verbose_logs,
+        routing_state["incremental_shortest_paths_state"],
+        routing_state["plus_grid_symmetry_state"],
+        routing_state["max_multipath_next_hops"],
+        routing_state["multipath_cost_tolerance"],
+        routing_state["dst_gids"],
+        dynamic_state_output
     )
 
     print("")
@@ -0,0 +1,356 @@
+# The MIT License (MIT)
+#
+# Copyright (c) 2020 ETH Zurich
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+
+import functools
+import io
+import os
+import threading
+from contextlib import contextmanager
+from .dynamic_state_writer import submit_to_dynamic_state_writer
+from .dynamic_state_compression import (
+    DYNAMIC_STATE_COMPRESSIONS,
+    check_dynamic_state_compression,
+    compression_of,
+    compressed_filename,
+    uncompressed_filename,
+    compress_content,
+    decompress_content,
+    open_compressed_file
+)
+
+# A dynamic state archive holds all the files of the dynamic state of a run (e.g., fstate_<t>.txt and
+# gsl_if_bandwidth_<t>.txt) appended one after the other in a single data file, together with an index
+# file which has a line "filename,offset,number of bytes" for each of them
+DYNAMIC_STATE_ARCHIVE_FILENAME = "dynamic_state_archive.bin"
+DYNAMIC_STATE_ARCHIVE_INDEX_FILENAME = "dynamic_state_archive_index.txt"
+
+# Index of each archive which was read, together with the size and modification time of its index file
+# at that moment, such that the index is only read again if the archive was changed in the meantime
+_archive_index_cache = {}
+
+
+def create_dynamic_state_archive(output_dynamic_state_dir):
+    """
+    Create an (empty) dynamic state archive in the dynamic state directory, replacing any existing one.
+    Files can be appended to it by multiple threads at the same time.
+
+    :param output_dynamic_state_dir:  Dynamic state directory
+
+    :return: Dynamic state archive (dictionary), which must be closed with close_dynamic_state_archive()
+    """
+    return {
+        "dynamic_state_dir": output_dynamic_state_dir,
+        "f_data": open(os.path.join(output_dynamic_state_dir, DYNAMIC_STATE_ARCHIVE_FILENAME), "wb"),
+        "f_index": open(os.path.join(output_dynamic_state_dir, DYNAMIC_STATE_ARCHIVE_INDEX_FILENAME), "w+"),
+        "offset": 0,
+        "filenames": set(),
+        "lock": threading.Lock(),
+    }
+
+
+def append_to_dynamic_state_archive(dynamic_state_archive, filename, content):
+    """
+    Append a file to the dynamic state archive. Each file can only be appended once.
+
+    :param dynamic_state_archive:  Dynamic state archive (as returned by create_dynamic_state_archive())
+    :param filename:               Filename within the dynamic state directory (e.g., fstate_<t>.txt)
+    :param content:                Content of the file (str or bytes)
+    """
+    if "," in filename or "\n" in filename:
+        raise ValueError("Filename in a dynamic state archive cannot contain a comma or newline: " + filename)
+    data = content.encode() if isinstance(content, str) else content
+    with dynamic_state_archive["lock"]:
+        if filename in dynamic_state_archive["filenames"]:
+            raise ValueError("File is already in the dynamic state archive: " + filename)
+        dynamic_state_archive["filenames"].add(filename)
+        dynamic_state_archive["f_data"].write(data)
+        dynamic_state_archive["f_index"].write("%s,%d,%d\n" % (filename, dynamic_state_archive["offset"], len(data)))
+        dynamic_state_archive["offset"] += len(data)
+
+
+def close_dynamic_state_archive(dynamic_state_archive):
+    """
+    Close the dynamic state archive, after which nothing can be appended to it anymore.
+
+    :param dynamic_state_archive:  Dynamic state archive (as returned by create_dynamic_state_archive())
+
+    :return: Number of files in the archive
+    """
+    with dynamic_state_archive["lock"]:
+        dynamic_state_archive["f_data"].close()
+        dynamic_state_archive["f_index"].close()
+    return len(dynamic_state_archive["filenames"])
+
+
+def write_dynamic_state_content(output_dynamic_state_dir, filename, content, dynamic_state_archive=None,
+                                compression=None):
+    """
+    Write the whole content of a file of the dynamic state at once.
+
+    :param output_dynamic_state_dir:  Dynamic state directory
+    :param filename:                  Filename within the dynamic state directory (e.g., fstate_<t>.txt)
+    :param content:                   Content of the file (bytes)
+    :param dynamic_state_archive:     Dynamic state archive (as returned by create_dynamic_state_archive()),
+                                      if None the file is written to the dynamic state directory
+    :param compression:               Compression (see DYNAMIC_STATE_COMPRESSIONS), if not None the file is
+                                      compressed and its extension appended to the filename
+    """
+    if compression is not None:
+        content = compress_content(content, compression)
+    filename = compressed_filename(filename, compression)
+    if dynamic_state_archive is None:
+        with open(os.path.join(output_dynamic_state_dir, filename), "wb") as f_out:
+            f_out.write(content)
+    else:
+        append_to_dynamic_state_archive(dynamic_state_archive, filename, content)
+
+
+@contextmanager
+def open_dynamic_state_file(output_dynamic_state_dir, filename, mode="w+", dynamic_state_archive=None,
+                            compression=None, dynamic_state_writer=None):
+    """
+    Open a file of the dynamic state to write to. If there is a dynamic state archive or a background writer,
+    what is written is kept in memory and appended to the archive or handed to the writer as a whole
+    when the file is closed.
+
+    :param output_dynamic_state_dir:  Dynamic state directory
+    :param filename:                  Filename within the dynamic state directory (e.g., fstate_<t>.txt)
+    :param mode:                      "w+" (text) or "wb" (binary)
+    :param dynamic_state_archive:     Dynamic state archive (as returned by create_dynamic_state_archive()),
+                                      if None the file is written to the dynamic state directory
+    :param compression:               Compression (see DYNAMIC_STATE_COMPRESSIONS), if not None the file is
+                                      compressed and its extension appended to the filename (e.g., fstate_<t>.txt.gz)
+    :param dynamic_state_writer:      Background writer (as returned by create_dynamic_state_writer()),
+                                      if not None the file is compressed and written by it instead
+
+    :return: File to write to (to use in a with statement)
+    """
+    if mode not in ("w+", "wb"):
+        raise ValueError("Dynamic state files can only be opened for writing: " + str(mode))
+    check_dynamic_state_compression(compression)
+    if dynamic_state_archive is None and dynamic_state_writer is None:
+        output_filename = os.path.join(output_dynamic_state_dir, compressed_filename(filename, compression))
+        if compression is None:
+            with open(output_filename, mode) as f_out:
+                yield f_out
+        else:
+            with open_compressed_file(output_filename, mode, compression) as f_out:
+                yield f_out
+    else:
+        f_out = io.BytesIO() if mode == "wb" else io.StringIO()
+        yield f_out
+        content = f_out.getvalue()
+        if isinstance(content, str):
+            content = content.encode()
+        if dynamic_state_writer is None:
+            write_dynamic_state_content(output_dynamic_state_dir, filename, content, dynamic_state_archive, compression)
+        else:
+            submit_to_dynamic_state_writer(dynamic_state_writer, len(content), functools.partial(
+                write_dynamic_state_content, output_dynamic_state_dir, filename, content, dynamic_state_archive,
+                compression
+            ))
+
+
+def has_dynamic_state_archive(dynamic_state_dir):
+    """
+    Check whether there is a dynamic state archive in the dynamic state directory.
+
+    :param dynamic_state_dir:  Dynamic state directory
+
+    :return: True iff there is a dynamic state archive
+    """
+    return os.path.isfile(os.path.join(dynamic_state_dir, DYNAMIC_STATE_ARCHIVE_INDEX_FILENAME))
+
+
+def read_dynamic_state_archive_index(dynamic_state_dir):
+    """
+    Read the index of the dynamic state archive. It is only read again if the archive changed.
+
+    :param dynamic_state_dir:  Dynamic state directory
+
+    :return: Dictionary of filename to (offset, number of bytes) in the archive data file
+    """
+    index_filename = os.path.abspath(os.path.join(dynamic_state_dir, DYNAMIC_STATE_ARCHIVE_INDEX_FILENAME))
+    index_stat = os.stat(index_filename)
+    index_version = (index_stat.st_size, index_stat.st_mtime_ns)
+    cached = _archive_index_cache.get(index_filename)
+    if cached is not None and cached[0] == index_version:
+        return cached[1]
+    index = {}
+    with open(index_filename, "r") as f_in:
+        for line in f_in:
+            split = line.strip().split(",")
+            if len(split) != 3:
+                raise ValueError("Dynamic state archive index line must have 3 values: " + line.strip())
+            index[split[0]] = (int(split[1]), int(split[2]))
+    _archive_index_cache[index_filename] = (index_version, index)
+    return index
+
+
+def dynamic_state_file_exists(dynamic_state_dir, filename):
+    """
+    Check whether there is a file of the dynamic state, as a separate file or in the dynamic state archive,
+    either as is or compressed (see DYNAMIC_STATE_COMPRESSIONS).
+
+    :param dynamic_state_dir:  Dynamic state directory
+    :param filename:           Filename within the dynamic state directory (e.g., fstate_<t>.txt)
+
+    :return: True iff the file exists
+    """
+    return find_dynamic_state_file(dynamic_state_dir, filename) is not None
+
+
+def find_dynamic_state_file(dynamic_state_dir, filename):
+    """
+    Find a file of the dynamic state, first as a separate file and else in the dynamic state archive,
+    either as is or compressed (see DYNAMIC_STATE_COMPRESSIONS).
+
+    :param dynamic_state_dir:  Dynamic state directory
+    :param filename:           Filename within the dynamic state directory (e.g., fstate_<t>.txt)
+
+    :return: Tuple (filename as found, True iff it is in the archive), or None if it was not found
+    """
+    candidates = [filename] + [compressed_filename(filename, compression) for compression in DYNAMIC_STATE_COMPRESSIONS]
+    for candidate in candidates:
+        if os.path.isfile(os.path.join(dynamic_state_dir, candidate)):
+            return candidate, False
+    if has_dynamic_state_archive(dynamic_state_dir):
+        index = read_dynamic_state_archive_index(dynamic_state_dir)
+        for candidate in candidates:
+            if candidate in index:
+                return candidate, True
+    return None
+
+
+def read_dynamic_state_archive_file(dynamic_state_dir, filename):
+    """
+    Read a file of the dynamic state from the dynamic state archive, by seeking directly to it.
+
+    :param dynamic_state_dir:  Dynamic state directory
+    :param filename:           Filename within the dynamic state directory (e.g., fstate_<t>.txt)
+
+    :return: Content of the file (bytes)
+    """
+    index = read_dynamic_state_archive_index(dynamic_state_dir)
+    if filename not in index:
+        raise ValueError("There is no %s in the dynamic state archive of %s" % (filename, dynamic_state_dir))
+    (offset, num_bytes) = index[filename]
+    with open(os.path.join(dynamic_state_dir, DYNAMIC_STATE_ARCHIVE_FILENAME), "rb") as f_in:
+        f_in.seek(offset)
+        content = f_in.read(num_bytes)
+    if len(content) != num_bytes:
+        raise ValueError("Dynamic state archive of %s is truncated at %s" % (dynamic_state_dir, filename))
+    return content
+
+
+def list_dynamic_state_files(dynamic_state_dir):
+    """
+    List the files of the dynamic state, both those which are separate files and those in the dynamic state archive.
+
+    :param dynamic_state_dir:  Dynamic state directory
+
+    :return: Sorted list of filenames within the dynamic state directory
+    """
+    filenames = set(os.listdir(dynamic_state_dir))
+    filenames.discard(DYNAMIC_STATE_ARCHIVE_FILENAME)
+    filenames.discard(DYNAMIC_STATE_ARCHIVE_INDEX_FILENAME)
+    if has_dynamic_state_archive(dynamic_state_dir):
+        filenames.update(read_dynamic_state_archive_index(dynamic_state_dir).keys())
+    return sorted(filenames)
+
+
+def read_dynamic_state_file(dynamic_state_dir, filename):
+    """
+    Read a file of the dynamic state, from the dynamic state directory if it is there as a separate file,
+    else from the dynamic state archive. If it was compressed, it is decompressed.
+
+    :param dynamic_state_dir:  Dynamic state directory
+    :param filename:           Filename within the dynamic state directory (e.g., fstate_<t>.txt)
+
+    :return: Content of the file (bytes)
+    """
+    found = find_dynamic_state_file(dynamic_state_dir, filename)
+    if found is None:
+        raise ValueError("There is no %s in %s" % (filename, dynamic_state_dir))
+    (found_filename, is_in_archive) = found
+    if is_in_archive:
+        content = read_dynamic_state_archive_file(dynamic_state_dir, found_filename)
+    else:
+        with open(os.path.join(dynamic_state_dir, found_filename), "rb") as f_in:
+            content = f_in.read()
+    compression = compression_of(found_filename)
+    return content if compression is None else decompress_content(content, compression)
+
+
+def decompress_dynamic_state_files(dynamic_state_dir, remove_compressed=False):
+    """
+    Decompress the compressed files of the dynamic state directory (e.g., for the ns-3 simulator,
+    which only reads uncompressed files). The decompressed file is written next to it, without the extension
+    of the compression.
+
+    :param dynamic_state_dir:  Dynamic state directory
+    :param remove_compressed:  True to remove the compressed files after they have been decompressed
+
+    :return: Number of files decompressed
+    """
+    num_decompressed = 0
+    for filename in sorted(os.listdir(dynamic_state_dir)):
+        compression = compression_of(filename)
+        if compression is not None:
+            with open(os.path.join(dynamic_state_dir, filename), "rb") as f_in:
+                content = decompress_content(f_in.read(), compression)
+            with open(os.path.join(dynamic_state_dir, uncompressed_filename(filename)), "wb") as f_out:
+                f_out.write(content)
+            if remove_compressed:
+                os.remove(os.path.join(dynamic_state_dir, filename))
+            num_decompressed += 1
+    return num_decompressed
+
+
+def expand_dynamic_state_archive(dynamic_state_dir, remove_archive=False):
+    """
+    Expand the dynamic state archive into the separate files of the dynamic state
+    (e.g., for the ns-3 simulator, which reads fstate_<t>.txt and gsl_if_bandwidth_<t>.txt).
+    Files which were compressed in the archive are decompressed.
+
+    :param dynamic_state_dir:  Dynamic state directory
+    :param remove_archive:     True to remove the archive after it has been expanded
+
+    :return: Number of files written
+    """
+    index = read_dynamic_state_archive_index(dynamic_state_dir)
+    with open(os.path.join(dynamic_state_dir, DYNAMIC_STATE_ARCHIVE_FILENAME), "rb") as f_in:
+        for (filename, (offset, num_bytes)) in sorted(index.items(), key=lambda x: x[1][0]):
+            f_in.seek(offset)
+            content = f_in.read(num_bytes)
+            if len(content) != num_bytes:
+                raise ValueError("Dynamic state archive of %s is truncated at %s" % (dynamic_state_dir, filename))
+            compression = compression_of(filename)
+            if compression is not None:
+                content = decompress_content(content, compression)
+            with open(os.path.join(dynamic_state_dir, uncompressed_filename(filename)), "wb") as f_out:
+                f_out.write(content)
+    if remove_archive:
+        os.remove(os.path.join(dynamic_state_dir, DYNAMIC_STATE_ARCHIVE_FILENAME))
+        os.remove(os.path.join(dynamic_state_dir, DYNAMIC_STATE_ARCHIVE_INDEX_FILENAME))
+    return len(index)
@@ -0,0 +1,149 @@
+# The MIT License (MIT)
+#
+# Copyright (c) 2020 ETH Zurich
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+
+import gzip
+import io
+
+# zstandard is optional, without it the dynamic state can only be compressed with gzip
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+# Compressions of the dynamic state files, of which the extension is appended to the filename
+# (e.g., fstate_<t>.txt.gz): "gz" (gzip) or "zst" (zstandard, if installed)
+DYNAMIC_STATE_COMPRESSIONS = ("gz", "zst")
+
+# Compression levels, which favor speed as the files are written every time step
+GZIP_COMPRESSION_LEVEL = 6
+ZSTD_COMPRESSION_LEVEL = 3
+
+
+def zstandard_available():
+    """
+    Check whether the dynamic state can be compressed with zstandard.
+
+    :return: True iff zstandard is installed
+    """
+    return zstandard is not None
+
+
+def check_dynamic_state_compression(compression):
+    """
+    Check that the dynamic state files can be compressed with a compression.
+
+    :param compression:  Compression (see DYNAMIC_STATE_COMPRESSIONS), or None for no compression
+    """
+    if compression is not None and compression not in DYNAMIC_STATE_COMPRESSIONS:
+        raise ValueError("Unknown dynamic state compression: " + str(compression))
+    if compression == "zst" and not zstandard_available():
+        raise ValueError("Compression with zstandard requires the zstandard package (pip install zstandard)")
+
+
+def compression_of(filename):
+    """
+    Determine the compression of a dynamic state file from its extension.
+
+    :param filename:  Filename
+
+    :return: Compression (see DYNAMIC_STATE_COMPRESSIONS), or None if it is not compressed
+    """
+    for compression in DYNAMIC_STATE_COMPRESSIONS:
+        if filename.endswith("." + compression):
+            return compression
+    return None
+
+
+def compressed_filename(filename, compression):
+    """
+    Name of a dynamic state file once compressed.
+
+    :param filename:     Filename
+    :param compression:  Compression (see DYNAMIC_STATE_COMPRESSIONS), or None for no compression
+
+    :return: Filename with the extension of the compression appended (the same if None)
+    """
+    return filename if compression is None else filename + "." + compression
+
+
+def uncompressed_filename(filename):
+    """
+    Name of a dynamic state file once decompressed.
+
+    :param filename:  Filename
+
+    :return: Filename without the extension of the compression (the same if it is not compressed)
+    """
+    compression = compression_of(filename)
+    return filename if compression is None else filename[:-(len(compression) + 1)]
+
+
+def compress_content(content, compression):
+    """
+    Compress the content of a dynamic state file at once.
+
+    :param content:      Content (bytes)
+    :param compression:  Compression (see DYNAMIC_STATE_COMPRESSIONS)
+
+    :return: Compressed content (bytes)
+    """
+    check_dynamic_state_compression(compression)
+    if compression == "gz":
+        return gzip.compress(content, compresslevel=GZIP_COMPRESSION_LEVEL, mtime=0)
+    else:
+        return zstandard.ZstdCompressor(level=ZSTD_COMPRESSION_LEVEL).compress(content)
+
+
+def decompress_content(content, compression):
+    """
+    Decompress the content of a dynamic state file at once.
+
+    :param content:      Compressed content (bytes)
+    :param compression:  Compression (see DYNAMIC_STATE_COMPRESSIONS)
+
+    :return: Content (bytes)
+    """
+    check_dynamic_state_compression(compression)
+    if compression == "gz":
+        return gzip.decompress(content)
+    else:
+        with zstandard.ZstdDecompressor().stream_reader(io.BytesIO(content)) as reader:
+            return reader.read()
+
+
+def open_compressed_file(filename, mode, compression):
+    """
+    Open a compressed dynamic state file to write to, which is compressed while it is being written.
+
+    :param filename:     Filename (including the extension of the compression)
+    :param mode:         "w+" (text) or "wb" (binary)
+    :param compression:  Compression (see DYNAMIC_STATE_COMPRESSIONS)
+
+    :return: File to write to
+    """
+    check_dynamic_state_compression(compression)
+    if compression == "gz":
+        f_compressed = gzip.GzipFile(filename, "wb", compresslevel=GZIP_COMPRESSION_LEVEL, mtime=0)
+    else:
+        f_compressed = zstandard.open(filename, "wb", cctx=zstandard.ZstdCompressor(level=ZSTD_COMPRESSION_LEVEL))
+    return f_compressed if mode == "wb" else io.TextIOWrapper(f_compressed)
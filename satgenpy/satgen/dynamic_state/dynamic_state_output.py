@@ -0,0 +1,128 @@
+# The MIT License (MIT)
+#
+# Copyright (c) 2020 ETH Zurich
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+from .forwarding_state import FSTATE_FORMATS
+from .dynamic_state_archive import create_dynamic_state_archive, close_dynamic_state_archive, open_dynamic_state_file
+from .dynamic_state_writer import create_dynamic_state_writer, close_dynamic_state_writer, report_dynamic_state_writer
+from .dynamic_state_compression import check_dynamic_state_compression
+
+
+def create_dynamic_state_output(
+        fstate_format="txt",
+        use_archive=False,
+        keyframe_interval=None,
+        compression=None,
+        use_background_writer=False
+):
+    """
+    Create the options of how the dynamic state files are written. None of them change what is in the files.
+
+    :param fstate_format:          Format of the forwarding state files (see FSTATE_FORMATS): "txt" (fstate_<t>.txt)
+                                   or "bin" (fstate_<t>.bin, see convert_forwarding_state_files())
+    :param use_archive:            True to append the files to one dynamic state archive (see
+                                   create_dynamic_state_archive()) instead of writing them to the directory
+    :param keyframe_interval:      If not None, every this many time steps (counted from t=0) the full forwarding state
+                                   is written instead of only what changed, and these keyframes are listed in
+                                   fstate_keyframes_<offset>.txt (see read_forwarding_state_at_time())
+    :param compression:            If not None, the files are compressed while written (see
+                                   DYNAMIC_STATE_COMPRESSIONS): "gz" (e.g., fstate_<t>.txt.gz) or "zst"
+    :param use_background_writer:  True to hand the files to one background writer (see create_dynamic_state_writer()),
+                                   which compresses and writes them while the next time step is calculated
+
+    :return: Dynamic state output (dictionary), of which the archive and the background writer are only
+             there once opened with open_dynamic_state_output()
+    """
+    if fstate_format not in FSTATE_FORMATS:
+        raise ValueError("Unknown forwarding state format: " + str(fstate_format))
+    if keyframe_interval is not None and keyframe_interval < 1:
+        raise ValueError("Forwarding state keyframe interval must be at least 1 time step")
+    check_dynamic_state_compression(compression)
+    return {
+        "fstate_format": fstate_format,
+        "use_archive": use_archive,
+        "keyframe_interval": keyframe_interval,
+        "compression": compression,
+        "use_background_writer": use_background_writer,
+        "archive": None,
+        "writer": None
+    }
+
+
+def open_dynamic_state_output(dynamic_state_output, output_dynamic_state_dir):
+    """
+    Open the dynamic state archive and start the background writer of the dynamic state output, if it uses them.
+    They can be shared by multiple threads.
+
+    :param dynamic_state_output:      Dynamic state output (as returned by create_dynamic_state_output())
+    :param output_dynamic_state_dir:  Dynamic state directory
+
+    :return: Opened dynamic state output (dictionary), which must be closed with close_dynamic_state_output()
+    """
+    opened = dict(dynamic_state_output)
+    if dynamic_state_output["use_archive"]:
+        opened["archive"] = create_dynamic_state_archive(output_dynamic_state_dir)
+    if dynamic_state_output["use_background_writer"]:
+        opened["writer"] = create_dynamic_state_writer()
+    return opened
+
+
+def close_dynamic_state_output(dynamic_state_output):
+    """
+    Wait for the background writer to have written all the files, and then close the dynamic state archive.
+
+    :param dynamic_state_output:  Dynamic state output (as returned by open_dynamic_state_output())
+    """
+    if dynamic_state_output["writer"] is not None:
+        close_dynamic_state_writer(dynamic_state_output["writer"])
+        report_dynamic_state_writer(dynamic_state_output["writer"])
+    if dynamic_state_output["archive"] is not None:
+        print("Dynamic state archive has %d file(s)" % close_dynamic_state_archive(dynamic_state_output["archive"]))
+
+
+def check_dynamic_state_output_opened(dynamic_state_output):
+    """
+    Check that the archive and the background writer which the dynamic state output uses are there.
+
+    :param dynamic_state_output:  Dynamic state output (as returned by open_dynamic_state_output())
+    """
+    if (
+            (dynamic_state_output["use_archive"] and dynamic_state_output["archive"] is None)
+            or (dynamic_state_output["use_background_writer"] and dynamic_state_output["writer"] is None)
+    ):
+        raise ValueError("Dynamic state output must first be opened (see open_dynamic_state_output())")
+
+
+def open_dynamic_state_output_file(dynamic_state_output, output_dynamic_state_dir, filename, mode="w+"):
+    """
+    Open a dynamic state file to write as the dynamic state output says (see open_dynamic_state_file()).
+
+    :param dynamic_state_output:      Dynamic state output (as returned by open_dynamic_state_output())
+    :param output_dynamic_state_dir:  Dynamic state directory
+    :param filename:                  Filename within the dynamic state directory (e.g., fstate_<t>.txt)
+    :param mode:                      "w+" (text) or "wb" (binary)
+
+    :return: File to write to (to use in a with statement)
+    """
+    return open_dynamic_state_file(
+        output_dynamic_state_dir, filename, mode, dynamic_state_output["archive"], dynamic_state_output["compression"],
+        dynamic_state_output["writer"]
+    )
@@ -0,0 +1,153 @@
+# The MIT License (MIT)
+#
+# Copyright (c) 2020 ETH Zurich
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+
+import collections
+import threading
+import time
+
+# At most this many bytes of output are queued for the background writer, after which the calculation
+# waits until it has caught up, such that the memory which is used stays bounded
+DEFAULT_MAX_QUEUED_BYTES = 256 * 1000 * 1000
+
+
+def create_dynamic_state_writer(max_queued_bytes=DEFAULT_MAX_QUEUED_BYTES):
+    """
+    Create and start a background writer, which writes the files of the dynamic state (see open_dynamic_state_file())
+    in a separate thread while the next time step is calculated. Files can be handed to it by multiple threads.
+
+    :param max_queued_bytes:  Maximum number of bytes which are queued to be written, beyond which handing a file
+                              to the writer blocks until there is room (a larger file waits for the queue to be empty)
+
+    :return: Dynamic state writer (dictionary), which must be closed with close_dynamic_state_writer()
+    """
+    if max_queued_bytes < 1:
+        raise ValueError("Maximum number of queued bytes must be at least 1")
+    dynamic_state_writer = {
+        "max_queued_bytes": max_queued_bytes,
+        "queue": collections.deque(),
+        "queued_bytes": 0,
+        "condition": threading.Condition(),
+        "closed": False,
+        "error": None,
+        "num_files_written": 0,
+        "num_batches_written": 0,
+        "wait_s": 0.0,
+    }
+    dynamic_state_writer["thread"] = threading.Thread(
+        target=run_dynamic_state_writer, args=(dynamic_state_writer,), daemon=True
+    )
+    dynamic_state_writer["thread"].start()
+    return dynamic_state_writer
+
+
+def submit_to_dynamic_state_writer(dynamic_state_writer, num_bytes, write_function):
+    """
+    Hand a file to the background writer, after waiting for room in its queue if it is full.
+
+    :param dynamic_state_writer:  Dynamic state writer (as returned by create_dynamic_state_writer())
+    :param num_bytes:             Number of bytes of the file (which are held in memory until it is written)
+    :param write_function:        Function without arguments which writes the file
+    """
+    condition = dynamic_state_writer["condition"]
+    with condition:
+        if dynamic_state_writer["closed"]:
+            raise ValueError("Dynamic state writer is already closed")
+        start = time.time()
+        while (
+                dynamic_state_writer["error"] is None
+                and dynamic_state_writer["queued_bytes"] > 0
+                and dynamic_state_writer["queued_bytes"] + num_bytes > dynamic_state_writer["max_queued_bytes"]
+        ):
+            condition.wait()
+        dynamic_state_writer["wait_s"] += time.time() - start
+        if dynamic_state_writer["error"] is not None:
+            raise dynamic_state_writer["error"]
+        dynamic_state_writer["queue"].append((num_bytes, write_function))
+        dynamic_state_writer["queued_bytes"] += num_bytes
+        condition.notify_all()
+
+
+def run_dynamic_state_writer(dynamic_state_writer):
+    """
+    Write the files handed to the background writer, all those which are queued at once, until it is closed.
+    If writing fails, the error is raised when the next file is handed to it or when it is closed.
+
+    :param dynamic_state_writer:  Dynamic state writer (as returned by create_dynamic_state_writer())
+    """
+    condition = dynamic_state_writer["condition"]
+    while True:
+        with condition:
+            while len(dynamic_state_writer["queue"]) == 0 and not dynamic_state_writer["closed"]:
+                condition.wait()
+            if len(dynamic_state_writer["queue"]) == 0:
+                return
+            batch = list(dynamic_state_writer["queue"])
+            dynamic_state_writer["queue"].clear()
+
+        # Written outside of the lock, such that the files of the next time step can be handed over meanwhile
+        try:
+            for (_, write_function) in batch:
+                write_function()
+        except Exception as e:
+            with condition:
+                dynamic_state_writer["error"] = e
+                condition.notify_all()
+            return
+
+        with condition:
+            dynamic_state_writer["queued_bytes"] -= sum(num_bytes for (num_bytes, _) in batch)
+            dynamic_state_writer["num_files_written"] += len(batch)
+            dynamic_state_writer["num_batches_written"] += 1
+            condition.notify_all()
+
+
+def close_dynamic_state_writer(dynamic_state_writer):
+    """
+    Close the background writer, after it has written all the files which were handed to it.
+
+    :param dynamic_state_writer:  Dynamic state writer (as returned by create_dynamic_state_writer())
+
+    :return: Number of files written
+    """
+    with dynamic_state_writer["condition"]:
+        dynamic_state_writer["closed"] = True
+        dynamic_state_writer["condition"].notify_all()
+    dynamic_state_writer["thread"].join()
+    if dynamic_state_writer["error"] is not None:
+        raise dynamic_state_writer["error"]
+    return dynamic_state_writer["num_files_written"]
+
+
+def report_dynamic_state_writer(dynamic_state_writer):
+    """
+    Print how many files the background writer wrote, and how long the calculation waited for it.
+
+    :param dynamic_state_writer:  Dynamic state writer (as returned by create_dynamic_state_writer()),
+                                  if None nothing is printed
+    """
+    if dynamic_state_writer is not None:
+        print("Background writer: %d file(s) written in %d batch(es), calculation waited %.2f s for it" % (
+            dynamic_state_writer["num_files_written"],
+            dynamic_state_writer["num_batches_written"],
+            dynamic_state_writer["wait_s"]
+        ))
@@ -0,0 +1,124 @@
+# The MIT License (MIT)
+#
+# Copyright (c) 2020 ETH Zurich
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+
+import math
+import numpy as np
+from scipy.sparse import csr_array
+from scipy.sparse.csgraph import shortest_path
+
+
+def create_fewest_hops_state(num_satellites, list_isls):
+    """
+    Calculate the number of hops between every two satellites over the ISLs. As the ISLs do not change
+    during a run, this only has to be done once at the start, after which every time step only the distance
+    over the paths with the fewest hops is calculated (see calculate_fewest_hops_distances_to()).
+
+    :param num_satellites:  Number of satellites
+    :param list_isls:       List of ISLs (as read from the isls.txt by read_isls())
+
+    :return: Fewest hops state (dictionary) with "hops", an int16 array of shape (number of satellites,
+             number of satellites) with at [i, j] the fewest hops between satellite i and j (-1 if unreachable),
+             and "is_closer", set the first time step (see update_fewest_hops_closer_neighbors())
+    """
+    if num_satellites >= np.iinfo(np.int16).max:
+        raise ValueError("Too many satellites to store the number of hops")
+    isls = np.array(list_isls, dtype=int).reshape(-1, 2)
+    adjacency = csr_array(
+        (np.ones(len(isls)), (isls[:, 0], isls[:, 1])),
+        shape=(num_satellites, num_satellites)
+    )
+    hops = shortest_path(adjacency, directed=False, unweighted=True)
+    return {
+        "hops": np.where(np.isinf(hops), -1, hops).astype(np.int16),
+        "neighbor_ids": None,
+        "is_closer": None,
+    }
+
+
+def update_fewest_hops_closer_neighbors(state, padded_neighbors):
+    """
+    Determine which neighbors of each satellite are one hop closer to each destination satellite. This only
+    depends on the order of the neighbors, as such it is only calculated again if that changes.
+
+    :param state:             Fewest hops state (as returned by create_fewest_hops_state())
+    :param padded_neighbors:  Neighbors of the satellites (as returned by create_padded_neighbor_arrays())
+    """
+    neighbor_ids = padded_neighbors["neighbor_ids"]
+    if state["neighbor_ids"] is None or not np.array_equal(state["neighbor_ids"], neighbor_ids):
+        hops = state["hops"]
+        state["neighbor_ids"] = neighbor_ids.copy()
+        state["is_closer"] = (
+            (hops[:, neighbor_ids] == hops[:, :, np.newaxis] - 1)
+            & ~np.isinf(padded_neighbors["weights"])[np.newaxis, :, :]
+        )
+
+
+def calculate_fewest_hops_distances_to(state, padded_neighbors, dst_node_ids):
+    """
+    Calculate for all satellites the shortest distance to each of the given destination satellites over only the
+    paths with the fewest hops. Going outward from each destination hop level by hop level, the distance of each
+    satellite is the smallest over its neighbors which are one hop closer of (distance of neighbor + ISL length).
+
+    :param state:             Fewest hops state (as returned by create_fewest_hops_state())
+    :param padded_neighbors:  Neighbors of the satellites with the current ISL lengths as weights
+                              (as returned by create_padded_neighbor_arrays())
+    :param dst_node_ids:      List of destination satellite identifiers
+
+    :return: Tuple of two arrays of shape (number of destinations, number of satellites), with at [i, j] the fewest
+             hops (-1 if unreachable) and the shortest distance over those (inf if unreachable) from satellite j to
+             destination dst_node_ids[i]
+    """
+    update_fewest_hops_closer_neighbors(state, padded_neighbors)
+    dst_node_ids = np.array(dst_node_ids, dtype=int)
+    num_satellites = len(state["hops"])
+    hops = state["hops"][dst_node_ids]
+    is_closer = state["is_closer"][dst_node_ids].reshape(-1, padded_neighbors["neighbor_ids"].shape[1])
+    distances = np.full(hops.shape, math.inf)
+    distances[np.arange(len(dst_node_ids)), dst_node_ids] = 0.0
+
+    # All (destination, satellite) pairs ordered by their number of hops
+    hops_flat = hops.reshape(-1)
+    distances_flat = distances.reshape(-1)
+    order = np.argsort(hops_flat, kind="stable")
+    level_starts = np.searchsorted(hops_flat[order], np.arange(1, int(np.max(hops_flat, initial=0)) + 2))
+
+    # Each hop level only depends on the one before
+    for hop in range(1, len(level_starts)):
+        level_flat_idxs = order[level_starts[hop - 1]:level_starts[hop]]
+        level_sids = level_flat_idxs % num_satellites
+        level_dst_offsets = level_flat_idxs - level_sids
+        level_is_closer = is_closer[level_flat_idxs]
+        level_distances = np.full(len(level_flat_idxs), math.inf)
+        for i in range(level_is_closer.shape[1]):
+            distance_via_neighbor_m = (
+                padded_neighbors["weights"][level_sids, i]
+                + distances_flat[level_dst_offsets + padded_neighbors["neighbor_ids"][level_sids, i]]
+            )
+            np.minimum(
+                level_distances,
+                np.where(level_is_closer[:, i], distance_via_neighbor_m, math.inf),
+                out=level_distances
+            )
+        distances_flat[level_flat_idxs] = level_distances
+
+    return hops, distances
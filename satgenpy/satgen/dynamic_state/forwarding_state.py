@@ -0,0 +1,407 @@
+# The MIT License (MIT)
+#
+# Copyright (c) 2020 ETH Zurich
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+import io
+import os
+import numpy as np
+from .dynamic_state_archive import open_dynamic_state_file
+from .dynamic_state_compression import uncompressed_filename
+
+# Formats of the forwarding state files (fstate_<t>.<format>), of which each entry is
+# (node, destination, next-hop, my-if, next-hop-if), in text ("txt") as a line "%d,%d,%d,%d,%d",
+# or in binary ("bin") as five little-endian int32 values (20 bytes)
+FSTATE_FORMATS = ("txt", "bin")
+FSTATE_BINARY_DTYPE = np.dtype("<i4")
+
+
+def create_forwarding_state(num_satellites, num_ground_stations):
+    """
+    Create a forwarding state in which no node has a next hop to any ground station.
+
+    The forwarding state holds for every node (satellites first, then ground stations) and every destination
+    ground station the next-hop decision (next-hop node id, my outgoing interface id, next-hop incoming
+    interface id) in a single array, with (-1, -1, -1) if there is none.
+
+    :param num_satellites:       Number of satellites
+    :param num_ground_stations:  Number of ground stations
+
+    :return: Forwarding state (dictionary), with "next_hops" an int32 array of shape
+             (number of satellites + number of ground stations, number of ground stations, 3)
+    """
+    return {
+        "num_satellites": num_satellites,
+        "num_ground_stations": num_ground_stations,
+        "next_hops": np.full((num_satellites + num_ground_stations, num_ground_stations, 3), -1, dtype=np.int32),
+    }
+
+
+def get_next_hop_decision(fstate, node_id, dst_node_id):
+    """
+    Retrieve the next-hop decision of a node towards a destination ground station.
+
+    :param fstate:       Forwarding state (as returned by create_forwarding_state())
+    :param node_id:      Node identifier
+    :param dst_node_id:  Destination ground station node identifier
+
+    :return: Tuple (next-hop node id, my outgoing interface id, next-hop incoming interface id)
+    """
+    return tuple(fstate["next_hops"][node_id, dst_node_id - fstate["num_satellites"]].tolist())
+
+
+def get_next_hop(fstate, node_id, dst_node_id):
+    """
+    Retrieve the next-hop node of a node towards a destination ground station.
+
+    :param fstate:       Forwarding state (as returned by create_forwarding_state())
+    :param node_id:      Node identifier
+    :param dst_node_id:  Destination ground station node identifier
+
+    :return: Next-hop node identifier (-1 if there is none)
+    """
+    return int(fstate["next_hops"][node_id, dst_node_id - fstate["num_satellites"], 0])
+
+
+def set_next_hop_decision(fstate, node_id, dst_node_id, next_hop_decision):
+    """
+    Set the next-hop decision of a node towards a destination ground station.
+
+    :param fstate:             Forwarding state (as returned by create_forwarding_state())
+    :param node_id:            Node identifier
+    :param dst_node_id:        Destination ground station node identifier
+    :param next_hop_decision:  Tuple (next-hop node id, my outgoing interface id, next-hop incoming interface id)
+    """
+    fstate["next_hops"][node_id, dst_node_id - fstate["num_satellites"]] = next_hop_decision
+
+
+def mask_out_of_scope_destinations(changed, dst_gids):
+    """
+    Mark the entries to destination ground stations which are not in scope as unchanged, such that they are not written.
+
+    :param changed:   Boolean array of shape (number of nodes, number of ground stations, ...), updated in-place
+    :param dst_gids:  Destination ground station identifiers in scope (if None, all are in scope)
+    """
+    if dst_gids is not None:
+        is_in_scope = np.zeros(changed.shape[1], dtype=bool)
+        is_in_scope[np.asarray(dst_gids, dtype=int)] = True
+        changed[:, ~is_in_scope] = False
+
+
+def forwarding_state_filename(dynamic_state_dir, time_since_epoch_ns, fstate_format="txt"):
+    """
+    Name of the forwarding state file of a time step.
+
+    :param dynamic_state_dir:    Dynamic state directory
+    :param time_since_epoch_ns:  Time since epoch (ns)
+    :param fstate_format:        Format of the file (see FSTATE_FORMATS)
+
+    :return: Forwarding state filename (<dynamic_state_dir>/fstate_<t>.<format>)
+    """
+    if fstate_format not in FSTATE_FORMATS:
+        raise ValueError("Unknown forwarding state format: " + str(fstate_format))
+    return dynamic_state_dir + "/fstate_" + str(time_since_epoch_ns) + "." + fstate_format
+
+
+def forwarding_state_format_of(filename):
+    """
+    Determine the format of a forwarding state file from its extension (before that of its compression, if any).
+
+    :param filename:  Forwarding state filename
+
+    :return: Format of the file (see FSTATE_FORMATS)
+    """
+    fstate_format = os.path.splitext(uncompressed_filename(filename))[1][1:]
+    if fstate_format not in FSTATE_FORMATS:
+        raise ValueError("Unknown forwarding state format of file: " + filename)
+    return fstate_format
+
+
+def encode_forwarding_state_entries(entries, fstate_format="txt"):
+    """
+    Encode forwarding state entries.
+
+    :param entries:        Integer array of shape (number of entries, 5)
+    :param fstate_format:  Format (see FSTATE_FORMATS)
+
+    :return: Encoded entries (str if "txt", bytes if "bin")
+    """
+    if fstate_format == "txt":
+        return "".join(["%d,%d,%d,%d,%d\n" % tuple(entry) for entry in entries.tolist()])
+    elif fstate_format == "bin":
+        return np.ascontiguousarray(entries, dtype=FSTATE_BINARY_DTYPE).tobytes()
+    else:
+        raise ValueError("Unknown forwarding state format: " + str(fstate_format))
+
+
+def decode_forwarding_state_entries(content, fstate_format="txt"):
+    """
+    Decode forwarding state entries. Binary entries are decoded at once, without copying.
+
+    :param content:        Encoded entries (str if "txt", bytes if "bin")
+    :param fstate_format:  Format (see FSTATE_FORMATS)
+
+    :return: Integer array of shape (number of entries, 5)
+    """
+    if fstate_format == "txt":
+        if content == "":
+            return np.zeros((0, 5), dtype=np.int64)
+        entries = np.loadtxt(io.StringIO(content), delimiter=",", dtype=np.int64, ndmin=2)
+        if entries.shape[1] != 5:
+            raise ValueError("Forwarding state entries must have 5 values")
+        return entries
+    elif fstate_format == "bin":
+        if len(content) % (5 * FSTATE_BINARY_DTYPE.itemsize) != 0:
+            raise ValueError("Binary forwarding state must consist of entries of 5 values")
+        return np.frombuffer(content, dtype=FSTATE_BINARY_DTYPE).reshape((-1, 5))
+    else:
+        raise ValueError("Unknown forwarding state format: " + str(fstate_format))
+
+
+def apply_forwarding_state_entries(fstate, entries):
+    """
+    Set the next-hop decisions of forwarding state entries in the forwarding state.
+
+    :param fstate:   Forwarding state (as returned by create_forwarding_state()), which is updated in-place
+    :param entries:  Integer array of shape (number of entries, 5)
+
+    :return: Number of entries
+    """
+    fstate["next_hops"][entries[:, 0], entries[:, 1] - fstate["num_satellites"]] = entries[:, 2:5]
+    return entries.shape[0]
+
+
+def write_forwarding_state_delta(f_out, fstate, prev_fstate, dst_gids=None, fstate_format="txt"):
+    """
+    Write the entries of the forwarding state which differ from the previous forwarding state, as
+    lines "node,destination,next-hop,my-if,next-hop-if" (or in binary, see FSTATE_FORMATS)
+    ordered by node and then destination. The entry of a ground station to itself is never written.
+
+    :param f_out:          File to write to (opened in binary mode for "bin")
+    :param fstate:         Forwarding state (as returned by create_forwarding_state())
+    :param prev_fstate:    Previous forwarding state, if None all entries are written
+    :param dst_gids:       Destination ground station identifiers of which the entries are written (if None, all)
+    :param fstate_format:  Format (see FSTATE_FORMATS)
+
+    :return: Number of entries written
+    """
+    num_satellites = fstate["num_satellites"]
+    num_ground_stations = fstate["num_ground_stations"]
+    next_hops = fstate["next_hops"]
+    if prev_fstate is None:
+        changed = np.ones(next_hops.shape[0:2], dtype=bool)
+    else:
+        changed = np.any(next_hops != prev_fstate["next_hops"], axis=2)
+    changed[num_satellites + np.arange(num_ground_stations), np.arange(num_ground_stations)] = False
+    mask_out_of_scope_destinations(changed, dst_gids)
+    node_ids, changed_dst_gids = np.nonzero(changed)
+    entries = np.column_stack((node_ids, num_satellites + changed_dst_gids, next_hops[node_ids, changed_dst_gids]))
+    f_out.write(encode_forwarding_state_entries(entries, fstate_format))
+    return entries.shape[0]
+
+
+def read_forwarding_state_delta(f_in, fstate, fstate_format="txt"):
+    """
+    Update the forwarding state with the entries of a forwarding state file (fstate_<t>.txt),
+    which only contains the entries that changed since the previous time step.
+
+    :param f_in:           Forwarding state file to read from (opened in binary mode for "bin")
+    :param fstate:         Forwarding state (as returned by create_forwarding_state()), which is updated in-place
+    :param fstate_format:  Format (see FSTATE_FORMATS)
+
+    :return: Number of entries read
+    """
+    return apply_forwarding_state_entries(fstate, decode_forwarding_state_entries(f_in.read(), fstate_format))
+
+
+def write_forwarding_state_delta_file(filename, fstate, prev_fstate, dst_gids=None, dynamic_state_archive=None,
+                                      compression=None, dynamic_state_writer=None):
+    """
+    Write the entries of the forwarding state which differ from the previous forwarding state to a file,
+    in the format of its extension (see write_forwarding_state_delta()).
+
+    :param filename:               Forwarding state filename (see forwarding_state_filename())
+    :param fstate:                 Forwarding state (as returned by create_forwarding_state())
+    :param prev_fstate:            Previous forwarding state, if None all entries are written
+    :param dst_gids:               Destination ground station identifiers of which the entries are written
+                                   (if None, all)
+    :param dynamic_state_archive:  Dynamic state archive (as returned by create_dynamic_state_archive()),
+                                   if not None the file is appended to it instead
+    :param compression:            Compression (see DYNAMIC_STATE_COMPRESSIONS), if not None the file is compressed
+                                   and its extension appended to the filename
+    :param dynamic_state_writer:   Background writer (as returned by create_dynamic_state_writer()),
+                                   if not None the file is written by it
+
+    :return: Number of entries written
+    """
+    fstate_format = forwarding_state_format_of(filename)
+    (dynamic_state_dir, name) = os.path.split(filename)
+    with open_dynamic_state_file(
+            dynamic_state_dir, name, "wb" if fstate_format == "bin" else "w+", dynamic_state_archive, compression,
+            dynamic_state_writer
+    ) as f_out:
+        return write_forwarding_state_delta(f_out, fstate, prev_fstate, dst_gids, fstate_format)
+
+
+def read_forwarding_state_delta_file(filename, fstate):
+    """
+    Update the forwarding state with the entries of a forwarding state file,
+    in the format of its extension (see read_forwarding_state_delta()).
+
+    :param filename:  Forwarding state filename (see forwarding_state_filename())
+    :param fstate:    Forwarding state (as returned by create_forwarding_state()), which is updated in-place
+
+    :return: Number of entries read
+    """
+    fstate_format = forwarding_state_format_of(filename)
+    with open(filename, "rb" if fstate_format == "bin" else "r") as f_in:
+        return read_forwarding_state_delta(f_in, fstate, fstate_format)
+
+
+def write_forwarding_state_keyframes(f_out, keyframe_segments):
+    """
+    Write the time steps at which the full forwarding state was written (keyframes), each of which starts a segment
+    of time steps of which only the entries which changed were written, as lines
+    "keyframe time (ns),time step (ns),number of time steps" (the keyframe included).
+
+    :param f_out:              File to write to
+    :param keyframe_segments:  List of (keyframe time (ns), time step (ns), number of time steps)
+    """
+    f_out.write("".join(["%d,%d,%d\n" % tuple(segment) for segment in keyframe_segments]))
+
+
+def read_forwarding_state_keyframes(f_in):
+    """
+    Read the time steps at which the full forwarding state was written (see write_forwarding_state_keyframes()).
+
+    :param f_in:  File to read from
+
+    :return: List of (keyframe time (ns), time step (ns), number of time steps)
+    """
+    keyframe_segments = []
+    for line in f_in:
+        split = line.strip().split(",")
+        if len(split) != 3:
+            raise ValueError("Forwarding state keyframe line must have 3 values: " + line.strip())
+        keyframe_segments.append((int(split[0]), int(split[1]), int(split[2])))
+    return keyframe_segments
+
+
+def create_multipath_forwarding_state(num_satellites, num_ground_stations, max_next_hops):
+    """
+    Create a multipath forwarding state in which no node has a next hop to any ground station.
+
+    The multipath forwarding state holds for every node (satellites first, then ground stations) and every
+    destination ground station up to max_next_hops next-hop decisions (next-hop node id, my outgoing interface id,
+    next-hop incoming interface id), best first and padded with (-1, -1, -1), together with the fraction of the
+    traffic to the destination which is sent to each of them (0 for padding).
+
+    :param num_satellites:       Number of satellites
+    :param num_ground_stations:  Number of ground stations
+    :param max_next_hops:        Maximum number of next hops of a node to a destination ground station
+
+    :return: Multipath forwarding state (dictionary), with "next_hops" an int32 array of shape
+             (number of satellites + number of ground stations, number of ground stations, max_next_hops, 3)
+             and "weights" a float array of shape
+             (number of satellites + number of ground stations, number of ground stations, max_next_hops)
+    """
+    if max_next_hops < 1:
+        raise ValueError("Maximum number of next hops must be at least 1")
+    num_nodes = num_satellites + num_ground_stations
+    return {
+        "num_satellites": num_satellites,
+        "num_ground_stations": num_ground_stations,
+        "max_next_hops": max_next_hops,
+        "next_hops": np.full((num_nodes, num_ground_stations, max_next_hops, 3), -1, dtype=np.int32),
+        "weights": np.zeros((num_nodes, num_ground_stations, max_next_hops)),
+    }
+
+
+def write_multipath_forwarding_state_delta(f_out, multipath_fstate, prev_multipath_fstate, dst_gids=None):
+    """
+    Write the entries of the multipath forwarding state which differ from the previous multipath forwarding state,
+    as lines "node,destination,next-hop-1,my-if-1,next-hop-if-1,weight-1,...,next-hop-k,my-if-k,next-hop-if-k,weight-k"
+    with k the maximum number of next hops (padded with "-1,-1,-1,0.000000"), ordered by node and then destination.
+    The entry of a ground station to itself is never written.
+
+    :param f_out:                  File to write to
+    :param multipath_fstate:       Multipath forwarding state (as returned by create_multipath_forwarding_state())
+    :param prev_multipath_fstate:  Previous multipath forwarding state, if None all entries are written
+    :param dst_gids:               Destination ground station identifiers of which the entries are written
+                                   (if None, all)
+
+    :return: Number of entries written
+    """
+    num_satellites = multipath_fstate["num_satellites"]
+    num_ground_stations = multipath_fstate["num_ground_stations"]
+    max_next_hops = multipath_fstate["max_next_hops"]
+    next_hops = multipath_fstate["next_hops"]
+    weights = multipath_fstate["weights"]
+    if prev_multipath_fstate is None:
+        changed = np.ones(next_hops.shape[0:2], dtype=bool)
+    else:
+        if prev_multipath_fstate["max_next_hops"] != max_next_hops:
+            raise ValueError("Maximum number of next hops differs from the previous multipath forwarding state")
+        changed = (
+            np.any(next_hops != prev_multipath_fstate["next_hops"], axis=(2, 3))
+            | np.any(weights != prev_multipath_fstate["weights"], axis=2)
+        )
+    changed[num_satellites + np.arange(num_ground_stations), np.arange(num_ground_stations)] = False
+    mask_out_of_scope_destinations(changed, dst_gids)
+    node_ids, changed_dst_gids = np.nonzero(changed)
+    line_format = "%d,%d" + ",%d,%d,%d,%f" * max_next_hops + "\n"
+    lines = []
+    for (node_id, dst_gid, entry_next_hops, entry_weights) in zip(
+            node_ids.tolist(), changed_dst_gids.tolist(),
+            next_hops[node_ids, changed_dst_gids].tolist(), weights[node_ids, changed_dst_gids].tolist()
+    ):
+        values = [node_id, num_satellites + dst_gid]
+        for (next_hop_decision, weight) in zip(entry_next_hops, entry_weights):
+            values.extend(next_hop_decision)
+            values.append(weight)
+        lines.append(line_format % tuple(values))
+    f_out.write("".join(lines))
+    return len(lines)
+
+
+def read_multipath_forwarding_state_delta(f_in, multipath_fstate):
+    """
+    Update the multipath forwarding state with the entries of a multipath forwarding state file
+    (fstate_multipath_<t>.txt), which only contains the entries that changed since the previous time step.
+
+    :param f_in:              Multipath forwarding state file to read from
+    :param multipath_fstate:  Multipath forwarding state (as returned by create_multipath_forwarding_state()),
+                              which is updated in-place
+
+    :return: Number of entries read
+    """
+    content = f_in.read()
+    if content == "":
+        return 0
+    entries = np.loadtxt(io.StringIO(content), delimiter=",", dtype=float, ndmin=2)
+    max_next_hops = multipath_fstate["max_next_hops"]
+    if entries.shape[1] != 2 + 4 * max_next_hops:
+        raise ValueError("Multipath forwarding state entries must have %d values" % (2 + 4 * max_next_hops))
+    node_ids = entries[:, 0].astype(np.int64)
+    dst_gids = entries[:, 1].astype(np.int64) - multipath_fstate["num_satellites"]
+    per_next_hop = entries[:, 2:].reshape((entries.shape[0], max_next_hops, 4))
+    multipath_fstate["next_hops"][node_ids, dst_gids] = per_next_hop[:, :, 0:3].astype(np.int64)
+    multipath_fstate["weights"][node_ids, dst_gids] = per_next_hop[:, :, 3]
+    return entries.shape[0]
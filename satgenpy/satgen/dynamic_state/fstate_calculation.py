@@ -1,5 +1,136 @@
 import math
 import networkx as nx
+import numpy as np
+from scipy.sparse import csr_array
+from scipy.sparse.csgraph import dijkstra
+from .incremental_shortest_paths import calculate_shortest_path_distances_to_incrementally
+from .plus_grid_symmetry import calculate_shortest_path_distances_to_with_symmetry
+from .fewest_hops import calculate_fewest_hops_distances_to
+from .forwarding_state import (
+    create_forwarding_state,
+    forwarding_state_filename,
+    write_forwarding_state_delta_file,
+    create_multipath_forwarding_state,
+    write_multipath_forwarding_state_delta
+)
+from .dynamic_state_output import create_dynamic_state_output, open_dynamic_state_output_file
+from .fstate_kernels import (
+    create_candidate_arrays,
+    select_satellite_next_hops_to_ground_stations,
+    select_ground_station_next_hops
+)
+from multiprocessing.dummy import Pool as ThreadPool
+
+
+# Number of destination ground stations of which the shortest paths are calculated at once with ground station relays
+GS_RELAYING_DESTINATIONS_PER_BLOCK = 64
+
+# A next hop of the multipath forwarding state is only used if the distance via it is at most this fraction
+# longer than via the best next hop
+DEFAULT_MULTIPATH_COST_TOLERANCE = 0.1
+
+
+def scoped_destination_gids(num_ground_stations, dst_gids):
+    """
+    Determine the destination ground stations of which the forwarding state is calculated.
+
+    :param num_ground_stations:  Number of ground stations
+    :param dst_gids:             Destination ground station identifiers (if None, all ground stations)
+
+    :return: Numpy array with the destination ground station identifiers in ascending order, without duplicates
+    """
+    if dst_gids is None:
+        return np.arange(num_ground_stations, dtype=np.int64)
+    dst_gids = np.unique(np.asarray(list(dst_gids), dtype=np.int64))
+    if len(dst_gids) > 0 and (dst_gids[0] < 0 or dst_gids[-1] >= num_ground_stations):
+        raise ValueError("Destination ground station identifiers must be in [0, %d)" % num_ground_stations)
+    return dst_gids
+
+
+def calculate_shortest_path_distances_to(graph, num_nodes, dst_node_ids):
+    """
+    Calculate the shortest path distances of all nodes to only the given destination nodes,
+    by running Dijkstra from each destination over the sparse (CSR) adjacency matrix of the graph.
+    As the graph is undirected, the distance from a destination to a node is the distance of the node to it.
+
+    :param graph:         Undirected networkx graph with nodes 0 up to num_nodes - 1 and "weight" edge attributes
+    :param num_nodes:     Number of nodes in the graph
+    :param dst_node_ids:  List of destination node identifiers
+
+    :return: Numpy array of shape (number of destinations, number of nodes), with at [i, j] the
+             shortest path distance from node j to destination dst_node_ids[i] (inf if unreachable)
+    """
+    if len(dst_node_ids) == 0:
+        return np.zeros((0, num_nodes))
+    adjacency = nx.to_scipy_sparse_array(graph, nodelist=range(num_nodes), weight="weight", format="csr")
+    return dijkstra(adjacency, directed=False, indices=dst_node_ids)
+
+
+def create_padded_neighbor_arrays(graph, num_nodes, neighbor_to_if):
+    """
+    Create arrays with the neighbors of each node, padded to the maximum degree, such that
+    a next hop can be selected for all nodes at once. The neighbors of each node are in the order
+    in which the graph iterates over them.
+
+    :param graph:           Undirected networkx graph with nodes 0 up to num_nodes - 1 and "weight" edge attributes
+    :param num_nodes:       Number of nodes in the graph
+    :param neighbor_to_if:  Dictionary mapping (node, neighbor) to the interface of the node to that neighbor
+
+    :return: Dictionary with "neighbor_ids", "weights", "my_ifs" and "next_hop_ifs", each an array of shape
+             (number of nodes, maximum degree (at least 1)), padded with neighbor 0, weight inf and interfaces -1
+    """
+    max_degree = max([graph.degree(node_id) for node_id in range(num_nodes)] + [1])
+    neighbor_ids = np.zeros((num_nodes, max_degree), dtype=int)
+    weights = np.full((num_nodes, max_degree), math.inf)
+    my_ifs = np.full((num_nodes, max_degree), -1, dtype=int)
+    next_hop_ifs = np.full((num_nodes, max_degree), -1, dtype=int)
+    for node_id in range(num_nodes):
+        for (i, neighbor_id) in enumerate(graph.neighbors(node_id)):
+            neighbor_ids[node_id, i] = neighbor_id
+            weights[node_id, i] = graph.edges[(node_id, neighbor_id)]["weight"]
+            my_ifs[node_id, i] = neighbor_to_if[(node_id, neighbor_id)]
+            next_hop_ifs[node_id, i] = neighbor_to_if[(neighbor_id, node_id)]
+    return {
+        "neighbor_ids": neighbor_ids,
+        "weights": weights,
+        "my_ifs": my_ifs,
+        "next_hop_ifs": next_hop_ifs,
+    }
+
+
+def create_neighbor_edge_arrays(graph, num_nodes, neighbor_to_if):
+    """
+    Create flat arrays with the neighbors of each node, one after the other (as in a CSR matrix), such that
+    a next hop can be selected for all nodes at once without padding to the maximum degree, which is
+    large for satellites which are in range of many ground stations. The neighbors of each node are
+    in the order in which the graph iterates over them.
+
+    :param graph:           Undirected networkx graph with nodes 0 up to num_nodes - 1 and "weight" edge attributes
+    :param num_nodes:       Number of nodes in the graph
+    :param neighbor_to_if:  Dictionary mapping (node, neighbor) to the interface of the node to that neighbor
+
+    :return: Dictionary with "indptr" (the neighbors of node i are at indptr[i] up to indptr[i + 1]), and
+             "neighbor_ids", "weights", "my_ifs" and "next_hop_ifs", each an array of length twice the number of edges
+    """
+    indptr = np.zeros(num_nodes + 1, dtype=int)
+    neighbor_ids = []
+    weights = []
+    my_ifs = []
+    next_hop_ifs = []
+    for node_id in range(num_nodes):
+        for neighbor_id in graph.neighbors(node_id):
+            neighbor_ids.append(neighbor_id)
+            weights.append(graph.edges[(node_id, neighbor_id)]["weight"])
+            my_ifs.append(neighbor_to_if[(node_id, neighbor_id)])
+            next_hop_ifs.append(neighbor_to_if[(neighbor_id, node_id)])
+        indptr[node_id + 1] = len(neighbor_ids)
+    return {
+        "indptr": indptr,
+        "neighbor_ids": np.array(neighbor_ids, dtype=int),
+        "weights": np.array(weights, dtype=float),
+        "my_ifs": np.array(my_ifs, dtype=int),
+        "next_hop_ifs": np.array(next_hop_ifs, dtype=int),
+    }
 
 
 def calculate_fstate_shortest_path_without_gs_relaying(
@@ -13,141 +144,398 @@ def calculate_fstate_shortest_path_without_gs_relaying(
         ground_station_satellites_in_range_candidates,
         sat_neighbor_to_if,
         prev_fstate,
-        enable_verbose_logs
+        enable_verbose_logs,
+        incremental_shortest_paths_state=None,
+        plus_grid_symmetry_state=None,
+        max_multipath_next_hops=None,
+        multipath_cost_tolerance=DEFAULT_MULTIPATH_COST_TOLERANCE,
+        dst_gids=None,
+        dynamic_state_output=None
 ):
 
+    # Destination ground stations (all, unless it is scoped to those which receive traffic)
+    dst_gids = scoped_destination_gids(num_ground_stations, dst_gids)
+
     # Calculate shortest path distances
+    # Only the distances to satellites in range of a destination ground station are ever used
     if enable_verbose_logs:
-        print("  > Calculating Floyd-Warshall for graph without ground-station relays")
-    # (Note: Numpy has a deprecation warning here because of how networkx uses matrices)
-    dist_sat_net_without_gs = nx.floyd_warshall_numpy(sat_net_graph_only_satellites_with_isls)
+        print("  > Calculating Dijkstra for graph without ground-station relays")
+    dst_sats = sorted(set(
+        b[1] for dst_gid in dst_gids.tolist() for b in ground_station_satellites_in_range_candidates[dst_gid]
+    ))
+    if plus_grid_symmetry_state is not None:
+        dist_to_dst_sat = calculate_shortest_path_distances_to_with_symmetry(
+            plus_grid_symmetry_state, sat_net_graph_only_satellites_with_isls, num_satellites, dst_sats
+        )
+    elif incremental_shortest_paths_state is not None:
+        dist_to_dst_sat = calculate_shortest_path_distances_to_incrementally(
+            incremental_shortest_paths_state, sat_net_graph_only_satellites_with_isls, num_satellites, dst_sats
+        )
+    else:
+        dist_to_dst_sat = calculate_shortest_path_distances_to(
+            sat_net_graph_only_satellites_with_isls, num_satellites, dst_sats
+        )
+
+    # Neighbors of each satellite (in the order of the graph, which determines how ties are broken)
+    padded_neighbors = create_padded_neighbor_arrays(
+        sat_net_graph_only_satellites_with_isls, num_satellites, sat_neighbor_to_if
+    )
 
     # Forwarding state
-    fstate = {}
+    fstate = create_forwarding_state(num_satellites, num_ground_stations)
+
+    # Satellites in range of each ground station
+    # (of which only those of the destination ground stations are in dst_sats)
+    candidate_indptr, candidate_satellite_ids, candidate_distances_m = create_candidate_arrays(
+        ground_station_satellites_in_range_candidates, sort_by_satellite_id=True
+    )
+    num_isls_per_sat_array = np.array(num_isls_per_sat, dtype=np.int64)
+    gid_to_sat_gsl_if_idx_array = np.array(gid_to_sat_gsl_if_idx, dtype=np.int64)
+
+    # Satellites to ground stations
+    # From the satellites attached to the destination ground station,
+    # select the one which promises the shortest path to the destination ground station (getting there + last hop),
+    # and if the current node is not that satellite, the neighbor which promises the lowest distance to reach it
+    # (with (-1, -1, -1) if the ground station cannot be reached)
+    dist_satellite_to_ground_station = np.full((num_satellites, num_ground_stations), math.inf)
+    select_satellite_next_hops_to_ground_stations(
+        dist_to_dst_sat,
+        candidate_indptr,
+        np.searchsorted(np.array(dst_sats, dtype=np.int64), candidate_satellite_ids),
+        candidate_satellite_ids,
+        candidate_distances_m,
+        padded_neighbors["neighbor_ids"],
+        padded_neighbors["weights"],
+        padded_neighbors["my_ifs"],
+        padded_neighbors["next_hop_ifs"],
+        num_isls_per_sat_array,
+        gid_to_sat_gsl_if_idx_array,
+        dst_gids,
+        fstate["next_hops"][0:num_satellites],
+        dist_satellite_to_ground_station
+    )
+
+    # Ground stations to ground stations
+    # Choose the source satellite which promises the shortest path
+    select_ground_station_next_hops(
+        candidate_indptr,
+        candidate_satellite_ids,
+        candidate_distances_m,
+        np.zeros((num_satellites, num_ground_stations)),
+        dist_satellite_to_ground_station,
+        num_isls_per_sat_array,
+        gid_to_sat_gsl_if_idx_array,
+        dst_gids,
+        fstate["next_hops"][num_satellites:]
+    )
+
+    # Now write the entries which changed to file
+    if dynamic_state_output is None:
+        dynamic_state_output = create_dynamic_state_output()
+    output_filename = forwarding_state_filename(
+        output_dynamic_state_dir, time_since_epoch_ns, dynamic_state_output["fstate_format"]
+    )
+    if enable_verbose_logs:
+        print("  > Writing forwarding state to: " + output_filename)
+    write_forwarding_state_delta_file(
+        output_filename, fstate, prev_fstate, dst_gids, dynamic_state_output["archive"],
+        dynamic_state_output["compression"], dynamic_state_output["writer"]
+    )
+
+    # Multipath forwarding state, of which also only the entries which changed are written to file
+    if max_multipath_next_hops is not None:
+        fstate["multipath"] = calculate_multipath_fstate_without_gs_relaying(
+            num_satellites,
+            num_ground_stations,
+            num_isls_per_sat,
+            gid_to_sat_gsl_if_idx,
+            ground_station_satellites_in_range_candidates,
+            padded_neighbors,
+            dist_satellite_to_ground_station,
+            max_multipath_next_hops,
+            multipath_cost_tolerance,
+            dst_gids
+        )
+        output_filename = "fstate_multipath_" + str(time_since_epoch_ns) + ".txt"
+        if enable_verbose_logs:
+            print("  > Writing multipath forwarding state to: " + output_dynamic_state_dir + "/" + output_filename)
+        with open_dynamic_state_output_file(dynamic_state_output, output_dynamic_state_dir, output_filename) as f_out:
+            write_multipath_forwarding_state_delta(
+                f_out,
+                fstate["multipath"],
+                prev_fstate["multipath"] if prev_fstate is not None and "multipath" in prev_fstate else None,
+                dst_gids
+            )
 
-    # Now write state to file for complete graph
-    output_filename = output_dynamic_state_dir + "/fstate_" + str(time_since_epoch_ns) + ".txt"
+    # Finally return result
+    return fstate
+
+
+def calculate_multipath_fstate_without_gs_relaying(
+        num_satellites,
+        num_ground_stations,
+        num_isls_per_sat,
+        gid_to_sat_gsl_if_idx,
+        ground_station_satellites_in_range_candidates,
+        padded_neighbors,
+        dist_satellite_to_ground_station,
+        max_next_hops,
+        cost_tolerance=DEFAULT_MULTIPATH_COST_TOLERANCE,
+        dst_gids=None
+):
+    """
+    Calculate a multipath forwarding state, in which every node has up to max_next_hops next hops
+    to each destination ground station among which the traffic is split equally.
+
+    The shortest path distance of every satellite to every ground station is re-used for all pairs,
+    instead of calculating k shortest paths for each pair separately. A satellite only forwards to
+    neighbors which are strictly closer to the destination ground station than itself (including the
+    ground station itself if it is in range), such that any combination of next hops is free of loops.
+    Of those, only the near-equal-cost ones are used: the distance via the next hop must be at most
+    (1 + cost_tolerance) times the shortest distance via any of them, such that no traffic is split onto
+    a much longer path. These are ranked by the distance via them (the first in case of a tie, with the
+    ground station itself first), such that the first next hop is on a shortest path. A ground station
+    ranks the satellites in range in the same way (the lowest satellite identifier in case of a tie),
+    with the same tolerance.
+
+    :param num_satellites:                                 Number of satellites
+    :param num_ground_stations:                            Number of ground stations
+    :param num_isls_per_sat:                               List with the number of ISLs of each satellite
+    :param gid_to_sat_gsl_if_idx:                          List with the GSL interface index of each ground station
+    :param ground_station_satellites_in_range_candidates:  List with for each ground station a list of
+                                                           (distance, satellite identifier) in range
+    :param padded_neighbors:                               Neighbors of the satellites over ISLs
+                                                           (as returned by create_padded_neighbor_arrays())
+    :param dist_satellite_to_ground_station:               Numpy array of shape (number of satellites, number of
+                                                           ground stations) with the shortest path distance
+                                                           (inf if the ground station cannot be reached)
+    :param max_next_hops:                                  Maximum number of next hops of a node to a destination
+    :param cost_tolerance:                                 Fraction by which the distance via a next hop may be longer
+                                                           than via the best next hop (math.inf to use every
+                                                           strictly closer next hop)
+    :param dst_gids:                                       Destination ground station identifiers (if None, all)
+
+    :return: Multipath forwarding state (as returned by create_multipath_forwarding_state())
+    """
+    multipath_fstate = create_multipath_forwarding_state(num_satellites, num_ground_stations, max_next_hops)
+    num_possible_next_hops = padded_neighbors["neighbor_ids"].shape[1] + 1
+    num_selected = min(max_next_hops, num_possible_next_hops)
+    satellite_ids = np.arange(num_satellites)
+
+    # Satellites to ground stations
+    # The ground station itself (if in range) and then the neighbors over ISLs are possible next hops
+    possible_next_hop_ids = np.zeros((num_satellites, num_possible_next_hops), dtype=int)
+    possible_next_hop_ids[:, 1:] = padded_neighbors["neighbor_ids"]
+    possible_my_ifs = np.zeros((num_satellites, num_possible_next_hops), dtype=int)
+    possible_my_ifs[:, 1:] = padded_neighbors["my_ifs"]
+    possible_next_hop_ifs = np.zeros((num_satellites, num_possible_next_hops), dtype=int)
+    possible_next_hop_ifs[:, 1:] = padded_neighbors["next_hop_ifs"]
+    distance_via_next_hop_m = np.full((num_satellites, num_possible_next_hops), math.inf)
+    for dst_gid in scoped_destination_gids(num_ground_stations, dst_gids).tolist():
+        distance_to_ground_station_m = dist_satellite_to_ground_station[:, dst_gid]
+
+        # Last hop to the ground station itself
+        possible_next_hop_ids[:, 0] = num_satellites + dst_gid
+        possible_my_ifs[:, 0] = np.array(num_isls_per_sat) + gid_to_sat_gsl_if_idx[dst_gid]
+        distance_via_next_hop_m[:, 0] = math.inf
+        for b in ground_station_satellites_in_range_candidates[dst_gid]:
+            distance_via_next_hop_m[b[1], 0] = b[0]
+
+        # Neighbors which are strictly closer to the ground station
+        distance_of_neighbor_m = distance_to_ground_station_m[padded_neighbors["neighbor_ids"]]
+        distance_via_next_hop_m[:, 1:] = np.where(
+            distance_of_neighbor_m < distance_to_ground_station_m[:, np.newaxis],
+            padded_neighbors["weights"] + distance_of_neighbor_m,
+            math.inf
+        )
+        distance_via_next_hop_m[distance_via_next_hop_m >= 1000000000000000] = math.inf
+
+        # Only those of near-equal cost to the best one
+        max_distance_via_next_hop_m = (1.0 + cost_tolerance) * np.min(distance_via_next_hop_m, axis=1)
+        distance_via_next_hop_m[distance_via_next_hop_m > max_distance_via_next_hop_m[:, np.newaxis]] = math.inf
+
+        # Select the best ones
+        selected = np.argsort(distance_via_next_hop_m, axis=1, kind="stable")[:, 0:num_selected]
+        is_valid = ~np.isinf(distance_via_next_hop_m[satellite_ids[:, np.newaxis], selected])
+        multipath_fstate["next_hops"][0:num_satellites, dst_gid, 0:num_selected] = np.where(
+            is_valid[:, :, np.newaxis],
+            np.stack((
+                possible_next_hop_ids[satellite_ids[:, np.newaxis], selected],
+                possible_my_ifs[satellite_ids[:, np.newaxis], selected],
+                possible_next_hop_ifs[satellite_ids[:, np.newaxis], selected]
+            ), axis=2),
+            -1
+        )
+        multipath_fstate["weights"][0:num_satellites, dst_gid, 0:num_selected] = (
+            is_valid / np.maximum(np.sum(is_valid, axis=1), 1)[:, np.newaxis]
+        )
+
+    # Ground stations to ground stations
+    # The satellites in range which can reach the destination ground station are possible next hops
+    for src_gid in range(num_ground_stations):
+        possible_src_sats = sorted(ground_station_satellites_in_range_candidates[src_gid], key=lambda a: a[1])
+        if len(possible_src_sats) == 0:
+            continue
+        src_sat_ids = np.array([a[1] for a in possible_src_sats])
+        distance_via_src_sat_m = (
+            np.array([a[0] for a in possible_src_sats])[:, np.newaxis]
+            +
+            dist_satellite_to_ground_station[src_sat_ids, :]
+        )
+        max_distance_via_src_sat_m = (1.0 + cost_tolerance) * np.min(distance_via_src_sat_m, axis=0)
+        distance_via_src_sat_m[distance_via_src_sat_m > max_distance_via_src_sat_m[np.newaxis, :]] = math.inf
+        selected = np.argsort(distance_via_src_sat_m, axis=0, kind="stable")[0:max_next_hops, :]
+        is_valid = ~np.isinf(distance_via_src_sat_m[selected, np.arange(num_ground_stations)])
+        is_valid[:, src_gid] = False
+        selected_sat_ids = src_sat_ids[selected]
+        num_src_selected = selected.shape[0]
+        multipath_fstate["next_hops"][num_satellites + src_gid, :, 0:num_src_selected] = np.where(
+            is_valid.T[:, :, np.newaxis],
+            np.stack((
+                selected_sat_ids.T,
+                np.zeros(selected_sat_ids.T.shape, dtype=int),
+                np.array(num_isls_per_sat)[selected_sat_ids.T] + gid_to_sat_gsl_if_idx[src_gid]
+            ), axis=2),
+            -1
+        )
+        multipath_fstate["weights"][num_satellites + src_gid, :, 0:num_src_selected] = (
+            is_valid.T / np.maximum(np.sum(is_valid, axis=0), 1)[:, np.newaxis]
+        )
+
+    return multipath_fstate
+
+
+def calculate_fstate_fewest_hops_without_gs_relaying(
+        output_dynamic_state_dir,
+        time_since_epoch_ns,
+        num_satellites,
+        num_ground_stations,
+        sat_net_graph_only_satellites_with_isls,
+        num_isls_per_sat,
+        gid_to_sat_gsl_if_idx,
+        ground_station_satellites_in_range_candidates,
+        sat_neighbor_to_if,
+        prev_fstate,
+        enable_verbose_logs,
+        fewest_hops_state,
+        dst_gids=None,
+        dynamic_state_output=None
+):
+
+    # Destination ground stations (all, unless it is scoped to those which receive traffic)
+    dst_gids = scoped_destination_gids(num_ground_stations, dst_gids)
+
+    # Neighbors of each satellite (in the order of the graph, which determines how ties are broken)
+    padded_neighbors = create_padded_neighbor_arrays(
+        sat_net_graph_only_satellites_with_isls, num_satellites, sat_neighbor_to_if
+    )
+    satellite_ids = np.arange(num_satellites)
+
+    # Calculate the fewest hops and the shortest distance over those
+    # Only those to satellites in range of a destination ground station are ever used
+    if enable_verbose_logs:
+        print("  > Calculating distances over fewest hops for graph without ground-station relays")
+    dst_sats = sorted(set(
+        b[1] for dst_gid in dst_gids.tolist() for b in ground_station_satellites_in_range_candidates[dst_gid]
+    ))
+    dst_sat_to_idx = dict((sid, idx) for (idx, sid) in enumerate(dst_sats))
+    hops_to_dst_sat, dist_to_dst_sat = calculate_fewest_hops_distances_to(fewest_hops_state, padded_neighbors, dst_sats)
+
+    # Forwarding state
+    fstate = create_forwarding_state(num_satellites, num_ground_stations)
+
+    # Satellites to ground stations
+    # From the satellites attached to the destination ground station, select the one which promises
+    # the fewest hops, and among those the shortest path to the destination ground station (getting there + last hop)
+    # (calculated for all satellites at once, with (-1, -1, -1) if the ground station cannot be reached)
+    hops_satellite_to_ground_station = np.full((num_satellites, num_ground_stations), math.inf)
+    dist_satellite_to_ground_station = np.full((num_satellites, num_ground_stations), math.inf)
+    next_hop_satellite_to_ground_station = fstate["next_hops"][0:num_satellites]
+    for dst_gid in dst_gids.tolist():
+        dst_gs_node_id = num_satellites + dst_gid
+
+        # Among the satellites in range of the destination ground station, find the one which promises
+        # the fewest hops, and then the shortest distance (the lowest satellite identifier in case of a tie)
+        possible_dst_sats = sorted(ground_station_satellites_in_range_candidates[dst_gid], key=lambda b: b[1])
+        if len(possible_dst_sats) == 0:
+            continue
+        possible_dst_sat_idxs = np.array([dst_sat_to_idx[b[1]] for b in possible_dst_sats])
+        possible_hops = hops_to_dst_sat[possible_dst_sat_idxs, :].astype(float)
+        possible_hops[possible_hops < 0] = math.inf
+        fewest_hops = np.min(possible_hops, axis=0)
+        possibilities = np.where(
+            possible_hops == fewest_hops,
+            dist_to_dst_sat[possible_dst_sat_idxs, :] + np.array([b[0] for b in possible_dst_sats])[:, np.newaxis],
+            math.inf
+        )
+        best_possibility = np.argmin(possibilities, axis=0)
+        best_dst_sat_idx = possible_dst_sat_idxs[best_possibility]
+        dst_sat = np.array([b[1] for b in possible_dst_sats])[best_possibility]
+        distance_to_ground_station_m = possibilities[best_possibility, satellite_ids]
+        is_reachable = ~np.isinf(distance_to_ground_station_m)
+
+        # If the current node is not that satellite, among its neighbors which are one hop closer to it,
+        # find the one which promises the lowest distance to reach it (the first in case of a tie)
+        distance_via_neighbor_m = (
+            padded_neighbors["weights"]
+            +
+            dist_to_dst_sat[best_dst_sat_idx[:, np.newaxis], padded_neighbors["neighbor_ids"]]
+        )
+        distance_via_neighbor_m[~fewest_hops_state["is_closer"][dst_sat, satellite_ids]] = math.inf
+        best_neighbor = np.argmin(distance_via_neighbor_m, axis=1)
+        is_via_neighbor = (
+            is_reachable
+            & (dst_sat != satellite_ids)
+            & (distance_via_neighbor_m[satellite_ids, best_neighbor] < 1000000000000000)
+        )
+        next_hop_satellite_to_ground_station[is_via_neighbor, dst_gid] = np.stack((
+            padded_neighbors["neighbor_ids"][satellite_ids, best_neighbor],
+            padded_neighbors["my_ifs"][satellite_ids, best_neighbor],
+            padded_neighbors["next_hop_ifs"][satellite_ids, best_neighbor]
+        ), axis=1)[is_via_neighbor]
+
+        # If it is that satellite, the next hop is the ground station itself
+        is_dst_sat = is_reachable & (dst_sat == satellite_ids)
+        next_hop_satellite_to_ground_station[is_dst_sat, dst_gid, 0] = dst_gs_node_id
+        next_hop_satellite_to_ground_station[is_dst_sat, dst_gid, 1] = (
+            np.array(num_isls_per_sat)[is_dst_sat] + gid_to_sat_gsl_if_idx[dst_gid]
+        )
+        next_hop_satellite_to_ground_station[is_dst_sat, dst_gid, 2] = 0
+
+        # In any case, save the hops and distance of the satellite to the ground station to re-use
+        # when we calculate ground station to ground station forwarding
+        hops_satellite_to_ground_station[:, dst_gid] = np.where(is_reachable, fewest_hops, math.inf)
+        dist_satellite_to_ground_station[:, dst_gid] = distance_to_ground_station_m
+
+    # Ground stations to ground stations
+    # Choose the source satellite which promises the fewest hops, and among those the shortest path
+    candidate_indptr, candidate_satellite_ids, candidate_distances_m = create_candidate_arrays(
+        ground_station_satellites_in_range_candidates, sort_by_satellite_id=False
+    )
+    select_ground_station_next_hops(
+        candidate_indptr,
+        candidate_satellite_ids,
+        candidate_distances_m,
+        hops_satellite_to_ground_station,
+        dist_satellite_to_ground_station,
+        np.array(num_isls_per_sat, dtype=np.int64),
+        np.array(gid_to_sat_gsl_if_idx, dtype=np.int64),
+        dst_gids,
+        fstate["next_hops"][num_satellites:]
+    )
+
+    # Now write the entries which changed to file
+    if dynamic_state_output is None:
+        dynamic_state_output = create_dynamic_state_output()
+    output_filename = forwarding_state_filename(
+        output_dynamic_state_dir, time_since_epoch_ns, dynamic_state_output["fstate_format"]
+    )
     if enable_verbose_logs:
         print("  > Writing forwarding state to: " + output_filename)
-    with open(output_filename, "w+") as f_out:
-
-        # Satellites to ground stations
-        # From the satellites attached to the destination ground station,
-        # select the one which promises the shortest path to the destination ground station (getting there + last hop)
-        dist_satellite_to_ground_station = {}
-        for curr in range(num_satellites):
-            for dst_gid in range(num_ground_stations):
-                dst_gs_node_id = num_satellites + dst_gid
-
-                # Among the satellites in range of the destination ground station,
-                # find the one which promises the shortest distance
-                possible_dst_sats = ground_station_satellites_in_range_candidates[dst_gid]
-                possibilities = []
-                for b in possible_dst_sats:
-                    if not math.isinf(dist_sat_net_without_gs[(curr, b[1])]):  # Must be reachable
-                        possibilities.append(
-                            (
-                                dist_sat_net_without_gs[(curr, b[1])] + b[0],
-                                b[1]
-                            )
-                        )
-                possibilities = list(sorted(possibilities))
-
-                # By default, if there is no satellite in range for the
-                # destination ground station, it will be dropped (indicated by -1)
-                next_hop_decision = (-1, -1, -1)
-                distance_to_ground_station_m = float("inf")
-                if len(possibilities) > 0:
-                    dst_sat = possibilities[0][1]
-                    distance_to_ground_station_m = possibilities[0][0]
-
-                    # If the current node is not that satellite, determine how to get to the satellite
-                    if curr != dst_sat:
-
-                        # Among its neighbors, find the one which promises the
-                        # lowest distance to reach the destination satellite
-                        best_distance_m = 1000000000000000
-                        for neighbor_id in sat_net_graph_only_satellites_with_isls.neighbors(curr):
-                            distance_m = (
-                                    sat_net_graph_only_satellites_with_isls.edges[(curr, neighbor_id)]["weight"]
-                                    +
-                                    dist_sat_net_without_gs[(neighbor_id, dst_sat)]
-                            )
-                            if distance_m < best_distance_m:
-                                next_hop_decision = (
-                                    neighbor_id,
-                                    sat_neighbor_to_if[(curr, neighbor_id)],
-                                    sat_neighbor_to_if[(neighbor_id, curr)]
-                                )
-                                best_distance_m = distance_m
-
-                    else:
-                        # This is the destination satellite, as such the next hop is the ground station itself
-                        next_hop_decision = (
-                            dst_gs_node_id,
-                            num_isls_per_sat[dst_sat] + gid_to_sat_gsl_if_idx[dst_gid],
-                            0
-                        )
-
-                # In any case, save the distance of the satellite to the ground station to re-use
-                # when we calculate ground station to ground station forwarding
-                dist_satellite_to_ground_station[(curr, dst_gs_node_id)] = distance_to_ground_station_m
-
-                # Write to forwarding state
-                if not prev_fstate or prev_fstate[(curr, dst_gs_node_id)] != next_hop_decision:
-                    f_out.write("%d,%d,%d,%d,%d\n" % (
-                        curr,
-                        dst_gs_node_id,
-                        next_hop_decision[0],
-                        next_hop_decision[1],
-                        next_hop_decision[2]
-                    ))
-                fstate[(curr, dst_gs_node_id)] = next_hop_decision
-
-        # Ground stations to ground stations
-        # Choose the source satellite which promises the shortest path
-        for src_gid in range(num_ground_stations):
-            for dst_gid in range(num_ground_stations):
-                if src_gid != dst_gid:
-                    src_gs_node_id = num_satellites + src_gid
-                    dst_gs_node_id = num_satellites + dst_gid
-
-                    # Among the satellites in range of the source ground station,
-                    # find the one which promises the shortest distance
-                    possible_src_sats = ground_station_satellites_in_range_candidates[src_gid]
-                    possibilities = []
-                    for a in possible_src_sats:
-                        best_distance_offered_m = dist_satellite_to_ground_station[(a[1], dst_gs_node_id)]
-                        if not math.isinf(best_distance_offered_m):
-                            possibilities.append(
-                                (
-                                    a[0] + best_distance_offered_m,
-                                    a[1]
-                                )
-                            )
-                    possibilities = sorted(possibilities)
-
-                    # By default, if there is no satellite in range for one of the
-                    # ground stations, it will be dropped (indicated by -1)
-                    next_hop_decision = (-1, -1, -1)
-                    if len(possibilities) > 0:
-                        src_sat_id = possibilities[0][1]
-                        next_hop_decision = (
-                            src_sat_id,
-                            0,
-                            num_isls_per_sat[src_sat_id] + gid_to_sat_gsl_if_idx[src_gid]
-                        )
-
-                    # Update forwarding state
-                    if not prev_fstate or prev_fstate[(src_gs_node_id, dst_gs_node_id)] != next_hop_decision:
-                        f_out.write("%d,%d,%d,%d,%d\n" % (
-                            src_gs_node_id,
-                            dst_gs_node_id,
-                            next_hop_decision[0],
-                            next_hop_decision[1],
-                            next_hop_decision[2]
-                        ))
-                    fstate[(src_gs_node_id, dst_gs_node_id)] = next_hop_decision
+    write_forwarding_state_delta_file(
+        output_filename, fstate, prev_fstate, dst_gids, dynamic_state_output["archive"],
+        dynamic_state_output["compression"], dynamic_state_output["writer"]
+    )
 
     # Finally return result
     return fstate
@@ -163,99 +551,116 @@ def calculate_fstate_shortest_path_with_gs_relaying(
         gid_to_sat_gsl_if_idx,
         sat_neighbor_to_if,
         prev_fstate,
-        enable_verbose_logs
+        enable_verbose_logs,
+        num_threads=1,
+        dst_gids=None,
+        dynamic_state_output=None
 ):
 
-    # Calculate shortest paths
-    if enable_verbose_logs:
-        print("  > Calculating Floyd-Warshall for graph including ground-station relays")
-    # (Note: Numpy has a deprecation warning here because of how networkx uses matrices)
-    dist_sat_net = nx.floyd_warshall_numpy(sat_net_graph)
+    # Destination ground stations (all, unless it is scoped to those which receive traffic)
+    dst_gids = scoped_destination_gids(num_ground_stations, dst_gids)
+
+    # Interface identifiers of each node to each of its neighbors
+    # (the one of the neighbor back is the next-hop incoming interface)
+    neighbor_to_if = {}
+    for (a, b) in sat_net_graph.edges():
+        for (current_node_id, neighbor_id) in [(a, b), (b, a)]:
+            if current_node_id >= num_satellites and neighbor_id < num_satellites:  # GS to sat.
+                neighbor_to_if[(current_node_id, neighbor_id)] = 0
+            elif current_node_id < num_satellites and neighbor_id >= num_satellites:  # Sat. to GS
+                neighbor_to_if[(current_node_id, neighbor_id)] = (
+                    num_isls_per_sat[current_node_id]
+                    +
+                    gid_to_sat_gsl_if_idx[neighbor_id - num_satellites]
+                )
+            elif current_node_id < num_satellites and neighbor_id < num_satellites:  # Sat. to sat.
+                neighbor_to_if[(current_node_id, neighbor_id)] = sat_neighbor_to_if[(current_node_id, neighbor_id)]
+            else:  # GS to GS
+                raise ValueError("GS-to-GS link cannot exist")
+
+    # Neighbors of each node (in the order of the graph, which determines how ties are broken)
+    num_nodes = num_satellites + num_ground_stations
+    neighbor_edges = create_neighbor_edge_arrays(sat_net_graph, num_nodes, neighbor_to_if)
+    edge_node_ids = np.repeat(np.arange(num_nodes), np.diff(neighbor_edges["indptr"]))
+    edge_idxs = np.arange(len(edge_node_ids))
+
+    # Only nodes with neighbors can have a next hop, as their edges are consecutive
+    # each of them is a segment which starts where the one of the previous node ends
+    node_ids_with_neighbors = np.flatnonzero(np.diff(neighbor_edges["indptr"]) > 0)
+    segment_starts = neighbor_edges["indptr"][node_ids_with_neighbors]
+
+    # Sparse adjacency matrix (the same for all destinations)
+    adjacency = csr_array(
+        (neighbor_edges["weights"], neighbor_edges["neighbor_ids"], neighbor_edges["indptr"]),
+        shape=(num_nodes, num_nodes)
+    )
 
     # Forwarding state
-    fstate = {}
-
-    # Now write state to file for complete graph
-    output_filename = output_dynamic_state_dir + "/fstate_" + str(time_since_epoch_ns) + ".txt"
+    fstate = create_forwarding_state(num_satellites, num_ground_stations)
+
+    def calculate_for_destinations(dst_gids):
+
+        # Calculate shortest paths
+        # Only the distances to the ground stations are ever used
+        dst_gids = np.array(dst_gids, dtype=int)
+        dist_to_dst_gs = dijkstra(adjacency, directed=False, indices=num_satellites + dst_gids)
+
+        # Among its neighbors, find for each node the one which promises the lowest distance
+        # to reach each destination ground station (the first in case of a tie)
+        distance_via_edge_m = neighbor_edges["weights"] + dist_to_dst_gs[:, neighbor_edges["neighbor_ids"]]
+        best_distance_m = np.minimum.reduceat(distance_via_edge_m, segment_starts, axis=1)
+        best_edge_idx = np.minimum.reduceat(
+            np.where(
+                distance_via_edge_m == best_distance_m[:, np.searchsorted(node_ids_with_neighbors, edge_node_ids)],
+                edge_idxs,
+                len(edge_idxs)
+            ),
+            segment_starts,
+            axis=1
+        )
+
+        # Cannot forward to itself
+        has_next_hop = best_distance_m < 1000000000000000
+        has_next_hop &= node_ids_with_neighbors != (num_satellites + dst_gids)[:, np.newaxis]
+
+        # Set in forwarding state
+        (dst_idxs, node_idxs) = np.nonzero(has_next_hop)
+        edge_idxs_taken = best_edge_idx[dst_idxs, node_idxs]
+        fstate["next_hops"][node_ids_with_neighbors[node_idxs], dst_gids[dst_idxs]] = np.stack((
+            neighbor_edges["neighbor_ids"][edge_idxs_taken],  # Next-hop node identifier
+            neighbor_edges["my_ifs"][edge_idxs_taken],        # My outgoing interface id
+            neighbor_edges["next_hop_ifs"][edge_idxs_taken]   # Next-hop incoming interface id
+        ), axis=1)
+
+    # Satellites and ground stations to ground stations
+    # (the destinations are split into blocks, each of which can be calculated by a different thread)
+    if enable_verbose_logs:
+        print("  > Calculating Dijkstra for graph including ground-station relays")
+    dst_gid_blocks = [
+        dst_gids[start:(start + GS_RELAYING_DESTINATIONS_PER_BLOCK)].tolist()
+        for start in range(0, len(dst_gids), GS_RELAYING_DESTINATIONS_PER_BLOCK)
+    ]
+    if num_threads > 1 and len(dst_gid_blocks) > 1:
+        pool = ThreadPool(num_threads)
+        pool.map(calculate_for_destinations, dst_gid_blocks)
+        pool.close()
+        pool.join()
+    else:
+        for block_dst_gids in dst_gid_blocks:
+            calculate_for_destinations(block_dst_gids)
+
+    # Now write the entries which changed to file
+    if dynamic_state_output is None:
+        dynamic_state_output = create_dynamic_state_output()
+    output_filename = forwarding_state_filename(
+        output_dynamic_state_dir, time_since_epoch_ns, dynamic_state_output["fstate_format"]
+    )
     if enable_verbose_logs:
         print("  > Writing forwarding state to: " + output_filename)
-    with open(output_filename, "w+") as f_out:
-
-        # Satellites and ground stations to ground stations
-        for current_node_id in range(num_satellites + num_ground_stations):
-            for dst_gid in range(num_ground_stations):
-                dst_gs_node_id = num_satellites + dst_gid
-
-                # Cannot forward to itself
-                if current_node_id != dst_gs_node_id:
-
-                    # Among its neighbors, find the one which promises the
-                    # lowest distance to reach the destination satellite
-                    next_hop_decision = (-1, -1, -1)
-                    best_distance_m = 1000000000000000
-                    for neighbor_id in sat_net_graph.neighbors(current_node_id):
-
-                        # Any neighbor must be reachable
-                        if math.isinf(dist_sat_net[(current_node_id, neighbor_id)]):
-                            raise ValueError("Neighbor cannot be unreachable")
-
-                        # Calculate distance = next-hop + distance the next hop node promises
-                        distance_m = (
-                            sat_net_graph.edges[(current_node_id, neighbor_id)]["weight"]
-                            +
-                            dist_sat_net[(neighbor_id, dst_gs_node_id)]
-                        )
-                        if (
-                                not math.isinf(dist_sat_net[(neighbor_id, dst_gs_node_id)])
-                                and
-                                distance_m < best_distance_m
-                        ):
-
-                            # Check node identifiers to determine what are the
-                            # correct interface identifiers
-                            if current_node_id >= num_satellites and neighbor_id < num_satellites:  # GS to sat.
-                                my_if = 0
-                                next_hop_if = (
-                                    num_isls_per_sat[neighbor_id]
-                                    +
-                                    gid_to_sat_gsl_if_idx[current_node_id - num_satellites]
-                                )
-
-                            elif current_node_id < num_satellites and neighbor_id >= num_satellites:  # Sat. to GS
-                                my_if = (
-                                    num_isls_per_sat[current_node_id]
-                                    +
-                                    gid_to_sat_gsl_if_idx[neighbor_id - num_satellites]
-                                )
-                                next_hop_if = 0
-
-                            elif current_node_id < num_satellites and neighbor_id < num_satellites:  # Sat. to sat.
-                                my_if = sat_neighbor_to_if[(current_node_id, neighbor_id)]
-                                next_hop_if = sat_neighbor_to_if[(neighbor_id, current_node_id)]
-
-                            else:  # GS to GS
-                                raise ValueError("GS-to-GS link cannot exist")
-
-                            # Write the next-hop decision
-                            next_hop_decision = (
-                                neighbor_id,  # Next-hop node identifier
-                                my_if,        # My outgoing interface id
-                                next_hop_if   # Next-hop incoming interface id
-                            )
-
-                            # Update best distance found
-                            best_distance_m = distance_m
-
-                    # Write to forwarding state
-                    if not prev_fstate or prev_fstate[(current_node_id, dst_gs_node_id)] != next_hop_decision:
-                        f_out.write("%d,%d,%d,%d,%d\n" % (
-                            current_node_id,
-                            dst_gs_node_id,
-                            next_hop_decision[0],
-                            next_hop_decision[1],
-                            next_hop_decision[2]
-                        ))
-                    fstate[(current_node_id, dst_gs_node_id)] = next_hop_decision
+    write_forwarding_state_delta_file(
+        output_filename, fstate, prev_fstate, dst_gids, dynamic_state_output["archive"],
+        dynamic_state_output["compression"], dynamic_state_output["writer"]
+    )
 
     # Finally return result
     return fstate
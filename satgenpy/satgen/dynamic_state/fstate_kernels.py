@@ -0,0 +1,466 @@
+# The MIT License (MIT)
+#
+# Copyright (c) 2020 ETH Zurich
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+import functools
+import math
+import os
+import numpy as np
+
+# Numba is optional: if it is installed, the kernels are compiled (without the global interpreter lock,
+# such that the threads of help_dynamic_state() run them in parallel), else their numpy equivalents are run
+try:
+    import numba
+except ImportError:
+    numba = None
+
+# Whether the compiled kernels are used (see enable_jit_kernels())
+_jit_kernels_enabled = numba is not None
+
+# The compiled kernels are only cached on disk if a cache directory is set (NUMBA_CACHE_DIR), as else
+# numba writes its cache next to the source files, where a stale one can break the import
+_jit_kernels_cached = "NUMBA_CACHE_DIR" in os.environ
+
+
+def jit_kernels_available():
+    """
+    Check whether the kernels can be compiled, which is the case if numba is installed.
+
+    :return: True iff numba is installed
+    """
+    return numba is not None
+
+
+def enable_jit_kernels(enabled):
+    """
+    Select whether the compiled kernels or their numpy equivalents are used. Both produce exactly the same result.
+    By default, the compiled kernels are used if numba is installed.
+
+    :param enabled:  True to use the compiled kernels, False to use their numpy equivalents
+    """
+    global _jit_kernels_enabled
+    if enabled and numba is None:
+        raise ValueError("Kernels cannot be compiled as numba is not installed")
+    _jit_kernels_enabled = enabled
+
+
+def jit_kernel(numpy_function):
+    """
+    Decorate a kernel, which only takes numbers and numpy arrays, such that it is compiled with numba
+    (the first time it is called) if the compiled kernels are enabled. Else the numpy function is run instead,
+    as the loops of the kernel are slow in plain Python.
+
+    :param numpy_function:  Function which takes the same arguments and produces exactly the same result
+                            with numpy array operations
+
+    :return: Decorator which returns a kernel function which runs either the compiled kernel or the numpy function
+             (the plain Python kernel is kept as its loop_function)
+    """
+    def decorator(function):
+        compiled = None if numba is None else numba.njit(cache=_jit_kernels_cached, nogil=True)(function)
+
+        @functools.wraps(function)
+        def kernel(*args):
+            if _jit_kernels_enabled:
+                return compiled(*args)
+            return numpy_function(*args)
+
+        kernel.loop_function = function
+        return kernel
+
+    return decorator
+
+
+def create_candidate_arrays(ground_station_satellites_in_range_candidates, sort_by_satellite_id):
+    """
+    Put the satellites in range of each ground station into flat arrays, one ground station after the
+    other (as in a CSR matrix), such that the kernels can go over them.
+
+    :param ground_station_satellites_in_range_candidates:  List with for each ground station a list of
+                                                           (distance, satellite identifier) in range
+    :param sort_by_satellite_id:                           True to order the satellites in range of each ground
+                                                           station by identifier, False to keep them in order
+
+    :return: Tuple (indptr, satellite identifiers, distances), with the satellites in range of
+             ground station i at indptr[i] up to indptr[i + 1]
+    """
+    indptr = np.zeros(len(ground_station_satellites_in_range_candidates) + 1, dtype=np.int64)
+    satellite_ids = []
+    distances_m = []
+    for (gid, candidates) in enumerate(ground_station_satellites_in_range_candidates):
+        if sort_by_satellite_id:
+            candidates = sorted(candidates, key=lambda b: b[1])
+        for (distance_m, sid) in candidates:
+            satellite_ids.append(sid)
+            distances_m.append(distance_m)
+        indptr[gid + 1] = len(satellite_ids)
+    return indptr, np.array(satellite_ids, dtype=np.int64), np.array(distances_m, dtype=np.float64)
+
+
+def select_satellite_next_hops_to_ground_stations_with_numpy(
+        dist_to_dst_sat,
+        candidate_indptr,
+        candidate_dst_sat_idxs,
+        candidate_satellite_ids,
+        candidate_distances_m,
+        neighbor_ids,
+        neighbor_weights,
+        neighbor_my_ifs,
+        neighbor_next_hop_ifs,
+        num_isls_per_sat,
+        gid_to_sat_gsl_if_idx,
+        dst_gids,
+        next_hops,
+        dist_satellite_to_ground_station
+):
+    """
+    Same as select_satellite_next_hops_to_ground_stations(), but for all satellites at once with numpy.
+    """
+    num_satellites = dist_to_dst_sat.shape[1]
+    satellite_ids = np.arange(num_satellites)
+    for dst_gid in np.asarray(dst_gids).tolist():
+        start = candidate_indptr[dst_gid]
+        end = candidate_indptr[dst_gid + 1]
+        if start == end:
+            continue
+
+        # Satellite in range of the destination ground station which promises the shortest distance
+        possible_dst_sat_idxs = candidate_dst_sat_idxs[start:end]
+        possibilities = dist_to_dst_sat[possible_dst_sat_idxs, :] + candidate_distances_m[start:end, np.newaxis]
+        best_possibility = np.argmin(possibilities, axis=0)
+        dst_sat = candidate_satellite_ids[start:end][best_possibility]
+        distance_to_ground_station_m = possibilities[best_possibility, satellite_ids]
+        is_reachable = ~np.isinf(distance_to_ground_station_m)
+        dist_satellite_to_ground_station[is_reachable, dst_gid] = distance_to_ground_station_m[is_reachable]
+
+        # If it is that satellite, the next hop is the ground station itself
+        is_dst_sat = is_reachable & (dst_sat == satellite_ids)
+        next_hops[is_dst_sat, dst_gid, 0] = num_satellites + dst_gid
+        next_hops[is_dst_sat, dst_gid, 1] = num_isls_per_sat[is_dst_sat] + gid_to_sat_gsl_if_idx[dst_gid]
+        next_hops[is_dst_sat, dst_gid, 2] = 0
+
+        # Else, the neighbor which promises the lowest distance to reach it
+        distance_via_neighbor_m = (
+            neighbor_weights
+            +
+            dist_to_dst_sat[possible_dst_sat_idxs[best_possibility][:, np.newaxis], neighbor_ids]
+        )
+        best_neighbor = np.argmin(distance_via_neighbor_m, axis=1)
+        is_via_neighbor = (
+            is_reachable
+            & ~is_dst_sat
+            & (distance_via_neighbor_m[satellite_ids, best_neighbor] < 1000000000000000)
+        )
+        next_hops[is_via_neighbor, dst_gid] = np.stack((
+            neighbor_ids[satellite_ids, best_neighbor],
+            neighbor_my_ifs[satellite_ids, best_neighbor],
+            neighbor_next_hop_ifs[satellite_ids, best_neighbor]
+        ), axis=1)[is_via_neighbor]
+
+
+@jit_kernel(select_satellite_next_hops_to_ground_stations_with_numpy)
+def select_satellite_next_hops_to_ground_stations(
+        dist_to_dst_sat,
+        candidate_indptr,
+        candidate_dst_sat_idxs,
+        candidate_satellite_ids,
+        candidate_distances_m,
+        neighbor_ids,
+        neighbor_weights,
+        neighbor_my_ifs,
+        neighbor_next_hop_ifs,
+        num_isls_per_sat,
+        gid_to_sat_gsl_if_idx,
+        dst_gids,
+        next_hops,
+        dist_satellite_to_ground_station
+):
+    """
+    Select the next hop of every satellite to every ground station over the shortest path. Among the satellites
+    in range of the destination ground station, the one which promises the shortest distance (getting there + last
+    hop) is chosen (the first in case of a tie). If the satellite is not that one, the next hop is its neighbor which
+    promises the lowest distance to reach it (the first in case of a tie), else it is the ground station itself.
+
+    :param dist_to_dst_sat:                   Array of shape (number of destination satellites, number of satellites)
+                                              with the shortest path distances to the destination satellites
+    :param candidate_indptr:                  Indptr of the satellites in range of each ground station, ordered by
+                                              identifier (as returned by create_candidate_arrays())
+    :param candidate_dst_sat_idxs:            Row in dist_to_dst_sat of each satellite in range
+    :param candidate_satellite_ids:           Identifier of each satellite in range
+    :param candidate_distances_m:             Distance of each satellite in range to the ground station
+    :param neighbor_ids:                      Padded neighbor identifiers of each satellite
+                                              (as returned by create_padded_neighbor_arrays())
+    :param neighbor_weights:                  Padded ISL length to each neighbor
+    :param neighbor_my_ifs:                   Padded outgoing interface to each neighbor
+    :param neighbor_next_hop_ifs:             Padded incoming interface of each neighbor
+    :param num_isls_per_sat:                  Array with the number of ISLs of each satellite
+    :param gid_to_sat_gsl_if_idx:             Array with the GSL interface index of each ground station
+    :param dst_gids:                          Array with the destination ground station identifiers
+    :param next_hops:                         Array of shape (number of satellites, number of ground stations, 3)
+                                              in which the next-hop decisions are set (it is left as is if the
+                                              ground station cannot be reached)
+    :param dist_satellite_to_ground_station:  Array of shape (number of satellites, number of ground stations) in
+                                              which the shortest path distances are set (it is left as is if the
+                                              ground station cannot be reached)
+    """
+    num_satellites = dist_to_dst_sat.shape[1]
+    max_degree = neighbor_ids.shape[1]
+    for dst_gid in dst_gids:
+        start = candidate_indptr[dst_gid]
+        end = candidate_indptr[dst_gid + 1]
+        if start == end:
+            continue
+        for sid in range(num_satellites):
+
+            # Satellite in range of the destination ground station which promises the shortest distance
+            best_candidate = start
+            best_distance_m = dist_to_dst_sat[candidate_dst_sat_idxs[start], sid] + candidate_distances_m[start]
+            for c in range(start + 1, end):
+                distance_m = dist_to_dst_sat[candidate_dst_sat_idxs[c], sid] + candidate_distances_m[c]
+                if distance_m < best_distance_m:
+                    best_candidate = c
+                    best_distance_m = distance_m
+            if math.isinf(best_distance_m):
+                continue
+            dist_satellite_to_ground_station[sid, dst_gid] = best_distance_m
+
+            # If it is that satellite, the next hop is the ground station itself
+            if candidate_satellite_ids[best_candidate] == sid:
+                next_hops[sid, dst_gid, 0] = num_satellites + dst_gid
+                next_hops[sid, dst_gid, 1] = num_isls_per_sat[sid] + gid_to_sat_gsl_if_idx[dst_gid]
+                next_hops[sid, dst_gid, 2] = 0
+                continue
+
+            # Else, the neighbor which promises the lowest distance to reach it
+            dst_sat_idx = candidate_dst_sat_idxs[best_candidate]
+            best_neighbor = 0
+            best_distance_via_neighbor_m = (
+                neighbor_weights[sid, 0] + dist_to_dst_sat[dst_sat_idx, neighbor_ids[sid, 0]]
+            )
+            for i in range(1, max_degree):
+                distance_via_neighbor_m = neighbor_weights[sid, i] + dist_to_dst_sat[dst_sat_idx, neighbor_ids[sid, i]]
+                if distance_via_neighbor_m < best_distance_via_neighbor_m:
+                    best_neighbor = i
+                    best_distance_via_neighbor_m = distance_via_neighbor_m
+            if best_distance_via_neighbor_m < 1000000000000000:
+                next_hops[sid, dst_gid, 0] = neighbor_ids[sid, best_neighbor]
+                next_hops[sid, dst_gid, 1] = neighbor_my_ifs[sid, best_neighbor]
+                next_hops[sid, dst_gid, 2] = neighbor_next_hop_ifs[sid, best_neighbor]
+
+
+def select_ground_station_next_hops_with_numpy(
+        candidate_indptr,
+        candidate_satellite_ids,
+        candidate_distances_m,
+        hops_satellite_to_ground_station,
+        dist_satellite_to_ground_station,
+        num_isls_per_sat,
+        gid_to_sat_gsl_if_idx,
+        dst_gids,
+        next_hops
+):
+    """
+    Same as select_ground_station_next_hops(), but for all destinations of a source ground station at once with numpy.
+    """
+    dst_gids = np.asarray(dst_gids, dtype=np.int64)
+    num_ground_stations = len(candidate_indptr) - 1
+    for src_gid in range(num_ground_stations):
+        start = candidate_indptr[src_gid]
+        end = candidate_indptr[src_gid + 1]
+        if start == end:
+            continue
+        possible_src_sats = candidate_satellite_ids[start:end]
+        other_dst_gids = dst_gids[dst_gids != src_gid]
+
+        # Order the satellites in range by whether they can reach the destination, then the hops, then the
+        # distance (getting there + the rest) and then the identifier, and choose the first
+        best_distance_offered_m = dist_satellite_to_ground_station[possible_src_sats[:, np.newaxis], other_dst_gids]
+        is_unreachable = np.isinf(best_distance_offered_m)
+        best_possibility = np.lexsort((
+            np.broadcast_to(possible_src_sats[:, np.newaxis], best_distance_offered_m.shape),
+            candidate_distances_m[start:end, np.newaxis] + best_distance_offered_m,
+            hops_satellite_to_ground_station[possible_src_sats[:, np.newaxis], other_dst_gids],
+            is_unreachable
+        ), axis=0)[0]
+
+        # By default, if no satellite in range can reach the destination, it will be dropped (indicated by -1)
+        is_reachable = ~is_unreachable[best_possibility, np.arange(len(other_dst_gids))]
+        src_sat_ids = possible_src_sats[best_possibility[is_reachable]]
+        next_hops[src_gid, other_dst_gids[is_reachable], 0] = src_sat_ids
+        next_hops[src_gid, other_dst_gids[is_reachable], 1] = 0
+        next_hops[src_gid, other_dst_gids[is_reachable], 2] = (
+            num_isls_per_sat[src_sat_ids] + gid_to_sat_gsl_if_idx[src_gid]
+        )
+
+
+@jit_kernel(select_ground_station_next_hops_with_numpy)
+def select_ground_station_next_hops(
+        candidate_indptr,
+        candidate_satellite_ids,
+        candidate_distances_m,
+        hops_satellite_to_ground_station,
+        dist_satellite_to_ground_station,
+        num_isls_per_sat,
+        gid_to_sat_gsl_if_idx,
+        dst_gids,
+        next_hops
+):
+    """
+    Select the next hop of every ground station to every other destination ground station. Among the satellites in range
+    of the source ground station which can reach the destination ground station, the one which promises the fewest
+    hops, then the shortest distance (getting there + the rest), and then has the lowest identifier is chosen.
+
+    :param candidate_indptr:                  Indptr of the satellites in range of each ground station
+                                              (as returned by create_candidate_arrays())
+    :param candidate_satellite_ids:           Identifier of each satellite in range
+    :param candidate_distances_m:             Distance of each satellite in range to the ground station
+    :param hops_satellite_to_ground_station:  Array of shape (number of satellites, number of ground stations) with
+                                              the hops of each satellite to each ground station (all zero to only
+                                              choose by distance)
+    :param dist_satellite_to_ground_station:  Array of shape (number of satellites, number of ground stations) with
+                                              the distance of each satellite to each ground station (inf if it
+                                              cannot be reached)
+    :param num_isls_per_sat:                  Array with the number of ISLs of each satellite
+    :param gid_to_sat_gsl_if_idx:             Array with the GSL interface index of each ground station
+    :param dst_gids:                          Array with the destination ground station identifiers
+    :param next_hops:                         Array of shape (number of ground stations, number of ground stations, 3)
+                                              in which the next-hop decisions are set (it is left as is if the
+                                              destination cannot be reached)
+    """
+    num_ground_stations = len(candidate_indptr) - 1
+    for src_gid in range(num_ground_stations):
+        for dst_gid in dst_gids:
+            if src_gid == dst_gid:
+                continue
+            src_sat_id = -1
+            best_hops = math.inf
+            best_distance_m = math.inf
+            for c in range(candidate_indptr[src_gid], candidate_indptr[src_gid + 1]):
+                sid = candidate_satellite_ids[c]
+                best_distance_offered_m = dist_satellite_to_ground_station[sid, dst_gid]
+                if math.isinf(best_distance_offered_m):
+                    continue
+                hops = hops_satellite_to_ground_station[sid, dst_gid]
+                distance_m = candidate_distances_m[c] + best_distance_offered_m
+                if (
+                        src_sat_id == -1
+                        or hops < best_hops
+                        or (hops == best_hops and distance_m < best_distance_m)
+                        or (hops == best_hops and distance_m == best_distance_m and sid < src_sat_id)
+                ):
+                    src_sat_id = sid
+                    best_hops = hops
+                    best_distance_m = distance_m
+            if src_sat_id != -1:
+                next_hops[src_gid, dst_gid, 0] = src_sat_id
+                next_hops[src_gid, dst_gid, 1] = 0
+                next_hops[src_gid, dst_gid, 2] = num_isls_per_sat[src_sat_id] + gid_to_sat_gsl_if_idx[src_gid]
+
+
+def select_nearest_satellites_with_numpy(candidate_indptr, candidate_satellite_ids, candidate_distances_m):
+    """
+    Same as select_nearest_satellites(), but with numpy.
+    """
+    num_ground_stations = len(candidate_indptr) - 1
+    nearest_satellite_ids = np.full(num_ground_stations, -1, dtype=np.int64)
+    nearest_distances_m = np.full(num_ground_stations, math.inf)
+    for gid in range(num_ground_stations):
+        start = candidate_indptr[gid]
+        end = candidate_indptr[gid + 1]
+        if start == end:
+            continue
+        nearest = start + np.argmin(candidate_distances_m[start:end])
+        if candidate_distances_m[nearest] < 1000000000000000.0:
+            nearest_satellite_ids[gid] = candidate_satellite_ids[nearest]
+            nearest_distances_m[gid] = candidate_distances_m[nearest]
+    return nearest_satellite_ids, nearest_distances_m
+
+
+@jit_kernel(select_nearest_satellites_with_numpy)
+def select_nearest_satellites(candidate_indptr, candidate_satellite_ids, candidate_distances_m):
+    """
+    Select for each ground station the nearest satellite in range (the first in case of a tie).
+
+    :param candidate_indptr:         Indptr of the satellites in range of each ground station
+                                     (as returned by create_candidate_arrays())
+    :param candidate_satellite_ids:  Identifier of each satellite in range
+    :param candidate_distances_m:    Distance of each satellite in range to the ground station
+
+    :return: Tuple of two arrays with for each ground station the nearest satellite (-1 if there is none in range)
+             and the distance to it (inf if there is none in range)
+    """
+    num_ground_stations = len(candidate_indptr) - 1
+    nearest_satellite_ids = np.full(num_ground_stations, -1, dtype=np.int64)
+    nearest_distances_m = np.full(num_ground_stations, math.inf)
+    for gid in range(num_ground_stations):
+        best_distance_m = 1000000000000000.0
+        for c in range(candidate_indptr[gid], candidate_indptr[gid + 1]):
+            if candidate_distances_m[c] < best_distance_m:
+                nearest_satellite_ids[gid] = candidate_satellite_ids[c]
+                best_distance_m = candidate_distances_m[c]
+        if nearest_satellite_ids[gid] != -1:
+            nearest_distances_m[gid] = best_distance_m
+    return nearest_satellite_ids, nearest_distances_m
+
+
+def calculate_paired_gsl_if_bandwidth_with_numpy(num_satellites, paired_satellite_ids):
+    """
+    Same as calculate_paired_gsl_if_bandwidth(), but with numpy.
+    """
+    num_ground_stations = len(paired_satellite_ids)
+    paired_gids = np.flatnonzero(paired_satellite_ids != -1)
+    paired_sids = paired_satellite_ids[paired_gids]
+    num_paired = np.bincount(paired_sids, minlength=num_satellites)
+    satellite_bandwidth = np.ones((num_satellites, num_ground_stations))
+    ground_station_bandwidth = np.ones(num_ground_stations)
+    satellite_bandwidth[paired_sids, paired_gids] = 1.0 / num_paired[paired_sids].astype(float)
+    ground_station_bandwidth[paired_gids] = 1.0 / num_paired[paired_sids].astype(float)
+    return satellite_bandwidth, ground_station_bandwidth
+
+
+@jit_kernel(calculate_paired_gsl_if_bandwidth_with_numpy)
+def calculate_paired_gsl_if_bandwidth(num_satellites, paired_satellite_ids):
+    """
+    Calculate the bandwidth of the GSL interfaces if every ground station is paired to at most one satellite, on the
+    interface of that satellite corresponding to its gid. The paired GSL interfaces of a satellite share the total
+    bandwidth, as does a ground station with the other ones paired to the same satellite. All other interfaces get
+    the full bandwidth to flush out the packets in them.
+
+    :param num_satellites:        Number of satellites
+    :param paired_satellite_ids:  Array with for each ground station the satellite it is paired to (-1 if none)
+
+    :return: Tuple of two arrays, of shape (number of satellites, number of ground stations) with the bandwidth of
+             each satellite GSL interface (by gid), and of shape (number of ground stations) with the bandwidth of
+             the GSL interface of each ground station
+    """
+    num_ground_stations = len(paired_satellite_ids)
+    num_paired = np.zeros(num_satellites, dtype=np.int64)
+    for gid in range(num_ground_stations):
+        if paired_satellite_ids[gid] != -1:
+            num_paired[paired_satellite_ids[gid]] += 1
+    satellite_bandwidth = np.ones((num_satellites, num_ground_stations))
+    ground_station_bandwidth = np.ones(num_ground_stations)
+    for gid in range(num_ground_stations):
+        sid = paired_satellite_ids[gid]
+        if sid != -1:
+            satellite_bandwidth[sid, gid] = 1.0 / float(num_paired[sid])
+            ground_station_bandwidth[gid] = 1.0 / float(num_paired[sid])
+    return satellite_bandwidth, ground_station_bandwidth
@@ -21,12 +21,18 @@
 # SOFTWARE.
 
 from satgen.distance_tools import *
+from satgen.propagation import *
 from astropy import units as u
 import math
 import networkx as nx
 import numpy as np
+from .routing_options import create_routing_state, report_routing_state
+from .forwarding_state import write_forwarding_state_keyframes
+from .dynamic_state_archive import open_dynamic_state_file
+from .dynamic_state_output import create_dynamic_state_output, check_dynamic_state_output_opened
 from .algorithm_free_one_only_gs_relays import algorithm_free_one_only_gs_relays
 from .algorithm_free_one_only_over_isls import algorithm_free_one_only_over_isls
+from .algorithm_free_one_only_over_isls_fewest_hops import algorithm_free_one_only_over_isls_fewest_hops
 from .algorithm_paired_many_only_over_isls import algorithm_paired_many_only_over_isls
 from .algorithm_free_gs_one_sat_many_only_over_isls import algorithm_free_gs_one_sat_many_only_over_isls
 
@@ -46,21 +52,93 @@ def generate_dynamic_state(
         dynamic_state_algorithm,  # Options:
                                   # "algorithm_free_one_only_gs_relays"
                                   # "algorithm_free_one_only_over_isls"
+                                  # "algorithm_free_one_only_over_isls_fewest_hops"
                                   # "algorithm_paired_many_only_over_isls"
-        enable_verbose_logs
+        enable_verbose_logs,
+        propagator="ephem",
+        ephemeris=None,
+        interpolation_anchor_ns=None,
+        max_interpolation_error_m=DEFAULT_MAX_INTERPOLATION_ERROR_M,
+        use_visibility_windows=False,
+        routing_options=None,
+        dynamic_state_output=None
 ):
+    """
+    Generate the dynamic state of the time steps from offset_ns up to simulation_end_time_ns.
+
+    :param propagator:                 "ephem" (each distance is calculated by ephem), "sgp4" (all satellites are
+                                       propagated at once each time step), "analytic" (closed-form SGP-4 for circular
+                                       orbits without drag) or "auto" ("analytic" if possible, else "sgp4")
+    :param ephemeris:                  If not None, the satellite positions are read from this ephemeris
+                                       (see read_ephemeris_file()) instead of being propagated
+    :param interpolation_anchor_ns:    If not None, the satellites are only propagated every this many ns
+                                       and interpolated in between (only with the sgp4 propagator)
+    :param max_interpolation_error_m:  Maximum interpolation error (m) which is accepted
+    :param use_visibility_windows:     True to look up the satellites in range of each ground station in
+                                       visibility windows calculated beforehand (see calculate_visibility_windows())
+    :param routing_options:            Routing options (as returned by create_routing_options(), with "plus_grid_torus"
+                                       set to use the plus grid symmetry), if None the defaults
+    :param dynamic_state_output:       Dynamic state output (as returned by open_dynamic_state_output(), which can be
+                                       shared by multiple threads), if None the files are written as text
+    """
     if offset_ns % time_step_ns != 0:
         raise ValueError("Offset must be a multiple of time_step_ns")
+    if dynamic_state_output is None:
+        dynamic_state_output = create_dynamic_state_output()
+    check_dynamic_state_output_opened(dynamic_state_output)
+    fstate_keyframe_interval = dynamic_state_output["keyframe_interval"]
+
+    # Satellite propagation
+    position_source = create_position_source(
+        satellites, propagator, ephemeris, interpolation_anchor_ns, max_interpolation_error_m
+    )
+    report_analytic_max_deviation(
+        position_source, epoch, satellites, list(range(offset_ns, simulation_end_time_ns, time_step_ns))
+    )
+
+    # Visibility windows of the ground stations
+    visibility_windows = None
+    if use_visibility_windows:
+        visibility_windows = calculate_visibility_windows(
+            position_source, epoch, satellites, ground_station_cartesian_positions_m(ground_stations),
+            max_gsl_length_m, offset_ns, simulation_end_time_ns
+        )
+        print("Visibility windows: %d (with %d rise or set events)" % (
+            sum(map(lambda x: len(x), visibility_windows["windows"])),
+            len(visibility_change_times_ns(visibility_windows))
+        ))
+
+    # Routing state carried from one time step to the next
+    routing_state = create_routing_state(dynamic_state_algorithm, len(satellites), list_isls, routing_options)
+
+    # Segments of time steps, each starting with a keyframe at which the full state is written (the first time step
+    # always is one, as there is no previous state), such that the state at any time step can be reconstructed
+    # from the keyframe before it instead of from the first time step
+    keyframe_segments = []
+
     prev_output = None
     i = 0
     total_iterations = ((simulation_end_time_ns - offset_ns) / time_step_ns)
     for time_since_epoch_ns in range(offset_ns, simulation_end_time_ns, time_step_ns):
         if not enable_verbose_logs:
-            if i % int(math.floor(total_iterations) / 10.0) == 0:
+            if i % max(1, int(math.floor(total_iterations) / 10.0)) == 0:
                 print("Progress: calculating for T=%d (time step granularity is still %d ms)" % (
                     time_since_epoch_ns, time_step_ns / 1000000
                 ))
             i += 1
+
+        # At a keyframe there is no previous state to only write the changes of
+        if prev_output is None or (
+                fstate_keyframe_interval is not None
+                and (time_since_epoch_ns // time_step_ns) % fstate_keyframe_interval == 0
+        ):
+            prev_output = None
+            keyframe_segments.append([time_since_epoch_ns, time_step_ns, 0])
+        keyframe_segments[-1][2] += 1
+
+        # Satellite positions are shared by all distance calculations within the time step
+        position_table = create_position_table_from_source(position_source, epoch, time_since_epoch_ns, satellites)
+
         prev_output = generate_dynamic_state_at(
             output_dynamic_state_dir,
             epoch,
@@ -73,9 +151,27 @@ def generate_dynamic_state(
             max_isl_length_m,
             dynamic_state_algorithm,
             prev_output,
-            enable_verbose_logs
+            enable_verbose_logs,
+            position_table=position_table,
+            visibility_windows=visibility_windows,
+            routing_state=routing_state,
+            dynamic_state_output=dynamic_state_output
         )
 
+    # Keyframes of the time steps of this call (named by the offset, as multiple threads each generate their own)
+    if fstate_keyframe_interval is not None:
+        with open_dynamic_state_file(
+                output_dynamic_state_dir, "fstate_keyframes_" + str(offset_ns) + ".txt", "w+",
+                dynamic_state_output["archive"], dynamic_state_writer=dynamic_state_output["writer"]
+        ) as f_out:
+            write_forwarding_state_keyframes(f_out, keyframe_segments)
+
+    # Accuracy of the interpolation
+    report_interpolation_max_error(position_source)
+
+    # Re-use of the shortest path trees, and shortest paths which followed from the symmetry
+    report_routing_state(routing_state)
+
 
 def generate_dynamic_state_at(
         output_dynamic_state_dir,
@@ -89,8 +185,33 @@ def generate_dynamic_state_at(
         max_isl_length_m,
         dynamic_state_algorithm,
         prev_output,
-        enable_verbose_logs
+        enable_verbose_logs,
+        position_table=None,
+        visibility_windows=None,
+        routing_state=None,
+        dynamic_state_output=None
 ):
+    """
+    Generate the dynamic state of one time step.
+
+    :param position_table:        Position table of this time step (see create_position_table()),
+                                  if None, one is created which uses ephem
+    :param visibility_windows:    If not None, the satellites in range are looked up in these visibility windows
+                                  (see calculate_visibility_windows()), which requires satellite positions
+    :param routing_state:         Routing state carried from one time step to the next
+                                  (as returned by create_routing_state()), if None the default routing
+    :param dynamic_state_output:  Dynamic state output (as returned by open_dynamic_state_output()),
+                                  if None the files are written as text
+
+    :return: Output of the dynamic state algorithm, to pass as prev_output to the next time step
+    """
+    if routing_state is None:
+        routing_state = create_routing_state(dynamic_state_algorithm, len(satellites), list_isls)
+    if dynamic_state_output is None:
+        dynamic_state_output = create_dynamic_state_output()
+    if position_table is None:
+        position_table = create_position_table(epoch, time_since_epoch_ns, satellites)
+
     if enable_verbose_logs:
         print("FORWARDING STATE AT T = " + (str(time_since_epoch_ns))
               + "ns (= " + str(time_since_epoch_ns / 1e9) + " seconds)")
@@ -122,6 +243,7 @@ def generate_dynamic_state_at(
         print("  > Ground stations........ " + str(len(ground_stations)))
         print("  > Max. range GSL......... " + str(max_gsl_length_m) + "m")
         print("  > Max. range ISL......... " + str(max_isl_length_m) + "m")
+        print("  > Propagator............. " + position_table["propagator"])
 
     #################################
 
@@ -129,34 +251,36 @@ def generate_dynamic_state_at(
         print("\nISL INFORMATION")
 
     # ISL edges
-    total_num_isls = 0
-    num_isls_per_sat = [0] * len(satellites)
-    sat_neighbor_to_if = {}
-    for (a, b) in list_isls:
-
-        # ISLs are not permitted to exceed their maximum distance
-        # TODO: Technically, they can (could just be ignored by forwarding state calculation),
-        # TODO: but practically, defining a permanent ISL between two satellites which
-        # TODO: can go out of distance is generally unwanted
-        sat_distance_m = distance_m_between_satellites(satellites[a], satellites[b], str(epoch), str(time))
-        if sat_distance_m > max_isl_length_m:
-            raise ValueError(
-                "The distance between two satellites (%d and %d) "
-                "with an ISL exceeded the maximum ISL length (%.2fm > %.2fm at t=%dns)"
-                % (a, b, sat_distance_m, max_isl_length_m, time_since_epoch_ns)
-            )
-
-        # Add to networkx graph
-        sat_net_graph_only_satellites_with_isls.add_edge(
-            a, b, weight=sat_distance_m
+    isls = np.asarray(list_isls, dtype=int).reshape((len(list_isls), 2))
+    isl_lengths_m = isl_lengths_m_from_position_table(position_table, isls)
+
+    # ISLs are not permitted to exceed their maximum distance
+    # TODO: Technically, they can (could just be ignored by forwarding state calculation),
+    # TODO: but practically, defining a permanent ISL between two satellites which
+    # TODO: can go out of distance is generally unwanted
+    too_long = np.flatnonzero(isl_lengths_m > max_isl_length_m)
+    if too_long.shape[0] > 0:
+        raise ValueError(
+            "The distance between two satellites with an ISL exceeded the maximum ISL length (%.2fm at t=%dns) "
+            "for %d ISL(s): %s"
+            % (max_isl_length_m, time_since_epoch_ns, too_long.shape[0], ", ".join(
+                "%d and %d (%.2fm)" % (isls[i, 0], isls[i, 1], isl_lengths_m[i]) for i in too_long
+            ))
         )
 
-        # Interface mapping of ISLs
+    # Add to networkx graph
+    sat_net_graph_only_satellites_with_isls.add_weighted_edges_from(
+        zip(isls[:, 0].tolist(), isls[:, 1].tolist(), isl_lengths_m.tolist())
+    )
+
+    # Interface mapping of ISLs
+    num_isls_per_sat = [0] * len(satellites)
+    sat_neighbor_to_if = {}
+    for (a, b) in isls.tolist():
         sat_neighbor_to_if[(a, b)] = num_isls_per_sat[a]
         sat_neighbor_to_if[(b, a)] = num_isls_per_sat[b]
         num_isls_per_sat[a] += 1
         num_isls_per_sat[b] += 1
-        total_num_isls += 1
 
     if enable_verbose_logs:
         print("  > Total ISLs............. " + str(len(list_isls)))
@@ -188,24 +312,44 @@ def generate_dynamic_state_at(
         print("\nGSL IN-RANGE INFORMATION")
 
     # What satellites can a ground station see
-    ground_station_satellites_in_range = []
-    for ground_station in ground_stations:
-        # Find satellites in range
-        satellites_in_range = []
-        for sid in range(len(satellites)):
-            distance_m = distance_m_ground_station_to_satellite(
-                ground_station,
-                satellites[sid],
-                str(epoch),
-                str(time)
+    if position_table["satellite_positions_m"] is not None:
+        if visibility_windows is not None:
+            ground_station_satellites_in_range = satellites_in_range_from_visibility_windows(
+                visibility_windows,
+                ground_station_cartesian_positions_m(ground_stations),
+                position_table["satellite_positions_m"],
+                time_since_epoch_ns
             )
-            if distance_m <= max_gsl_length_m:
-                satellites_in_range.append((distance_m, sid))
+        else:
+            ground_station_satellites_in_range = ground_station_satellites_in_range_from_positions(
+                ground_stations,
+                position_table["satellite_positions_m"],
+                max_gsl_length_m
+            )
+        for (ground_station, satellites_in_range) in zip(ground_stations, ground_station_satellites_in_range):
+            for (distance_m, sid) in satellites_in_range:
                 sat_net_graph_all_with_only_gsls.add_edge(
                     sid, len(satellites) + ground_station["gid"], weight=distance_m
                 )
 
-        ground_station_satellites_in_range.append(satellites_in_range)
+    else:
+        ground_station_satellites_in_range = []
+        for ground_station in ground_stations:
+            # Find satellites in range
+            satellites_in_range = []
+            for sid in range(len(satellites)):
+                distance_m = distance_m_ground_station_to_satellite_from_position_table(
+                    position_table,
+                    ground_station,
+                    sid
+                )
+                if distance_m <= max_gsl_length_m:
+                    satellites_in_range.append((distance_m, sid))
+                    sat_net_graph_all_with_only_gsls.add_edge(
+                        sid, len(satellites) + ground_station["gid"], weight=distance_m
+                    )
+
+            ground_station_satellites_in_range.append(satellites_in_range)
 
     # Print how many are in range
     ground_station_num_in_range = list(map(lambda x: len(x), ground_station_satellites_in_range))
@@ -234,7 +378,27 @@ def generate_dynamic_state_at(
             sat_neighbor_to_if,
             list_gsl_interfaces_info,
             prev_output,
-            enable_verbose_logs
+            enable_verbose_logs,
+            routing_state,
+            dynamic_state_output
+        )
+
+    elif dynamic_state_algorithm == "algorithm_free_one_only_over_isls_fewest_hops":
+
+        return algorithm_free_one_only_over_isls_fewest_hops(
+            output_dynamic_state_dir,
+            time_since_epoch_ns,
+            satellites,
+            ground_stations,
+            sat_net_graph_only_satellites_with_isls,
+            ground_station_satellites_in_range,
+            num_isls_per_sat,
+            sat_neighbor_to_if,
+            list_gsl_interfaces_info,
+            prev_output,
+            enable_verbose_logs,
+            routing_state,
+            dynamic_state_output
         )
 
     elif dynamic_state_algorithm == "algorithm_free_gs_one_sat_many_only_over_isls":
@@ -250,7 +414,9 @@ def generate_dynamic_state_at(
             sat_neighbor_to_if,
             list_gsl_interfaces_info,
             prev_output,
-            enable_verbose_logs
+            enable_verbose_logs,
+            routing_state,
+            dynamic_state_output
         )
 
     elif dynamic_state_algorithm == "algorithm_free_one_only_gs_relays":
@@ -264,7 +430,9 @@ def generate_dynamic_state_at(
             num_isls_per_sat,
             list_gsl_interfaces_info,
             prev_output,
-            enable_verbose_logs
+            enable_verbose_logs,
+            routing_state,
+            dynamic_state_output
         )
 
     elif dynamic_state_algorithm == "algorithm_paired_many_only_over_isls":
@@ -280,8 +448,28 @@ def generate_dynamic_state_at(
             sat_neighbor_to_if,
             list_gsl_interfaces_info,
             prev_output,
-            enable_verbose_logs
+            enable_verbose_logs,
+            routing_state,
+            dynamic_state_output
         )
 
     else:
         raise ValueError("Unknown dynamic state algorithm: " + str(dynamic_state_algorithm))
+
+
+def ground_station_satellites_in_range_from_positions(ground_stations, satellite_positions_m, max_gsl_length_m):
+    """
+    Determine for each ground station which satellites are in range using a spatial index
+    (see satellites_in_range_of_ground_stations()).
+
+    :param ground_stations:        List of extended ground stations (with cartesian_x/y/z)
+    :param satellite_positions_m:  Numpy array of shape (number of satellites, 3) of ECEF positions in meters
+    :param max_gsl_length_m:       Maximum GSL length in meters
+
+    :return: List with for each ground station a list of (distance in meters, satellite id) in ascending satellite id
+    """
+    return satellites_in_range_of_ground_stations(
+        ground_station_cartesian_positions_m(ground_stations),
+        satellite_positions_m,
+        max_gsl_length_m
+    )
@@ -24,7 +24,11 @@ from satgen.isls import *
 from satgen.ground_stations import *
 from satgen.tles import *
 from satgen.interfaces import *
+from satgen.propagation import *
 from .generate_dynamic_state import generate_dynamic_state
+from .plus_grid_symmetry import detect_plus_grid_torus
+from .routing_options import destination_gids_of_traffic, create_routing_options
+from .dynamic_state_output import create_dynamic_state_output, open_dynamic_state_output, close_dynamic_state_output
 import os
 import math
 from multiprocessing.dummy import Pool as ThreadPool
@@ -46,7 +50,14 @@ def worker(args):
         max_gsl_length_m,
         max_isl_length_m,
         dynamic_state_algorithm,
-        print_logs
+        print_logs,
+        propagator,
+        ephemeris,
+        interpolation_anchor_ns,
+        max_interpolation_error_m,
+        use_visibility_windows,
+        routing_options,
+        dynamic_state_output
      ) = args
 
     # Generate dynamic state
@@ -65,16 +76,43 @@ def worker(args):
         dynamic_state_algorithm,  # Options:
                                   # "algorithm_free_one_only_gs_relays"
                                   # "algorithm_free_one_only_over_isls"
+                                  # "algorithm_free_one_only_over_isls_fewest_hops"
                                   # "algorithm_free_gs_one_sat_many_only_over_isls"
                                   # "algorithm_paired_many_only_over_isls"
-        print_logs
+        print_logs,
+        propagator,
+        ephemeris,
+        interpolation_anchor_ns,
+        max_interpolation_error_m,
+        use_visibility_windows,
+        routing_options,
+        dynamic_state_output
     )
 
 
 def help_dynamic_state(
         output_generated_data_dir, num_threads, name, time_step_ms, duration_s,
-        max_gsl_length_m, max_isl_length_m, dynamic_state_algorithm, print_logs
+        max_gsl_length_m, max_isl_length_m, dynamic_state_algorithm, print_logs, propagator="ephem",
+        use_ephemeris_file=False, interpolation_anchor_ms=None,
+        max_interpolation_error_m=DEFAULT_MAX_INTERPOLATION_ERROR_M, use_visibility_windows=False,
+        routing_options=None, dynamic_state_output=None
 ):
+    """
+    Generate the dynamic state of a satellite network with multiple threads, each doing an interval of time steps
+    (see generate_dynamic_state() for propagator, max_interpolation_error_m and use_visibility_windows).
+
+    :param use_ephemeris_file:       True to read the satellite positions from the ephemeris file calculated
+                                     beforehand (see help_ephemeris()) instead of propagating them
+    :param interpolation_anchor_ms:  If not None, the satellites are only propagated every this many ms
+                                     and interpolated in between (only with the sgp4 propagator)
+    :param routing_options:          Routing options (as returned by create_routing_options()), if None the defaults
+    :param dynamic_state_output:     Dynamic state output (as returned by create_dynamic_state_output()),
+                                     if None the files are written as text
+    """
+    if routing_options is None:
+        routing_options = create_routing_options()
+    if dynamic_state_output is None:
+        dynamic_state_output = create_dynamic_state_output()
 
     # Directory
     output_dynamic_state_dir = output_generated_data_dir + "/" + name + "/dynamic_state_" + str(time_step_ms) \
@@ -86,25 +124,78 @@ def help_dynamic_state(
     simulation_end_time_ns = duration_s * 1000 * 1000 * 1000
     time_step_ns = time_step_ms * 1000 * 1000
 
+    # With keyframes, the time steps are divided among the threads in whole keyframe intervals,
+    # such that each thread starts at a keyframe
+    time_steps_per_block = 1
+    if dynamic_state_output["keyframe_interval"] is not None:
+        time_steps_per_block = dynamic_state_output["keyframe_interval"]
     num_calculations = math.floor(simulation_end_time_ns / time_step_ns)
-    calculations_per_thread = int(math.floor(float(num_calculations) / float(num_threads)))
-    num_threads_with_one_more = num_calculations % num_threads
+    num_blocks = int(math.ceil(float(num_calculations) / float(time_steps_per_block)))
+    blocks_per_thread = int(math.floor(float(num_blocks) / float(num_threads)))
+    num_threads_with_one_more = num_blocks % num_threads
+
+    # Satellite positions which were calculated beforehand (see help_ephemeris())
+    ephemeris = None
+    if use_ephemeris_file:
+        ephemeris = read_ephemeris_for_satellite_network(
+            output_generated_data_dir + "/" + name, time_step_ms, duration_s, propagator
+        )
+
+    # Satellites are only propagated at the anchors, and interpolated in between (see create_interpolation_state())
+    interpolation_anchor_ns = None
+    if interpolation_anchor_ms is not None:
+        interpolation_anchor_ns = interpolation_anchor_ms * 1000 * 1000
+
+    # Plus grid torus of the ISLs, of which the symmetry is used to calculate the shortest paths
+    if routing_options["plus_grid_symmetry"]:
+        tles = read_tles(output_generated_data_dir + "/" + name + "/tles.txt")
+        plus_grid_torus = detect_plus_grid_torus(
+            tles["n_orbits"],
+            tles["n_sats_per_orbit"],
+            read_isls(output_generated_data_dir + "/" + name + "/isls.txt", len(tles["satellites"]), as_array=True)
+        )
+        if plus_grid_torus is None:
+            print("The ISLs are not a plus grid torus, as such its symmetry is not used")
+        else:
+            print("The ISLs are a plus grid torus of %d orbits of %d satellites (ISL shift %d)" % (
+                plus_grid_torus["n_orbits"], plus_grid_torus["n_sats_per_orbit"], plus_grid_torus["isl_shift"]
+            ))
+        routing_options = dict(routing_options, plus_grid_torus=plus_grid_torus)
+
+    # Forwarding state is only generated to the destination ground stations which receive traffic
+    if routing_options["dst_gids"] is not None:
+        print("Forwarding state is only generated to %d destination ground station(s)" % len(
+            set(routing_options["dst_gids"])
+        ))
+
+    # All threads share one archive and one background writer, if the output uses them
+    dynamic_state_output = open_dynamic_state_output(dynamic_state_output, output_dynamic_state_dir)
+
+    # Each thread but the last also calculates the first time step of the next thread, of which the file is then
+    # written by both; a file can only be appended once to an archive, and the next thread writes a keyframe there
+    # which must not be replaced by a delta, as such then each thread only does its own
+    overlap_time_steps = 1
+    if dynamic_state_output["use_archive"] or dynamic_state_output["keyframe_interval"] is not None:
+        overlap_time_steps = 0
 
     # Prepare arguments
     current = 0
     list_args = []
     for i in range(num_threads):
 
-        # How many time steps to calculate for
-        num_time_steps = calculations_per_thread
+        # How many time steps to calculate for (there can be more threads than keyframe intervals)
+        num_blocks_of_thread = blocks_per_thread
         if i < num_threads_with_one_more:
-            num_time_steps += 1
+            num_blocks_of_thread += 1
+        num_time_steps = min(num_blocks_of_thread * time_steps_per_block, num_calculations - current)
+        if num_time_steps == 0:
+            continue
 
         # Variables (load in for each thread such that they don't interfere)
         ground_stations = read_ground_stations_extended(output_generated_data_dir + "/" + name + "/ground_stations.txt")
         tles = read_tles(output_generated_data_dir + "/" + name + "/tles.txt")
         satellites = tles["satellites"]
-        list_isls = read_isls(output_generated_data_dir + "/" + name + "/isls.txt", len(satellites))
+        list_isls = read_isls(output_generated_data_dir + "/" + name + "/isls.txt", len(satellites), as_array=True)
         list_gsl_interfaces_info = read_gsl_interfaces_info(
             output_generated_data_dir + "/" + name + "/gsl_interfaces_info.txt",
             len(satellites),
@@ -122,7 +213,8 @@ def help_dynamic_state(
         list_args.append((
             output_dynamic_state_dir,
             epoch,
-            (current + num_time_steps) * time_step_ns + (time_step_ns if (i + 1) != num_threads else 0),
+            (current + num_time_steps + (overlap_time_steps if current + num_time_steps != num_calculations else 0))
+            * time_step_ns,
             time_step_ns,
             current * time_step_ns,
             satellites,
@@ -132,7 +224,14 @@ def help_dynamic_state(
             max_gsl_length_m,
             max_isl_length_m,
             dynamic_state_algorithm,
-            print_logs
+            print_logs,
+            propagator,
+            ephemeris,
+            interpolation_anchor_ns,
+            max_interpolation_error_m,
+            use_visibility_windows,
+            routing_options,
+            dynamic_state_output
         ))
 
         current += num_time_steps
@@ -142,3 +241,6 @@ def help_dynamic_state(
     pool.map(worker, list_args)
     pool.close()
     pool.join()
+
+    # Wait for all the files to be written, and complete the archive
+    close_dynamic_state_output(dynamic_state_output)
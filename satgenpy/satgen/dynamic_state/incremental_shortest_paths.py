@@ -0,0 +1,413 @@
+# The MIT License (MIT)
+#
+# Copyright (c) 2020 ETH Zurich
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+import networkx as nx
+import numpy as np
+from scipy.sparse.csgraph import dijkstra
+from .fstate_kernels import jit_kernel
+
+
+def create_incremental_shortest_paths_state():
+    """
+    Create the state of the incremental shortest path calculation, which carries the shortest path tree
+    of each destination from one time step to the next (see calculate_shortest_path_distances_to_incrementally()).
+
+    :return: Incremental shortest paths state (dictionary), updated in-place every time step
+    """
+    return {
+        "indptr": None,
+        "indices": None,
+        "dst_node_ids": np.zeros(0, dtype=np.int64),
+        "predecessor_edge_idxs": None,
+        "depths": None,
+        "num_trees_repaired": 0,
+        "num_trees_calculated": 0,
+        "num_nodes_resettled": 0,
+        "num_nodes_of_repaired_trees": 0,
+    }
+
+
+def calculate_tree_depths(dst_node_ids, predecessors):
+    """
+    Calculate the depth of every node in the shortest path trees.
+
+    :param dst_node_ids:  Array of destination node identifiers (the roots)
+    :param predecessors:  Array of shape (number of destinations, number of nodes) of the predecessor
+                          of each node in the tree of each destination (negative if none)
+
+    :return: Array of the same shape with the depth (the root at 0, -1 if unreachable)
+    """
+    rows = np.arange(len(dst_node_ids))
+    depths = np.full(predecessors.shape, -1, dtype=np.int16)
+    depths[rows, dst_node_ids] = 0
+    has_predecessor = predecessors >= 0
+    predecessor_idxs = np.where(has_predecessor, predecessors, 0)
+    while True:
+        predecessor_depths = depths[rows[:, np.newaxis], predecessor_idxs]
+        newly = (depths < 0) & has_predecessor & (predecessor_depths >= 0)
+        if not np.any(newly):
+            return depths
+        depths[newly] = predecessor_depths[newly] + 1
+
+
+def calculate_predecessor_edge_idxs(edge_from, edge_to, num_nodes, predecessors):
+    """
+    Find the edge from its predecessor to every node in the shortest path trees.
+
+    :param edge_from:     Array of the node each edge is from (the sorted edges of the CSR adjacency matrix)
+    :param edge_to:       Array of the node each edge is to
+    :param num_nodes:     Number of nodes
+    :param predecessors:  Array of shape (number of destinations, number of nodes) of the predecessor
+                          of each node in the tree of each destination (negative if none)
+
+    :return: Array of the same shape with the index of the edge from the predecessor (-1 if none)
+    """
+    has_predecessor = predecessors >= 0
+    edge_keys = edge_from * num_nodes + edge_to
+    predecessor_edge_idxs = np.full(predecessors.shape, -1, dtype=np.int64)
+    predecessor_edge_idxs[has_predecessor] = np.searchsorted(
+        edge_keys,
+        predecessors[has_predecessor].astype(np.int64) * num_nodes + np.nonzero(has_predecessor)[1]
+    )
+    return predecessor_edge_idxs
+
+
+def concatenate_ranges(starts, lengths):
+    """
+    Concatenate the ranges [start, start + length) into one array.
+
+    :param starts:   Array of the start of each range
+    :param lengths:  Array of the length of each range
+
+    :return: Array of all the values of the ranges, one range after the other
+    """
+    ends = np.cumsum(lengths)
+    return np.repeat(starts - ends + lengths, lengths) + np.arange(ends[-1] if len(ends) > 0 else 0)
+
+
+def repair_shortest_path_trees_with_numpy(
+        dst_node_ids,
+        indptr,
+        edge_from,
+        edge_to,
+        edge_weights,
+        predecessor_edge_idxs,
+        depths,
+        distances
+):
+    """
+    Numpy equivalent of repair_shortest_path_trees(), which goes over the nodes of all trees at once: level by level
+    to sum the distances, and round by round to settle nodes again.
+    """
+    num_nodes = len(indptr) - 1
+    distances_flat = distances.reshape(-1)
+    predecessor_edge_idxs_flat = predecessor_edge_idxs.reshape(-1)
+    depths_flat = depths.reshape(-1)
+
+    # Nodes of all trees grouped by depth (flat indices)
+    order = np.argsort(depths_flat, kind="stable")
+    level_starts = np.searchsorted(depths_flat[order], np.arange(1, int(np.max(depths_flat, initial=0)) + 2))
+    levels = [order[level_starts[i]:level_starts[i + 1]] for i in range(len(level_starts) - 1)]
+
+    # Sum the distances along the trees, level by level from the roots
+    distances[:] = np.inf
+    distances[np.arange(len(dst_node_ids)), dst_node_ids] = 0.0
+    for level_flat_idxs in levels:
+        level_predecessor_edge_idxs = predecessor_edge_idxs_flat[level_flat_idxs]
+        distances_flat[level_flat_idxs] = (
+            distances_flat[(level_flat_idxs // num_nodes) * num_nodes + edge_from[level_predecessor_edge_idxs]]
+            + edge_weights[level_predecessor_edge_idxs]
+        )
+
+    # Settle again round by round, first over all edges which shorten a distance,
+    # and then over the edges from the nodes settled again in the round before
+    is_resettled = np.zeros(len(distances_flat), dtype=bool)
+    (rows, edge_idxs) = np.nonzero(distances[:, edge_from] + edge_weights < distances[:, edge_to])
+    while len(edge_idxs) > 0:
+        to_flat_idxs = rows * num_nodes + edge_to[edge_idxs]
+        via_distances = distances_flat[rows * num_nodes + edge_from[edge_idxs]] + edge_weights[edge_idxs]
+        is_shorter = via_distances < distances_flat[to_flat_idxs]
+        (to_flat_idxs, via_distances, edge_idxs) = (
+            to_flat_idxs[is_shorter], via_distances[is_shorter], edge_idxs[is_shorter]
+        )
+
+        # The edges are in order of the node they are from, as such the first of the shortest is from the lowest
+        order = np.lexsort((via_distances, to_flat_idxs))
+        is_first = np.ones(len(order), dtype=bool)
+        is_first[1:] = to_flat_idxs[order[1:]] != to_flat_idxs[order[:-1]]
+        order = order[is_first]
+        (to_flat_idxs, edge_idxs) = (to_flat_idxs[order], edge_idxs[order])
+        distances_flat[to_flat_idxs] = via_distances[order]
+        predecessor_edge_idxs_flat[to_flat_idxs] = edge_idxs
+        is_resettled[to_flat_idxs] = True
+
+        nodes = edge_to[edge_idxs]
+        lengths = indptr[nodes + 1] - indptr[nodes]
+        rows = np.repeat(to_flat_idxs // num_nodes, lengths)
+        edge_idxs = concatenate_ranges(indptr[nodes], lengths)
+
+    # Depths in the repaired trees, going over the previous levels until none changes anymore
+    # (a node can now have a predecessor which was deeper, but mostly one pass suffices)
+    is_changed = True
+    while is_changed:
+        is_changed = False
+        for level_flat_idxs in levels:
+            level_depths = depths_flat[
+                (level_flat_idxs // num_nodes) * num_nodes + edge_from[predecessor_edge_idxs_flat[level_flat_idxs]]
+            ] + 1
+            if np.any(level_depths != depths_flat[level_flat_idxs]):
+                depths_flat[level_flat_idxs] = level_depths
+                is_changed = True
+
+    return int(np.count_nonzero(is_resettled))
+
+
+@jit_kernel(repair_shortest_path_trees_with_numpy)
+def repair_shortest_path_trees(
+        dst_node_ids,
+        indptr,
+        edge_from,
+        edge_to,
+        edge_weights,
+        predecessor_edge_idxs,
+        depths,
+        distances
+):
+    """
+    Repair the shortest path trees of the previous time step after the edge weights changed (but not the edges).
+
+    The distances are first summed along each tree with the new edge weights. These are the lengths of actual
+    paths, as such at least the shortest path distances. Then only the nodes which can be reached over a shorter path
+    than along their tree edge are settled again, over the neighbor via which it is shortest (of equal ones,
+    the lowest), in rounds: first over all edges, and then only over the edges from the nodes which were settled
+    again in the round before, until none can be reached over a shorter path anymore.
+
+    With positive edge weights, the only distances for which the distance of each node is the smallest over its
+    neighbors of (distance of neighbor + edge weight), in floating point arithmetic, are the ones Dijkstra calculates.
+    As the repair ends when that holds, and only ever lowers a distance to the length of an actual path,
+    the distances are exactly those of Dijkstra.
+
+    :param dst_node_ids:           Array of destination node identifiers (the roots)
+    :param indptr:                 Index pointer of the CSR adjacency matrix (the edges from node u are
+                                   indptr[u] up to indptr[u + 1], sorted by the node they are to)
+    :param edge_from:              Array of the node each edge is from
+    :param edge_to:                Array of the node each edge is to
+    :param edge_weights:           Array of the (new) weight of each edge
+    :param predecessor_edge_idxs:  Array of shape (number of destinations, number of nodes) of the index of the edge
+                                   from the predecessor of each node (-1 if none), updated in-place to the
+                                   repaired trees
+    :param depths:                 Array of the same shape of the depth of each node (the root at 0, -1 if
+                                   unreachable), updated in-place to the repaired trees
+    :param distances:              Array of the same shape to which the shortest path distances are written
+
+    :return: Number of nodes which were settled again (over all trees)
+    """
+    num_nodes = len(indptr) - 1
+    num_resettled = 0
+    order = np.empty(num_nodes, dtype=np.int64)
+    counts = np.empty(num_nodes + 1, dtype=np.int64)
+    best_via_distances = np.empty(num_nodes)
+    best_edge_idxs = np.empty(num_nodes, dtype=np.int64)
+    is_touched = np.zeros(num_nodes, dtype=np.bool_)
+    is_resettled = np.zeros(num_nodes, dtype=np.bool_)
+    touched = np.empty(num_nodes, dtype=np.int64)
+    frontier = np.empty(num_nodes, dtype=np.int64)
+    for row in range(len(dst_node_ids)):
+        row_predecessor_edge_idxs = predecessor_edge_idxs[row]
+        row_depths = depths[row]
+        row_distances = distances[row]
+
+        # Nodes in order of depth (counting sort)
+        counts[:] = 0
+        for node in range(num_nodes):
+            if row_depths[node] >= 1:
+                counts[row_depths[node]] += 1
+        num_in_tree = 0
+        for depth in range(num_nodes + 1):
+            count = counts[depth]
+            counts[depth] = num_in_tree
+            num_in_tree += count
+        for node in range(num_nodes):
+            if row_depths[node] >= 1:
+                order[counts[row_depths[node]]] = node
+                counts[row_depths[node]] += 1
+
+        # Sum the distances along the tree
+        for node in range(num_nodes):
+            row_distances[node] = np.inf
+        row_distances[dst_node_ids[row]] = 0.0
+        for i in range(num_in_tree):
+            edge_idx = row_predecessor_edge_idxs[order[i]]
+            row_distances[order[i]] = row_distances[edge_from[edge_idx]] + edge_weights[edge_idx]
+
+        # Settle again round by round
+        is_resettled[:] = False
+        num_frontier = -1
+        while num_frontier != 0:
+            num_touched = 0
+            num_candidate_nodes = num_nodes if num_frontier == -1 else num_frontier
+            for j in range(num_candidate_nodes):
+                from_node = j if num_frontier == -1 else frontier[j]
+                for edge_idx in range(indptr[from_node], indptr[from_node + 1]):
+                    to_node = edge_to[edge_idx]
+                    via_distance = row_distances[from_node] + edge_weights[edge_idx]
+                    if via_distance < row_distances[to_node]:
+                        if not is_touched[to_node]:
+                            is_touched[to_node] = True
+                            touched[num_touched] = to_node
+                            num_touched += 1
+                            best_via_distances[to_node] = via_distance
+                            best_edge_idxs[to_node] = edge_idx
+                        elif via_distance < best_via_distances[to_node] or (
+                                via_distance == best_via_distances[to_node]
+                                and from_node < edge_from[best_edge_idxs[to_node]]
+                        ):
+                            best_via_distances[to_node] = via_distance
+                            best_edge_idxs[to_node] = edge_idx
+            for j in range(num_touched):
+                node = touched[j]
+                is_touched[node] = False
+                row_distances[node] = best_via_distances[node]
+                row_predecessor_edge_idxs[node] = best_edge_idxs[node]
+                if not is_resettled[node]:
+                    is_resettled[node] = True
+                    num_resettled += 1
+                frontier[j] = node
+            num_frontier = num_touched
+
+        # Depths in the repaired tree, from the root down (the children of each node by counting sort)
+        counts[:] = 0
+        for node in range(num_nodes):
+            if row_predecessor_edge_idxs[node] >= 0:
+                counts[edge_from[row_predecessor_edge_idxs[node]] + 1] += 1
+        for node in range(num_nodes):
+            counts[node + 1] += counts[node]
+        for node in range(num_nodes):
+            if row_predecessor_edge_idxs[node] >= 0:
+                parent = edge_from[row_predecessor_edge_idxs[node]]
+                order[counts[parent]] = node
+                counts[parent] += 1
+        for node in range(num_nodes - 1, 0, -1):
+            counts[node] = counts[node - 1]
+        counts[0] = 0
+        frontier[0] = dst_node_ids[row]
+        num_frontier = 1
+        i = 0
+        while i < num_frontier:
+            parent = frontier[i]
+            for k in range(counts[parent], counts[parent + 1]):
+                row_depths[order[k]] = row_depths[parent] + 1
+                frontier[num_frontier] = order[k]
+                num_frontier += 1
+            i += 1
+
+    return num_resettled
+
+
+def calculate_shortest_path_distances_to_incrementally(state, graph, num_nodes, dst_node_ids):
+    """
+    Calculate the shortest path distances of all nodes to only the given destination nodes, with the same result
+    as calculate_shortest_path_distances_to(), but by repairing the shortest path trees of the previous time step
+    (see repair_shortest_path_trees()). As the edge weights change only a little from one time step to the next,
+    mostly only few nodes of each tree have to be settled again. Only for destinations which are new, Dijkstra is run.
+    If the graph has different edges than in the previous time step, all trees are calculated again.
+
+    :param state:         Incremental shortest paths state (as returned by create_incremental_shortest_paths_state())
+    :param graph:         Undirected networkx graph with nodes 0 up to num_nodes - 1 and positive "weight" attributes
+    :param num_nodes:     Number of nodes in the graph
+    :param dst_node_ids:  List of destination node identifiers
+
+    :return: Numpy array of shape (number of destinations, number of nodes), with at [i, j] the
+             shortest path distance from node j to destination dst_node_ids[i] (inf if unreachable)
+    """
+    adjacency = nx.to_scipy_sparse_array(graph, nodelist=range(num_nodes), weight="weight", format="csr")
+    adjacency.sort_indices()
+    dst_node_ids = np.array(dst_node_ids, dtype=np.int64)
+    indptr = adjacency.indptr.astype(np.int64)
+    edge_from = np.repeat(np.arange(num_nodes, dtype=np.int64), np.diff(indptr))
+    edge_to = adjacency.indices.astype(np.int64)
+    edge_weights = adjacency.data.astype(np.float64)
+
+    # The trees can only be repaired if the edges are the same
+    if state["indptr"] is None \
+            or not np.array_equal(state["indptr"], indptr) \
+            or not np.array_equal(state["indices"], edge_to):
+        state["indptr"] = indptr
+        state["indices"] = edge_to
+        state["dst_node_ids"] = np.zeros(0, dtype=np.int64)
+
+    # Which destinations had a tree in the previous time step
+    prev_dst_to_idx = dict((dst_node_id, idx) for (idx, dst_node_id) in enumerate(state["dst_node_ids"].tolist()))
+    prev_idxs = np.array([prev_dst_to_idx.get(dst_node_id, -1) for dst_node_id in dst_node_ids.tolist()], dtype=int)
+    is_repaired = prev_idxs >= 0
+
+    # Distances and trees of all destinations
+    distances = np.empty((len(dst_node_ids), num_nodes))
+    predecessor_edge_idxs = np.empty((len(dst_node_ids), num_nodes), dtype=np.int64)
+    depths = np.empty((len(dst_node_ids), num_nodes), dtype=np.int16)
+    if np.any(is_repaired):
+        repaired_predecessor_edge_idxs = state["predecessor_edge_idxs"][prev_idxs[is_repaired]]
+        repaired_depths = state["depths"][prev_idxs[is_repaired]]
+        repaired_distances = np.empty(repaired_depths.shape)
+        state["num_nodes_resettled"] += repair_shortest_path_trees(
+            dst_node_ids[is_repaired], indptr, edge_from, edge_to, edge_weights,
+            repaired_predecessor_edge_idxs, repaired_depths, repaired_distances
+        )
+        state["num_nodes_of_repaired_trees"] += repaired_distances.size
+        distances[is_repaired] = repaired_distances
+        predecessor_edge_idxs[is_repaired] = repaired_predecessor_edge_idxs
+        depths[is_repaired] = repaired_depths
+    if np.any(~is_repaired):
+        new_distances, new_predecessors = dijkstra(
+            adjacency, directed=False, indices=dst_node_ids[~is_repaired], return_predecessors=True
+        )
+        distances[~is_repaired] = new_distances
+        predecessor_edge_idxs[~is_repaired] = calculate_predecessor_edge_idxs(
+            edge_from, edge_to, num_nodes, new_predecessors
+        )
+        depths[~is_repaired] = calculate_tree_depths(dst_node_ids[~is_repaired], new_predecessors)
+    state["num_trees_repaired"] += int(np.count_nonzero(is_repaired))
+    state["num_trees_calculated"] += int(np.count_nonzero(~is_repaired))
+
+    # Trees to repair in the next time step
+    state["dst_node_ids"] = dst_node_ids
+    state["predecessor_edge_idxs"] = predecessor_edge_idxs
+    state["depths"] = depths
+    return distances
+
+
+def report_incremental_shortest_paths(state):
+    """
+    Print how many of the shortest path trees were repaired from the previous time step,
+    and how many of their nodes had to be settled again.
+
+    :param state:  Incremental shortest paths state (as returned by create_incremental_shortest_paths_state()),
+                   if None nothing is printed
+    """
+    if state is not None:
+        print("Incremental shortest paths: %d of %d destination trees were repaired (%d of their %d nodes settled "
+              "again), the others calculated anew" % (
+                  state["num_trees_repaired"],
+                  state["num_trees_repaired"] + state["num_trees_calculated"],
+                  state["num_nodes_resettled"],
+                  state["num_nodes_of_repaired_trees"]
+              ))
@@ -0,0 +1,284 @@
+# The MIT License (MIT)
+#
+# Copyright (c) 2020 ETH Zurich
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+
+import math
+import networkx as nx
+import numpy as np
+from scipy.sparse.csgraph import dijkstra
+
+
+# Maximum number of relaxation sweeps after which the remaining destinations are calculated by Dijkstra instead
+DEFAULT_MAX_RELAXATION_SWEEPS = 8
+
+
+def detect_plus_grid_torus(n_orbits, n_sats_per_orbit, list_isls):
+    """
+    Detect whether the ISLs are the plus grid of a single shell (as generated by generate_plus_grid_isls()
+    with an index offset of 0), which is a torus: satellite X of orbit O is connected to satellite X + 1 of
+    orbit O and to satellite X + isl_shift of orbit O + 1 (both modulo the number of satellites and orbits).
+
+    :param n_orbits:          Number of orbits (as read from the tles.txt by read_tles())
+    :param n_sats_per_orbit:  Number of satellites per orbit (as read from the tles.txt by read_tles())
+    :param list_isls:         List of ISLs (as read from the isls.txt by read_isls())
+
+    :return: Plus grid torus (dictionary with "n_orbits", "n_sats_per_orbit" and "isl_shift"), or None if it is not
+    """
+    if n_orbits < 3 or n_sats_per_orbit < 3 or len(list_isls) != 2 * n_orbits * n_sats_per_orbit:
+        return None
+    isls = set((min(a, b), max(a, b)) for (a, b) in np.array(list_isls, dtype=int).reshape(-1, 2).tolist())
+
+    # The shift follows from the satellite of the second orbit to which the first satellite is connected
+    neighbors_of_first = [a + b for (a, b) in isls if (a == 0) != (b == 0)]
+    adjacent_orbit = [sid for sid in neighbors_of_first if n_sats_per_orbit <= sid < 2 * n_sats_per_orbit]
+    if len(adjacent_orbit) != 1:
+        return None
+    plus_grid_torus = {
+        "n_orbits": n_orbits,
+        "n_sats_per_orbit": n_sats_per_orbit,
+        "isl_shift": adjacent_orbit[0] - n_sats_per_orbit,
+    }
+
+    # All ISLs must be exactly those of the plus grid
+    neighbor_ids = calculate_plus_grid_neighbor_ids(plus_grid_torus)
+    plus_grid_isls = set()
+    for sid in range(n_orbits * n_sats_per_orbit):
+        for neighbor_id in neighbor_ids[sid].tolist():
+            plus_grid_isls.add((min(sid, neighbor_id), max(sid, neighbor_id)))
+    if isls != plus_grid_isls:
+        return None
+    return plus_grid_torus
+
+
+def calculate_plus_grid_neighbor_ids(plus_grid_torus):
+    """
+    Calculate the four neighbors of each satellite in the plus grid torus.
+
+    :param plus_grid_torus:  Plus grid torus (as returned by detect_plus_grid_torus())
+
+    :return: Array of shape (number of satellites, 4) with the neighbor of each satellite in the direction of
+             the next satellite in the orbit, the previous one in the orbit, the next orbit and the previous orbit
+    """
+    return translate_plus_grid(
+        plus_grid_torus,
+        np.arange(plus_grid_torus["n_orbits"] * plus_grid_torus["n_sats_per_orbit"])[:, np.newaxis],
+        np.array([
+            1,
+            plus_grid_torus["n_sats_per_orbit"] - 1,
+            plus_grid_torus["n_sats_per_orbit"] + plus_grid_torus["isl_shift"] % plus_grid_torus["n_sats_per_orbit"],
+            (plus_grid_torus["n_orbits"] - 1) * plus_grid_torus["n_sats_per_orbit"]
+            + (-plus_grid_torus["isl_shift"]) % plus_grid_torus["n_sats_per_orbit"]
+        ])[np.newaxis, :]
+    )
+
+
+def translate_plus_grid(plus_grid_torus, sids, offset_sids):
+    """
+    Translate satellites over the plus grid torus, which maps the plus grid onto itself. Satellite X of
+    orbit O translated by satellite Y of orbit P is satellite X + Y of orbit O + P (modulo the number of satellites
+    and orbits). As such, translating by satellite 0 maps each satellite onto itself.
+
+    :param plus_grid_torus:  Plus grid torus (as returned by detect_plus_grid_torus())
+    :param sids:             Array of satellite identifiers
+    :param offset_sids:      Array of satellite identifiers by which to translate (broadcast with sids)
+
+    :return: Array of translated satellite identifiers
+    """
+    n_orbits = plus_grid_torus["n_orbits"]
+    n_sats_per_orbit = plus_grid_torus["n_sats_per_orbit"]
+    return (
+        (sids // n_sats_per_orbit + offset_sids // n_sats_per_orbit) % n_orbits * n_sats_per_orbit
+        + (sids % n_sats_per_orbit + offset_sids % n_sats_per_orbit) % n_sats_per_orbit
+    )
+
+
+def create_plus_grid_symmetry_state(plus_grid_torus, max_relaxation_sweeps=DEFAULT_MAX_RELAXATION_SWEEPS):
+    """
+    Create the state of the shortest path calculation over a plus grid torus
+    (see calculate_shortest_path_distances_to_with_symmetry()).
+
+    As translating maps the torus onto itself, the satellites at a given number of hops from a destination are
+    those at that number of hops from satellite 0 translated by the destination. As such, the hop levels
+    (and via which neighbors a satellite is one hop closer) are calculated only once, from satellite 0.
+
+    :param plus_grid_torus:        Plus grid torus (as returned by detect_plus_grid_torus())
+    :param max_relaxation_sweeps:  Maximum number of relaxation sweeps before falling back to Dijkstra
+
+    :return: Plus grid symmetry state (dictionary), of which the counters are updated every time step
+    """
+    num_satellites = plus_grid_torus["n_orbits"] * plus_grid_torus["n_sats_per_orbit"]
+    neighbor_ids = calculate_plus_grid_neighbor_ids(plus_grid_torus)
+
+    # Hops of each satellite to satellite 0
+    hops = np.full(num_satellites, -1, dtype=int)
+    hops[0] = 0
+    frontier = np.array([0])
+    while len(frontier) > 0:
+        next_frontier = np.unique(neighbor_ids[frontier].reshape(-1))
+        next_frontier = next_frontier[hops[next_frontier] < 0]
+        hops[next_frontier] = hops[frontier[0]] + 1
+        frontier = next_frontier
+
+    # For each hop level, the satellites in it and in which directions they are one hop closer
+    levels = []
+    for hop in range(1, int(np.max(hops)) + 1):
+        level_sids = np.flatnonzero(hops == hop)
+        levels.append((level_sids, hops[neighbor_ids[level_sids]] == hop - 1))
+
+    # To look up the direction of each ISL
+    neighbor_to_direction = {}
+    for sid in range(num_satellites):
+        for (direction, neighbor_id) in enumerate(neighbor_ids[sid].tolist()):
+            neighbor_to_direction[(sid, neighbor_id)] = direction
+
+    return {
+        "plus_grid_torus": plus_grid_torus,
+        "max_relaxation_sweeps": max_relaxation_sweeps,
+        "neighbor_ids": neighbor_ids,
+        "levels": levels,
+        "neighbor_to_direction": neighbor_to_direction,
+        "num_exact_by_hops": 0,
+        "num_exact_by_relaxation": 0,
+        "num_calculated_by_dijkstra": 0,
+    }
+
+
+def calculate_shortest_path_distances_to_with_symmetry(state, graph, num_nodes, dst_node_ids):
+    """
+    Calculate the shortest path distances of all satellites to only the given destination satellites over
+    the plus grid torus, with the same result as calculate_shortest_path_distances_to().
+
+    First, the shortest distance over only the paths with the fewest hops is calculated for all destinations
+    at once, going outward hop level by hop level (see create_plus_grid_symmetry_state()). As the ISL lengths of
+    a Walker shell are nearly the same, this is often already the shortest path. This is then verified exactly:
+    with positive edge weights, the distances calculated by Dijkstra are the only ones for which the distance of
+    each node is the smallest over its neighbors of (distance of neighbor + edge weight), in floating point
+    arithmetic. Where that does not yet hold, the distances are relaxed over all ISLs until it does, and
+    destinations for which that takes more than the maximum number of sweeps are calculated by Dijkstra.
+    If the graph is not the plus grid torus (e.g., an ISL is missing), Dijkstra is used for all.
+
+    This takes about half the time of calculate_shortest_path_distances_to() (including creating its adjacency
+    matrix), e.g., 8 ms instead of 17 ms per time step for a 24x24 Walker shell with about 150 destination
+    satellites, and 56 ms instead of 122 ms for a 40x40 shell with about 440. For those shells (and for a polar
+    one), all shortest paths were over the fewest hops, such that the relaxation sweeps and Dijkstra were not
+    needed. As such, it only shortens the total run time noticeably if the shortest paths are a large part of
+    each time step: for a 24x24 shell with the analytic propagator from 12.3 s to 10.8 s for 300 time steps,
+    but hardly at all if the time step is dominated by the rest (e.g., the ephem propagator).
+
+    :param state:         Plus grid symmetry state (as returned by create_plus_grid_symmetry_state())
+    :param graph:         Undirected networkx graph with nodes 0 up to num_nodes - 1 and positive "weight" attributes
+    :param num_nodes:     Number of nodes in the graph
+    :param dst_node_ids:  List of destination node identifiers
+
+    :return: Numpy array of shape (number of destinations, number of nodes), with at [i, j] the
+             shortest path distance from node j to destination dst_node_ids[i] (inf if unreachable)
+    """
+    dst_node_ids = np.array(dst_node_ids, dtype=int)
+    neighbor_ids = state["neighbor_ids"]
+
+    # Weight of the ISL of each satellite in each direction
+    weights = np.full(neighbor_ids.shape, math.nan)
+    if num_nodes == len(neighbor_ids) and graph.number_of_edges() == 2 * len(neighbor_ids):
+        for (a, b, weight) in graph.edges(data="weight"):
+            direction = state["neighbor_to_direction"].get((a, b))
+            if direction is None:
+                break
+            weights[(a, direction)] = weight
+            weights[(b, state["neighbor_to_direction"][(b, a)])] = weight
+    if np.any(np.isnan(weights)) or len(dst_node_ids) == 0:
+        state["num_calculated_by_dijkstra"] += len(dst_node_ids)
+        if len(dst_node_ids) == 0:
+            return np.zeros((0, num_nodes))
+        adjacency = nx.to_scipy_sparse_array(graph, nodelist=range(num_nodes), weight="weight", format="csr")
+        return dijkstra(adjacency, directed=False, indices=dst_node_ids)
+
+    # Everything is calculated relative to each destination: row i is the satellite which is at satellite i
+    # translated by the destination, such that the neighbors of a row are the same rows for all destinations
+    num_dsts = len(dst_node_ids)
+    sids = translate_plus_grid(
+        state["plus_grid_torus"], np.arange(num_nodes)[:, np.newaxis], dst_node_ids[np.newaxis, :]
+    )
+    relative_weights = [weights[sids, direction] for direction in range(4)]
+
+    # Shortest distance over the paths with the fewest hops, for all destinations at once
+    relative_distances = np.full((num_nodes, num_dsts), math.inf)
+    relative_distances[0] = 0.0
+    for (level_sids, is_closer) in state["levels"]:
+        level_distances = np.full((len(level_sids), num_dsts), math.inf)
+        for direction in range(4):
+            closer_sids = level_sids[is_closer[:, direction]]
+            level_distances[is_closer[:, direction]] = np.minimum(
+                level_distances[is_closer[:, direction]],
+                relative_distances[neighbor_ids[closer_sids, direction]] + relative_weights[direction][closer_sids]
+            )
+        relative_distances[level_sids] = level_distances
+
+    # Relax over all ISLs until no distance gets shorter anymore
+    num_sweeps = 0
+    is_pending = np.ones(num_dsts, dtype=bool)
+    while True:
+        relaxed = relative_distances.copy()
+        for direction in range(4):
+            np.minimum(
+                relaxed,
+                relative_distances[neighbor_ids[:, direction]] + relative_weights[direction],
+                out=relaxed
+            )
+        is_changed = is_pending & np.any(relaxed < relative_distances, axis=0)
+        if num_sweeps == 0:
+            state["num_exact_by_hops"] += int(np.count_nonzero(is_pending & ~is_changed))
+        else:
+            state["num_exact_by_relaxation"] += int(np.count_nonzero(is_pending & ~is_changed))
+        relative_distances = relaxed
+        is_pending = is_changed
+        if not np.any(is_pending) or num_sweeps == state["max_relaxation_sweeps"]:
+            break
+        num_sweeps += 1
+
+    # Back from relative to the destination
+    distances = np.empty((num_dsts, num_nodes))
+    distances[np.arange(num_dsts)[np.newaxis, :], sids] = relative_distances
+
+    # Those which did not settle in time
+    if np.any(is_pending):
+        state["num_calculated_by_dijkstra"] += int(np.count_nonzero(is_pending))
+        adjacency = nx.to_scipy_sparse_array(graph, nodelist=range(num_nodes), weight="weight", format="csr")
+        distances[is_pending] = dijkstra(adjacency, directed=False, indices=dst_node_ids[is_pending])
+
+    return distances
+
+
+def report_plus_grid_symmetry(state):
+    """
+    Print for how many destinations the shortest paths followed from the symmetry of the plus grid torus.
+
+    :param state:  Plus grid symmetry state (as returned by create_plus_grid_symmetry_state()),
+                   if None nothing is printed
+    """
+    if state is not None:
+        print("Plus grid symmetry: %d of %d destinations had their shortest paths over the fewest hops, "
+              "%d after relaxation (%d by Dijkstra)" % (
+                  state["num_exact_by_hops"],
+                  state["num_exact_by_hops"] + state["num_exact_by_relaxation"] + state["num_calculated_by_dijkstra"],
+                  state["num_exact_by_relaxation"],
+                  state["num_calculated_by_dijkstra"]
+              ))
@@ -0,0 +1,160 @@
+# The MIT License (MIT)
+#
+# Copyright (c) 2020 ETH Zurich
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+from .incremental_shortest_paths import create_incremental_shortest_paths_state, report_incremental_shortest_paths
+from .plus_grid_symmetry import create_plus_grid_symmetry_state, report_plus_grid_symmetry
+from .fewest_hops import create_fewest_hops_state
+from .fstate_calculation import DEFAULT_MULTIPATH_COST_TOLERANCE
+
+
+def destination_gids_of_traffic(traffic_gs_pairs, include_reverse_direction=True):
+    """
+    Determine the destination ground stations of the traffic, such that the forwarding state is only
+    generated to those. If the traffic also flows back (e.g., the acknowledgements of TCP),
+    the sources are destinations as well.
+
+    :param traffic_gs_pairs:           List of (source ground station id, destination ground station id)
+    :param include_reverse_direction:  True iff the traffic also flows from the destination to the source
+
+    :return: List of destination ground station identifiers in ascending order
+    """
+    dst_gids = set()
+    for (src_gid, dst_gid) in traffic_gs_pairs:
+        if src_gid == dst_gid:
+            raise ValueError("Traffic cannot be from a ground station to itself: %d" % src_gid)
+        dst_gids.add(dst_gid)
+        if include_reverse_direction:
+            dst_gids.add(src_gid)
+    return sorted(dst_gids)
+
+
+def create_routing_options(
+        incremental_shortest_paths=False,
+        plus_grid_symmetry=False,
+        max_multipath_next_hops=None,
+        multipath_cost_tolerance=DEFAULT_MULTIPATH_COST_TOLERANCE,
+        dst_gids=None,
+        traffic_gs_pairs=None,
+        include_reverse_traffic=True,
+        num_gs_relaying_threads=1
+):
+    """
+    Create the options of how the forwarding state is calculated. None of them change the forwarding state,
+    except for the multipath forwarding state which is generated next to it, and the destination scope.
+
+    :param incremental_shortest_paths:  True to repair the shortest path trees of the previous time step instead of
+                                        calculating them anew (see repair_shortest_path_trees(), fastest with numba;
+                                        not for algorithm_free_one_only_gs_relays)
+    :param plus_grid_symmetry:          True to use the symmetry of the ISLs to calculate the shortest paths if they
+                                        are a plus grid torus (see detect_plus_grid_torus()), which is detected by
+                                        help_dynamic_state() and set as "plus_grid_torus" (see
+                                        calculate_shortest_path_distances_to_with_symmetry() for when it helps)
+    :param max_multipath_next_hops:     If not None, a multipath forwarding state (fstate_multipath_<t>.txt) with up to
+                                        this many next hops is also generated (only for the shortest path
+                                        algorithms over ISLs)
+    :param multipath_cost_tolerance:    Fraction by which the distance via a multipath next hop may be longer than
+                                        via the best next hop (math.inf to use every next hop closer to the
+                                        destination)
+    :param dst_gids:                    If not None, the forwarding state is only generated to these destination
+                                        ground stations
+    :param traffic_gs_pairs:            If not None (instead of dst_gids), the forwarding state is only generated to
+                                        the destinations of these (source gid, destination gid) traffic pairs
+                                        (see destination_gids_of_traffic())
+    :param include_reverse_traffic:     True iff the traffic pairs also flow back, such that their sources are
+                                        destinations as well
+    :param num_gs_relaying_threads:     Number of threads among which the destination ground stations are divided
+                                        (only for algorithm_free_one_only_gs_relays)
+
+    :return: Routing options (dictionary)
+    """
+    if traffic_gs_pairs is not None:
+        if dst_gids is not None:
+            raise ValueError("Either the destination ground stations or the traffic pairs can be given, not both")
+        dst_gids = destination_gids_of_traffic(traffic_gs_pairs, include_reverse_traffic)
+    return {
+        "incremental_shortest_paths": incremental_shortest_paths,
+        "plus_grid_symmetry": plus_grid_symmetry,
+        "plus_grid_torus": None,
+        "max_multipath_next_hops": max_multipath_next_hops,
+        "multipath_cost_tolerance": multipath_cost_tolerance,
+        "dst_gids": dst_gids,
+        "num_gs_relaying_threads": num_gs_relaying_threads
+    }
+
+
+def create_routing_state(dynamic_state_algorithm, num_satellites, list_isls, routing_options=None):
+    """
+    Create the state which the dynamic state algorithm carries from one time step to the next
+    for the routing options, and check that the algorithm supports them.
+
+    :param dynamic_state_algorithm:  Dynamic state algorithm
+    :param num_satellites:           Number of satellites
+    :param list_isls:                List of ISLs (as read from the isls.txt by read_isls())
+    :param routing_options:          Routing options (as returned by create_routing_options()), if None the defaults
+
+    :return: Routing state (dictionary)
+    """
+    if routing_options is None:
+        routing_options = create_routing_options()
+    if routing_options["incremental_shortest_paths"] and routing_options["plus_grid_torus"] is not None:
+        raise ValueError("Incremental shortest paths cannot be combined with the plus grid symmetry")
+    if dynamic_state_algorithm == "algorithm_free_one_only_over_isls_fewest_hops":
+        if routing_options["incremental_shortest_paths"] or routing_options["plus_grid_torus"] is not None:
+            raise ValueError("Incremental shortest paths and plus grid symmetry are not used by the fewest hops "
+                             "algorithm, which only calculates the hops once")
+        if routing_options["max_multipath_next_hops"] is not None:
+            raise ValueError("Multipath forwarding state is only supported by the shortest path algorithms over ISLs")
+    if dynamic_state_algorithm == "algorithm_free_one_only_gs_relays":
+        if routing_options["incremental_shortest_paths"]:
+            raise ValueError("Incremental shortest paths are not supported with ground station relays, "
+                             "as the links to the ground stations change every time step")
+        if routing_options["plus_grid_torus"] is not None:
+            raise ValueError("Plus grid symmetry is not supported with ground station relays, as there are no ISLs")
+        if routing_options["max_multipath_next_hops"] is not None:
+            raise ValueError("Multipath forwarding state is only supported by the shortest path algorithms over ISLs")
+    return {
+        "incremental_shortest_paths_state": (
+            create_incremental_shortest_paths_state() if routing_options["incremental_shortest_paths"] else None
+        ),
+        "plus_grid_symmetry_state": (
+            None if routing_options["plus_grid_torus"] is None
+            else create_plus_grid_symmetry_state(routing_options["plus_grid_torus"])
+        ),
+        "fewest_hops_state": (
+            create_fewest_hops_state(num_satellites, list_isls)
+            if dynamic_state_algorithm == "algorithm_free_one_only_over_isls_fewest_hops" else None
+        ),
+        "max_multipath_next_hops": routing_options["max_multipath_next_hops"],
+        "multipath_cost_tolerance": routing_options["multipath_cost_tolerance"],
+        "dst_gids": routing_options["dst_gids"],
+        "num_gs_relaying_threads": routing_options["num_gs_relaying_threads"]
+    }
+
+
+def report_routing_state(routing_state):
+    """
+    Print how much the incremental shortest paths and the plus grid symmetry saved, if they were used.
+
+    :param routing_state:  Routing state (as returned by create_routing_state())
+    """
+    report_incremental_shortest_paths(routing_state["incremental_shortest_paths_state"])
+    report_plus_grid_symmetry(routing_state["plus_grid_symmetry_state"])
@@ -20,15 +20,17 @@
 # OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
 # SOFTWARE.
 
+import numpy as np
 from exputil import parse_positive_int
 
 
-def read_isls(filename_isls, num_satellites):
+def read_isls(filename_isls, num_satellites, as_array=False):
     """
     Read ISLs file into a list of undirected edges
 
     :param filename_isls:  Filename of ISLs (typically /path/to/isls.txt)
     :param num_satellites: Number of satellites (to verify indices)
+    :param as_array:       If True, return the ISLs as an integer numpy array of shape (number of ISLs, 2) instead
 
     :return: List of all undirected ISL edges
     """
@@ -54,4 +56,6 @@ def read_isls(filename_isls, num_satellites):
             # Finally add it to the list
             isls_list.append((a, b))
 
+    if as_array:
+        return np.array(isls_list, dtype=int).reshape((len(isls_list), 2))
     return isls_list
@@ -12,3 +12,13 @@ from .graph_tools import (
     augment_path_with_weights,
     sum_path_weights
 )
+from .fstate_files import (
+    find_forwarding_state_file,
+    open_forwarding_state_file,
+    read_forwarding_state_entries,
+    read_forwarding_state_at,
+    find_forwarding_state_keyframes,
+    read_forwarding_state_at_time,
+    convert_forwarding_state_file,
+    convert_forwarding_state_files
+)
@@ -21,6 +21,7 @@
 # SOFTWARE.
 
 from .graph_tools import *
+from .fstate_files import read_forwarding_state_at
 from satgen.ground_stations import *
 from satgen.tles import *
 import exputil
@@ -72,7 +73,7 @@ def analyze_path(
     time_step_num_fstate_updates = []
 
     # For each time moment
-    fstate = {}
+    fstate = create_forwarding_state(len(satellites), len(ground_stations))
     num_iterations = simulation_end_time_ns / dynamic_state_update_interval_ns
     it = 1
     for t in range(0, simulation_end_time_ns, dynamic_state_update_interval_ns):
@@ -80,29 +81,22 @@ def analyze_path(
         num_fstate_updates = 0
 
         # Read in forwarding state
-        with open(satellite_network_dynamic_state_dir + "/fstate_" + str(t) + ".txt", "r") as f_in:
-            for line in f_in:
-                spl = line.split(",")
-                current = int(spl[0])
-                destination = int(spl[1])
-                next_hop = int(spl[2])
-                fstate[(current, destination)] = next_hop
-                num_fstate_updates += 1
-
-            # Go over each pair of ground stations and calculate the length
-            for src in range(len(ground_stations)):
-                for dst in range(src + 1, len(ground_stations)):
-                    src_node_id = len(satellites) + src
-                    dst_node_id = len(satellites) + dst
-                    path = get_path(src_node_id, dst_node_id, fstate)
-                    if path is None:
-                        if len(path_list_per_pair[src][dst]) == 0 or path_list_per_pair[src][dst][-1] != []:
-                            path_list_per_pair[src][dst].append([])
-                            num_path_changes += 1
-                    else:
-                        if len(path_list_per_pair[src][dst]) == 0 or path != path_list_per_pair[src][dst][-1]:
-                            path_list_per_pair[src][dst].append(path)
-                            num_path_changes += 1
+        num_fstate_updates += read_forwarding_state_at(satellite_network_dynamic_state_dir, t, fstate)
+
+        # Go over each pair of ground stations and calculate the length
+        for src in range(len(ground_stations)):
+            for dst in range(src + 1, len(ground_stations)):
+                src_node_id = len(satellites) + src
+                dst_node_id = len(satellites) + dst
+                path = get_path(src_node_id, dst_node_id, fstate)
+                if path is None:
+                    if len(path_list_per_pair[src][dst]) == 0 or path_list_per_pair[src][dst][-1] != []:
+                        path_list_per_pair[src][dst].append([])
+                        num_path_changes += 1
+                else:
+                    if len(path_list_per_pair[src][dst]) == 0 or path != path_list_per_pair[src][dst][-1]:
+                        path_list_per_pair[src][dst].append(path)
+                        num_path_changes += 1
 
         # First iteration has an update for all, which is not interesting
         # to show in the ECDF and is not really a "change" / "update"
@@ -21,6 +21,7 @@
 # SOFTWARE.
 
 from .graph_tools import *
+from .fstate_files import open_forwarding_state_file
 from satgen.distance_tools import *
 from satgen.isls import *
 from satgen.ground_stations import *
@@ -38,7 +39,7 @@ GEODESIC_ECDF_PLOT_CUTOFF_KM = 500
 
 def analyze_rtt(
         output_data_dir, satellite_network_dir, dynamic_state_update_interval_ms,
-        simulation_end_time_s, satgenpy_dir_with_ending_slash
+        simulation_end_time_s, satgenpy_dir_with_ending_slash, propagator="ephem", use_ephemeris_file=False
 ):
 
     # Dynamic state directory
@@ -73,6 +74,14 @@ def analyze_rtt(
     max_gsl_length_m = exputil.parse_positive_float(description.get_property_or_fail("max_gsl_length_m"))
     max_isl_length_m = exputil.parse_positive_float(description.get_property_or_fail("max_isl_length_m"))
 
+    # Satellite positions
+    ephemeris = None
+    if use_ephemeris_file:
+        ephemeris = read_ephemeris_for_satellite_network(
+            satellite_network_dir, dynamic_state_update_interval_ms, simulation_end_time_s, propagator
+        )
+    position_source = create_position_source(satellites, propagator, ephemeris)
+
     # Analysis
     rtt_list_per_pair = []
     for i in range(len(ground_stations)):
@@ -83,23 +92,20 @@ def analyze_rtt(
     unreachable_per_pair = np.zeros((len(ground_stations), len(ground_stations)))
 
     # For each time moment
-    fstate = {}
+    fstate = create_forwarding_state(len(satellites), len(ground_stations))
     num_iterations = simulation_end_time_ns / dynamic_state_update_interval_ns
     it = 1
     for t in range(0, simulation_end_time_ns, dynamic_state_update_interval_ns):
 
         # Read in forwarding state
-        with open(satellite_network_dynamic_state_dir + "/fstate_" + str(t) + ".txt", "r") as f_in:
-            for line in f_in:
-                spl = line.split(",")
-                current = int(spl[0])
-                destination = int(spl[1])
-                next_hop = int(spl[2])
-                fstate[(current, destination)] = next_hop
+        with open_forwarding_state_file(satellite_network_dynamic_state_dir, t) as f_in:
+            read_forwarding_state_delta(f_in, fstate, forwarding_state_format_of(f_in.name))
 
             # Given we are going to graph often, we can pre-compute the edge lengths
+            position_table = create_position_table_from_source(position_source, epoch, t, satellites)
             graph_with_distance = construct_graph_with_distances(epoch, t, satellites, ground_stations,
-                                                                 list_isls, max_gsl_length_m, max_isl_length_m)
+                                                                 list_isls, max_gsl_length_m, max_isl_length_m,
+                                                                 position_table=position_table)
 
             # Go over each pair of ground stations and calculate the length
             for src in range(len(ground_stations)):
@@ -191,7 +197,8 @@ def analyze_rtt(
                 ))
                 print_routes_and_rtt(base_output_dir, satellite_network_dir, dynamic_state_update_interval_ms,
                                      simulation_end_time_s, len(satellites) + largest_rtt_delta_list[i][3],
-                                     len(satellites) + largest_rtt_delta_list[i][4], satgenpy_dir_with_ending_slash)
+                                     len(satellites) + largest_rtt_delta_list[i][4], satgenpy_dir_with_ending_slash,
+                                     propagator=propagator, use_ephemeris_file=use_ephemeris_file)
                 already_plotted_nodes.add(largest_rtt_delta_list[i][3])
                 already_plotted_nodes.add(largest_rtt_delta_list[i][4])
                 num_plotted += 1
@@ -223,7 +230,8 @@ def analyze_rtt(
                 ))
                 print_routes_and_rtt(base_output_dir, satellite_network_dir, dynamic_state_update_interval_ms,
                                      simulation_end_time_s, len(satellites) + most_unreachable_list[i][1],
-                                     len(satellites) + most_unreachable_list[i][2], satgenpy_dir_with_ending_slash)
+                                     len(satellites) + most_unreachable_list[i][2], satgenpy_dir_with_ending_slash,
+                                     propagator=propagator, use_ephemeris_file=use_ephemeris_file)
                 already_plotted_nodes.add(most_unreachable_list[i][1])
                 already_plotted_nodes.add(most_unreachable_list[i][2])
                 num_plotted += 1
@@ -21,6 +21,7 @@
 # SOFTWARE.
 
 from .graph_tools import *
+from .fstate_files import open_forwarding_state_file
 from satgen.ground_stations import *
 from satgen.tles import *
 import exputil
@@ -75,7 +76,7 @@ def analyze_time_step_path(output_data_dir, satellite_network_dir,
         per_dyn_state_path_list_per_pair.append(path_list_per_pair)
 
     # For each time moment
-    fstate = {}
+    fstate = create_forwarding_state(len(satellites), len(ground_stations))
     smallest_step_ns = min(multiple_dynamic_state_update_interval_ms) * 1000 * 1000
     num_iterations = simulation_end_time_ns / smallest_step_ns
     it = 1
@@ -86,13 +87,8 @@ def analyze_time_step_path(output_data_dir, satellite_network_dir,
             if t % (c[0] * 1000 * 1000) == 0:
 
                 # Read in forwarding state
-                with open(c[1] + "/fstate_" + str(t) + ".txt", "r") as f_in:
-                    for line in f_in:
-                        spl = line.split(",")
-                        current = int(spl[0])
-                        destination = int(spl[1])
-                        next_hop = int(spl[2])
-                        fstate[(current, destination)] = next_hop
+                with open_forwarding_state_file(c[1], t) as f_in:
+                    read_forwarding_state_delta(f_in, fstate, forwarding_state_format_of(f_in.name))
 
                     # Go over each pair of ground stations and calculate the length
                     for src in range(len(ground_stations)):
@@ -0,0 +1,206 @@
+# The MIT License (MIT)
+#
+# Copyright (c) 2020 ETH Zurich
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+import io
+import os
+from satgen.dynamic_state.forwarding_state import (
+    FSTATE_FORMATS,
+    create_forwarding_state,
+    read_forwarding_state_keyframes,
+    forwarding_state_filename,
+    forwarding_state_format_of,
+    encode_forwarding_state_entries,
+    decode_forwarding_state_entries,
+    apply_forwarding_state_entries
+)
+from satgen.dynamic_state.dynamic_state_compression import uncompressed_filename
+from satgen.dynamic_state.dynamic_state_archive import (
+    dynamic_state_file_exists,
+    list_dynamic_state_files,
+    read_dynamic_state_file
+)
+
+
+def find_forwarding_state_file(dynamic_state_dir, time_since_epoch_ns):
+    """
+    Find the forwarding state file of a time step, in whichever format it was generated,
+    as a separate file or in the dynamic state archive, and compressed or not.
+
+    :param dynamic_state_dir:    Dynamic state directory
+    :param time_since_epoch_ns:  Time since epoch (ns)
+
+    :return: Forwarding state filename
+    """
+    for fstate_format in FSTATE_FORMATS:
+        filename = forwarding_state_filename(dynamic_state_dir, time_since_epoch_ns, fstate_format)
+        if dynamic_state_file_exists(dynamic_state_dir, os.path.basename(filename)):
+            return filename
+    raise ValueError("There is no forwarding state file at t=%d ns in %s" % (time_since_epoch_ns, dynamic_state_dir))
+
+
+def open_forwarding_state_file(dynamic_state_dir, time_since_epoch_ns):
+    """
+    Open the forwarding state file of a time step (see find_forwarding_state_file()), to be read with
+    read_forwarding_state_delta() in the format of its name (see forwarding_state_format_of()).
+
+    :param dynamic_state_dir:    Dynamic state directory
+    :param time_since_epoch_ns:  Time since epoch (ns)
+
+    :return: In-memory file with the uncompressed content (bytes if "bin", else text), named as the forwarding
+             state file
+    """
+    filename = find_forwarding_state_file(dynamic_state_dir, time_since_epoch_ns)
+    content = read_dynamic_state_file(*os.path.split(filename))
+    f_in = io.BytesIO(content) if forwarding_state_format_of(filename) == "bin" else io.StringIO(content.decode())
+    f_in.name = filename
+    return f_in
+
+
+def read_forwarding_state_entries(filename):
+    """
+    Read all the entries of a forwarding state file at once. A binary file is read with a single numpy.frombuffer.
+    If it is not there as a separate file, it is read from the dynamic state archive of its directory,
+    and if it was compressed, it is decompressed.
+
+    :param filename:  Forwarding state filename (fstate_<t>.txt or fstate_<t>.bin, optionally with .gz or .zst)
+
+    :return: Integer array of shape (number of entries, 5), each entry being
+             (node, destination, next-hop, my-if, next-hop-if)
+    """
+    fstate_format = forwarding_state_format_of(filename)
+    content = read_dynamic_state_file(*os.path.split(filename))
+    return decode_forwarding_state_entries(content if fstate_format == "bin" else content.decode(), fstate_format)
+
+
+def read_forwarding_state_at(dynamic_state_dir, time_since_epoch_ns, fstate):
+    """
+    Update the forwarding state with the entries which changed at a time step,
+    in whichever format the forwarding state was generated.
+
+    :param dynamic_state_dir:    Dynamic state directory
+    :param time_since_epoch_ns:  Time since epoch (ns)
+    :param fstate:               Forwarding state (as returned by create_forwarding_state()), which is updated in-place
+
+    :return: Number of entries read
+    """
+    return apply_forwarding_state_entries(
+        fstate, read_forwarding_state_entries(find_forwarding_state_file(dynamic_state_dir, time_since_epoch_ns))
+    )
+
+
+def find_forwarding_state_keyframes(dynamic_state_dir):
+    """
+    Find the time steps at which the full forwarding state was written (keyframes), which are listed
+    in the fstate_keyframes_<offset>.txt files if it was generated with a keyframe interval.
+
+    :param dynamic_state_dir:  Dynamic state directory
+
+    :return: List of (keyframe time (ns), time step (ns), number of time steps) in ascending order of time
+    """
+    keyframe_segments = []
+    for filename in list_dynamic_state_files(dynamic_state_dir):
+        if filename.startswith("fstate_keyframes_") and filename.endswith(".txt"):
+            content = read_dynamic_state_file(dynamic_state_dir, filename).decode()
+            keyframe_segments.extend(read_forwarding_state_keyframes(io.StringIO(content)))
+    return sorted(keyframe_segments)
+
+
+def read_forwarding_state_at_time(
+        dynamic_state_dir,
+        time_since_epoch_ns,
+        num_satellites,
+        num_ground_stations,
+        keyframe_segments=None
+):
+    """
+    Reconstruct the forwarding state at a time step, by reading the keyframe before it and then only the time steps
+    in between, instead of all the time steps since the start.
+
+    :param dynamic_state_dir:    Dynamic state directory
+    :param time_since_epoch_ns:  Time since epoch (ns)
+    :param num_satellites:       Number of satellites
+    :param num_ground_stations:  Number of ground stations
+    :param keyframe_segments:    Keyframes (as returned by find_forwarding_state_keyframes()),
+                                 if None they are found (which is best done once when reading many time steps)
+
+    :return: Forwarding state (as returned by create_forwarding_state())
+    """
+    if keyframe_segments is None:
+        keyframe_segments = find_forwarding_state_keyframes(dynamic_state_dir)
+    for (keyframe_ns, time_step_ns, num_time_steps) in reversed(keyframe_segments):
+        if keyframe_ns <= time_since_epoch_ns < keyframe_ns + num_time_steps * time_step_ns:
+            if (time_since_epoch_ns - keyframe_ns) % time_step_ns != 0:
+                raise ValueError("There is no time step at t=%d ns in %s" % (time_since_epoch_ns, dynamic_state_dir))
+            fstate = create_forwarding_state(num_satellites, num_ground_stations)
+            for t in range(keyframe_ns, time_since_epoch_ns + 1, time_step_ns):
+                read_forwarding_state_at(dynamic_state_dir, t, fstate)
+            return fstate
+    raise ValueError("There is no forwarding state keyframe before t=%d ns in %s" % (
+        time_since_epoch_ns, dynamic_state_dir
+    ))
+
+
+def convert_forwarding_state_file(filename, fstate_format):
+    """
+    Convert a forwarding state file to another format (e.g., a binary one to text for ns-3).
+    The converted file is written next to it, with the extension of the format (and uncompressed).
+
+    :param filename:       Forwarding state filename (fstate_<t>.txt or fstate_<t>.bin, optionally with .gz or .zst)
+    :param fstate_format:  Format to convert to (see FSTATE_FORMATS)
+
+    :return: Converted forwarding state filename
+    """
+    converted_filename = os.path.splitext(uncompressed_filename(filename))[0] + "." + fstate_format
+    if converted_filename == filename:
+        return filename
+    entries = read_forwarding_state_entries(filename)
+    with open(converted_filename, "wb" if fstate_format == "bin" else "w+") as f_out:
+        f_out.write(encode_forwarding_state_entries(entries, fstate_format))
+    return converted_filename
+
+
+def convert_forwarding_state_files(dynamic_state_dir, fstate_format, remove_original=False):
+    """
+    Convert all the forwarding state files of a dynamic state directory to another format.
+
+    :param dynamic_state_dir:  Dynamic state directory
+    :param fstate_format:      Format to convert to (see FSTATE_FORMATS)
+    :param remove_original:    True to remove the files which were converted
+
+    :return: Number of files converted
+    """
+    if fstate_format not in FSTATE_FORMATS:
+        raise ValueError("Unknown forwarding state format: " + str(fstate_format))
+    num_converted = 0
+    for name in sorted(os.listdir(dynamic_state_dir)):
+        (base, extension) = os.path.splitext(uncompressed_filename(name))
+        if (
+                base.startswith("fstate_")
+                and base[len("fstate_"):].isdigit()
+                and extension[1:] in FSTATE_FORMATS
+                and extension[1:] != fstate_format
+        ):
+            convert_forwarding_state_file(dynamic_state_dir + "/" + name, fstate_format)
+            if remove_original:
+                os.remove(dynamic_state_dir + "/" + name)
+            num_converted += 1
+    return num_converted
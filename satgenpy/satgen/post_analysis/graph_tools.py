@@ -21,15 +21,17 @@
 # SOFTWARE.
 
 from satgen.distance_tools import *
+from satgen.dynamic_state import *
+from satgen.propagation import *
 import networkx as nx
-from astropy import units as u
 
 
 def construct_graph_with_distances(epoch, time_since_epoch_ns, satellites, ground_stations, list_isls,
-                                   max_gsl_length_m, max_isl_length_m):
+                                   max_gsl_length_m, max_isl_length_m, position_table=None):
 
-    # Time
-    time = epoch + time_since_epoch_ns * u.ns
+    # Satellite positions
+    if position_table is None:
+        position_table = create_position_table(epoch, time_since_epoch_ns, satellites)
 
     # Graph
     sat_net_graph_with_gs = nx.Graph()
@@ -38,7 +40,7 @@ def construct_graph_with_distances(epoch, time_since_epoch_ns, satellites, groun
     for (a, b) in list_isls:
 
         # Only ISLs which are close enough are considered
-        sat_distance_m = distance_m_between_satellites(satellites[a], satellites[b], str(epoch), str(time))
+        sat_distance_m = distance_m_between_satellites_from_position_table(position_table, a, b)
         if sat_distance_m <= max_isl_length_m:
             sat_net_graph_with_gs.add_edge(
                 a, b, weight=sat_distance_m
@@ -49,7 +51,7 @@ def construct_graph_with_distances(epoch, time_since_epoch_ns, satellites, groun
 
         # Find satellites in range
         for sid in range(len(satellites)):
-            distance_m = distance_m_ground_station_to_satellite(ground_station, satellites[sid], str(epoch), str(time))
+            distance_m = distance_m_ground_station_to_satellite_from_position_table(position_table, ground_station, sid)
             if distance_m <= max_gsl_length_m:
                 sat_net_graph_with_gs.add_edge(len(satellites) + ground_station["gid"], sid, weight=distance_m)
 
@@ -61,10 +63,11 @@ def compute_path_length_with_graph(path, graph):
 
 
 def compute_path_length_without_graph(path, epoch, time_since_epoch_ns, satellites, ground_stations, list_isls,
-                                      max_gsl_length_m, max_isl_length_m):
+                                      max_gsl_length_m, max_isl_length_m, position_table=None):
 
-    # Time
-    time = epoch + time_since_epoch_ns * u.ns
+    # Satellite positions
+    if position_table is None:
+        position_table = create_position_table(epoch, time_since_epoch_ns, satellites)
 
     # Go hop-by-hop and compute
     path_length_m = 0.0
@@ -75,11 +78,10 @@ def compute_path_length_without_graph(path, epoch, time_since_epoch_ns, satellit
         
         # Satellite to satellite
         if from_node_id < len(satellites) and to_node_id < len(satellites):
-            sat_distance_m = distance_m_between_satellites(
-                satellites[from_node_id],
-                satellites[to_node_id],
-                str(epoch),
-                str(time)
+            sat_distance_m = distance_m_between_satellites_from_position_table(
+                position_table,
+                from_node_id,
+                to_node_id
             )
             if sat_distance_m > max_isl_length_m \
                     or ((to_node_id, from_node_id) not in list_isls and (from_node_id, to_node_id) not in list_isls):
@@ -89,11 +91,10 @@ def compute_path_length_without_graph(path, epoch, time_since_epoch_ns, satellit
         # Ground station to satellite
         elif from_node_id >= len(satellites) and to_node_id < len(satellites):
             ground_station = ground_stations[from_node_id - len(satellites)]
-            distance_m = distance_m_ground_station_to_satellite(
+            distance_m = distance_m_ground_station_to_satellite_from_position_table(
+                position_table,
                 ground_station,
-                satellites[to_node_id],
-                str(epoch),
-                str(time)
+                to_node_id
             )
             if distance_m > max_gsl_length_m:
                 raise ValueError("Invalid GSL hop from " + str(from_node_id) + " to " + str(to_node_id)
@@ -103,11 +104,10 @@ def compute_path_length_without_graph(path, epoch, time_since_epoch_ns, satellit
         # Satellite to ground station
         elif from_node_id < len(satellites) and to_node_id >= len(satellites):
             ground_station = ground_stations[to_node_id - len(satellites)]
-            distance_m = distance_m_ground_station_to_satellite(
+            distance_m = distance_m_ground_station_to_satellite_from_position_table(
+                position_table,
                 ground_station,
-                satellites[from_node_id],
-                str(epoch),
-                str(time)
+                from_node_id
             )
             if distance_m > max_gsl_length_m:
                 raise ValueError("Invalid GSL hop from " + str(from_node_id) + " to " + str(to_node_id)
@@ -122,13 +122,13 @@ def compute_path_length_without_graph(path, epoch, time_since_epoch_ns, satellit
 
 def get_path(src, dst, forward_state):
 
-    if forward_state[(src, dst)] == -1:  # No path exists
+    if get_next_hop(forward_state, src, dst) == -1:  # No path exists
         return None
 
     curr = src
     path = [src]
     while curr != dst:
-        next_hop = forward_state[(curr, dst)]
+        next_hop = get_next_hop(forward_state, curr, dst)
         path.append(next_hop)
         curr = next_hop
     return path
@@ -136,13 +136,13 @@ def get_path(src, dst, forward_state):
 
 def get_path_with_weights(src, dst, forward_state, sat_net_graph_with_gs):
 
-    if forward_state[(src, dst)] == -1:  # No path exists
+    if get_next_hop(forward_state, src, dst) == -1:  # No path exists
         return None
 
     curr = src
     path = []
     while curr != dst:
-        next_hop = forward_state[(curr, dst)]
+        next_hop = get_next_hop(forward_state, curr, dst)
         w = sat_net_graph_with_gs.get_edge_data(curr, next_hop)["weight"]
         path.append((curr, next_hop, w))
         curr = next_hop
@@ -0,0 +1,43 @@
+# The MIT License (MIT)
+#
+# Copyright (c) 2020 ETH Zurich
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+import sys
+from satgen.dynamic_state.dynamic_state_archive import expand_dynamic_state_archive
+
+
+def main():
+    args = sys.argv[1:]
+    if len(args) != 1 and len(args) != 2:
+        print("Must supply one or two arguments")
+        print("Usage: python -m satgen.post_analysis.main_expand_dynamic_state_archive.py [dynamic_state_dir] "
+              "[optional: remove_archive (default: false)]")
+        exit(1)
+    else:
+        num_expanded = expand_dynamic_state_archive(
+            args[0],
+            len(args) == 2 and args[1].lower() == "true"
+        )
+        print("Expanded the dynamic state archive into %d file(s)" % num_expanded)
+
+
+if __name__ == "__main__":
+    main()
@@ -21,6 +21,7 @@
 # SOFTWARE.
 
 from .graph_tools import *
+from .fstate_files import open_forwarding_state_file
 from satgen.isls import *
 from satgen.ground_stations import *
 from satgen.tles import *
@@ -41,7 +42,7 @@ ISL_COLOR = "#eb6b38"
 def print_graphical_routes_and_rtt(
         base_output_dir, satellite_network_dir,
         dynamic_state_update_interval_ms,
-        simulation_end_time_s, src, dst
+        simulation_end_time_s, src, dst, propagator="ephem", use_ephemeris_file=False
 ):
 
     # Local shell
@@ -72,29 +73,35 @@ def print_graphical_routes_and_rtt(
     max_gsl_length_m = exputil.parse_positive_float(description.get_property_or_fail("max_gsl_length_m"))
     max_isl_length_m = exputil.parse_positive_float(description.get_property_or_fail("max_isl_length_m"))
 
+    # Satellite positions
+    ephemeris = None
+    if use_ephemeris_file:
+        ephemeris = read_ephemeris_for_satellite_network(
+            satellite_network_dir, dynamic_state_update_interval_ms, simulation_end_time_s, propagator
+        )
+    position_source = create_position_source(satellites, propagator, ephemeris)
+
     # For each time moment
-    fstate = {}
+    fstate = create_forwarding_state(len(satellites), len(ground_stations))
     current_path = []
     rtt_ns_list = []
     for t in range(0, simulation_end_time_ns, dynamic_state_update_interval_ns):
-        with open(satellite_network_dynamic_state_dir + "/fstate_" + str(t) + ".txt", "r") as f_in:
-            for line in f_in:
-                spl = line.split(",")
-                current = int(spl[0])
-                destination = int(spl[1])
-                next_hop = int(spl[2])
-                fstate[(current, destination)] = next_hop
+        with open_forwarding_state_file(satellite_network_dynamic_state_dir, t) as f_in:
+            read_forwarding_state_delta(f_in, fstate, forwarding_state_format_of(f_in.name))
 
             # Calculate path length
             path_there = get_path(src, dst, fstate)
             path_back = get_path(dst, src, fstate)
             if path_there is not None and path_back is not None:
+                position_table = create_position_table_from_source(position_source, epoch, t, satellites)
                 length_src_to_dst_m = compute_path_length_without_graph(path_there, epoch, t, satellites,
                                                                         ground_stations, list_isls,
-                                                                        max_gsl_length_m, max_isl_length_m)
+                                                                        max_gsl_length_m, max_isl_length_m,
+                                                                        position_table=position_table)
                 length_dst_to_src_m = compute_path_length_without_graph(path_back, epoch, t,
                                                                         satellites, ground_stations, list_isls,
-                                                                        max_gsl_length_m, max_isl_length_m)
+                                                                        max_gsl_length_m, max_isl_length_m,
+                                                                        position_table=position_table)
                 rtt_ns = (length_src_to_dst_m + length_dst_to_src_m) * 1000000000.0 / 299792458.0
             else:
                 length_src_to_dst_m = 0.0
@@ -131,15 +138,15 @@ def print_graphical_routes_and_rtt(
                 ax.add_feature(cartopy.feature.LAND, zorder=0, edgecolor='black', linewidth=0.2)
                 ax.add_feature(cartopy.feature.BORDERS, edgecolor='gray', linewidth=0.2)
                 
-                # Time moment
-                time_moment_str = str(epoch + t * u.ns)
+                # Time moment (converted once for all satellites)
+                time_instant = create_time_instant(epoch, t)
 
                 # Other satellites
                 for node_id in range(len(satellites)):
                     shadow_ground_station = create_basic_ground_station_for_satellite_shadow(
                         satellites[node_id],
-                        str(epoch),
-                        time_moment_str
+                        time_instant["ephem_epoch"],
+                        time_instant["ephem_date"]
                     )
                     latitude_deg = float(shadow_ground_station["latitude_degrees_str"])
                     longitude_deg = float(shadow_ground_station["longitude_degrees_str"])
@@ -223,8 +230,8 @@ def print_graphical_routes_and_rtt(
                         if from_node_id < len(satellites):
                             shadow_ground_station = create_basic_ground_station_for_satellite_shadow(
                                 satellites[from_node_id],
-                                str(epoch),
-                                time_moment_str
+                                time_instant["ephem_epoch"],
+                                time_instant["ephem_date"]
                             )
                             from_latitude_deg = float(shadow_ground_station["latitude_degrees_str"])
                             from_longitude_deg = float(shadow_ground_station["longitude_degrees_str"])
@@ -240,8 +247,8 @@ def print_graphical_routes_and_rtt(
                         if to_node_id < len(satellites):
                             shadow_ground_station = create_basic_ground_station_for_satellite_shadow(
                                 satellites[to_node_id],
-                                str(epoch),
-                                time_moment_str
+                                time_instant["ephem_epoch"],
+                                time_instant["ephem_date"]
                             )
                             to_latitude_deg = float(shadow_ground_station["latitude_degrees_str"])
                             to_longitude_deg = float(shadow_ground_station["longitude_degrees_str"])
@@ -286,8 +293,8 @@ def print_graphical_routes_and_rtt(
                         if node_id < len(satellites):
                             shadow_ground_station = create_basic_ground_station_for_satellite_shadow(
                                 satellites[node_id],
-                                str(epoch),
-                                time_moment_str
+                                time_instant["ephem_epoch"],
+                                time_instant["ephem_date"]
                             )
                             latitude_deg = float(shadow_ground_station["latitude_degrees_str"])
                             longitude_deg = float(shadow_ground_station["longitude_degrees_str"])
@@ -21,6 +21,7 @@
 # SOFTWARE.
 
 from .graph_tools import *
+from .fstate_files import open_forwarding_state_file
 from satgen.isls import *
 from satgen.ground_stations import *
 from satgen.tles import *
@@ -29,7 +30,8 @@ import tempfile
 
 
 def print_routes_and_rtt(base_output_dir, satellite_network_dir, dynamic_state_update_interval_ms,
-                         simulation_end_time_s, src, dst, satgenpy_dir_with_ending_slash):
+                         simulation_end_time_s, src, dst, satgenpy_dir_with_ending_slash,
+                         propagator="ephem", use_ephemeris_file=False):
 
     # Local shell
     local_shell = exputil.LocalShell()
@@ -59,35 +61,41 @@ def print_routes_and_rtt(base_output_dir, satellite_network_dir, dynamic_state_u
     max_gsl_length_m = exputil.parse_positive_float(description.get_property_or_fail("max_gsl_length_m"))
     max_isl_length_m = exputil.parse_positive_float(description.get_property_or_fail("max_isl_length_m"))
 
+    # Satellite positions
+    ephemeris = None
+    if use_ephemeris_file:
+        ephemeris = read_ephemeris_for_satellite_network(
+            satellite_network_dir, dynamic_state_update_interval_ms, simulation_end_time_s, propagator
+        )
+    position_source = create_position_source(satellites, propagator, ephemeris)
+
     # Write data file
 
     data_path_filename = data_dir + "/networkx_path_" + str(src) + "_to_" + str(dst) + ".txt"
     with open(data_path_filename, "w+") as data_path_file:
 
         # For each time moment
-        fstate = {}
+        fstate = create_forwarding_state(len(satellites), len(ground_stations))
         current_path = []
         rtt_ns_list = []
         for t in range(0, simulation_end_time_ns, dynamic_state_update_interval_ns):
 
-            with open(satellite_network_dynamic_state_dir + "/fstate_" + str(t) + ".txt", "r") as f_in:
-                for line in f_in:
-                    spl = line.split(",")
-                    current = int(spl[0])
-                    destination = int(spl[1])
-                    next_hop = int(spl[2])
-                    fstate[(current, destination)] = next_hop
+            with open_forwarding_state_file(satellite_network_dynamic_state_dir, t) as f_in:
+                read_forwarding_state_delta(f_in, fstate, forwarding_state_format_of(f_in.name))
 
                 # Calculate path length
                 path_there = get_path(src, dst, fstate)
                 path_back = get_path(dst, src, fstate)
                 if path_there is not None and path_back is not None:
+                    position_table = create_position_table_from_source(position_source, epoch, t, satellites)
                     length_src_to_dst_m = compute_path_length_without_graph(path_there, epoch, t, satellites,
                                                                             ground_stations, list_isls,
-                                                                            max_gsl_length_m, max_isl_length_m)
+                                                                            max_gsl_length_m, max_isl_length_m,
+                                                                            position_table=position_table)
                     length_dst_to_src_m = compute_path_length_without_graph(path_back, epoch, t,
                                                                             satellites, ground_stations, list_isls,
-                                                                            max_gsl_length_m, max_isl_length_m)
+                                                                            max_gsl_length_m, max_isl_length_m,
+                                                                            position_table=position_table)
                     rtt_ns = (length_src_to_dst_m + length_dst_to_src_m) * 1000000000.0 / 299792458.0
                 else:
                     length_src_to_dst_m = 0.0
@@ -0,0 +1,64 @@
+from .propagate_satellites import (
+    create_satrec,
+    create_satrec_array,
+    propagate_satellite_states_teme_km,
+    propagate_satellite_positions_m,
+    teme_to_ecef_m,
+    greenwich_mean_sidereal_time_rad
+)
+from .time_instant import (
+    create_time_instant
+)
+from .position_table import (
+    resolve_propagator,
+    create_position_source,
+    report_analytic_max_deviation,
+    report_interpolation_max_error,
+    satellite_positions_m_from_source,
+    create_position_table_from_source,
+    create_position_table,
+    satellite_observation_from_position_table,
+    distance_m_between_satellites_from_position_table,
+    isl_lengths_m_from_position_table,
+    distance_m_ground_station_to_satellite_from_position_table
+)
+from .ephemeris_file import (
+    ephemeris_filename,
+    calculate_tles_sha256,
+    generate_ephemeris_file,
+    read_ephemeris_file,
+    satellite_positions_m_from_ephemeris
+)
+from .helper_ephemeris import (
+    help_ephemeris,
+    read_ephemeris_for_satellite_network
+)
+from .analytic_propagator import (
+    is_analytic_propagation_possible,
+    create_analytic_elements,
+    propagate_satellite_positions_teme_km_analytic,
+    propagate_satellite_positions_m_analytic,
+    calculate_analytic_max_deviation_m
+)
+from .interpolation import (
+    DEFAULT_MAX_INTERPOLATION_ERROR_M,
+    INTERPOLATION_CHECK_FRACTIONS,
+    create_interpolation_state,
+    hermite_interpolate_teme_km,
+    load_anchor_interval,
+    interpolate_satellite_positions_m
+)
+from .visibility_windows import (
+    DEFAULT_VISIBILITY_SAMPLE_INTERVAL_NS,
+    DEFAULT_VISIBILITY_TOLERANCE_NS,
+    MAX_SATELLITE_SPEED_M_PER_S,
+    create_single_satellite_propagator,
+    single_satellite_position_m,
+    single_satellite_distance_m,
+    refine_visibility_change_ns,
+    find_visible_time_ns,
+    calculate_visibility_windows,
+    create_visibility_windows_index,
+    satellites_in_range_from_visibility_windows,
+    visibility_change_times_ns
+)
@@ -0,0 +1,221 @@
+# The MIT License (MIT)
+#
+# Copyright (c) 2020 ETH Zurich
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+import numpy as np
+from .propagate_satellites import create_satrec, teme_to_ecef_m, propagate_satellite_positions_m, NS_PER_DAY
+
+
+# Largest eccentricity which is considered circular (generated TLEs have 0.0000001)
+ANALYTIC_MAX_ECCENTRICITY = 1e-6
+
+# Smallest mean motion (rev/day) of a near-Earth orbit (period below 225 minutes), beyond which SGP-4 adds deep space
+# perturbations that are not modeled
+ANALYTIC_MIN_MEAN_MOTION_REV_PER_DAY = 1440.0 / 225.0
+
+# Number of Newton iterations to solve Kepler's equation (the orbits are near-circular, as such it converges quickly)
+ANALYTIC_KEPLER_ITERATIONS = 3
+
+
+def is_analytic_propagation_possible(satellites):
+    """
+    Check whether the satellites can be propagated analytically, which is the case for near-circular
+    near-Earth orbits without drag, such as those generated by generate_tles_from_scratch_manual()
+    and generate_tles_from_scratch_with_sgp().
+
+    :param satellites:  List of ephem satellites
+
+    :return: True iff all satellites can be propagated analytically
+    """
+    for satellite in satellites:
+        if satellite._e > ANALYTIC_MAX_ECCENTRICITY \
+                or satellite._drag != 0 \
+                or satellite._decay != 0 \
+                or satellite._n < ANALYTIC_MIN_MEAN_MOTION_REV_PER_DAY:
+            return False
+    return True
+
+
+def create_analytic_elements(satellites):
+    """
+    Create the elements of the analytic propagator.
+
+    Without drag and deep space perturbations, the SGP-4 secular update of the mean elements is linear in time,
+    and the periodic corrections only depend on the elements at that time. As such, each satellite
+    is fully described by its epoch elements and the secular rates calculated by the SGP-4 initialization.
+
+    :param satellites:  List of ephem satellites (must be possible to propagate analytically)
+
+    :return: Analytic elements (dictionary of numpy arrays, satellite i at index i)
+    """
+    if not is_analytic_propagation_possible(satellites):
+        raise ValueError("Satellites can only be propagated analytically if they are in near-circular "
+                         "near-Earth orbits without drag")
+
+    satrecs = [create_satrec(satellites[sid], sid) for sid in range(len(satellites))]
+    inclination = np.array([satrec.inclo for satrec in satrecs])
+    sin_inclination = np.sin(inclination)
+    cos_inclination = np.cos(inclination)
+    j3oj2 = satrecs[0].j3oj2 if len(satrecs) > 0 else 0.0
+    return {
+        "jd_epoch": np.array([satrec.jdsatepoch for satrec in satrecs]),
+        "fr_epoch": np.array([satrec.jdsatepochF for satrec in satrecs]),
+        "mean_anomaly": np.array([satrec.mo for satrec in satrecs]),
+        "mean_anomaly_dot": np.array([satrec.mdot for satrec in satrecs]),
+        "arg_of_perigee": np.array([satrec.argpo for satrec in satrecs]),
+        "arg_of_perigee_dot": np.array([satrec.argpdot for satrec in satrecs]),
+        "raan": np.array([satrec.nodeo for satrec in satrecs]),
+        "raan_dot": np.array([satrec.nodedot for satrec in satrecs]),
+        "eccentricity": np.maximum(np.array([satrec.ecco for satrec in satrecs]), 1.0e-6),  # Same lower bound as SGP-4
+        "semi_major_axis": np.array([satrec.a for satrec in satrecs]),  # In Earth radii
+        "inclination": inclination,
+        "sin_inclination": sin_inclination,
+        "cos_inclination": cos_inclination,
+        "con41": 3.0 * cos_inclination * cos_inclination - 1.0,
+        "x1mth2": 1.0 - cos_inclination * cos_inclination,
+        "x7thm1": 7.0 * cos_inclination * cos_inclination - 1.0,
+        "aycof": -0.5 * j3oj2 * sin_inclination,
+        "xlcof": -0.25 * j3oj2 * sin_inclination * (3.0 + 5.0 * cos_inclination)
+                 / np.maximum(1.0 + cos_inclination, 1.5e-12),  # Same divide by zero guard as SGP-4
+        "j2": satrecs[0].j2 if len(satrecs) > 0 else 0.0,
+        "radius_earth_km": satrecs[0].radiusearthkm if len(satrecs) > 0 else 0.0,
+    }
+
+
+def propagate_satellite_positions_teme_km_analytic(analytic_elements, minutes_since_satellite_epoch):
+    """
+    Calculate the positions in the TEME frame analytically.
+
+    :param analytic_elements:              Analytic elements (as returned by create_analytic_elements())
+    :param minutes_since_satellite_epoch:  Minutes since the epoch of each satellite, either of shape
+                                           (number of satellites,) or (number of time instants, number of satellites)
+
+    :return: Numpy array of shape (..., number of satellites, 3) of TEME positions in kilometers
+    """
+    e = analytic_elements
+    t = minutes_since_satellite_epoch
+
+    # Secular update of the mean elements
+    mean_anomaly = e["mean_anomaly"] + e["mean_anomaly_dot"] * t
+    arg_of_perigee = e["arg_of_perigee"] + e["arg_of_perigee_dot"] * t
+    raan = e["raan"] + e["raan_dot"] * t
+    am = e["semi_major_axis"]
+    em = e["eccentricity"]
+
+    # Long period periodics
+    axnl = em * np.cos(arg_of_perigee)
+    temp = 1.0 / (am * (1.0 - em * em))
+    aynl = em * np.sin(arg_of_perigee) + temp * e["aycof"]
+    xl = mean_anomaly + arg_of_perigee + raan + temp * e["xlcof"] * axnl
+
+    # Kepler's equation
+    u = np.mod(xl - raan, 2.0 * np.pi)
+    eo1 = u
+    for _ in range(ANALYTIC_KEPLER_ITERATIONS):
+        sineo1 = np.sin(eo1)
+        coseo1 = np.cos(eo1)
+        eo1 = eo1 + (u - aynl * coseo1 + axnl * sineo1 - eo1) / (1.0 - coseo1 * axnl - sineo1 * aynl)
+    sineo1 = np.sin(eo1)
+    coseo1 = np.cos(eo1)
+
+    # Short period preliminary quantities
+    ecose = axnl * coseo1 + aynl * sineo1
+    esine = axnl * sineo1 - aynl * coseo1
+    el2 = axnl * axnl + aynl * aynl
+    pl = am * (1.0 - el2)
+    rl = am * (1.0 - ecose)
+    betal = np.sqrt(1.0 - el2)
+    temp = esine / (1.0 + betal)
+    sinu = am / rl * (sineo1 - aynl - axnl * temp)
+    cosu = am / rl * (coseo1 - axnl + aynl * temp)
+    su = np.arctan2(sinu, cosu)
+    sin2u = (cosu + cosu) * sinu
+    cos2u = 1.0 - 2.0 * sinu * sinu
+    temp1 = 0.5 * e["j2"] / pl
+    temp2 = temp1 / pl
+
+    # Short period periodics
+    mrt = rl * (1.0 - 1.5 * temp2 * betal * e["con41"]) + 0.5 * temp1 * e["x1mth2"] * cos2u
+    su = su - 0.25 * temp2 * e["x7thm1"] * sin2u
+    xnode = raan + 1.5 * temp2 * e["cos_inclination"] * sin2u
+    xinc = e["inclination"] + 1.5 * temp2 * e["cos_inclination"] * e["sin_inclination"] * cos2u
+
+    # Orientation vectors
+    sinsu = np.sin(su)
+    cossu = np.cos(su)
+    snod = np.sin(xnode)
+    cnod = np.cos(xnode)
+    sini = np.sin(xinc)
+    cosi = np.cos(xinc)
+    mr = mrt * e["radius_earth_km"]
+    return np.stack((
+        mr * (-snod * cosi * sinsu + cnod * cossu),
+        mr * (cnod * cosi * sinsu + snod * cossu),
+        mr * (sini * sinsu)
+    ), axis=-1)
+
+
+def propagate_satellite_positions_m_analytic(analytic_elements, epoch, time_since_epoch_ns):
+    """
+    Calculate all satellite positions at a time instant analytically.
+
+    :param analytic_elements:    Analytic elements (as returned by create_analytic_elements())
+    :param epoch:                Epoch (astropy Time, as returned by read_tles())
+    :param time_since_epoch_ns:  Time since epoch in nanoseconds
+
+    :return: Numpy array of shape (number of satellites, 3) with the ECEF (x, y, z) position of each satellite in meters
+    """
+
+    # Same time interpretation as propagate_satellite_positions_m()
+    jd = epoch.jd1
+    fr = epoch.jd2 + time_since_epoch_ns / NS_PER_DAY
+    minutes_since_satellite_epoch = (
+        (jd - analytic_elements["jd_epoch"]) + (fr - analytic_elements["fr_epoch"])
+    ) * 1440.0
+
+    return teme_to_ecef_m(
+        propagate_satellite_positions_teme_km_analytic(analytic_elements, minutes_since_satellite_epoch),
+        jd,
+        fr
+    )
+
+
+def calculate_analytic_max_deviation_m(analytic_elements, satrec_array, epoch, list_time_since_epoch_ns):
+    """
+    Calculate the maximum deviation of the analytic positions from those propagated by SGP-4.
+
+    :param analytic_elements:         Analytic elements (as returned by create_analytic_elements())
+    :param satrec_array:              SGP-4 satellite array (as returned by create_satrec_array())
+    :param epoch:                     Epoch (astropy Time, as returned by read_tles())
+    :param list_time_since_epoch_ns:  List of times since epoch (ns) at which to compare
+
+    :return: Maximum distance in meters between the analytic and SGP-4 position of any satellite at any of the times
+    """
+    max_deviation_m = 0.0
+    for time_since_epoch_ns in list_time_since_epoch_ns:
+        deviation_m = np.linalg.norm(
+            propagate_satellite_positions_m_analytic(analytic_elements, epoch, time_since_epoch_ns)
+            - propagate_satellite_positions_m(satrec_array, epoch, time_since_epoch_ns),
+            axis=1
+        )
+        if deviation_m.shape[0] > 0:
+            max_deviation_m = max(max_deviation_m, float(np.max(deviation_m)))
+    return max_deviation_m
@@ -0,0 +1,178 @@
+# The MIT License (MIT)
+#
+# Copyright (c) 2020 ETH Zurich
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+import hashlib
+import numpy as np
+from .propagate_satellites import create_satrec_array, propagate_satellite_positions_m
+from .analytic_propagator import create_analytic_elements, propagate_satellite_positions_m_analytic
+
+
+# The header is plain text (key=value lines) padded with spaces to a fixed size,
+# after which the positions follow as little-endian float64 in (time step, satellite, xyz) order
+EPHEMERIS_FILE_MAGIC = "satgen-ephemeris"
+EPHEMERIS_FILE_VERSION = 1
+EPHEMERIS_FILE_HEADER_SIZE_BYTES = 512
+
+
+def ephemeris_filename(satellite_network_dir, time_step_ms, duration_s):
+    """
+    Filename of the ephemeris file, which is placed next to the dynamic state directory.
+
+    :param satellite_network_dir:  Satellite network directory (with the tles.txt)
+    :param time_step_ms:           Time step in milliseconds
+    :param duration_s:             Duration in seconds
+
+    :return: Ephemeris filename
+    """
+    return "%s/ephemeris_%dms_for_%ds.bin" % (satellite_network_dir, time_step_ms, duration_s)
+
+
+def calculate_tles_sha256(filename_tles):
+    """
+    Calculate the SHA-256 hash of a TLEs file.
+
+    :param filename_tles:  Filename of the TLEs file
+
+    :return: Hexadecimal SHA-256 digest
+    """
+    with open(filename_tles, "rb") as f_in:
+        return hashlib.sha256(f_in.read()).hexdigest()
+
+
+def generate_ephemeris_file(filename_out, filename_tles, epoch, satellites, time_step_ns, num_time_steps,
+                            propagator="sgp4"):
+    """
+    Propagate all satellites for all time steps once and write their ECEF positions to file.
+
+    :param filename_out:    Output ephemeris filename
+    :param filename_tles:   Filename of the TLEs file the satellites were read from (its hash goes into the header)
+    :param epoch:           Epoch (astropy Time, as returned by read_tles())
+    :param satellites:      List of ephem satellites (as returned by read_tles())
+    :param time_step_ns:    Time step in nanoseconds
+    :param num_time_steps:  Number of time steps (time step i is at i * time_step_ns since epoch)
+    :param propagator:      Propagator used to calculate the positions ("sgp4" or "analytic")
+    """
+    if propagator not in ("sgp4", "analytic"):
+        raise ValueError("Ephemeris files can only be generated with the sgp4 or analytic propagator, not: "
+                         + str(propagator))
+    if time_step_ns <= 0 or num_time_steps <= 0:
+        raise ValueError("Time step and number of time steps must be positive")
+
+    # Header
+    header = (
+        "%s\n"
+        "version=%d\n"
+        "epoch=%s\n"
+        "time_step_ns=%d\n"
+        "num_time_steps=%d\n"
+        "num_satellites=%d\n"
+        "propagator=%s\n"
+        "tles_sha256=%s\n"
+    ) % (
+        EPHEMERIS_FILE_MAGIC,
+        EPHEMERIS_FILE_VERSION,
+        str(epoch),
+        time_step_ns,
+        num_time_steps,
+        len(satellites),
+        propagator,
+        calculate_tles_sha256(filename_tles)
+    )
+    if len(header) > EPHEMERIS_FILE_HEADER_SIZE_BYTES:
+        raise ValueError("Ephemeris file header is too large")
+
+    # Positions of each time step are appended one after the other
+    if propagator == "sgp4":
+        satrec_array = create_satrec_array(satellites)
+    else:
+        analytic_elements = create_analytic_elements(satellites)
+    with open(filename_out, "wb") as f_out:
+        f_out.write(header.ljust(EPHEMERIS_FILE_HEADER_SIZE_BYTES).encode("ascii"))
+        for i in range(num_time_steps):
+            if propagator == "sgp4":
+                positions_m = propagate_satellite_positions_m(satrec_array, epoch, i * time_step_ns)
+            else:
+                positions_m = propagate_satellite_positions_m_analytic(analytic_elements, epoch, i * time_step_ns)
+            f_out.write(positions_m.astype("<f8").tobytes())
+
+
+def read_ephemeris_file(filename_ephemeris, filename_tles=None):
+    """
+    Open an ephemeris file. The positions are memory-mapped, as such only the time steps
+    which are used are actually read from disk.
+
+    :param filename_ephemeris:  Ephemeris filename
+    :param filename_tles:       If not None, the TLEs file which must match the hash in the header
+
+    :return: Ephemeris (dictionary) with the header values and "positions_m", a read-only array of shape
+             (number of time steps, number of satellites, 3) of ECEF positions in meters
+    """
+    with open(filename_ephemeris, "rb") as f_in:
+        header = f_in.read(EPHEMERIS_FILE_HEADER_SIZE_BYTES).decode("ascii").rstrip(" ")
+    lines = header.split("\n")
+    if lines[0] != EPHEMERIS_FILE_MAGIC:
+        raise ValueError("Not an ephemeris file: " + filename_ephemeris)
+    properties = {}
+    for line in lines[1:]:
+        if line != "":
+            key, value = line.split("=", 1)
+            properties[key] = value
+    if int(properties["version"]) != EPHEMERIS_FILE_VERSION:
+        raise ValueError("Unsupported ephemeris file version: " + properties["version"])
+
+    ephemeris = {
+        "epoch_str": properties["epoch"],
+        "time_step_ns": int(properties["time_step_ns"]),
+        "num_time_steps": int(properties["num_time_steps"]),
+        "num_satellites": int(properties["num_satellites"]),
+        "propagator": properties["propagator"],
+        "tles_sha256": properties["tles_sha256"],
+    }
+    if filename_tles is not None and calculate_tles_sha256(filename_tles) != ephemeris["tles_sha256"]:
+        raise ValueError("Ephemeris file " + filename_ephemeris + " was not generated from " + filename_tles)
+
+    ephemeris["positions_m"] = np.memmap(
+        filename_ephemeris,
+        dtype="<f8",
+        mode="r",
+        offset=EPHEMERIS_FILE_HEADER_SIZE_BYTES,
+        shape=(ephemeris["num_time_steps"], ephemeris["num_satellites"], 3)
+    )
+    return ephemeris
+
+
+def satellite_positions_m_from_ephemeris(ephemeris, time_since_epoch_ns):
+    """
+    Retrieve the satellite positions of a time step from an ephemeris.
+
+    :param ephemeris:            Ephemeris (as returned by read_ephemeris_file())
+    :param time_since_epoch_ns:  Time since epoch in nanoseconds (must be a multiple of the ephemeris time step)
+
+    :return: Array of shape (number of satellites, 3) of ECEF positions in meters
+    """
+    if time_since_epoch_ns % ephemeris["time_step_ns"] != 0:
+        raise ValueError("Time %d ns is not a multiple of the ephemeris time step (%d ns)"
+                         % (time_since_epoch_ns, ephemeris["time_step_ns"]))
+    time_step_idx = time_since_epoch_ns // ephemeris["time_step_ns"]
+    if time_step_idx < 0 or time_step_idx >= ephemeris["num_time_steps"]:
+        raise ValueError("Time %d ns is outside of the ephemeris" % time_since_epoch_ns)
+    return ephemeris["positions_m"][time_step_idx]
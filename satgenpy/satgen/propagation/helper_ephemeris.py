@@ -0,0 +1,88 @@
+# The MIT License (MIT)
+#
+# Copyright (c) 2020 ETH Zurich
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+from satgen.tles import *
+from .ephemeris_file import ephemeris_filename, generate_ephemeris_file, read_ephemeris_file
+from .position_table import resolve_propagator, create_position_source, report_analytic_max_deviation
+import math
+
+
+def help_ephemeris(output_generated_data_dir, name, time_step_ms, duration_s, propagator="sgp4"):
+    """
+    Generate the ephemeris file of a satellite network, such that the dynamic state generation
+    and the post-analysis do not need to propagate the satellites again.
+
+    :param output_generated_data_dir:  Directory with the satellite networks
+    :param name:                       Name of the satellite network (sub-directory with the tles.txt)
+    :param time_step_ms:               Time step in milliseconds
+    :param duration_s:                 Duration in seconds
+    :param propagator:                 Propagator used to calculate the positions ("sgp4", "analytic" or "auto")
+    """
+    satellite_network_dir = output_generated_data_dir + "/" + name
+    tles = read_tles(satellite_network_dir + "/tles.txt")
+    propagator = resolve_propagator(tles["satellites"], propagator)
+
+    # In nanoseconds
+    simulation_end_time_ns = duration_s * 1000 * 1000 * 1000
+    time_step_ns = time_step_ms * 1000 * 1000
+
+    generate_ephemeris_file(
+        ephemeris_filename(satellite_network_dir, time_step_ms, duration_s),
+        satellite_network_dir + "/tles.txt",
+        tles["epoch"],
+        tles["satellites"],
+        time_step_ns,
+        int(math.floor(simulation_end_time_ns / time_step_ns)),
+        propagator
+    )
+
+    # Accuracy of the analytic propagator
+    if propagator == "analytic":
+        report_analytic_max_deviation(
+            create_position_source(tles["satellites"], propagator),
+            tles["epoch"],
+            tles["satellites"],
+            list(range(0, int(math.floor(simulation_end_time_ns / time_step_ns)) * time_step_ns, time_step_ns))
+        )
+
+
+def read_ephemeris_for_satellite_network(satellite_network_dir, time_step_ms, duration_s, propagator):
+    """
+    Open the ephemeris file of a satellite network, and check it can be used.
+
+    :param satellite_network_dir:  Satellite network directory (with the tles.txt)
+    :param time_step_ms:           Time step in milliseconds
+    :param duration_s:             Duration in seconds
+    :param propagator:             Propagator with which the positions must have been calculated
+
+    :return: Ephemeris (as returned by read_ephemeris_file())
+    """
+    filename = ephemeris_filename(satellite_network_dir, time_step_ms, duration_s)
+    ephemeris = read_ephemeris_file(filename, satellite_network_dir + "/tles.txt")
+    if propagator == "auto":
+        propagator = resolve_propagator(read_tles(satellite_network_dir + "/tles.txt")["satellites"], propagator)
+    if ephemeris["propagator"] != propagator:
+        raise ValueError("Ephemeris file %s was generated with the %s propagator, not %s"
+                         % (filename, ephemeris["propagator"], propagator))
+    if ephemeris["time_step_ns"] != time_step_ms * 1000 * 1000:
+        raise ValueError("Ephemeris file %s has a time step of %d ns" % (filename, ephemeris["time_step_ns"]))
+    return ephemeris
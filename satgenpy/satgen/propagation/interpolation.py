@@ -0,0 +1,160 @@
+# The MIT License (MIT)
+#
+# Copyright (c) 2020 ETH Zurich
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+import numpy as np
+from .propagate_satellites import propagate_satellite_states_teme_km, teme_to_ecef_m, NS_PER_DAY
+
+
+# Default bound on the interpolation error, any anchor interval with a larger error is rejected
+DEFAULT_MAX_INTERPOLATION_ERROR_M = 1.0
+
+# Fractions of each anchor interval at which the interpolated positions are compared to SGP-4. The cubic Hermite
+# error (~ f^2 (1 - f)^2) peaks at the midpoint, whereas the error due to the SGP-4 velocity not being exactly
+# the derivative of the SGP-4 position (~ f (1 - f) (1 - 2f)) cancels there and peaks near the quarter points.
+INTERPOLATION_CHECK_FRACTIONS = (0.25, 0.5, 0.75)
+
+
+def create_interpolation_state(satrec_array, anchor_interval_ns, max_interpolation_error_m):
+    """
+    Create the state of the interpolated propagation.
+
+    The satellites are only propagated by SGP-4 at the anchors (multiples of the anchor interval since epoch).
+    In between, the TEME positions are interpolated by cubic Hermite interpolation of the anchor positions and
+    velocities. Orbits are smooth, as such this is very accurate for anchor intervals of seconds.
+
+    :param satrec_array:               SGP-4 satellite array (as returned by create_satrec_array())
+    :param anchor_interval_ns:         Anchor interval in nanoseconds
+    :param max_interpolation_error_m:  Maximum interpolation error in meters
+
+    :return: Interpolation state (dictionary)
+    """
+    if anchor_interval_ns <= 0:
+        raise ValueError("Anchor interval must be positive")
+    if max_interpolation_error_m < 0:
+        raise ValueError("Maximum interpolation error cannot be negative")
+    return {
+        "satrec_array": satrec_array,
+        "anchor_interval_ns": anchor_interval_ns,
+        "max_interpolation_error_m": max_interpolation_error_m,
+        "anchor_idx": None,  # Index of the anchor at the start of the current anchor interval
+        "anchor_start": None,  # (TEME positions, TEME velocities) at the start of the current anchor interval
+        "anchor_end": None,  # (TEME positions, TEME velocities) at the end of the current anchor interval
+        "max_error_found_m": 0.0,
+        "num_anchor_intervals": 0,
+    }
+
+
+def hermite_interpolate_teme_km(anchor_start, anchor_end, anchor_interval_s, fraction):
+    """
+    Cubic Hermite interpolation of the positions between two anchors.
+
+    :param anchor_start:       Tuple of (positions, velocities) at the start anchor (TEME, km and km/s)
+    :param anchor_end:         Tuple of (positions, velocities) at the end anchor (TEME, km and km/s)
+    :param anchor_interval_s:  Time between the anchors in seconds
+    :param fraction:           Fraction of the anchor interval which has elapsed (in [0, 1])
+
+    :return: Numpy array of shape (number of satellites, 3) of interpolated TEME positions in kilometers
+    """
+    f2 = fraction * fraction
+    f3 = f2 * fraction
+    return (
+        (2.0 * f3 - 3.0 * f2 + 1.0) * anchor_start[0]
+        + ((f3 - 2.0 * f2 + fraction) * anchor_interval_s) * anchor_start[1]
+        + (-2.0 * f3 + 3.0 * f2) * anchor_end[0]
+        + ((f3 - f2) * anchor_interval_s) * anchor_end[1]
+    )
+
+
+def load_anchor_interval(interpolation, epoch, anchor_idx):
+    """
+    Propagate the anchors of an anchor interval, and check the interpolation error of the interval
+    at the INTERPOLATION_CHECK_FRACTIONS against the SGP-4 positions.
+
+    :param interpolation:  Interpolation state (as returned by create_interpolation_state())
+    :param epoch:          Epoch (astropy Time, as returned by read_tles())
+    :param anchor_idx:     Index of the anchor at the start of the anchor interval
+    """
+    satrec_array = interpolation["satrec_array"]
+    anchor_interval_ns = interpolation["anchor_interval_ns"]
+
+    # The end of the previous anchor interval is the start of this one
+    if interpolation["anchor_idx"] is not None and anchor_idx == interpolation["anchor_idx"] + 1:
+        anchor_start = interpolation["anchor_end"]
+    else:
+        _, _, positions_km, velocities_km_per_s = propagate_satellite_states_teme_km(
+            satrec_array, epoch, anchor_idx * anchor_interval_ns
+        )
+        anchor_start = (positions_km, velocities_km_per_s)
+    _, _, positions_km, velocities_km_per_s = propagate_satellite_states_teme_km(
+        satrec_array, epoch, (anchor_idx + 1) * anchor_interval_ns
+    )
+    anchor_end = (positions_km, velocities_km_per_s)
+
+    # Interpolation error
+    error_m = 0.0
+    for fraction in INTERPOLATION_CHECK_FRACTIONS:
+        _, _, check_positions_km, _ = propagate_satellite_states_teme_km(
+            satrec_array, epoch, anchor_idx * anchor_interval_ns + fraction * anchor_interval_ns
+        )
+        if check_positions_km.shape[0] > 0:
+            error_m = max(error_m, float(np.max(np.linalg.norm(
+                hermite_interpolate_teme_km(anchor_start, anchor_end, anchor_interval_ns / 1e9, fraction)
+                - check_positions_km,
+                axis=1
+            ))) * 1000.0)
+    if error_m > interpolation["max_interpolation_error_m"]:
+        raise ValueError(
+            "Interpolation error of %.6f m in the anchor interval starting at t=%dns exceeds the maximum of %.6f m, "
+            "use a smaller anchor interval" % (error_m, anchor_idx * anchor_interval_ns,
+                                               interpolation["max_interpolation_error_m"])
+        )
+
+    interpolation["anchor_idx"] = anchor_idx
+    interpolation["anchor_start"] = anchor_start
+    interpolation["anchor_end"] = anchor_end
+    interpolation["max_error_found_m"] = max(interpolation["max_error_found_m"], error_m)
+    interpolation["num_anchor_intervals"] += 1
+
+
+def interpolate_satellite_positions_m(interpolation, epoch, time_since_epoch_ns):
+    """
+    Calculate all satellite positions at a time instant by interpolation between the anchors.
+
+    :param interpolation:        Interpolation state (as returned by create_interpolation_state())
+    :param epoch:                Epoch (astropy Time, as returned by read_tles())
+    :param time_since_epoch_ns:  Time since epoch in nanoseconds
+
+    :return: Numpy array of shape (number of satellites, 3) with the ECEF (x, y, z) position of each satellite in meters
+    """
+    anchor_interval_ns = interpolation["anchor_interval_ns"]
+    anchor_idx = time_since_epoch_ns // anchor_interval_ns
+    if anchor_idx != interpolation["anchor_idx"]:
+        load_anchor_interval(interpolation, epoch, anchor_idx)
+    positions_teme_km = hermite_interpolate_teme_km(
+        interpolation["anchor_start"],
+        interpolation["anchor_end"],
+        anchor_interval_ns / 1e9,
+        (time_since_epoch_ns - anchor_idx * anchor_interval_ns) / anchor_interval_ns
+    )
+
+    # The Earth rotation is not interpolated, but applied at the time instant itself
+    return teme_to_ecef_m(positions_teme_km, epoch.jd1, epoch.jd2 + time_since_epoch_ns / NS_PER_DAY)
@@ -0,0 +1,341 @@
+# The MIT License (MIT)
+#
+# Copyright (c) 2020 ETH Zurich
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+import math
+import ephem
+import numpy as np
+from .time_instant import create_time_instant
+from .propagate_satellites import create_satrec_array, propagate_satellite_positions_m
+from .analytic_propagator import (
+    is_analytic_propagation_possible,
+    create_analytic_elements,
+    propagate_satellite_positions_m_analytic,
+    calculate_analytic_max_deviation_m
+)
+from .ephemeris_file import satellite_positions_m_from_ephemeris
+from .interpolation import (
+    DEFAULT_MAX_INTERPOLATION_ERROR_M,
+    create_interpolation_state,
+    interpolate_satellite_positions_m
+)
+
+
+def resolve_propagator(satellites, propagator):
+    """
+    Resolve the propagator to use for a set of satellites.
+
+    :param satellites:  List of ephem satellites
+    :param propagator:  Propagator ("ephem", "sgp4", "analytic" or "auto")
+
+    :return: Propagator, "auto" is resolved to "analytic" if possible, else "sgp4"
+    """
+    if propagator == "auto":
+        return "analytic" if is_analytic_propagation_possible(satellites) else "sgp4"
+    if propagator not in ("ephem", "sgp4", "analytic"):
+        raise ValueError("Unknown propagator: " + str(propagator))
+    return propagator
+
+
+def create_position_source(satellites, propagator="ephem", ephemeris=None, interpolation_anchor_ns=None,
+                           max_interpolation_error_m=DEFAULT_MAX_INTERPOLATION_ERROR_M):
+    """
+    Create the source from which the position table of each time step is created.
+
+    :param satellites:                 List of ephem satellites
+    :param propagator:                 Propagator, one of:
+                                       "ephem" (each distance is calculated by ephem)
+                                       "sgp4" (all satellites are propagated at once each time step)
+                                       "analytic" (closed-form SGP-4 for circular orbits without drag,
+                                       see create_analytic_elements())
+                                       "auto" ("analytic" if all satellites are in such orbits, else "sgp4")
+    :param ephemeris:                  If not None, the positions are read from this ephemeris
+                                       (see read_ephemeris_file()) instead of being propagated.
+                                       It must have been generated by the same propagator.
+    :param interpolation_anchor_ns:    If not None, the satellites are only propagated every this many nanoseconds,
+                                       and the positions in between are interpolated (see create_interpolation_state()).
+                                       Only possible with the sgp4 propagator.
+    :param max_interpolation_error_m:  Maximum interpolation error in meters, beyond which a ValueError is raised
+
+    :return: Position source (dictionary)
+    """
+    propagator = resolve_propagator(satellites, propagator)
+    satrec_array = None
+    analytic_elements = None
+    interpolation = None
+    if interpolation_anchor_ns is not None and (propagator != "sgp4" or ephemeris is not None):
+        raise ValueError("Interpolation is only possible with the sgp4 propagator without an ephemeris")
+    if propagator == "ephem":
+        if ephemeris is not None:
+            raise ValueError("The ephem propagator cannot use an ephemeris")
+    elif ephemeris is not None:
+        if ephemeris["propagator"] != propagator:
+            raise ValueError("Ephemeris was generated with the %s propagator, not %s"
+                             % (ephemeris["propagator"], propagator))
+        if ephemeris["num_satellites"] != len(satellites):
+            raise ValueError("Ephemeris has %d satellites instead of %d"
+                             % (ephemeris["num_satellites"], len(satellites)))
+    elif interpolation_anchor_ns is not None:
+        interpolation = create_interpolation_state(
+            create_satrec_array(satellites), interpolation_anchor_ns, max_interpolation_error_m
+        )
+    elif propagator == "sgp4":
+        satrec_array = create_satrec_array(satellites)
+    else:
+        analytic_elements = create_analytic_elements(satellites)
+    return {
+        "propagator": propagator,
+        "satrec_array": satrec_array,
+        "analytic_elements": analytic_elements,
+        "ephemeris": ephemeris,
+        "interpolation": interpolation,
+    }
+
+
+def satellite_positions_m_from_source(position_source, epoch, time_since_epoch_ns):
+    """
+    Retrieve all satellite positions at a time instant from a position source.
+
+    :param position_source:      Position source (as returned by create_position_source())
+    :param epoch:                Epoch (astropy Time, as returned by read_tles())
+    :param time_since_epoch_ns:  Time since epoch in nanoseconds
+
+    :return: Numpy array of shape (number of satellites, 3) with the ECEF (x, y, z) position of each satellite
+             in meters, or None if the position source uses ephem
+    """
+    if position_source["ephemeris"] is not None:
+        return satellite_positions_m_from_ephemeris(position_source["ephemeris"], time_since_epoch_ns)
+    elif position_source["interpolation"] is not None:
+        return interpolate_satellite_positions_m(position_source["interpolation"], epoch, time_since_epoch_ns)
+    elif position_source["analytic_elements"] is not None:
+        return propagate_satellite_positions_m_analytic(
+            position_source["analytic_elements"], epoch, time_since_epoch_ns
+        )
+    elif position_source["satrec_array"] is not None:
+        return propagate_satellite_positions_m(position_source["satrec_array"], epoch, time_since_epoch_ns)
+    else:
+        return None
+
+
+def create_position_table_from_source(position_source, epoch, time_since_epoch_ns, satellites):
+    """
+    Create the table of satellite positions for a single time step from a position source.
+
+    :param position_source:      Position source (as returned by create_position_source())
+    :param epoch:                Epoch (astropy Time, as returned by read_tles())
+    :param time_since_epoch_ns:  Time since epoch in nanoseconds
+    :param satellites:           List of ephem satellites
+
+    :return: Position table (dictionary)
+    """
+    position_table = create_position_table(
+        epoch, time_since_epoch_ns, satellites,
+        satellite_positions_m=satellite_positions_m_from_source(position_source, epoch, time_since_epoch_ns)
+    )
+    position_table["propagator"] = position_source["propagator"]
+    return position_table
+
+
+def report_analytic_max_deviation(position_source, epoch, satellites, list_time_since_epoch_ns, max_num_samples=11):
+    """
+    Print the maximum deviation of the analytic propagator from SGP-4 over a run.
+    Only evenly spaced samples of the run are compared, such that the SGP-4 propagation
+    does not cancel out the speed-up.
+
+    :param position_source:           Position source (as returned by create_position_source())
+    :param epoch:                     Epoch (astropy Time, as returned by read_tles())
+    :param satellites:                List of ephem satellites
+    :param list_time_since_epoch_ns:  List of all times since epoch (ns) of the run
+    :param max_num_samples:           Maximum number of times at which to compare
+
+    :return: Maximum deviation in meters, or None if the position source does not propagate analytically
+    """
+    if position_source["analytic_elements"] is None or len(list_time_since_epoch_ns) == 0:
+        return None
+    num_samples = min(max_num_samples, len(list_time_since_epoch_ns))
+    sampled = sorted(set(
+        list_time_since_epoch_ns[int(round(i * (len(list_time_since_epoch_ns) - 1) / max(1, num_samples - 1)))]
+        for i in range(num_samples)
+    ))
+    max_deviation_m = calculate_analytic_max_deviation_m(
+        position_source["analytic_elements"], create_satrec_array(satellites), epoch, sampled
+    )
+    print("Analytic propagator max. deviation from SGP-4: %.6f m (over %d sampled time steps)"
+          % (max_deviation_m, len(sampled)))
+    return max_deviation_m
+
+
+def report_interpolation_max_error(position_source):
+    """
+    Print the maximum interpolation error encountered so far (see load_anchor_interval()).
+
+    :param position_source:  Position source (as returned by create_position_source())
+
+    :return: Maximum interpolation error in meters, or None if the position source does not interpolate
+    """
+    interpolation = position_source["interpolation"]
+    if interpolation is None:
+        return None
+    print("Interpolation max. error from SGP-4: %.6f m (over %d anchor intervals of %d ns, bound is %.6f m)"
+          % (interpolation["max_error_found_m"], interpolation["num_anchor_intervals"],
+             interpolation["anchor_interval_ns"], interpolation["max_interpolation_error_m"]))
+    return interpolation["max_error_found_m"]
+
+
+def create_position_table(epoch, time_since_epoch_ns, satellites, satrec_array=None, satellite_positions_m=None):
+    """
+    Create the table of satellite positions for a single time step.
+
+    With an SGP-4 satellite array, all satellite positions are propagated at once when the table
+    is created. Without (ephem), each satellite is computed at most once on first use, such that
+    all distances remain exactly the same as those of distance_m_between_satellites() and
+    distance_m_ground_station_to_satellite().
+
+    :param epoch:                  Epoch (astropy Time, as returned by read_tles())
+    :param time_since_epoch_ns:    Time since epoch in nanoseconds
+    :param satellites:             List of ephem satellites
+    :param satrec_array:           SGP-4 satellite array (as returned by create_satrec_array()), or None to use ephem
+    :param satellite_positions_m:  Already known ECEF positions of this time step (e.g., from an ephemeris file),
+                                   if given the satellites are not propagated
+
+    :return: Position table (dictionary)
+    """
+    if satellite_positions_m is None and satrec_array is not None:
+        satellite_positions_m = propagate_satellite_positions_m(satrec_array, epoch, time_since_epoch_ns)
+    return {
+        "time_instant": create_time_instant(epoch, time_since_epoch_ns),  # Converted once for all ephem observers
+        "time_since_epoch_ns": time_since_epoch_ns,
+        "propagator": "ephem" if satellite_positions_m is None else "sgp4",
+        "satellites": satellites,
+        "satellite_positions_m": satellite_positions_m,  # ECEF, (number of satellites, 3), or None for ephem
+        "satellite_observations": [None] * len(satellites),  # ephem: (range, ra, dec) from (0, 0)
+        "origin_observer": None,  # ephem: observer at (0, 0), created on first use
+        "ground_station_observers": {},  # ephem: gid -> observer at the ground station
+    }
+
+
+def satellite_observation_from_position_table(position_table, sid):
+    """
+    Retrieve the ephem observation (range, ra, dec) of a satellite from an observer at latitude 0 and
+    longitude 0. It is computed the first time it is requested.
+
+    :param position_table:  Position table (as returned by create_position_table())
+    :param sid:             Satellite identifier
+
+    :return: Tuple of (range in meters, right ascension, declination)
+    """
+    observation = position_table["satellite_observations"][sid]
+    if observation is None:
+        observer = position_table["origin_observer"]
+        if observer is None:
+            observer = ephem.Observer()
+            observer.epoch = position_table["time_instant"]["ephem_epoch"]
+            observer.date = position_table["time_instant"]["ephem_date"]
+            observer.lat = 0
+            observer.lon = 0
+            observer.elevation = 0
+            position_table["origin_observer"] = observer
+        satellite = position_table["satellites"][sid]
+        satellite.compute(observer)
+        observation = (satellite.range, satellite.ra, satellite.dec)
+        position_table["satellite_observations"][sid] = observation
+    return observation
+
+
+def distance_m_between_satellites_from_position_table(position_table, sid_a, sid_b):
+    """
+    Computes the straight distance between two satellites in meters.
+
+    :param position_table:  Position table (as returned by create_position_table())
+    :param sid_a:           The first satellite identifier
+    :param sid_b:           The other satellite identifier
+
+    :return: The distance between the satellites in meters
+    """
+    satellite_positions_m = position_table["satellite_positions_m"]
+    if satellite_positions_m is not None:
+        # Same arithmetic as isl_lengths_m_from_position_table() (squared by multiplication, as numpy scalar powers
+        # are not always rounded the same way)
+        dx = float(satellite_positions_m[sid_a, 0] - satellite_positions_m[sid_b, 0])
+        dy = float(satellite_positions_m[sid_a, 1] - satellite_positions_m[sid_b, 1])
+        dz = float(satellite_positions_m[sid_a, 2] - satellite_positions_m[sid_b, 2])
+        return math.sqrt(dx * dx + dy * dy + dz * dz)
+
+    # Same triangle as in distance_m_between_satellites()
+    (range_a, ra_a, dec_a) = satellite_observation_from_position_table(position_table, sid_a)
+    (range_b, ra_b, dec_b) = satellite_observation_from_position_table(position_table, sid_b)
+    angle_radians = float(repr(ephem.separation((ra_a, dec_a), (ra_b, dec_b))))
+    return math.sqrt(range_a ** 2 + range_b ** 2 - (2 * range_a * range_b * math.cos(angle_radians)))
+
+
+def isl_lengths_m_from_position_table(position_table, isls):
+    """
+    Computes the straight distance between the two satellites of each ISL in meters, all at once.
+    Each length is exactly the same as distance_m_between_satellites_from_position_table().
+
+    :param position_table:  Position table (as returned by create_position_table())
+    :param isls:            Integer numpy array of shape (number of ISLs, 2) (e.g., read_isls(..., as_array=True))
+
+    :return: Numpy array of shape (number of ISLs,) with the length of each ISL in meters
+    """
+    satellite_positions_m = position_table["satellite_positions_m"]
+    if satellite_positions_m is None:
+        return np.array([
+            distance_m_between_satellites_from_position_table(position_table, a, b) for (a, b) in isls.tolist()
+        ], dtype=float)
+    squared_length_m2 = np.zeros(isls.shape[0])
+    for dim in range(3):
+        difference_m = satellite_positions_m[isls[:, 0], dim] - satellite_positions_m[isls[:, 1], dim]
+        squared_length_m2 += difference_m * difference_m
+    return np.sqrt(squared_length_m2)
+
+
+def distance_m_ground_station_to_satellite_from_position_table(position_table, ground_station, sid):
+    """
+    Computes the straight distance between a ground station and a satellite in meters.
+
+    :param position_table:  Position table (as returned by create_position_table())
+    :param ground_station:  The ground station (extended, with cartesian coordinates if not using ephem)
+    :param sid:             The satellite identifier
+
+    :return: The distance between the ground station and the satellite in meters
+    """
+    satellite_positions_m = position_table["satellite_positions_m"]
+    if satellite_positions_m is not None:
+        # Same arithmetic as distance_m_matrix_ground_stations_to_satellites()
+        dx = float(satellite_positions_m[sid, 0] - ground_station["cartesian_x"])
+        dy = float(satellite_positions_m[sid, 1] - ground_station["cartesian_y"])
+        dz = float(satellite_positions_m[sid, 2] - ground_station["cartesian_z"])
+        return math.sqrt(dx * dx + dy * dy + dz * dz)
+
+    # The ephem satellite range is relative to the observer, as such only the observer can be re-used
+    observer = position_table["ground_station_observers"].get(ground_station["gid"])
+    if observer is None:
+        observer = ephem.Observer()
+        observer.epoch = position_table["time_instant"]["ephem_epoch"]
+        observer.date = position_table["time_instant"]["ephem_date"]
+        observer.lat = str(ground_station["latitude_degrees_str"])   # String argument is in degrees
+        observer.lon = str(ground_station["longitude_degrees_str"])
+        observer.elevation = ground_station["elevation_m_float"]
+        position_table["ground_station_observers"][ground_station["gid"]] = observer
+    satellite = position_table["satellites"][sid]
+    satellite.compute(observer)
+    return satellite.range
@@ -0,0 +1,162 @@
+# The MIT License (MIT)
+#
+# Copyright (c) 2020 ETH Zurich
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+import math
+import numpy as np
+from sgp4.api import Satrec, SatrecArray, WGS72
+
+
+# Julian date at which ephem dates start counting (1899 December 31 12:00 UT)
+EPHEM_DATE_ZERO_JD = 2415020.0
+
+# Julian date at which the sgp4init() epoch starts counting (1949 December 31 00:00 UT)
+SGP4INIT_EPOCH_ZERO_JD = 2433281.5
+
+# Nanoseconds in a day
+NS_PER_DAY = 86400.0 * 1000 * 1000 * 1000
+
+
+def create_satrec(satellite, sid):
+    """
+    Create the SGP-4 propagator of a single satellite.
+
+    The orbital elements are taken from the ephem satellite such that the
+    propagation starts from exactly the same elements as ephem does.
+
+    :param satellite:  Ephem satellite
+    :param sid:        Satellite identifier
+
+    :return: SGP-4 satellite (sgp4.api.Satrec)
+    """
+    satrec = Satrec()
+    satrec.sgp4init(
+        WGS72,                                                          # Gravity model (same as ns-3)
+        'i',                                                            # Improved operating mode
+        sid + 1,                                                        # Satellite number
+        satellite._epoch + EPHEM_DATE_ZERO_JD - SGP4INIT_EPOCH_ZERO_JD,  # Epoch (days since 1949-12-31 00:00)
+        satellite._drag,                                                # B-star drag term
+        satellite._decay * 2.0 * math.pi / (1440.0 * 1440.0),           # First derivative mean motion / 2
+        0.0,                                                            # Second derivative of mean motion
+        satellite._e,                                                   # Eccentricity
+        satellite._ap,                                                  # Argument of perigee (radians)
+        satellite._inc,                                                 # Inclination (radians)
+        satellite._M,                                                   # Mean anomaly (radians)
+        satellite._n * 2.0 * math.pi / 1440.0,                          # Mean motion (radians/minute)
+        satellite._raan                                                 # Right ascension of ascending node
+    )
+    return satrec
+
+
+def create_satrec_array(satellites):
+    """
+    Create a vectorized SGP-4 propagator for all satellites of a constellation.
+
+    :param satellites:  List of ephem satellites (as returned by read_tles())
+
+    :return: SGP-4 satellite array (sgp4.api.SatrecArray), satellite i at index i
+    """
+    return SatrecArray([create_satrec(satellites[sid], sid) for sid in range(len(satellites))])
+
+
+def propagate_satellite_states_teme_km(satrec_array, epoch, time_since_epoch_ns):
+    """
+    Propagate all satellites to a time instant in a single vectorized call, without rotating into ECEF.
+
+    :param satrec_array:         SGP-4 satellite array (as returned by create_satrec_array())
+    :param epoch:                Epoch (astropy Time, as returned by read_tles())
+    :param time_since_epoch_ns:  Time since epoch in nanoseconds
+
+    :return: Tuple of (jd, fr, positions, velocities), with the Julian date pair of the time instant,
+             and numpy arrays of shape (number of satellites, 3) with the TEME positions in kilometers
+             and velocities in kilometers per second
+    """
+
+    # The time is interpreted the same way as ephem does with str(epoch + time_since_epoch_ns * u.ns),
+    # which is as a universal time without scale conversion
+    jd = np.array([epoch.jd1])
+    fr = np.array([epoch.jd2 + time_since_epoch_ns / NS_PER_DAY])
+
+    # Propagate in the True Equator Mean Equinox (TEME) frame
+    errors, positions_teme_km, velocities_teme_km_per_s = satrec_array.sgp4(jd, fr)
+    for sid in range(errors.shape[0]):
+        if errors[sid, 0] != 0:
+            raise ValueError(
+                "SGP-4 propagation of satellite %d failed with error code %d at t=%dns"
+                % (sid, errors[sid, 0], time_since_epoch_ns)
+            )
+
+    return jd[0], fr[0], positions_teme_km[:, 0, :], velocities_teme_km_per_s[:, 0, :]
+
+
+def propagate_satellite_positions_m(satrec_array, epoch, time_since_epoch_ns):
+    """
+    Propagate all satellites to a time instant in a single vectorized call.
+
+    :param satrec_array:         SGP-4 satellite array (as returned by create_satrec_array())
+    :param epoch:                Epoch (astropy Time, as returned by read_tles())
+    :param time_since_epoch_ns:  Time since epoch in nanoseconds
+
+    :return: Numpy array of shape (number of satellites, 3) with the ECEF (x, y, z) position of each satellite in meters
+    """
+    jd, fr, positions_teme_km, _ = propagate_satellite_states_teme_km(satrec_array, epoch, time_since_epoch_ns)
+    return teme_to_ecef_m(positions_teme_km, jd, fr)
+
+
+def teme_to_ecef_m(positions_teme_km, jd, fr):
+    """
+    Rotate positions from the TEME frame into the Earth-centered, Earth-fixed (ECEF) frame.
+
+    Polar motion is neglected, which is the same as ground station positions (see geodetic2cartesian()).
+
+    :param positions_teme_km:  Numpy array of shape (n, 3) of TEME positions in kilometers
+    :param jd:                 Julian date (whole part)
+    :param fr:                 Julian date (fraction part)
+
+    :return: Numpy array of shape (n, 3) of ECEF positions in meters
+    """
+    gmst = greenwich_mean_sidereal_time_rad(jd, fr)
+    cos_gmst = math.cos(gmst)
+    sin_gmst = math.sin(gmst)
+    positions_ecef_m = np.empty(positions_teme_km.shape)
+    positions_ecef_m[:, 0] = (cos_gmst * positions_teme_km[:, 0] + sin_gmst * positions_teme_km[:, 1]) * 1000.0
+    positions_ecef_m[:, 1] = (-sin_gmst * positions_teme_km[:, 0] + cos_gmst * positions_teme_km[:, 1]) * 1000.0
+    positions_ecef_m[:, 2] = positions_teme_km[:, 2] * 1000.0
+    return positions_ecef_m
+
+
+def greenwich_mean_sidereal_time_rad(jd, fr):
+    """
+    Greenwich mean sidereal time (IAU-82 model, as used by SGP-4).
+
+    :param jd:  Julian date (whole part)
+    :param fr:  Julian date (fraction part)
+
+    :return: Greenwich mean sidereal time in radians in [0, 2 * pi)
+    """
+    tut1 = ((jd - 2451545.0) + fr) / 36525.0
+    gmst_s = (
+        -6.2e-6 * tut1 * tut1 * tut1
+        + 0.093104 * tut1 * tut1
+        + (876600.0 * 3600.0 + 8640184.812866) * tut1
+        + 67310.54841
+    )
+    return math.radians(gmst_s / 240.0) % (2.0 * math.pi)
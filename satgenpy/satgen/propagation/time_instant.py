@@ -0,0 +1,46 @@
+# The MIT License (MIT)
+#
+# Copyright (c) 2020 ETH Zurich
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+import ephem
+from astropy import units as u
+
+
+def create_time_instant(epoch, time_since_epoch_ns, ephem_epoch=None):
+    """
+    Convert a time step once to ephem dates, such that the distance calculations of that time step
+    do not each need to format the astropy time as a string and parse it again.
+
+    The ephem dates are parsed from the same strings as before (astropy formats the time with millisecond
+    precision), as such the ephem distances remain exactly the same as those calculated with strings.
+
+    :param epoch:                Epoch (astropy Time, as returned by read_tles())
+    :param time_since_epoch_ns:  Time since epoch in nanoseconds
+    :param ephem_epoch:          Already converted ephem epoch (e.g., of the previous time step), or None to convert it
+
+    :return: Time instant (dictionary) with "time_since_epoch_ns", "ephem_epoch" and "ephem_date"
+             (the latter two are ephem.Date, which can be used wherever ephem accepts a date string)
+    """
+    return {
+        "time_since_epoch_ns": time_since_epoch_ns,
+        "ephem_epoch": ephem.Date(str(epoch)) if ephem_epoch is None else ephem_epoch,
+        "ephem_date": ephem.Date(str(epoch + time_since_epoch_ns * u.ns)),
+    }
@@ -0,0 +1,439 @@
+# The MIT License (MIT)
+#
+# Copyright (c) 2020 ETH Zurich
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+import math
+import numpy as np
+from satgen.distance_tools import distance_m_matrix_ground_stations_to_satellites, satellites_in_range_of_candidates
+from .propagate_satellites import create_satrec, teme_to_ecef_m, NS_PER_DAY
+from .analytic_propagator import propagate_satellite_positions_m_analytic
+from .position_table import create_position_source, satellite_positions_m_from_source
+
+
+# Default interval at which the distances are sampled to find the rise and set events
+DEFAULT_VISIBILITY_SAMPLE_INTERVAL_NS = 10 * 1000 * 1000 * 1000
+
+# Default precision of the rise and set times
+DEFAULT_VISIBILITY_TOLERANCE_NS = 1000 * 1000
+
+# Upper bound of the speed of a satellite relative to a ground station (both in the ECEF frame),
+# Earth orbits which do not escape are below 8 km/s, to which the Earth rotation adds less than 0.5 km/s
+MAX_SATELLITE_SPEED_M_PER_S = 10000.0
+
+# Golden section ratio, used to search for the closest approach
+GOLDEN_SECTION_RATIO = (math.sqrt(5.0) - 1.0) / 2.0
+
+
+def create_single_satellite_propagator(position_source, satellites):
+    """
+    Create a propagator of individual satellites, which is used to refine the time of events of a single satellite
+    without propagating the entire constellation.
+
+    :param position_source:  Position source (as returned by create_position_source()) which propagates
+                             (with the sgp4 or analytic propagator, without ephemeris or interpolation)
+    :param satellites:       List of ephem satellites
+
+    :return: Single satellite propagator (dictionary)
+    """
+    if position_source["satrec_array"] is None and position_source["analytic_elements"] is None:
+        raise ValueError("Single satellites can only be propagated with the sgp4 or analytic propagator")
+    return {
+        "satellites": satellites,
+        "analytic_elements": position_source["analytic_elements"],
+        "satrecs": [None] * len(satellites),  # sgp4: created on first use
+        "analytic_elements_per_satellite": [None] * len(satellites),  # analytic: created on first use
+    }
+
+
+def single_satellite_position_m(single_satellite_propagator, epoch, sid, time_since_epoch_ns):
+    """
+    Calculate the position of a single satellite, which is the same as its position as calculated for
+    the entire constellation.
+
+    :param single_satellite_propagator:  Single satellite propagator (see create_single_satellite_propagator())
+    :param epoch:                        Epoch (astropy Time, as returned by read_tles())
+    :param sid:                          Satellite identifier
+    :param time_since_epoch_ns:          Time since epoch in nanoseconds
+
+    :return: Numpy array of shape (3,) with the ECEF (x, y, z) position of the satellite in meters
+    """
+    if single_satellite_propagator["analytic_elements"] is not None:
+        elements = single_satellite_propagator["analytic_elements_per_satellite"][sid]
+        if elements is None:
+            elements = {}
+            for key, value in single_satellite_propagator["analytic_elements"].items():
+                elements[key] = value[sid:sid + 1] if isinstance(value, np.ndarray) else value
+            single_satellite_propagator["analytic_elements_per_satellite"][sid] = elements
+        return propagate_satellite_positions_m_analytic(elements, epoch, time_since_epoch_ns)[0]
+
+    satrec = single_satellite_propagator["satrecs"][sid]
+    if satrec is None:
+        satrec = create_satrec(single_satellite_propagator["satellites"][sid], sid)
+        single_satellite_propagator["satrecs"][sid] = satrec
+    jd = epoch.jd1
+    fr = epoch.jd2 + time_since_epoch_ns / NS_PER_DAY
+    error, position_teme_km, _ = satrec.sgp4(jd, fr)
+    if error != 0:
+        raise ValueError(
+            "SGP-4 propagation of satellite %d failed with error code %d at t=%dns" % (sid, error, time_since_epoch_ns)
+        )
+    return teme_to_ecef_m(np.array([position_teme_km]), jd, fr)[0]
+
+
+def single_satellite_distance_m(single_satellite_propagator, epoch, ground_station_position_m, sid,
+                                time_since_epoch_ns):
+    """
+    Calculate the distance between a ground station and a single satellite.
+
+    :param single_satellite_propagator:  Single satellite propagator (see create_single_satellite_propagator())
+    :param epoch:                        Epoch (astropy Time, as returned by read_tles())
+    :param ground_station_position_m:    Numpy array of shape (3,) with the ECEF position of the ground station
+    :param sid:                          Satellite identifier
+    :param time_since_epoch_ns:          Time since epoch in nanoseconds
+
+    :return: Distance in meters
+    """
+    position_m = single_satellite_position_m(single_satellite_propagator, epoch, sid, time_since_epoch_ns)
+    dx = float(position_m[0] - ground_station_position_m[0])
+    dy = float(position_m[1] - ground_station_position_m[1])
+    dz = float(position_m[2] - ground_station_position_m[2])
+    return math.sqrt(dx * dx + dy * dy + dz * dz)
+
+
+def refine_visibility_change_ns(single_satellite_propagator, epoch, ground_station_position_m, sid, max_distance_m,
+                                lower_ns, upper_ns, tolerance_ns, lower_distance_m=None, upper_distance_m=None):
+    """
+    Refine the time at which the visibility of a satellite changes.
+
+    The distance is smooth, as such the change is estimated by linear interpolation of the distances at both ends
+    of the interval (secant method). Next to the estimate, the distance is also calculated one tolerance further
+    towards the change, which in most cases narrows the interval down to the tolerance within a few iterations.
+    If an iteration does not halve the interval, the next one bisects it instead.
+
+    :param single_satellite_propagator:  Single satellite propagator (see create_single_satellite_propagator())
+    :param epoch:                        Epoch (astropy Time, as returned by read_tles())
+    :param ground_station_position_m:    Numpy array of shape (3,) with the ECEF position of the ground station
+    :param sid:                          Satellite identifier
+    :param max_distance_m:               Maximum distance in meters at which the satellite is visible
+    :param lower_ns:                     Time since epoch (ns) before the change
+    :param upper_ns:                     Time since epoch (ns) after the change (visibility must differ from lower_ns)
+    :param tolerance_ns:                 Precision in nanoseconds
+    :param lower_distance_m:             Distance at lower_ns if already known, else None
+    :param upper_distance_m:             Distance at upper_ns if already known, else None
+
+    :return: Time since epoch (ns) of the change, which is at most tolerance_ns after the actual change
+    """
+    if lower_distance_m is None:
+        lower_distance_m = single_satellite_distance_m(
+            single_satellite_propagator, epoch, ground_station_position_m, sid, lower_ns
+        )
+    if upper_distance_m is None:
+        upper_distance_m = single_satellite_distance_m(
+            single_satellite_propagator, epoch, ground_station_position_m, sid, upper_ns
+        )
+    visible_at_lower = lower_distance_m <= max_distance_m
+    bisect = False
+    while upper_ns - lower_ns > tolerance_ns:
+        previous_interval_ns = upper_ns - lower_ns
+
+        # Estimate of the change (strictly within the interval)
+        if bisect:
+            estimate_ns = (lower_ns + upper_ns) // 2
+        else:
+            estimate_ns = lower_ns + int(round(
+                (upper_ns - lower_ns) * (lower_distance_m - max_distance_m) / (lower_distance_m - upper_distance_m)
+            ))
+        estimate_ns = min(upper_ns - 1, max(lower_ns + 1, estimate_ns))
+
+        # Distance at the estimate, and one tolerance further towards the change
+        probe_ns = estimate_ns
+        for _ in range(2):
+            probe_distance_m = single_satellite_distance_m(
+                single_satellite_propagator, epoch, ground_station_position_m, sid, probe_ns
+            )
+            if (probe_distance_m <= max_distance_m) == visible_at_lower:
+                lower_ns, lower_distance_m = probe_ns, probe_distance_m
+                probe_ns = probe_ns + tolerance_ns
+            else:
+                upper_ns, upper_distance_m = probe_ns, probe_distance_m
+                probe_ns = probe_ns - tolerance_ns
+            if upper_ns - lower_ns <= tolerance_ns or probe_ns <= lower_ns or probe_ns >= upper_ns:
+                break
+
+        bisect = 2 * (upper_ns - lower_ns) > previous_interval_ns
+    return upper_ns
+
+
+def find_visible_time_ns(single_satellite_propagator, epoch, ground_station_position_m, sid, max_distance_m,
+                         lower_ns, upper_ns, lower_distance_m, upper_distance_m, tolerance_ns,
+                         max_satellite_speed_m_per_s=MAX_SATELLITE_SPEED_M_PER_S):
+    """
+    Search for a time at which a satellite, which is not visible at either end of the interval, is visible
+    in between. The interval must be short compared to the orbital period, such that the distance has a single
+    minimum, which is searched for by golden section search.
+
+    The search stops as soon as a visible time is found, or once the speed bound shows that no time in the
+    remaining interval can be visible: in between two times the distance cannot drop below their average minus
+    half of the distance the satellite can travel.
+
+    :param single_satellite_propagator:  Single satellite propagator (see create_single_satellite_propagator())
+    :param epoch:                        Epoch (astropy Time, as returned by read_tles())
+    :param ground_station_position_m:    Numpy array of shape (3,) with the ECEF position of the ground station
+    :param sid:                          Satellite identifier
+    :param max_distance_m:               Maximum distance in meters at which the satellite is visible
+    :param lower_ns:                     Start of the interval (time since epoch in ns)
+    :param upper_ns:                     End of the interval (time since epoch in ns)
+    :param lower_distance_m:             Distance at the start of the interval
+    :param upper_distance_m:             Distance at the end of the interval
+    :param tolerance_ns:                 Precision in nanoseconds
+    :param max_satellite_speed_m_per_s:  Upper bound of the speed of satellites relative to ground stations
+
+    :return: Tuple of (time since epoch in ns, distance) at which the satellite is visible, or None if there is none
+    """
+    a_ns = lower_ns + int(round((1.0 - GOLDEN_SECTION_RATIO) * (upper_ns - lower_ns)))
+    b_ns = lower_ns + int(round(GOLDEN_SECTION_RATIO * (upper_ns - lower_ns)))
+    a_m = single_satellite_distance_m(single_satellite_propagator, epoch, ground_station_position_m, sid, a_ns)
+    b_m = single_satellite_distance_m(single_satellite_propagator, epoch, ground_station_position_m, sid, b_ns)
+    while True:
+        if a_m <= max_distance_m:
+            return a_ns, a_m
+        if b_m <= max_distance_m:
+            return b_ns, b_m
+        lowest_possible_m = min(
+            (lower_distance_m + a_m - max_satellite_speed_m_per_s * (a_ns - lower_ns) / 1e9) / 2.0,
+            (a_m + b_m - max_satellite_speed_m_per_s * (b_ns - a_ns) / 1e9) / 2.0,
+            (b_m + upper_distance_m - max_satellite_speed_m_per_s * (upper_ns - b_ns) / 1e9) / 2.0
+        )
+        if lowest_possible_m > max_distance_m or upper_ns - lower_ns <= tolerance_ns or b_ns <= a_ns:
+            return None
+        if a_m <= b_m:
+            upper_ns, upper_distance_m = b_ns, b_m
+            b_ns, b_m = a_ns, a_m
+            a_ns = lower_ns + int(round((1.0 - GOLDEN_SECTION_RATIO) * (upper_ns - lower_ns)))
+            a_m = single_satellite_distance_m(single_satellite_propagator, epoch, ground_station_position_m, sid, a_ns)
+        else:
+            lower_ns, lower_distance_m = a_ns, a_m
+            a_ns, a_m = b_ns, b_m
+            b_ns = lower_ns + int(round(GOLDEN_SECTION_RATIO * (upper_ns - lower_ns)))
+            b_m = single_satellite_distance_m(single_satellite_propagator, epoch, ground_station_position_m, sid, b_ns)
+
+
+def calculate_visibility_windows(position_source, epoch, satellites, ground_station_positions_m, max_distance_m,
+                                 start_ns, end_ns, sample_interval_ns=DEFAULT_VISIBILITY_SAMPLE_INTERVAL_NS,
+                                 tolerance_ns=DEFAULT_VISIBILITY_TOLERANCE_NS,
+                                 max_satellite_speed_m_per_s=MAX_SATELLITE_SPEED_M_PER_S):
+    """
+    Calculate for each ground station the windows [rise, set) during which each satellite is visible
+    (within the maximum distance), such that the visibility does not need to be tested at each time step.
+
+    The distances are sampled at the sample interval, after which the rise and set times between samples are
+    refined by bisection. A satellite can rise and set again in between two samples at which it is not visible.
+    As its speed is bounded, this is only possible if the average of both distances minus half the distance it
+    can travel in between is within the maximum distance. For those, a visible time in between is searched for.
+
+    :param position_source:              Position source (as returned by create_position_source()) which propagates
+                                         (not ephem, and without ephemeris). If it interpolates, SGP-4 is used.
+    :param epoch:                        Epoch (astropy Time, as returned by read_tles())
+    :param satellites:                   List of ephem satellites
+    :param ground_station_positions_m:   Numpy array of shape (number of ground stations, 3) of ECEF positions
+    :param max_distance_m:               Maximum distance in meters at which a satellite is visible (inclusive)
+    :param start_ns:                     Start time since epoch (ns)
+    :param end_ns:                       End time since epoch (ns), windows that are still open are closed here
+    :param sample_interval_ns:           Interval at which the distances are sampled (must be short compared to the
+                                         orbital period)
+    :param tolerance_ns:                 Precision of the rise and set times
+    :param max_satellite_speed_m_per_s:  Upper bound of the speed of satellites relative to ground stations
+
+    :return: Visibility windows (dictionary) with "windows", for each ground station a list of
+             (rise time ns, set time ns, satellite id) ordered by rise time, and an interval index
+             (see satellites_in_range_from_visibility_windows())
+    """
+    if position_source["ephemeris"] is not None or position_source["propagator"] == "ephem":
+        raise ValueError("Visibility windows can only be calculated by propagating with the sgp4 or analytic "
+                         "propagator")
+    if sample_interval_ns <= 0 or tolerance_ns <= 0:
+        raise ValueError("Sample interval and tolerance must be positive")
+    if end_ns < start_ns:
+        raise ValueError("End time must not be before start time")
+    if position_source["interpolation"] is not None:
+        position_source = create_position_source(satellites, "sgp4")
+    single_satellite_propagator = create_single_satellite_propagator(position_source, satellites)
+
+    num_ground_stations = ground_station_positions_m.shape[0]
+    windows = [[] for _ in range(num_ground_stations)]
+    rise_ns = np.full((num_ground_stations, len(satellites)), -1, dtype=np.int64)  # -1 if not visible
+
+    # Visible at the start
+    previous_ns = start_ns
+    previous_distance_m = distance_m_matrix_ground_stations_to_satellites(
+        ground_station_positions_m, satellite_positions_m_from_source(position_source, epoch, start_ns)
+    )
+    previous_visible = previous_distance_m <= max_distance_m
+    rise_ns[previous_visible] = start_ns
+
+    # Changes in between samples
+    for sample_ns in list(range(start_ns + sample_interval_ns, end_ns, sample_interval_ns)) + [end_ns]:
+        if sample_ns == previous_ns:
+            continue
+        distance_m = distance_m_matrix_ground_stations_to_satellites(
+            ground_station_positions_m, satellite_positions_m_from_source(position_source, epoch, sample_ns)
+        )
+        visible = distance_m <= max_distance_m
+
+        # Rise
+        for (gs_idx, sid) in zip(*np.nonzero(~previous_visible & visible)):
+            rise_ns[gs_idx, sid] = refine_visibility_change_ns(
+                single_satellite_propagator, epoch, ground_station_positions_m[gs_idx], sid, max_distance_m,
+                previous_ns, sample_ns, tolerance_ns, previous_distance_m[gs_idx, sid], distance_m[gs_idx, sid]
+            )
+
+        # Set
+        for (gs_idx, sid) in zip(*np.nonzero(previous_visible & ~visible)):
+            windows[gs_idx].append((int(rise_ns[gs_idx, sid]), refine_visibility_change_ns(
+                single_satellite_propagator, epoch, ground_station_positions_m[gs_idx], sid, max_distance_m,
+                previous_ns, sample_ns, tolerance_ns, previous_distance_m[gs_idx, sid], distance_m[gs_idx, sid]
+            ), int(sid)))
+            rise_ns[gs_idx, sid] = -1
+
+        # Rise and set in between
+        max_dip_m = max_satellite_speed_m_per_s * (sample_ns - previous_ns) / 1e9 / 2.0
+        possible_dip = ~previous_visible & ~visible & ((previous_distance_m + distance_m) / 2.0 - max_dip_m
+                                                       <= max_distance_m)
+        for (gs_idx, sid) in zip(*np.nonzero(possible_dip)):
+            visible_time = find_visible_time_ns(
+                single_satellite_propagator, epoch, ground_station_positions_m[gs_idx], sid, max_distance_m,
+                previous_ns, sample_ns, previous_distance_m[gs_idx, sid], distance_m[gs_idx, sid], tolerance_ns,
+                max_satellite_speed_m_per_s
+            )
+            if visible_time is not None:
+                (visible_ns, visible_distance_m) = visible_time
+                windows[gs_idx].append((
+                    refine_visibility_change_ns(
+                        single_satellite_propagator, epoch, ground_station_positions_m[gs_idx], sid, max_distance_m,
+                        previous_ns, visible_ns, tolerance_ns, previous_distance_m[gs_idx, sid], visible_distance_m
+                    ),
+                    refine_visibility_change_ns(
+                        single_satellite_propagator, epoch, ground_station_positions_m[gs_idx], sid, max_distance_m,
+                        visible_ns, sample_ns, tolerance_ns, visible_distance_m, distance_m[gs_idx, sid]
+                    ),
+                    int(sid)
+                ))
+
+        previous_ns = sample_ns
+        previous_distance_m = distance_m
+        previous_visible = visible
+
+    # Still visible at the end
+    for (gs_idx, sid) in zip(*np.nonzero(rise_ns >= 0)):
+        windows[gs_idx].append((int(rise_ns[gs_idx, sid]), end_ns, int(sid)))
+
+    for gs_idx in range(num_ground_stations):
+        windows[gs_idx].sort()
+    return create_visibility_windows_index({
+        "start_ns": start_ns,
+        "end_ns": end_ns,
+        "max_distance_m": max_distance_m,
+        "tolerance_ns": tolerance_ns,
+        "windows": windows,
+    })
+
+
+def create_visibility_windows_index(visibility_windows):
+    """
+    Add the interval index to visibility windows: all windows, widened by the tolerance on both sides,
+    ordered by their start. As windows are no longer than the longest one, the windows which contain a
+    time instant are within a contiguous range of the index, which is found by binary search.
+
+    :param visibility_windows:  Visibility windows (dictionary with "windows" and "tolerance_ns")
+
+    :return: The same visibility windows, with the index added
+    """
+    entries = sorted(
+        (rise_ns - visibility_windows["tolerance_ns"], set_ns + visibility_windows["tolerance_ns"], gs_idx, sid)
+        for gs_idx in range(len(visibility_windows["windows"]))
+        for (rise_ns, set_ns, sid) in visibility_windows["windows"][gs_idx]
+    )
+    visibility_windows["index_start_ns"] = np.array([entry[0] for entry in entries], dtype=np.int64)
+    visibility_windows["index_end_ns"] = np.array([entry[1] for entry in entries], dtype=np.int64)
+    visibility_windows["index_gs_idx"] = np.array([entry[2] for entry in entries], dtype=int)
+    visibility_windows["index_sid"] = np.array([entry[3] for entry in entries], dtype=int)
+    visibility_windows["index_max_duration_ns"] = int(np.max(
+        visibility_windows["index_end_ns"] - visibility_windows["index_start_ns"]
+    )) if len(entries) > 0 else 0
+    return visibility_windows
+
+
+def satellites_in_range_from_visibility_windows(visibility_windows, ground_station_positions_m, satellite_positions_m,
+                                                time_since_epoch_ns):
+    """
+    Determine for each ground station which satellites are in range at a time instant, by only calculating
+    the distances to the satellites of which a visibility window contains the time instant.
+
+    The windows are widened by their tolerance, and the distances are calculated the same way as
+    distance_m_matrix_ground_stations_to_satellites(), as such the result is exactly the same as
+    satellites_in_range_of_ground_stations() for the positions of which the windows were calculated.
+
+    :param visibility_windows:          Visibility windows (as returned by calculate_visibility_windows())
+    :param ground_station_positions_m:  Numpy array of shape (number of ground stations, 3) of ECEF positions
+    :param satellite_positions_m:       Numpy array of shape (number of satellites, 3) of ECEF positions
+    :param time_since_epoch_ns:         Time since epoch in nanoseconds (within the windows' start and end)
+
+    :return: List with for each ground station a list of (distance in meters, satellite id) in ascending satellite id
+    """
+    if time_since_epoch_ns < visibility_windows["start_ns"] or time_since_epoch_ns > visibility_windows["end_ns"]:
+        raise ValueError("Time %d ns is outside of the visibility windows" % time_since_epoch_ns)
+
+    # Windows which contain the time instant
+    index_start_ns = visibility_windows["index_start_ns"]
+    first = np.searchsorted(
+        index_start_ns, time_since_epoch_ns - visibility_windows["index_max_duration_ns"], side="right"
+    )
+    last = np.searchsorted(index_start_ns, time_since_epoch_ns, side="right")
+    contains = visibility_windows["index_end_ns"][first:last] > time_since_epoch_ns
+    candidate_gs_idxs = visibility_windows["index_gs_idx"][first:last][contains]
+    candidate_sids = visibility_windows["index_sid"][first:last][contains]
+    order = np.lexsort((candidate_sids, candidate_gs_idxs))
+    return satellites_in_range_of_candidates(
+        ground_station_positions_m,
+        satellite_positions_m,
+        candidate_gs_idxs[order],
+        candidate_sids[order],
+        visibility_windows["max_distance_m"]
+    )
+
+
+def visibility_change_times_ns(visibility_windows):
+    """
+    Retrieve all times at which a satellite rises or sets for any ground station (the handover times),
+    which can for instance be used to choose the time steps.
+
+    :param visibility_windows:  Visibility windows (as returned by calculate_visibility_windows())
+
+    :return: Sorted list of distinct times since epoch (ns), excluding the start and end
+    """
+    times_ns = set()
+    for windows in visibility_windows["windows"]:
+        for (rise_ns, set_ns, _) in windows:
+            times_ns.add(rise_ns)
+            times_ns.add(set_ns)
+    times_ns.discard(visibility_windows["start_ns"])
+    times_ns.discard(visibility_windows["end_ns"])
+    return sorted(times_ns)
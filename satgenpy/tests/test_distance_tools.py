@@ -25,6 +25,8 @@ import unittest
 
 import ephem
 import math
+import random
+import numpy as np
 from astropy.time import Time
 from astropy import units as u
 import exputil
@@ -320,3 +322,72 @@ class TestDistanceTools(unittest.TestCase):
             straight_shadow_distance_m,
             delta=20000  # 20km
         )
+
+    def test_distance_matrix_ground_stations_to_satellites(self):
+        ground_stations = []
+        for gid, (latitude, longitude, elevation) in enumerate([(0.0, 0.0, 0.0), (47.3769, 8.5417, 400.0),
+                                                                 (-33.8688, 151.2093, 58.0)]):
+            x, y, z = geodetic2cartesian(latitude, longitude, elevation)
+            ground_stations.append({"gid": gid, "cartesian_x": x, "cartesian_y": y, "cartesian_z": z})
+        ground_station_positions_m = ground_station_cartesian_positions_m(ground_stations)
+        self.assertEqual(ground_station_positions_m.shape, (3, 3))
+        self.assertEqual(ground_station_positions_m[1, 2], ground_stations[1]["cartesian_z"])
+
+        satellite_positions_m = np.array([
+            [7000000.0, 0.0, 0.0],
+            [0.0, -7000000.0, 100.0],
+            [4000000.0, 1000000.0, 5500000.0],
+            [-3000000.0, 5000000.0, -4000000.0],
+        ])
+        distance_m_matrix = distance_m_matrix_ground_stations_to_satellites(
+            ground_station_positions_m,
+            satellite_positions_m
+        )
+        self.assertEqual(distance_m_matrix.shape, (3, 4))
+        for i in range(3):
+            for j in range(4):
+                self.assertEqual(
+                    distance_m_matrix[i, j],
+                    math.sqrt(
+                        (satellite_positions_m[j, 0] - ground_stations[i]["cartesian_x"]) ** 2
+                        + (satellite_positions_m[j, 1] - ground_stations[i]["cartesian_y"]) ** 2
+                        + (satellite_positions_m[j, 2] - ground_stations[i]["cartesian_z"]) ** 2
+                    )
+                )
+        self.assertAlmostEqual(distance_m_matrix[0, 0], 7000000.0 - 6378135.0, places=6)
+
+    def test_satellites_in_range_of_ground_stations(self):
+        random.seed(123456789)
+        ground_station_positions_m = np.array([
+            geodetic2cartesian(random.uniform(-90.0, 90.0), random.uniform(-180.0, 180.0), 0.0) for _ in range(50)
+        ])
+        satellite_positions_m = np.array([
+            geodetic2cartesian(random.uniform(-90.0, 90.0), random.uniform(-180.0, 180.0), 630000.0)
+            for _ in range(400)
+        ])
+        distance_m_matrix = distance_m_matrix_ground_stations_to_satellites(
+            ground_station_positions_m,
+            satellite_positions_m
+        )
+
+        # Exactly the same as filtering the distance matrix, also for a radius equal to one of the distances
+        for max_distance_m in [0.0, 1089686.4181956202, float(distance_m_matrix[3, 17]), 20000000.0]:
+            satellites_in_range = satellites_in_range_of_ground_stations(
+                ground_station_positions_m,
+                satellite_positions_m,
+                max_distance_m
+            )
+            self.assertEqual(len(satellites_in_range), 50)
+            for i in range(50):
+                self.assertEqual(
+                    satellites_in_range[i],
+                    [(distance_m_matrix[i, j], j) for j in range(400) if distance_m_matrix[i, j] <= max_distance_m]
+                )
+            if max_distance_m == distance_m_matrix[3, 17]:
+                self.assertIn((distance_m_matrix[3, 17], 17), satellites_in_range[3])
+
+        # Without ground stations or satellites
+        self.assertEqual(satellites_in_range_of_ground_stations(np.zeros((0, 3)), satellite_positions_m, 1000.0), [])
+        self.assertEqual(
+            satellites_in_range_of_ground_stations(ground_station_positions_m[:2], np.zeros((0, 3)), 1000.0), [[], []]
+        )
@@ -196,3 +196,199 @@ class TestDynamicState(unittest.TestCase):
 
         # Clean up
         local_shell.remove_force_recursive(temp_gen_data)
+
+    def test_isl_length_exceeded(self):
+        local_shell = exputil.LocalShell()
+
+        # Output directory
+        temp_gen_data = "temp_dynamic_state_isl_length_gen_data"
+        name = "small_equator_constellation"
+        local_shell.make_full_dir(temp_gen_data + "/" + name)
+
+        # Ground stations
+        local_shell.write_file(
+            temp_gen_data + "/" + name + "/ground_stations.txt",
+            "0,Luanda,-8.836820,13.234320,0.000000,6135530.183815,1442953.502786,-973332.344974"
+        )
+
+        # Satellites (TLEs)
+        local_shell.write_file(
+            temp_gen_data + "/" + name + "/tles.txt",
+            (
+                "1 4\n"
+                "Starlink-550 0\n"
+                "1 01308U 00000ABC 00001.00000000  .00000000  00000-0  00000+0 0    05\n"
+                "2 01308  53.0000 295.0000 0000001   0.0000 155.4545 15.19000000    04\n"
+                "Starlink-550 1\n"
+                "1 01309U 00000ABC 00001.00000000  .00000000  00000-0  00000+0 0    06\n"
+                "2 01309  53.0000 295.0000 0000001   0.0000 171.8182 15.19000000    04\n"
+                "Starlink-550 2\n"
+                "1 01310U 00000ABC 00001.00000000  .00000000  00000-0  00000+0 0    08\n"
+                "2 01310  53.0000 295.0000 0000001   0.0000 188.1818 15.19000000    03\n"
+                "Starlink-550 3\n"
+                "1 01311U 00000ABC 00001.00000000  .00000000  00000-0  00000+0 0    09\n"
+                "2 01311  53.0000 295.0000 0000001   0.0000 204.5455 15.19000000    04"
+            )
+        )
+
+        # ISLs (0-1, 1-2 and 2-3 are about 1950 km long, 0-3 about 5800 km)
+        local_shell.write_file(temp_gen_data + "/" + name + "/isls.txt", "0 1\n1 2\n2 3\n0 3")
+
+        # GSL interfaces info
+        local_shell.write_file(
+            temp_gen_data + "/" + name + "/gsl_interfaces_info.txt",
+            "\n".join(["%d,1,1.0" % i for i in range(5)])
+        )
+
+        # All ISLs which are too long are reported at once
+        for propagator in ["ephem", "sgp4"]:
+            for (max_isl_length_m, expected_isls) in [
+                (1000.0, ["0 and 1", "1 and 2", "2 and 3", "0 and 3"]),
+                (5000000.0, ["0 and 3"]),
+            ]:
+                with self.assertRaises(ValueError) as context:
+                    help_dynamic_state(
+                        temp_gen_data,
+                        1,
+                        name,
+                        1000,
+                        10,
+                        1089686.4181956202,
+                        max_isl_length_m,
+                        "algorithm_free_one_only_over_isls",
+                        False,
+                        propagator=propagator
+                    )
+                message = str(context.exception)
+                self.assertIn("for %d ISL(s)" % len(expected_isls), message)
+                for isl in expected_isls:
+                    self.assertIn(isl + " (", message)
+
+        local_shell.remove_force_recursive(temp_gen_data)
+
+    def write_small_equator_constellation(self, local_shell, temp_gen_data, name):
+        local_shell.remove_force_recursive(temp_gen_data)
+        local_shell.make_full_dir(temp_gen_data + "/" + name)
+        local_shell.write_file(
+            temp_gen_data + "/" + name + "/ground_stations.txt",
+            (
+                "0,Luanda,-8.836820,13.234320,0.000000,6135530.183815,1442953.502786,-973332.344974\n"
+                "1,Lagos,6.453060,3.395830,0.000000,6326864.177950,375422.898833,712064.787620\n"
+                "2,Kinshasa,-4.327580,15.313570,0.000000,6134256.671861,1679704.404461,-478073.165313\n"
+                "3,Ar-Riyadh-(Riyadh),24.690466,46.709566,0.000000,3975957.341095,4220595.030186,2647959.980346"
+            )
+        )
+        local_shell.write_file(
+            temp_gen_data + "/" + name + "/tles.txt",
+            (
+                "1 4\n"
+                "Starlink-550 0\n"
+                "1 01308U 00000ABC 00001.00000000  .00000000  00000-0  00000+0 0    05\n"
+                "2 01308  53.0000 295.0000 0000001   0.0000 155.4545 15.19000000    04\n"
+                "Starlink-550 1\n"
+                "1 01309U 00000ABC 00001.00000000  .00000000  00000-0  00000+0 0    06\n"
+                "2 01309  53.0000 295.0000 0000001   0.0000 171.8182 15.19000000    04\n"
+                "Starlink-550 2\n"
+                "1 01310U 00000ABC 00001.00000000  .00000000  00000-0  00000+0 0    08\n"
+                "2 01310  53.0000 295.0000 0000001   0.0000 188.1818 15.19000000    03\n"
+                "Starlink-550 3\n"
+                "1 01311U 00000ABC 00001.00000000  .00000000  00000-0  00000+0 0    09\n"
+                "2 01311  53.0000 295.0000 0000001   0.0000 204.5455 15.19000000    04"
+            )
+        )
+        local_shell.write_file(temp_gen_data + "/" + name + "/isls.txt", "0 1\n1 2\n2 3")
+        local_shell.write_file(
+            temp_gen_data + "/" + name + "/gsl_interfaces_info.txt",
+            "\n".join(["%d,1,1.0" % i for i in range(8)])
+        )
+
+    def test_dynamic_state_archive_with_multiple_threads(self):
+        local_shell = exputil.LocalShell()
+        fstates = {}
+        for (variant, num_threads, use_archive) in [
+            ("separate_files", 1, False),
+            ("archive", 4, True),
+        ]:
+            temp_gen_data = "temp_dynamic_state_archive_threads_" + variant
+            name = "small_equator_constellation"
+            self.write_small_equator_constellation(local_shell, temp_gen_data, name)
+            help_dynamic_state(
+                temp_gen_data,
+                num_threads,
+                name,
+                10000,
+                100,
+                1089686.4181956202,
+                5016591.2330984278,
+                "algorithm_free_one_only_over_isls",
+                False,
+                dynamic_state_output=create_dynamic_state_output(use_archive=use_archive)
+            )
+            dynamic_state_dir = temp_gen_data + "/" + name + "/dynamic_state_10000ms_for_100s"
+
+            # Each file of each time step is exactly once in the archive
+            if use_archive:
+                with open(dynamic_state_dir + "/" + DYNAMIC_STATE_ARCHIVE_INDEX_FILENAME, "r") as f_in:
+                    filenames = [line.split(",")[0] for line in f_in]
+                self.assertEqual(sorted(filenames), sorted(
+                    ["fstate_%d.txt" % (t * 10000000000) for t in range(10)]
+                    + ["gsl_if_bandwidth_%d.txt" % (t * 10000000000) for t in range(10)]
+                ))
+
+            # Forwarding state at each time step
+            fstate = create_forwarding_state(4, 4)
+            fstates[variant] = []
+            for t in range(0, 100000000000, 10000000000):
+                read_forwarding_state_at(dynamic_state_dir, t, fstate)
+                fstates[variant].append(fstate["next_hops"].tolist())
+
+            local_shell.remove_force_recursive(temp_gen_data)
+
+        # The threads together result in the same forwarding state
+        self.assertEqual(fstates["separate_files"], fstates["archive"])
+
+    def test_forwarding_state_keyframes_with_multiple_threads(self):
+        local_shell = exputil.LocalShell()
+        for (variant, use_archive) in [
+            ("separate_files", False),
+            ("archive", True),
+        ]:
+            temp_gen_data = "temp_dynamic_state_keyframes_threads_" + variant
+            name = "small_equator_constellation"
+            self.write_small_equator_constellation(local_shell, temp_gen_data, name)
+
+            # 50 time steps with a keyframe every 4, divided among 4 threads
+            help_dynamic_state(
+                temp_gen_data,
+                4,
+                name,
+                2000,
+                100,
+                1089686.4181956202,
+                5016591.2330984278,
+                "algorithm_free_one_only_over_isls",
+                False,
+                dynamic_state_output=create_dynamic_state_output(use_archive=use_archive, keyframe_interval=4)
+            )
+            dynamic_state_dir = temp_gen_data + "/" + name + "/dynamic_state_2000ms_for_100s"
+
+            # Each thread starts at a keyframe, and together the segments cover each time step exactly once
+            keyframe_segments = find_forwarding_state_keyframes(dynamic_state_dir)
+            self.assertEqual(keyframe_segments, [(t * 2000000000, 2000000000, min(4, 50 - t)) for t in range(0, 50, 4)])
+
+            # Reconstructed from the keyframe before it, the state is the same as when reading all time steps in order
+            fstate = create_forwarding_state(4, 4)
+            for t in range(0, 100000000000, 2000000000):
+                read_forwarding_state_at(dynamic_state_dir, t, fstate)
+                self.assertEqual(
+                    read_forwarding_state_at_time(dynamic_state_dir, t, 4, 4, keyframe_segments)["next_hops"].tolist(),
+                    fstate["next_hops"].tolist()
+                )
+
+            # Only time steps which were generated can be reconstructed
+            with self.assertRaises(ValueError):
+                read_forwarding_state_at_time(dynamic_state_dir, 100000000000, 4, 4, keyframe_segments)
+            with self.assertRaises(ValueError):
+                read_forwarding_state_at_time(dynamic_state_dir, 1000000000, 4, 4, keyframe_segments)
+
+            local_shell.remove_force_recursive(temp_gen_data)
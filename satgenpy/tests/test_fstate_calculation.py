@@ -21,8 +21,26 @@
 # SOFTWARE.
 
 import exputil
+import math
+import numpy as np
+import os
+import random
 import unittest
+from satgen.isls import generate_plus_grid_isls
+from satgen.tles import generate_tles_from_scratch_manual, read_tles
+from satgen.propagation import create_position_source, create_position_table_from_source, \
+    isl_lengths_m_from_position_table
 from satgen.dynamic_state.fstate_calculation import *
+from satgen.dynamic_state.forwarding_state import *
+from satgen.dynamic_state.incremental_shortest_paths import *
+from satgen.dynamic_state.plus_grid_symmetry import *
+from satgen.dynamic_state.fewest_hops import *
+from satgen.dynamic_state.dynamic_state_archive import *
+from satgen.dynamic_state.dynamic_state_compression import *
+from satgen.dynamic_state.dynamic_state_writer import *
+from satgen.dynamic_state.fstate_kernels import *
+from satgen.dynamic_state.helper_dynamic_state import destination_gids_of_traffic
+from satgen.post_analysis.fstate_files import *
 
 
 def calculate_fstate_for(
@@ -133,6 +151,15 @@ def calculate_fstate_for(
     # Remove the temporary directory afterwards
     local_shell.remove_force_recursive(temp_dir)
 
+    # As dictionaries (node, destination) -> next-hop decision
+    for key in result.keys():
+        result[key] = dict(
+            ((node_id, dst_node_id), get_next_hop_decision(result[key], node_id, dst_node_id))
+            for node_id in range(num_satellites + num_ground_stations)
+            for dst_node_id in range(num_satellites, num_satellites + num_ground_stations)
+            if node_id != dst_node_id
+        )
+
     return result
 
 
@@ -521,3 +548,969 @@ class TestFstateCalculation(unittest.TestCase):
         self.assertEqual(output["combined"][(3, 4)], (1, 0, 1))
         self.assertEqual(output["combined"][(4, 2)], (1, 0, 2))
         self.assertEqual(output["combined"][(4, 3)], (1, 0, 2))
+
+    def test_shortest_path_distances_to(self):
+
+        # Random graph with one unreachable node
+        random.seed(123456789)
+        num_nodes = 30
+        graph = nx.Graph()
+        for i in range(num_nodes):
+            graph.add_node(i)
+        for i in range(num_nodes - 1):
+            for j in range(i + 1, num_nodes - 1):
+                if random.random() < 0.15:
+                    graph.add_edge(i, j, weight=random.uniform(1000.0, 5000000.0))
+        dist_all = nx.floyd_warshall_numpy(graph)
+
+        # Same distances as Floyd-Warshall, but only to the destinations
+        for dst_node_ids in [[], [0], [5, 2, num_nodes - 1], list(range(num_nodes))]:
+            dist_to_dst = calculate_shortest_path_distances_to(graph, num_nodes, dst_node_ids)
+            self.assertEqual(dist_to_dst.shape, (len(dst_node_ids), num_nodes))
+            for (idx, dst_node_id) in enumerate(dst_node_ids):
+                for node_id in range(num_nodes):
+                    if math.isinf(dist_all[(node_id, dst_node_id)]):
+                        self.assertTrue(math.isinf(dist_to_dst[(idx, node_id)]))
+                    else:
+                        self.assertAlmostEqual(dist_to_dst[(idx, node_id)], dist_all[(node_id, dst_node_id)], places=6)
+
+    def test_padded_neighbor_arrays(self):
+
+        #
+        #  0 - 1 - 2    3
+        #
+        graph = nx.Graph()
+        for i in range(4):
+            graph.add_node(i)
+        graph.add_edge(1, 2, weight=200.0)
+        graph.add_edge(1, 0, weight=100.0)
+        neighbor_to_if = {(1, 2): 0, (2, 1): 0, (1, 0): 1, (0, 1): 0}
+
+        padded_neighbors = create_padded_neighbor_arrays(graph, 4, neighbor_to_if)
+        self.assertEqual(padded_neighbors["neighbor_ids"].tolist(), [[1, 0], [2, 0], [1, 0], [0, 0]])
+        self.assertEqual(padded_neighbors["weights"].tolist(), [
+            [100.0, math.inf], [200.0, 100.0], [200.0, math.inf], [math.inf, math.inf]
+        ])
+        self.assertEqual(padded_neighbors["my_ifs"].tolist(), [[0, -1], [0, 1], [0, -1], [-1, -1]])
+        self.assertEqual(padded_neighbors["next_hop_ifs"].tolist(), [[1, -1], [0, 0], [0, -1], [-1, -1]])
+
+        # Without any edges, there is still one (padding) column
+        padded_neighbors = create_padded_neighbor_arrays(nx.empty_graph(3), 3, {})
+        self.assertEqual(padded_neighbors["neighbor_ids"].shape, (3, 1))
+        self.assertEqual(padded_neighbors["weights"].tolist(), [[math.inf], [math.inf], [math.inf]])
+
+    def test_neighbor_edge_arrays(self):
+
+        #
+        #  0 - 1 - 2    3
+        #
+        graph = nx.Graph()
+        for i in range(4):
+            graph.add_node(i)
+        graph.add_edge(1, 2, weight=200.0)
+        graph.add_edge(1, 0, weight=100.0)
+        neighbor_to_if = {(1, 2): 0, (2, 1): 0, (1, 0): 1, (0, 1): 0}
+
+        neighbor_edges = create_neighbor_edge_arrays(graph, 4, neighbor_to_if)
+        self.assertEqual(neighbor_edges["indptr"].tolist(), [0, 1, 3, 4, 4])
+        self.assertEqual(neighbor_edges["neighbor_ids"].tolist(), [1, 2, 0, 1])
+        self.assertEqual(neighbor_edges["weights"].tolist(), [100.0, 200.0, 100.0, 200.0])
+        self.assertEqual(neighbor_edges["my_ifs"].tolist(), [0, 0, 1, 0])
+        self.assertEqual(neighbor_edges["next_hop_ifs"].tolist(), [1, 0, 0, 0])
+
+    def test_gs_relaying_many_ground_stations(self):
+        local_shell = exputil.LocalShell()
+        temp_dir = "temp_gs_relaying_many_ground_stations_test"
+        local_shell.make_full_dir(temp_dir)
+
+        # Such that there are multiple blocks of destinations, of which some are unreachable
+        random.seed(192837465)
+        num_satellites = 12
+        num_ground_stations = GS_RELAYING_DESTINATIONS_PER_BLOCK * 2 + 7
+        graph = nx.Graph()
+        for i in range(num_satellites + num_ground_stations):
+            graph.add_node(i)
+        for gid in range(num_ground_stations - 3):
+            for sid in random.sample(range(num_satellites), random.randint(0, 3)):
+                graph.add_edge(sid, num_satellites + gid, weight=float(random.randint(500000, 500010)))
+        num_isls_per_sat = [0] * num_satellites
+        gid_to_sat_gsl_if_idx = [0] * num_ground_stations
+
+        # Regardless of the number of threads the same forwarding state
+        fstates = []
+        for num_threads in [1, 3]:
+            fstates.append(calculate_fstate_shortest_path_with_gs_relaying(
+                temp_dir, 0, num_satellites, num_ground_stations, graph, num_isls_per_sat,
+                gid_to_sat_gsl_if_idx, {}, None, False, num_threads=num_threads
+            ))
+        self.assertTrue(np.array_equal(fstates[0]["next_hops"], fstates[1]["next_hops"]))
+
+        # Every next hop is on a shortest path, and only unreachable destinations have none
+        dist_to_dst_gs = calculate_shortest_path_distances_to(
+            graph, num_satellites + num_ground_stations, range(num_satellites, num_satellites + num_ground_stations)
+        )
+        for dst_gid in range(num_ground_stations):
+            for node_id in range(num_satellites + num_ground_stations):
+                if node_id != num_satellites + dst_gid:
+                    (next_hop, my_if, next_hop_if) = get_next_hop_decision(
+                        fstates[0], node_id, num_satellites + dst_gid
+                    )
+                    if math.isinf(dist_to_dst_gs[(dst_gid, node_id)]):
+                        self.assertEqual((next_hop, my_if, next_hop_if), (-1, -1, -1))
+                    else:
+                        self.assertEqual(
+                            dist_to_dst_gs[(dst_gid, node_id)],
+                            graph.edges[(node_id, next_hop)]["weight"] + dist_to_dst_gs[(dst_gid, next_hop)]
+                        )
+                        self.assertEqual(my_if, 0)
+                        self.assertEqual(next_hop_if, 0)
+
+        local_shell.remove_force_recursive(temp_dir)
+
+    def test_forwarding_state_delta(self):
+        local_shell = exputil.LocalShell()
+        temp_dir = "temp_forwarding_state_delta_test"
+        local_shell.make_full_dir(temp_dir)
+
+        # 2 satellites and 2 ground stations (node 2 and 3)
+        fstate_a = create_forwarding_state(2, 2)
+        self.assertEqual(fstate_a["next_hops"].shape, (4, 2, 3))
+        self.assertEqual(get_next_hop_decision(fstate_a, 0, 3), (-1, -1, -1))
+        set_next_hop_decision(fstate_a, 0, 2, (2, 1, 0))
+        set_next_hop_decision(fstate_a, 1, 3, (3, 1, 0))
+        set_next_hop_decision(fstate_a, 2, 3, (0, 0, 1))
+        self.assertEqual(get_next_hop_decision(fstate_a, 0, 2), (2, 1, 0))
+        self.assertEqual(get_next_hop(fstate_a, 2, 3), 0)
+
+        # Without a previous forwarding state, all entries except ground station to itself are written
+        with open(temp_dir + "/fstate_a.txt", "w+") as f_out:
+            self.assertEqual(write_forwarding_state_delta(f_out, fstate_a, None), 6)
+        with open(temp_dir + "/fstate_a.txt", "r") as f_in:
+            self.assertEqual(f_in.read(), "0,2,2,1,0\n0,3,-1,-1,-1\n1,2,-1,-1,-1\n1,3,3,1,0\n2,3,0,0,1\n3,2,-1,-1,-1\n")
+
+        # Afterwards only the ones which changed
+        fstate_b = create_forwarding_state(2, 2)
+        fstate_b["next_hops"][:] = fstate_a["next_hops"]
+        set_next_hop_decision(fstate_b, 0, 3, (1, 0, 0))
+        set_next_hop_decision(fstate_b, 2, 3, (0, 0, 2))
+        with open(temp_dir + "/fstate_b.txt", "w+") as f_out:
+            self.assertEqual(write_forwarding_state_delta(f_out, fstate_b, fstate_a), 2)
+        with open(temp_dir + "/fstate_b.txt", "r") as f_in:
+            self.assertEqual(f_in.read(), "0,3,1,0,0\n2,3,0,0,2\n")
+        with open(temp_dir + "/fstate_c.txt", "w+") as f_out:
+            self.assertEqual(write_forwarding_state_delta(f_out, fstate_b, fstate_b), 0)
+
+        # Reading them in again in order results in the same forwarding state
+        fstate = create_forwarding_state(2, 2)
+        for (filename, num_entries) in [("fstate_a.txt", 6), ("fstate_b.txt", 2), ("fstate_c.txt", 0)]:
+            with open(temp_dir + "/" + filename, "r") as f_in:
+                self.assertEqual(read_forwarding_state_delta(f_in, fstate), num_entries)
+        self.assertTrue(np.array_equal(fstate["next_hops"], fstate_b["next_hops"]))
+
+        local_shell.remove_force_recursive(temp_dir)
+
+    def test_binary_forwarding_state(self):
+        local_shell = exputil.LocalShell()
+        temp_dir = "temp_binary_forwarding_state_test"
+        local_shell.make_full_dir(temp_dir)
+
+        # 2 satellites and 2 ground stations (node 2 and 3)
+        fstate_a = create_forwarding_state(2, 2)
+        set_next_hop_decision(fstate_a, 0, 2, (2, 1, 0))
+        set_next_hop_decision(fstate_a, 2, 3, (0, 0, 1))
+        fstate_b = create_forwarding_state(2, 2)
+        fstate_b["next_hops"][:] = fstate_a["next_hops"]
+        set_next_hop_decision(fstate_b, 0, 3, (1, 0, 0))
+
+        # Each entry is five little-endian int32 values
+        self.assertEqual(forwarding_state_filename(temp_dir, 0, "bin"), temp_dir + "/fstate_0.bin")
+        self.assertEqual(write_forwarding_state_delta_file(temp_dir + "/fstate_0.bin", fstate_a, None), 6)
+        self.assertEqual(write_forwarding_state_delta_file(temp_dir + "/fstate_1000.bin", fstate_b, fstate_a), 1)
+        with open(temp_dir + "/fstate_1000.bin", "rb") as f_in:
+            self.assertEqual(f_in.read(), np.array([0, 3, 1, 0, 0], dtype="<i4").tobytes())
+        self.assertEqual(os.path.getsize(temp_dir + "/fstate_0.bin"), 6 * 5 * 4)
+
+        # Reading them in again in order results in the same forwarding state
+        fstate = create_forwarding_state(2, 2)
+        self.assertEqual(read_forwarding_state_at(temp_dir, 0, fstate), 6)
+        self.assertTrue(np.array_equal(fstate["next_hops"], fstate_a["next_hops"]))
+        self.assertEqual(read_forwarding_state_at(temp_dir, 1000, fstate), 1)
+        self.assertTrue(np.array_equal(fstate["next_hops"], fstate_b["next_hops"]))
+        fstate = create_forwarding_state(2, 2)
+        for t in [0, 1000]:
+            with open_forwarding_state_file(temp_dir, t) as f_in:
+                self.assertEqual(f_in.name, temp_dir + "/fstate_%d.bin" % t)
+                read_forwarding_state_delta(f_in, fstate, forwarding_state_format_of(f_in.name))
+        self.assertTrue(np.array_equal(fstate["next_hops"], fstate_b["next_hops"]))
+
+        # Converted to text, it is the same as written as text, and converted back the same as before
+        write_forwarding_state_delta_file(temp_dir + "/expected_0.txt", fstate_a, None)
+        self.assertEqual(convert_forwarding_state_files(temp_dir, "txt", remove_original=True), 2)
+        self.assertFalse(os.path.exists(temp_dir + "/fstate_0.bin"))
+        with open(temp_dir + "/fstate_0.txt", "r") as f_in:
+            with open(temp_dir + "/expected_0.txt", "r") as f_expected:
+                self.assertEqual(f_in.read(), f_expected.read())
+        self.assertEqual(find_forwarding_state_file(temp_dir, 1000), temp_dir + "/fstate_1000.txt")
+        self.assertEqual(convert_forwarding_state_files(temp_dir, "bin"), 2)
+        self.assertTrue(np.array_equal(
+            read_forwarding_state_entries(temp_dir + "/fstate_1000.bin"),
+            read_forwarding_state_entries(temp_dir + "/fstate_1000.txt")
+        ))
+
+        # Truncated binary files and unknown formats are refused
+        with open(temp_dir + "/fstate_2000.bin", "wb") as f_out:
+            f_out.write(np.array([0, 3, 1], dtype="<i4").tobytes())
+        with self.assertRaises(ValueError):
+            read_forwarding_state_entries(temp_dir + "/fstate_2000.bin")
+        with self.assertRaises(ValueError):
+            forwarding_state_filename(temp_dir, 0, "csv")
+        with self.assertRaises(ValueError):
+            find_forwarding_state_file(temp_dir, 3000)
+
+        local_shell.remove_force_recursive(temp_dir)
+
+    def test_dynamic_state_archive(self):
+        local_shell = exputil.LocalShell()
+        temp_dir = "temp_dynamic_state_archive_test"
+        local_shell.make_full_dir(temp_dir)
+
+        # 2 satellites and 2 ground stations (node 2 and 3), of which a next hop changes every time step
+        fstates = []
+        for t in range(4):
+            fstate = create_forwarding_state(2, 2)
+            set_next_hop_decision(fstate, 0, 2, (2, 1, 0))
+            set_next_hop_decision(fstate, 1, 3, (3, 1, 0) if t % 2 == 0 else (0, 0, 0))
+            fstates.append(fstate)
+
+        # Forwarding state (alternating text and binary) and bandwidth of every time step in the archive
+        archive = create_dynamic_state_archive(temp_dir)
+        for t in range(4):
+            write_forwarding_state_delta_file(
+                forwarding_state_filename(temp_dir, t * 1000, "txt" if t % 2 == 0 else "bin"),
+                fstates[t], fstates[t - 1] if t > 0 else None, dynamic_state_archive=archive
+            )
+            with open_dynamic_state_file(temp_dir, "gsl_if_bandwidth_%d.txt" % (t * 1000), "w+", archive) as f_out:
+                f_out.write("%d,0,1.000000\n" % t)
+        with self.assertRaises(ValueError):
+            append_to_dynamic_state_archive(archive, "fstate_0.txt", b"")
+        self.assertEqual(close_dynamic_state_archive(archive), 8)
+        self.assertEqual(
+            sorted(os.listdir(temp_dir)),
+            [DYNAMIC_STATE_ARCHIVE_FILENAME, DYNAMIC_STATE_ARCHIVE_INDEX_FILENAME]
+        )
+
+        # Any time step can be read directly
+        index = read_dynamic_state_archive_index(temp_dir)
+        self.assertEqual(len(index), 8)
+        self.assertEqual(index["fstate_0.txt"][0], 0)
+        self.assertEqual(index["fstate_1000.bin"][1], 5 * 4)
+        self.assertEqual(read_dynamic_state_file(temp_dir, "gsl_if_bandwidth_2000.txt"), b"2,0,1.000000\n")
+        self.assertEqual(read_dynamic_state_archive_file(temp_dir, "fstate_3000.bin"),
+                         np.array([1, 3, 0, 0, 0], dtype="<i4").tobytes())
+        with self.assertRaises(ValueError):
+            read_dynamic_state_archive_file(temp_dir, "fstate_4000.txt")
+
+        # Reading them in again in order results in the same forwarding state
+        fstate = create_forwarding_state(2, 2)
+        for t in range(4):
+            self.assertEqual(read_forwarding_state_at(temp_dir, t * 1000, fstate), 6 if t == 0 else 1)
+            self.assertTrue(np.array_equal(fstate["next_hops"], fstates[t]["next_hops"]))
+        self.assertEqual(find_forwarding_state_file(temp_dir, 1000), temp_dir + "/fstate_1000.bin")
+
+        # Expanded, they are separate files again
+        self.assertEqual(expand_dynamic_state_archive(temp_dir, remove_archive=True), 8)
+        self.assertFalse(has_dynamic_state_archive(temp_dir))
+        self.assertEqual(len(os.listdir(temp_dir)), 8)
+        with open(temp_dir + "/gsl_if_bandwidth_3000.txt", "r") as f_in:
+            self.assertEqual(f_in.read(), "3,0,1.000000\n")
+        self.assertTrue(np.array_equal(
+            read_forwarding_state_entries(temp_dir + "/fstate_3000.bin"), np.array([[1, 3, 0, 0, 0]])
+        ))
+
+        local_shell.remove_force_recursive(temp_dir)
+
+    def test_compressed_dynamic_state(self):
+        local_shell = exputil.LocalShell()
+        temp_dir = "temp_compressed_dynamic_state_test"
+
+        # 2 satellites and 2 ground stations (node 2 and 3)
+        fstate_a = create_forwarding_state(2, 2)
+        set_next_hop_decision(fstate_a, 0, 2, (2, 1, 0))
+        set_next_hop_decision(fstate_a, 2, 3, (0, 0, 1))
+        fstate_b = create_forwarding_state(2, 2)
+        fstate_b["next_hops"][:] = fstate_a["next_hops"]
+        set_next_hop_decision(fstate_b, 0, 3, (1, 0, 0))
+
+        compressions = ["gz"] + (["zst"] if zstandard_available() else [])
+        for compression in compressions:
+            for use_archive in [False, True]:
+                local_shell.make_full_dir(temp_dir)
+
+                # Text and binary forwarding state, and bandwidth, compressed while written
+                archive = create_dynamic_state_archive(temp_dir) if use_archive else None
+                write_forwarding_state_delta_file(
+                    temp_dir + "/fstate_0.txt", fstate_a, None, None, archive, compression
+                )
+                write_forwarding_state_delta_file(
+                    temp_dir + "/fstate_1000.bin", fstate_b, fstate_a, None, archive, compression
+                )
+                with open_dynamic_state_file(temp_dir, "gsl_if_bandwidth_0.txt", "w+", archive, compression) as f_out:
+                    f_out.write("0,0,1.000000\n" * 1000)
+                if use_archive:
+                    close_dynamic_state_archive(archive)
+                    self.assertIn("fstate_0.txt." + compression, read_dynamic_state_archive_index(temp_dir))
+                else:
+                    self.assertTrue(os.path.isfile(temp_dir + "/fstate_1000.bin." + compression))
+                    self.assertLess(os.path.getsize(temp_dir + "/gsl_if_bandwidth_0.txt." + compression), 1000)
+
+                # Read transparently
+                self.assertEqual(
+                    read_dynamic_state_file(temp_dir, "gsl_if_bandwidth_0.txt"), b"0,0,1.000000\n" * 1000
+                )
+                fstate = create_forwarding_state(2, 2)
+                self.assertEqual(read_forwarding_state_at(temp_dir, 0, fstate), 6)
+                self.assertTrue(np.array_equal(fstate["next_hops"], fstate_a["next_hops"]))
+                self.assertEqual(read_forwarding_state_at(temp_dir, 1000, fstate), 1)
+                self.assertTrue(np.array_equal(fstate["next_hops"], fstate_b["next_hops"]))
+                self.assertEqual(find_forwarding_state_file(temp_dir, 1000), temp_dir + "/fstate_1000.bin")
+
+                # Decompressed (or expanded), they are the same as written without compression
+                if use_archive:
+                    self.assertEqual(expand_dynamic_state_archive(temp_dir, remove_archive=True), 3)
+                else:
+                    self.assertEqual(decompress_dynamic_state_files(temp_dir, remove_compressed=True), 3)
+                write_forwarding_state_delta_file(temp_dir + "/expected_0.txt", fstate_a, None)
+                with open(temp_dir + "/fstate_0.txt", "r") as f_in:
+                    with open(temp_dir + "/expected_0.txt", "r") as f_expected:
+                        self.assertEqual(f_in.read(), f_expected.read())
+                self.assertEqual(sorted(os.listdir(temp_dir)), [
+                    "expected_0.txt", "fstate_0.txt", "fstate_1000.bin", "gsl_if_bandwidth_0.txt"
+                ])
+
+                local_shell.remove_force_recursive(temp_dir)
+
+        # Unknown compressions are refused
+        with self.assertRaises(ValueError):
+            check_dynamic_state_compression("rar")
+
+    def test_dynamic_state_writer(self):
+        local_shell = exputil.LocalShell()
+        temp_dir = "temp_dynamic_state_writer_test"
+        local_shell.make_full_dir(temp_dir)
+
+        # Files are written in the order they were handed over, and never more than the maximum is queued
+        writer = create_dynamic_state_writer(max_queued_bytes=10)
+        written = []
+        max_queued_bytes = [0]
+
+        def write_function(i):
+            max_queued_bytes[0] = max(max_queued_bytes[0], writer["queued_bytes"])
+            written.append(i)
+
+        for i in range(50):
+            submit_to_dynamic_state_writer(writer, 4, lambda i=i: write_function(i))
+        self.assertEqual(close_dynamic_state_writer(writer), 50)
+        self.assertEqual(written, list(range(50)))
+        self.assertLessEqual(max_queued_bytes[0], 10)
+        with self.assertRaises(ValueError):
+            submit_to_dynamic_state_writer(writer, 4, lambda: None)
+
+        # Forwarding state and bandwidth of every time step, written by it into a compressed archive
+        fstates = []
+        archive = create_dynamic_state_archive(temp_dir)
+        writer = create_dynamic_state_writer(max_queued_bytes=100)
+        for t in range(20):
+            fstate = create_forwarding_state(2, 2)
+            set_next_hop_decision(fstate, 0, 2, (2, 1, 0))
+            set_next_hop_decision(fstate, 1, 3, (3, 1, 0) if t % 2 == 0 else (0, 0, 0))
+            fstates.append(fstate)
+            write_forwarding_state_delta_file(
+                forwarding_state_filename(temp_dir, t * 1000), fstate, fstates[t - 1] if t > 0 else None,
+                dynamic_state_archive=archive, compression="gz", dynamic_state_writer=writer
+            )
+            with open_dynamic_state_file(
+                    temp_dir, "gsl_if_bandwidth_%d.txt" % (t * 1000), "w+", archive, "gz", writer
+            ) as f_out:
+                f_out.write("%d,0,1.000000\n" % t)
+        self.assertEqual(close_dynamic_state_writer(writer), 40)
+        self.assertEqual(close_dynamic_state_archive(archive), 40)
+        fstate = create_forwarding_state(2, 2)
+        for t in range(20):
+            read_forwarding_state_at(temp_dir, t * 1000, fstate)
+            self.assertTrue(np.array_equal(fstate["next_hops"], fstates[t]["next_hops"]))
+            self.assertEqual(
+                read_dynamic_state_file(temp_dir, "gsl_if_bandwidth_%d.txt" % (t * 1000)), b"%d,0,1.000000\n" % t
+            )
+
+        # If writing fails, the error is raised in the calculation
+        writer = create_dynamic_state_writer()
+        with open_dynamic_state_file(temp_dir + "/missing", "fstate_0.txt", dynamic_state_writer=writer) as f_out:
+            f_out.write("0,2,2,1,0\n")
+        with self.assertRaises(OSError):
+            close_dynamic_state_writer(writer)
+
+        local_shell.remove_force_recursive(temp_dir)
+
+    def test_shortest_path_distances_to_incrementally(self):
+        random.seed(987654321)
+
+        # Grid of 8 x 8 with wrap-around (like +Grid ISLs), of which the weights change a bit every time step
+        num_nodes = 64
+        edges = []
+        for i in range(num_nodes):
+            edges.append((i, (i // 8) * 8 + (i + 1) % 8))
+            edges.append((i, (i + 8) % num_nodes))
+        weights = [random.uniform(1000000.0, 2000000.0) for _ in edges]
+
+        state = create_incremental_shortest_paths_state()
+        for t in range(30):
+            graph = nx.Graph()
+            for i in range(num_nodes):
+                graph.add_node(i)
+            num_edges = len(edges) if t != 20 else len(edges) - 1  # Once an edge is missing
+            for e in range(num_edges):
+                weights[e] *= random.uniform(0.999, 1.001)
+                graph.add_edge(edges[e][0], edges[e][1], weight=weights[e])
+
+            # Always exactly the same as calculating from scratch (with some destinations coming and going)
+            dst_node_ids = sorted(set([3, 17, 28, 40, 41, 63] + random.sample(range(num_nodes), 2)))
+            if t == 10:
+                dst_node_ids = []
+            self.assertTrue(np.array_equal(
+                calculate_shortest_path_distances_to_incrementally(state, graph, num_nodes, dst_node_ids),
+                calculate_shortest_path_distances_to(graph, num_nodes, dst_node_ids)
+            ))
+
+        # Most trees should have been repaired
+        self.assertGreater(state["num_trees_repaired"], state["num_trees_calculated"])
+
+    def test_shortest_path_distances_to_incrementally_on_plus_grid_shell(self):
+        local_shell = exputil.LocalShell()
+        temp_dir = "temp_incremental_shortest_paths_test"
+        local_shell.make_full_dir(temp_dir)
+
+        # Shell of 24 orbits of 24 satellites with +Grid ISLs, of which the ISL lengths change every 100 ms
+        generate_tles_from_scratch_manual(temp_dir + "/tles.txt", "Kuiper-630", 24, 24, True, 51.9, 0.0000001, 0.0,
+                                          14.80)
+        tles = read_tles(temp_dir + "/tles.txt")
+        list_isls = np.array(generate_plus_grid_isls(temp_dir + "/isls.txt", 24, 24, 0), dtype=np.int64)
+        position_source = create_position_source(tles["satellites"], "analytic")
+        state = create_incremental_shortest_paths_state()
+        for t in range(20):
+            position_table = create_position_table_from_source(
+                position_source, tles["epoch"], t * 100 * 1000 * 1000, tles["satellites"]
+            )
+            graph = nx.Graph()
+            graph.add_nodes_from(range(576))
+            for ((a, b), length_m) in zip(list_isls.tolist(), isl_lengths_m_from_position_table(position_table,
+                                                                                               list_isls).tolist()):
+                graph.add_edge(a, b, weight=length_m)
+
+            # Always exactly the same as calculating from scratch (with a destination coming every time step)
+            dst_node_ids = list(range(0, 576, 5)) + [5 * t + 1]
+            self.assertTrue(np.array_equal(
+                calculate_shortest_path_distances_to_incrementally(state, graph, 576, dst_node_ids),
+                calculate_shortest_path_distances_to(graph, 576, dst_node_ids)
+            ))
+
+        # Only the new destinations needed Dijkstra, and only few nodes of the other trees were settled again
+        self.assertEqual(state["num_trees_calculated"], 116 + 20)
+        self.assertEqual(state["num_trees_repaired"], 19 * 116)
+        self.assertGreater(state["num_nodes_resettled"], 0)
+        self.assertLess(state["num_nodes_resettled"], 0.05 * state["num_nodes_of_repaired_trees"])
+
+        local_shell.remove_force_recursive(temp_dir)
+
+    def test_repair_shortest_path_trees_same_with_numpy(self):
+        random.seed(246813579)
+        for _ in range(20):
+
+            # Grid with wrap-around of integer weights, such that there are many ties
+            n = random.randint(2, 6)
+            num_nodes = n * n
+            graph = nx.Graph()
+            graph.add_nodes_from(range(num_nodes))
+            for i in range(num_nodes):
+                for j in [(i // n) * n + (i + 1) % n, (i + n) % num_nodes]:
+                    if i != j and random.random() < 0.9:
+                        graph.add_edge(i, j, weight=float(random.randint(1, 4)))
+            adjacency = nx.to_scipy_sparse_array(graph, nodelist=range(num_nodes), weight="weight", format="csr")
+            adjacency.sort_indices()
+            indptr = adjacency.indptr.astype(np.int64)
+            edge_from = np.repeat(np.arange(num_nodes, dtype=np.int64), np.diff(indptr))
+            edge_to = adjacency.indices.astype(np.int64)
+            dst_node_ids = np.array(random.sample(range(num_nodes), random.randint(1, num_nodes)), dtype=np.int64)
+            _, predecessors = dijkstra(adjacency, directed=False, indices=dst_node_ids, return_predecessors=True)
+
+            # With other weights, repaired as plain Python loops and with numpy gives the same trees
+            edge_weights = adjacency.data + np.array([float(random.randint(-1, 1)) * 0.5 for _ in adjacency.data])
+            edge_weights = np.maximum(edge_weights, 0.5)
+            edge_weights = np.maximum(edge_weights, edge_weights[np.searchsorted(
+                edge_from * num_nodes + edge_to, edge_to * num_nodes + edge_from
+            )])
+            results = []
+            for kernel in [repair_shortest_path_trees.loop_function, repair_shortest_path_trees_with_numpy]:
+                predecessor_edge_idxs = calculate_predecessor_edge_idxs(edge_from, edge_to, num_nodes, predecessors)
+                depths = calculate_tree_depths(dst_node_ids, predecessors)
+                distances = np.empty(depths.shape)
+                num_resettled = kernel(
+                    dst_node_ids, indptr, edge_from, edge_to, edge_weights, predecessor_edge_idxs, depths, distances
+                )
+                results.append((distances, predecessor_edge_idxs, depths, num_resettled))
+            self.assertTrue(np.array_equal(results[0][0], results[1][0]))
+            self.assertTrue(np.array_equal(results[0][1], results[1][1]))
+            self.assertTrue(np.array_equal(results[0][2], results[1][2]))
+            self.assertEqual(results[0][3], results[1][3])
+
+            # Which are shortest path trees
+            adjacency.data = edge_weights
+            self.assertTrue(np.array_equal(results[0][0], dijkstra(adjacency, directed=False, indices=dst_node_ids)))
+
+    def test_plus_grid_torus_detection(self):
+        for (n_orbits, n_sats_per_orbit, isl_shift) in [(3, 3, 0), (5, 4, 1), (4, 7, 3), (34, 34, 1)]:
+            list_isls = generate_plus_grid_isls("isls.txt.tmp", n_orbits, n_sats_per_orbit, isl_shift)
+            os.remove("isls.txt.tmp")
+            self.assertEqual(detect_plus_grid_torus(n_orbits, n_sats_per_orbit, list_isls), {
+                "n_orbits": n_orbits,
+                "n_sats_per_orbit": n_sats_per_orbit,
+                "isl_shift": isl_shift
+            })
+
+            # Translating by a satellite maps every ISL onto an ISL
+            neighbor_ids = calculate_plus_grid_neighbor_ids(
+                detect_plus_grid_torus(n_orbits, n_sats_per_orbit, list_isls)
+            )
+            self.assertEqual(neighbor_ids.shape, (n_orbits * n_sats_per_orbit, 4))
+            for (a, b) in list_isls:
+                self.assertIn(b, neighbor_ids[a].tolist())
+                self.assertIn(a, neighbor_ids[b].tolist())
+
+            # Not if the orbits are different, an ISL is missing or another is added
+            self.assertIsNone(detect_plus_grid_torus(n_sats_per_orbit + 1, n_orbits, list_isls))
+            self.assertIsNone(detect_plus_grid_torus(n_orbits, n_sats_per_orbit, list_isls[1:]))
+            self.assertIsNone(detect_plus_grid_torus(n_orbits, n_sats_per_orbit, list_isls[1:] + [(0, 2)]))
+
+    def test_shortest_path_distances_to_with_symmetry(self):
+        random.seed(543216789)
+
+        # Torus of 7 orbits of 9 satellites
+        list_isls = generate_plus_grid_isls("isls.txt.tmp", 7, 9, 2)
+        os.remove("isls.txt.tmp")
+        num_nodes = 63
+        state = create_plus_grid_symmetry_state(detect_plus_grid_torus(7, 9, list_isls), max_relaxation_sweeps=3)
+
+        # Always exactly the same as Dijkstra, also if the shortest paths are not over the fewest hops
+        for t in range(12):
+            graph = nx.Graph()
+            for i in range(num_nodes):
+                graph.add_node(i)
+            for (a, b) in list_isls:
+                if t < 4:  # Nearly the same lengths (like a Walker shell)
+                    graph.add_edge(a, b, weight=random.uniform(1000000.0, 1001000.0))
+                elif t < 8:  # Very different lengths
+                    graph.add_edge(a, b, weight=random.uniform(1000000.0, 5000000.0))
+                elif (a, b) != list_isls[t]:  # One missing
+                    graph.add_edge(a, b, weight=random.uniform(1000000.0, 1001000.0))
+            dst_node_ids = sorted(random.sample(range(num_nodes), 10))
+            if t == 2:
+                dst_node_ids = []
+            self.assertTrue(np.array_equal(
+                calculate_shortest_path_distances_to_with_symmetry(state, graph, num_nodes, dst_node_ids),
+                calculate_shortest_path_distances_to(graph, num_nodes, dst_node_ids)
+            ))
+
+        # Each way was needed
+        self.assertGreater(state["num_exact_by_hops"], 0)
+        self.assertGreater(state["num_exact_by_relaxation"], 0)
+        self.assertGreater(state["num_calculated_by_dijkstra"], 0)
+
+    def test_fewest_hops(self):
+        local_shell = exputil.LocalShell()
+        temp_dir = "temp_fewest_hops_test"
+        local_shell.make_full_dir(temp_dir)
+
+        #
+        #       1 ------ (10) ----- 2   6: ground station in range of 2
+        #      /(10)        (4)  /  |
+        #     0 ---- (4) ---- 5 /   |(1)
+        #      \(1)                 |
+        #       3 ----- (1) ------- 4   7: ground station in range of 0
+        #
+        num_satellites = 6
+        list_isls = [(0, 1), (1, 2), (0, 5), (5, 2), (0, 3), (3, 4), (4, 2)]
+        weights = [10.0, 10.0, 4.0, 4.0, 1.0, 1.0, 1.0]
+        graph = nx.Graph()
+        for i in range(num_satellites):
+            graph.add_node(i)
+        num_isls_per_sat = [0] * num_satellites
+        sat_neighbor_to_if = {}
+        for ((a, b), weight) in zip(list_isls, weights):
+            graph.add_edge(a, b, weight=weight)
+            sat_neighbor_to_if[(a, b)] = num_isls_per_sat[a]
+            sat_neighbor_to_if[(b, a)] = num_isls_per_sat[b]
+            num_isls_per_sat[a] += 1
+            num_isls_per_sat[b] += 1
+        state = create_fewest_hops_state(num_satellites, list_isls)
+        self.assertEqual(state["hops"][0].tolist(), [0, 1, 2, 1, 2, 1])
+
+        # The shortest over the fewest hops from 0 to 2 is via 5 (8 m), not via 3 and 4 (3 m) nor via 1 (20 m)
+        hops, distances = calculate_fewest_hops_distances_to(
+            state, create_padded_neighbor_arrays(graph, num_satellites, sat_neighbor_to_if), [2]
+        )
+        self.assertEqual(hops.tolist(), [[2, 1, 0, 2, 1, 1]])
+        self.assertEqual(distances.tolist(), [[8.0, 10.0, 0.0, 2.0, 1.0, 4.0]])
+
+        # Forwarding state
+        fstate = calculate_fstate_fewest_hops_without_gs_relaying(
+            temp_dir, 0, num_satellites, 2, graph, num_isls_per_sat, [0, 0],
+            [[(1.0, 2)], [(1.0, 0)]], sat_neighbor_to_if, None, False, state
+        )
+        self.assertEqual(get_next_hop_decision(fstate, 0, 6), (5, 1, 0))
+        self.assertEqual(get_next_hop_decision(fstate, 3, 6), (4, 1, 0))
+        self.assertEqual(get_next_hop_decision(fstate, 2, 6), (6, 3, 0))
+        self.assertEqual(get_next_hop_decision(fstate, 2, 7), (5, 1, 1))
+        self.assertEqual(get_next_hop_decision(fstate, 4, 7), (3, 0, 1))
+        self.assertEqual(get_next_hop_decision(fstate, 6, 7), (2, 0, 3))
+        self.assertEqual(get_next_hop_decision(fstate, 7, 6), (0, 0, 3))
+
+        local_shell.remove_force_recursive(temp_dir)
+
+    def test_multipath_forwarding_state(self):
+        local_shell = exputil.LocalShell()
+        temp_dir = "temp_multipath_forwarding_state_test"
+        local_shell.make_full_dir(temp_dir)
+
+        #
+        #       1 ------ (10) ----- 2   6: ground station in range of 2 (1) and 4 (3)
+        #      /(10)        (4)  /  |
+        #     0 ---- (4) ---- 5 /   |(1)
+        #      \(1)                 |
+        #       3 ----- (1) ------- 4   7: ground station in range of 0 (1) and 1 (2)
+        #
+        num_satellites = 6
+        list_isls = [(0, 1), (1, 2), (0, 5), (5, 2), (0, 3), (3, 4), (4, 2)]
+        weights = [10.0, 10.0, 4.0, 4.0, 1.0, 1.0, 1.0]
+        graph = nx.Graph()
+        for i in range(num_satellites):
+            graph.add_node(i)
+        num_isls_per_sat = [0] * num_satellites
+        sat_neighbor_to_if = {}
+        for ((a, b), weight) in zip(list_isls, weights):
+            graph.add_edge(a, b, weight=weight)
+            sat_neighbor_to_if[(a, b)] = num_isls_per_sat[a]
+            sat_neighbor_to_if[(b, a)] = num_isls_per_sat[b]
+            num_isls_per_sat[a] += 1
+            num_isls_per_sat[b] += 1
+        ground_station_satellites_in_range = [[(1.0, 2), (3.0, 4)], [(1.0, 0), (2.0, 1)]]
+
+        # The single path forwarding state is the same as without multipath
+        fstate = calculate_fstate_shortest_path_without_gs_relaying(
+            temp_dir, 0, num_satellites, 2, graph, num_isls_per_sat, [0, 0],
+            ground_station_satellites_in_range, sat_neighbor_to_if, None, False, max_multipath_next_hops=3,
+            multipath_cost_tolerance=math.inf
+        )
+        fstate_single_path = calculate_fstate_shortest_path_without_gs_relaying(
+            temp_dir, 0, num_satellites, 2, graph, num_isls_per_sat, [0, 0],
+            ground_station_satellites_in_range, sat_neighbor_to_if, None, False
+        )
+        self.assertTrue(np.array_equal(fstate["next_hops"], fstate_single_path["next_hops"]))
+        self.assertNotIn("multipath", fstate_single_path)
+
+        # Without a cost tolerance, all next hops which are strictly closer to the destination, best first
+        multipath_fstate = fstate["multipath"]
+        self.assertEqual(multipath_fstate["next_hops"][0, 0].tolist(), [[3, 2, 0], [-1, -1, -1], [-1, -1, -1]])
+        self.assertEqual(multipath_fstate["weights"][0, 0].tolist(), [1.0, 0.0, 0.0])
+        self.assertEqual(multipath_fstate["next_hops"][4, 0].tolist(), [[2, 1, 2], [6, 2, 0], [-1, -1, -1]])
+        self.assertEqual(multipath_fstate["weights"][4, 0].tolist(), [0.5, 0.5, 0.0])
+        self.assertEqual(multipath_fstate["next_hops"][1, 0].tolist(), [[2, 1, 0], [0, 0, 0], [-1, -1, -1]])
+        self.assertEqual(multipath_fstate["next_hops"][5, 0].tolist(), [[2, 1, 1], [0, 0, 1], [-1, -1, -1]])
+        self.assertEqual(multipath_fstate["next_hops"][2, 0].tolist(), [[6, 3, 0], [-1, -1, -1], [-1, -1, -1]])
+        self.assertEqual(multipath_fstate["next_hops"][7, 0].tolist(), [[0, 0, 3], [1, 0, 2], [-1, -1, -1]])
+        self.assertEqual(multipath_fstate["next_hops"][6, 0].tolist(), [[-1, -1, -1]] * 3)
+        self.assertEqual(multipath_fstate["weights"][6, 0].tolist(), [0.0, 0.0, 0.0])
+
+        # Every next hop is strictly closer, and the first next hop is on a shortest path
+        # (over ISLs to a satellite in range of the destination ground station)
+        graph_with_last_hops = graph.copy()
+        for gid in range(2):
+            for b in ground_station_satellites_in_range[gid]:
+                graph_with_last_hops.add_edge(b[1], num_satellites + gid, weight=b[0])
+        dist_between_sats = calculate_shortest_path_distances_to(graph, num_satellites, range(num_satellites))
+        dist_to_dst_gs = np.zeros((2, num_satellites + 2))
+        for gid in range(2):
+            dist_to_dst_gs[gid, 0:num_satellites] = np.min([
+                dist_between_sats[b[1]] + b[0] for b in ground_station_satellites_in_range[gid]
+            ], axis=0)
+        for dst_gid in range(2):
+            for sid in range(num_satellites):
+                for (i, (next_hop, _, _)) in enumerate(multipath_fstate["next_hops"][sid, dst_gid].tolist()):
+                    if next_hop != -1:
+                        self.assertLess(dist_to_dst_gs[dst_gid, next_hop], dist_to_dst_gs[dst_gid, sid])
+                        if i == 0:
+                            self.assertEqual(
+                                dist_to_dst_gs[dst_gid, sid],
+                                graph_with_last_hops.edges[(sid, next_hop)]["weight"]
+                                + dist_to_dst_gs[dst_gid, next_hop]
+                            )
+
+        # Once ground station 6 is no longer in range of 4, only the entries of 4 to it and it to 7 are written
+        with open(temp_dir + "/fstate_multipath_0.txt", "r") as f_in:
+            self.assertEqual(len(f_in.readlines()), 14)
+        fstate_next = calculate_fstate_shortest_path_without_gs_relaying(
+            temp_dir, 1, num_satellites, 2, graph, num_isls_per_sat, [0, 0],
+            [[(1.0, 2)], [(1.0, 0), (2.0, 1)]], sat_neighbor_to_if, fstate, False, max_multipath_next_hops=3,
+            multipath_cost_tolerance=math.inf
+        )
+        with open(temp_dir + "/fstate_multipath_1.txt", "r") as f_in:
+            self.assertEqual(f_in.read(), "4,6,2,1,2,1.000000,-1,-1,-1,0.000000,-1,-1,-1,0.000000\n"
+                                          "6,7,2,0,3,1.000000,-1,-1,-1,0.000000,-1,-1,-1,0.000000\n")
+
+        # Reading them in again in order results in the same multipath forwarding state
+        multipath_fstate_read = create_multipath_forwarding_state(num_satellites, 2, 3)
+        for t in [0, 1]:
+            with open(temp_dir + "/fstate_multipath_%d.txt" % t, "r") as f_in:
+                read_multipath_forwarding_state_delta(f_in, multipath_fstate_read)
+        self.assertTrue(np.array_equal(multipath_fstate_read["next_hops"], fstate_next["multipath"]["next_hops"]))
+        self.assertTrue(np.array_equal(multipath_fstate_read["weights"], fstate_next["multipath"]["weights"]))
+
+        local_shell.remove_force_recursive(temp_dir)
+
+    def test_multipath_forwarding_state_cost_tolerance(self):
+        local_shell = exputil.LocalShell()
+        temp_dir = "temp_multipath_forwarding_state_cost_tolerance_test"
+        local_shell.make_full_dir(temp_dir)
+
+        #
+        #           1                4: ground station in range of 3 (1) and 0 (30)
+        #     (5) /   \ (5)
+        #        0     3             5: ground station in range of 1 (1), 2 (1) and 0 (10)
+        #     (5) \   / (5.5)
+        #           2
+        #
+        num_satellites = 4
+        graph = nx.Graph()
+        for i in range(num_satellites):
+            graph.add_node(i)
+        num_isls_per_sat = [0] * num_satellites
+        sat_neighbor_to_if = {}
+        for ((a, b), weight) in zip([(0, 1), (0, 2), (1, 3), (2, 3)], [5.0, 5.0, 5.0, 5.5]):
+            graph.add_edge(a, b, weight=weight)
+            sat_neighbor_to_if[(a, b)] = num_isls_per_sat[a]
+            sat_neighbor_to_if[(b, a)] = num_isls_per_sat[b]
+            num_isls_per_sat[a] += 1
+            num_isls_per_sat[b] += 1
+        ground_station_satellites_in_range = [[(1.0, 3), (30.0, 0)], [(1.0, 1), (1.0, 2), (10.0, 0)]]
+
+        # Without a cost tolerance, a third of the traffic of 0 to 4 would go over its direct link of 30
+        # instead of over 1 (11) or 2 (11.5), and of 5 to 4 over 0 (21) instead of over 1 (7) or 2 (7.5)
+        multipath_fstates = {}
+        for cost_tolerance in [math.inf, DEFAULT_MULTIPATH_COST_TOLERANCE]:
+            multipath_fstates[cost_tolerance] = calculate_fstate_shortest_path_without_gs_relaying(
+                temp_dir, 0, num_satellites, 2, graph, num_isls_per_sat, [0, 0],
+                ground_station_satellites_in_range, sat_neighbor_to_if, None, False, max_multipath_next_hops=3,
+                multipath_cost_tolerance=cost_tolerance
+            )["multipath"]
+        multipath_fstate = multipath_fstates[math.inf]
+        self.assertEqual(multipath_fstate["next_hops"][0, 0].tolist(), [[1, 0, 0], [2, 1, 0], [4, 2, 0]])
+        self.assertEqual(multipath_fstate["weights"][0, 0].tolist(), [1.0 / 3, 1.0 / 3, 1.0 / 3])
+        self.assertEqual(multipath_fstate["next_hops"][5, 0].tolist(), [[1, 0, 2], [2, 0, 2], [0, 0, 2]])
+
+        # With it, only the near-equal-cost next hops are used
+        multipath_fstate = multipath_fstates[DEFAULT_MULTIPATH_COST_TOLERANCE]
+        self.assertEqual(multipath_fstate["next_hops"][0, 0].tolist(), [[1, 0, 0], [2, 1, 0], [-1, -1, -1]])
+        self.assertEqual(multipath_fstate["weights"][0, 0].tolist(), [0.5, 0.5, 0.0])
+        self.assertEqual(multipath_fstate["next_hops"][5, 0].tolist(), [[1, 0, 2], [2, 0, 2], [-1, -1, -1]])
+        self.assertEqual(multipath_fstate["weights"][5, 0].tolist(), [0.5, 0.5, 0.0])
+        self.assertEqual(multipath_fstate["next_hops"][3, 0].tolist(), [[4, 2, 0], [-1, -1, -1], [-1, -1, -1]])
+        self.assertEqual(multipath_fstate["weights"][3, 0].tolist(), [1.0, 0.0, 0.0])
+
+        # A tolerance of zero only keeps next hops of exactly equal cost
+        multipath_fstate = calculate_multipath_fstate_without_gs_relaying(
+            num_satellites, 2, num_isls_per_sat, [0, 0], ground_station_satellites_in_range,
+            create_padded_neighbor_arrays(graph, num_satellites, sat_neighbor_to_if),
+            np.array([[11.0, 6.0], [6.0, 1.0], [6.5, 1.0], [1.0, 6.0]]), 3, 0.0
+        )
+        self.assertEqual(multipath_fstate["next_hops"][0, 0].tolist(), [[1, 0, 0], [-1, -1, -1], [-1, -1, -1]])
+        self.assertEqual(multipath_fstate["next_hops"][0, 1].tolist(), [[1, 0, 0], [2, 1, 0], [-1, -1, -1]])
+        self.assertEqual(multipath_fstate["weights"][0, 1].tolist(), [0.5, 0.5, 0.0])
+
+        local_shell.remove_force_recursive(temp_dir)
+
+    def test_scoped_destinations(self):
+        local_shell = exputil.LocalShell()
+        temp_dir = "temp_scoped_destinations_test"
+        local_shell.make_full_dir(temp_dir)
+
+        # Ring of satellites with some chords, and ground stations which see up to three satellites
+        random.seed(564738291)
+        num_satellites = 20
+        num_ground_stations = 10
+        graph = nx.Graph()
+        for i in range(num_satellites):
+            graph.add_node(i)
+        num_isls_per_sat = [0] * num_satellites
+        sat_neighbor_to_if = {}
+        for (a, b) in [(i, (i + 1) % num_satellites) for i in range(num_satellites)] + [(0, 10), (5, 15), (3, 12)]:
+            graph.add_edge(a, b, weight=float(random.randint(1, 5)))
+            sat_neighbor_to_if[(a, b)] = num_isls_per_sat[a]
+            sat_neighbor_to_if[(b, a)] = num_isls_per_sat[b]
+            num_isls_per_sat[a] += 1
+            num_isls_per_sat[b] += 1
+        ground_station_satellites_in_range = [
+            [(float(random.randint(1, 3)), sid) for sid in random.sample(range(num_satellites), random.randint(0, 3))]
+            for _ in range(num_ground_stations)
+        ]
+        gid_to_sat_gsl_if_idx = [0] * num_ground_stations
+
+        # Traffic from 1 to 4 and from 7 to 4, which flows back as well
+        dst_gids = destination_gids_of_traffic([(1, 4), (7, 4)])
+        self.assertEqual(dst_gids, [1, 4, 7])
+        self.assertEqual(destination_gids_of_traffic([(1, 4), (7, 4)], include_reverse_direction=False), [4])
+
+        # The entries to the destinations in scope are the same as without scope, the others are not calculated
+        fstates = []
+        for scope in [None, dst_gids]:
+            fstates.append(calculate_fstate_shortest_path_without_gs_relaying(
+                temp_dir, 0, num_satellites, num_ground_stations, graph, num_isls_per_sat, gid_to_sat_gsl_if_idx,
+                ground_station_satellites_in_range, sat_neighbor_to_if, None, False,
+                max_multipath_next_hops=2, dst_gids=scope
+            ))
+        for dst_gid in range(num_ground_stations):
+            if dst_gid in dst_gids:
+                self.assertTrue(np.array_equal(
+                    fstates[0]["next_hops"][:, dst_gid], fstates[1]["next_hops"][:, dst_gid]
+                ))
+                self.assertTrue(np.array_equal(
+                    fstates[0]["multipath"]["next_hops"][0:num_satellites, dst_gid],
+                    fstates[1]["multipath"]["next_hops"][0:num_satellites, dst_gid]
+                ))
+            else:
+                self.assertTrue(np.all(fstates[1]["next_hops"][:, dst_gid] == -1))
+
+        # Only the entries to the destinations in scope are written
+        with open(temp_dir + "/fstate_0.txt", "r") as f_in:
+            written_dst_node_ids = set(int(line.split(",")[1]) for line in f_in)
+        self.assertEqual(written_dst_node_ids, set(num_satellites + dst_gid for dst_gid in dst_gids))
+        with open(temp_dir + "/fstate_multipath_0.txt", "r") as f_in:
+            written_dst_node_ids = set(int(line.split(",")[1]) for line in f_in)
+        self.assertEqual(written_dst_node_ids, set(num_satellites + dst_gid for dst_gid in dst_gids))
+
+        # The same with ground station relays
+        relay_graph = nx.Graph()
+        for i in range(num_satellites + num_ground_stations):
+            relay_graph.add_node(i)
+        for (gid, satellites_in_range) in enumerate(ground_station_satellites_in_range):
+            for (distance_m, sid) in satellites_in_range:
+                relay_graph.add_edge(sid, num_satellites + gid, weight=distance_m)
+        relay_fstates = []
+        for scope in [None, dst_gids]:
+            relay_fstates.append(calculate_fstate_shortest_path_with_gs_relaying(
+                temp_dir, 0, num_satellites, num_ground_stations, relay_graph, [0] * num_satellites,
+                gid_to_sat_gsl_if_idx, {}, None, False, dst_gids=scope
+            ))
+        for dst_gid in range(num_ground_stations):
+            if dst_gid in dst_gids:
+                self.assertTrue(np.array_equal(
+                    relay_fstates[0]["next_hops"][:, dst_gid], relay_fstates[1]["next_hops"][:, dst_gid]
+                ))
+            else:
+                self.assertTrue(np.all(relay_fstates[1]["next_hops"][:, dst_gid] == -1))
+
+        # Destinations must be ground stations
+        with self.assertRaises(ValueError):
+            scoped_destination_gids(num_ground_stations, [num_ground_stations])
+
+        local_shell.remove_force_recursive(temp_dir)
+
+    def test_kernels_same_with_numpy(self):
+        random.seed(123456789)
+        for _ in range(30):
+            num_satellites = random.randint(2, 12)
+            num_ground_stations = random.randint(1, 6)
+
+            # Satellites in range, with many ties in distance (and some ground stations without any)
+            ground_station_satellites_in_range = []
+            for gid in range(num_ground_stations):
+                sids = random.sample(range(num_satellites), random.randint(0, num_satellites))
+                ground_station_satellites_in_range.append([(float(random.randint(1, 3)), sid) for sid in sids])
+            candidate_indptr, candidate_satellite_ids, candidate_distances_m = create_candidate_arrays(
+                ground_station_satellites_in_range, sort_by_satellite_id=True
+            )
+            dst_sats = np.unique(candidate_satellite_ids)
+
+            # Distances to the destination satellites, and padded neighbors, with ties and unreachable ones
+            dist_to_dst_sat = np.array(
+                [[random.choice([1.0, 2.0, 3.0, math.inf]) for _ in range(num_satellites)] for _ in dst_sats]
+            ).reshape((len(dst_sats), num_satellites))
+            dist_to_dst_sat[np.arange(len(dst_sats)), dst_sats] = 0.0
+            max_degree = 3
+            neighbor_ids = np.array([random.randrange(num_satellites) for _ in range(num_satellites * max_degree)],
+                                    dtype=np.int64).reshape((num_satellites, max_degree))
+            neighbor_weights = np.array([random.choice([1.0, 2.0, math.inf])
+                                         for _ in range(num_satellites * max_degree)]).reshape(neighbor_ids.shape)
+            neighbor_my_ifs = np.arange(num_satellites * max_degree, dtype=np.int64).reshape(neighbor_ids.shape)
+            neighbor_next_hop_ifs = neighbor_my_ifs + 100
+            num_isls_per_sat = np.full(num_satellites, max_degree, dtype=np.int64)
+            gid_to_sat_gsl_if_idx = np.arange(num_ground_stations, dtype=np.int64)
+            dst_gids = np.array(sorted(
+                random.sample(range(num_ground_stations), random.randint(1, num_ground_stations))
+            ), dtype=np.int64)
+            hops_satellite_to_ground_station = np.array(
+                [random.randint(0, 2) for _ in range(num_satellites * num_ground_stations)]
+            ).reshape((num_satellites, num_ground_stations))
+
+            # Each kernel as plain Python loops and with numpy gives the same result
+            results = []
+            for kernel in [select_satellite_next_hops_to_ground_stations.loop_function,
+                           select_satellite_next_hops_to_ground_stations_with_numpy]:
+                next_hops = np.full((num_satellites, num_ground_stations, 3), -1, dtype=np.int32)
+                dist_satellite_to_ground_station = np.full((num_satellites, num_ground_stations), math.inf)
+                kernel(
+                    dist_to_dst_sat, candidate_indptr, np.searchsorted(dst_sats, candidate_satellite_ids),
+                    candidate_satellite_ids, candidate_distances_m, neighbor_ids, neighbor_weights,
+                    neighbor_my_ifs, neighbor_next_hop_ifs, num_isls_per_sat, gid_to_sat_gsl_if_idx, dst_gids,
+                    next_hops, dist_satellite_to_ground_station
+                )
+                results.append((next_hops, dist_satellite_to_ground_station))
+            self.assertTrue(np.array_equal(results[0][0], results[1][0]))
+            self.assertTrue(np.array_equal(results[0][1], results[1][1]))
+            dist_satellite_to_ground_station = results[0][1]
+
+            next_hops_list = []
+            for kernel in [select_ground_station_next_hops.loop_function, select_ground_station_next_hops_with_numpy]:
+                next_hops = np.full((num_ground_stations, num_ground_stations, 3), -1, dtype=np.int32)
+                kernel(
+                    candidate_indptr, candidate_satellite_ids, candidate_distances_m,
+                    hops_satellite_to_ground_station, dist_satellite_to_ground_station, num_isls_per_sat,
+                    gid_to_sat_gsl_if_idx, dst_gids, next_hops
+                )
+                next_hops_list.append(next_hops)
+            self.assertTrue(np.array_equal(next_hops_list[0], next_hops_list[1]))
+
+            nearest = select_nearest_satellites.loop_function(
+                candidate_indptr, candidate_satellite_ids, candidate_distances_m
+            )
+            nearest_with_numpy = select_nearest_satellites_with_numpy(
+                candidate_indptr, candidate_satellite_ids, candidate_distances_m
+            )
+            self.assertTrue(np.array_equal(nearest[0], nearest_with_numpy[0]))
+            self.assertTrue(np.array_equal(nearest[1], nearest_with_numpy[1]))
+
+            bandwidth = calculate_paired_gsl_if_bandwidth.loop_function(num_satellites, nearest[0])
+            bandwidth_with_numpy = calculate_paired_gsl_if_bandwidth_with_numpy(num_satellites, nearest[0])
+            self.assertTrue(np.array_equal(bandwidth[0], bandwidth_with_numpy[0]))
+            self.assertTrue(np.array_equal(bandwidth[1], bandwidth_with_numpy[1]))
+
+
+@unittest.skipUnless(jit_kernels_available(), "numba is not installed, as such the kernels are not compiled")
+class TestFstateCalculationWithoutJitKernels(TestFstateCalculation):
+    """
+    All the forwarding state calculation tests again, but with the numpy equivalents of the kernels
+    instead of the compiled ones, which must give exactly the same result.
+    """
+
+    def setUp(self):
+        enable_jit_kernels(False)
+
+    def tearDown(self):
+        enable_jit_kernels(True)
@@ -33,6 +33,7 @@ class TestIsls(unittest.TestCase):
         satgen.generate_empty_isls("isls_empty.txt.tmp")
         isls_list = satgen.read_isls("isls_empty.txt.tmp", 0)
         self.assertEqual(0, len(isls_list))
+        self.assertEqual(satgen.read_isls("isls_empty.txt.tmp", 0, as_array=True).shape, (0, 2))
         os.remove("isls_empty.txt.tmp")
 
     def test_isls_plus_grid(self):
@@ -42,7 +43,11 @@ class TestIsls(unittest.TestCase):
             isl_shift = values[2]
             satgen.generate_plus_grid_isls("isls.txt.tmp", num_orbits, num_sat_per_orbit, isl_shift)
             isls_list = satgen.read_isls("isls.txt.tmp", num_orbits * num_sat_per_orbit)
+            isls_array = satgen.read_isls("isls.txt.tmp", num_orbits * num_sat_per_orbit, as_array=True)
             os.remove("isls.txt.tmp")
+            self.assertEqual(isls_array.shape, (len(isls_list), 2))
+            self.assertEqual(isls_array.dtype.kind, "i")
+            self.assertEqual(list(map(tuple, isls_array.tolist())), isls_list)
             self.assertEqual(len(isls_list), num_orbits * num_sat_per_orbit * 2)
             self.assertEqual(len(set(isls_list)), num_orbits * num_sat_per_orbit * 2)
             for i in range(num_orbits * num_sat_per_orbit):
@@ -0,0 +1,535 @@
+# The MIT License (MIT)
+#
+# Copyright (c) 2020 ETH Zurich
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+import unittest
+
+import ephem
+import exputil
+import numpy as np
+from astropy import units as u
+from sgp4.propagation import gstime
+
+from satgen import *
+
+
+class TestPropagation(unittest.TestCase):
+
+    def test_greenwich_mean_sidereal_time(self):
+        for jd, fr in [
+            (2451545.0, 0.0),
+            (2451544.5, 0.5),
+            (2451545.0, 0.123456789),
+            (2458849.5, 0.75),
+        ]:
+            self.assertAlmostEqual(greenwich_mean_sidereal_time_rad(jd, fr), gstime(jd + fr), places=8)
+
+    def test_propagation_matches_ephem(self):
+        local_shell = exputil.LocalShell()
+        temp_dir = "temp_propagation_test"
+        local_shell.make_full_dir(temp_dir)
+
+        # Small Kuiper-like shell
+        generate_tles_from_scratch_manual(
+            temp_dir + "/tles.txt",
+            "Kuiper-630",
+            4,
+            6,
+            False,
+            51.9,
+            0.0000001,
+            0.0,
+            14.80
+        )
+        tles = read_tles(temp_dir + "/tles.txt")
+        satellites = tles["satellites"]
+        epoch = tles["epoch"]
+
+        # Ground stations (extended format)
+        ground_stations = []
+        for gid, (latitude, longitude) in enumerate([("0.0", "0.0"), ("47.3769", "8.5417"), ("-33.8688", "151.2093")]):
+            x, y, z = geodetic2cartesian(float(latitude), float(longitude), 0.0)
+            ground_stations.append({
+                "gid": gid,
+                "name": "GS-" + str(gid),
+                "latitude_degrees_str": latitude,
+                "longitude_degrees_str": longitude,
+                "elevation_m_float": 0.0,
+                "cartesian_x": x,
+                "cartesian_y": y,
+                "cartesian_z": z,
+            })
+
+        satrec_array = create_satrec_array(satellites)
+        for time_since_epoch_ns in [0, 1000000000, 600 * 1000000000, 3600 * 1000000000, 86400 * 1000000000]:
+            positions_m = propagate_satellite_positions_m(satrec_array, epoch, time_since_epoch_ns)
+            self.assertEqual(positions_m.shape, (len(satellites), 3))
+            time = epoch + time_since_epoch_ns * u.ns
+
+            # Satellite-to-satellite distances agree up to the different Earth radius used by ephem
+            for a in range(len(satellites)):
+                for b in range(a + 1, len(satellites)):
+                    ephem_distance_m = distance_m_between_satellites(
+                        satellites[a], satellites[b], str(epoch), str(time)
+                    )
+                    sgp4_distance_m = np.linalg.norm(positions_m[a] - positions_m[b])
+                    self.assertLess(abs(sgp4_distance_m - ephem_distance_m), 1e-5 * ephem_distance_m + 10.0)
+
+            # Ground station to satellite distances agree within 100m (for those that are nearby)
+            for ground_station in ground_stations:
+                ground_station_position_m = np.array([
+                    ground_station["cartesian_x"], ground_station["cartesian_y"], ground_station["cartesian_z"]
+                ])
+                for sid in range(len(satellites)):
+                    ephem_distance_m = distance_m_ground_station_to_satellite(
+                        ground_station, satellites[sid], str(epoch), str(time)
+                    )
+                    if ephem_distance_m <= 3000000:
+                        sgp4_distance_m = np.linalg.norm(positions_m[sid] - ground_station_position_m)
+                        self.assertLess(abs(sgp4_distance_m - ephem_distance_m), 100.0)
+
+        # Unknown propagator
+        with self.assertRaises(ValueError):
+            generate_dynamic_state(
+                temp_dir, epoch, 1000000000, 1000000000, 0, satellites, ground_stations, [],
+                [], 1000000, 1000000, "algorithm_free_one_only_over_isls", False, propagator="unknown"
+            )
+
+        local_shell.remove_force_recursive(temp_dir)
+
+    def test_dynamic_state_same_for_all_propagators(self):
+        local_shell = exputil.LocalShell()
+        fstates = {}
+        for (variant, propagator, interpolation_anchor_ms, use_visibility_windows) in [
+            ("ephem", "ephem", None, False),
+            ("sgp4", "sgp4", None, False),
+            ("analytic", "analytic", None, False),
+            ("interpolated", "sgp4", 30000, False),
+            ("visibility_windows", "analytic", None, True),
+        ]:
+
+            # Output directory
+            temp_gen_data = "temp_propagation_dynamic_state_" + variant
+            name = "small_equator_constellation"
+            local_shell.make_full_dir(temp_gen_data + "/" + name)
+
+            # Ground stations
+            local_shell.write_file(
+                temp_gen_data + "/" + name + "/ground_stations.txt",
+                (
+                    "0,Luanda,-8.836820,13.234320,0.000000,6135530.183815,1442953.502786,-973332.344974\n"
+                    "1,Lagos,6.453060,3.395830,0.000000,6326864.177950,375422.898833,712064.787620\n"
+                    "2,Kinshasa,-4.327580,15.313570,0.000000,6134256.671861,1679704.404461,-478073.165313\n"
+                    "3,Ar-Riyadh-(Riyadh),24.690466,46.709566,0.000000,3975957.341095,4220595.030186,2647959.980346"
+                )
+            )
+
+            # Satellites (TLEs)
+            local_shell.write_file(
+                temp_gen_data + "/" + name + "/tles.txt",
+                (
+                    "1 4\n"
+                    "Starlink-550 0\n"
+                    "1 01308U 00000ABC 00001.00000000  .00000000  00000-0  00000+0 0    05\n"
+                    "2 01308  53.0000 295.0000 0000001   0.0000 155.4545 15.19000000    04\n"
+                    "Starlink-550 1\n"
+                    "1 01309U 00000ABC 00001.00000000  .00000000  00000-0  00000+0 0    06\n"
+                    "2 01309  53.0000 295.0000 0000001   0.0000 171.8182 15.19000000    04\n"
+                    "Starlink-550 2\n"
+                    "1 01310U 00000ABC 00001.00000000  .00000000  00000-0  00000+0 0    08\n"
+                    "2 01310  53.0000 295.0000 0000001   0.0000 188.1818 15.19000000    03\n"
+                    "Starlink-550 3\n"
+                    "1 01311U 00000ABC 00001.00000000  .00000000  00000-0  00000+0 0    09\n"
+                    "2 01311  53.0000 295.0000 0000001   0.0000 204.5455 15.19000000    04"
+                )
+            )
+
+            # ISLs
+            local_shell.write_file(temp_gen_data + "/" + name + "/isls.txt", "0 1\n1 2\n2 3")
+
+            # GSL interfaces info
+            local_shell.write_file(
+                temp_gen_data + "/" + name + "/gsl_interfaces_info.txt",
+                "\n".join(["%d,1,1.0" % i for i in range(8)])
+            )
+
+            # Call the helper
+            help_dynamic_state(
+                temp_gen_data,
+                1,
+                name,
+                10000,
+                100,
+                1089686.4181956202,
+                5016591.2330984278,
+                "algorithm_free_one_only_over_isls",
+                False,
+                propagator=propagator,
+                interpolation_anchor_ms=interpolation_anchor_ms,
+                use_visibility_windows=use_visibility_windows
+            )
+
+            # Read in all forwarding state files
+            fstates[variant] = []
+            for t in range(0, 100 * 1000 * 1000 * 1000, 10 * 1000 * 1000 * 1000):
+                with open(temp_gen_data + "/" + name + "/dynamic_state_10000ms_for_100s/fstate_%d.txt" % t) as f_in:
+                    fstates[variant].append(f_in.read())
+
+            local_shell.remove_force_recursive(temp_gen_data)
+
+        # All propagators should result in the same routing
+        self.assertEqual(fstates["ephem"], fstates["sgp4"])
+        self.assertEqual(fstates["ephem"], fstates["analytic"])
+        self.assertEqual(fstates["ephem"], fstates["interpolated"])
+        self.assertEqual(fstates["ephem"], fstates["visibility_windows"])
+
+    def test_position_table(self):
+        local_shell = exputil.LocalShell()
+        temp_dir = "temp_position_table_test"
+        local_shell.make_full_dir(temp_dir)
+        generate_tles_from_scratch_manual(temp_dir + "/tles.txt", "Kuiper-630", 3, 5, True, 51.9, 0.0000001, 0.0, 14.80)
+        tles = read_tles(temp_dir + "/tles.txt")
+        satellites = tles["satellites"]
+        epoch = tles["epoch"]
+        x, y, z = geodetic2cartesian(47.3769, 8.5417, 400.0)
+        ground_station = {
+            "gid": 0,
+            "name": "Zurich",
+            "latitude_degrees_str": "47.3769",
+            "longitude_degrees_str": "8.5417",
+            "elevation_m_float": 400.0,
+            "cartesian_x": x,
+            "cartesian_y": y,
+            "cartesian_z": z,
+        }
+        satrec_array = create_satrec_array(satellites)
+        isls = np.array([(a, b) for a in range(len(satellites)) for b in range(a + 1, len(satellites))], dtype=int)
+
+        for time_since_epoch_ns in [0, 1234567890, 3600 * 1000000000]:
+            time = epoch + time_since_epoch_ns * u.ns
+
+            # With ephem, the distances are exactly the same as without the table
+            position_table = create_position_table(epoch, time_since_epoch_ns, satellites)
+            for a in range(len(satellites)):
+                for b in range(len(satellites)):
+                    if a != b:
+                        self.assertEqual(
+                            distance_m_between_satellites_from_position_table(position_table, a, b),
+                            distance_m_between_satellites(satellites[a], satellites[b], str(epoch), str(time))
+                        )
+                self.assertEqual(
+                    distance_m_ground_station_to_satellite_from_position_table(position_table, ground_station, a),
+                    distance_m_ground_station_to_satellite(ground_station, satellites[a], str(epoch), str(time))
+                )
+
+            # All ISL lengths at once are exactly the same as one by one
+            for position_table in [
+                create_position_table(epoch, time_since_epoch_ns, satellites),
+                create_position_table(epoch, time_since_epoch_ns, satellites, satrec_array)
+            ]:
+                isl_lengths_m = isl_lengths_m_from_position_table(position_table, isls)
+                self.assertEqual(isl_lengths_m.shape, (len(isls),))
+                for i in range(len(isls)):
+                    self.assertEqual(
+                        isl_lengths_m[i],
+                        distance_m_between_satellites_from_position_table(position_table, isls[i][0], isls[i][1])
+                    )
+            self.assertEqual(isl_lengths_m_from_position_table(position_table, isls[:0]).shape, (0,))
+
+            # With SGP-4, the distances are those between the propagated positions
+            position_table = create_position_table(epoch, time_since_epoch_ns, satellites, satrec_array)
+            positions_m = propagate_satellite_positions_m(satrec_array, epoch, time_since_epoch_ns)
+            for a in range(len(satellites)):
+                for b in range(len(satellites)):
+                    self.assertAlmostEqual(
+                        distance_m_between_satellites_from_position_table(position_table, a, b),
+                        np.linalg.norm(positions_m[a] - positions_m[b]),
+                        places=6
+                    )
+                self.assertAlmostEqual(
+                    distance_m_ground_station_to_satellite_from_position_table(position_table, ground_station, a),
+                    np.linalg.norm(positions_m[a] - np.array([x, y, z])),
+                    places=6
+                )
+
+        local_shell.remove_force_recursive(temp_dir)
+
+    def test_time_instant(self):
+        local_shell = exputil.LocalShell()
+        temp_dir = "temp_time_instant_test"
+        local_shell.make_full_dir(temp_dir)
+        generate_tles_from_scratch_manual(temp_dir + "/tles.txt", "Kuiper-630", 3, 5, True, 51.9, 0.0000001, 0.0, 14.80)
+        tles = read_tles(temp_dir + "/tles.txt")
+        satellites = tles["satellites"]
+        epoch = tles["epoch"]
+        ground_station = {
+            "gid": 0,
+            "name": "Zurich",
+            "latitude_degrees_str": "47.3769",
+            "longitude_degrees_str": "8.5417",
+            "elevation_m_float": 400.0,
+        }
+        ephem_epoch = None
+        for time_since_epoch_ns in [0, 1, 999999, 1234567890, 3600 * 1000000000 + 500000]:
+            time = epoch + time_since_epoch_ns * u.ns
+            time_instant = create_time_instant(epoch, time_since_epoch_ns, ephem_epoch)
+            ephem_epoch = time_instant["ephem_epoch"]
+            self.assertEqual(time_instant["time_since_epoch_ns"], time_since_epoch_ns)
+            self.assertEqual(time_instant["ephem_epoch"], ephem.Date(str(epoch)))
+            self.assertEqual(time_instant["ephem_date"], ephem.Date(str(time)))
+
+            # The ephem results are exactly the same as with strings
+            for a in [0, 1, 7, 13]:
+                self.assertEqual(
+                    distance_m_between_satellites(
+                        satellites[a], satellites[a + 1], time_instant["ephem_epoch"], time_instant["ephem_date"]
+                    ),
+                    distance_m_between_satellites(satellites[a], satellites[a + 1], str(epoch), str(time))
+                )
+                self.assertEqual(
+                    distance_m_ground_station_to_satellite(
+                        ground_station, satellites[a], time_instant["ephem_epoch"], time_instant["ephem_date"]
+                    ),
+                    distance_m_ground_station_to_satellite(ground_station, satellites[a], str(epoch), str(time))
+                )
+                self.assertEqual(
+                    create_basic_ground_station_for_satellite_shadow(
+                        satellites[a], time_instant["ephem_epoch"], time_instant["ephem_date"]
+                    ),
+                    create_basic_ground_station_for_satellite_shadow(satellites[a], str(epoch), str(time))
+                )
+
+        local_shell.remove_force_recursive(temp_dir)
+
+    def test_interpolation(self):
+        local_shell = exputil.LocalShell()
+        temp_dir = "temp_interpolation_test"
+        local_shell.make_full_dir(temp_dir)
+        generate_tles_from_scratch_manual(temp_dir + "/tles.txt", "Kuiper-630", 3, 5, True, 51.9, 0.0000001, 0.0, 14.80)
+        tles = read_tles(temp_dir + "/tles.txt")
+        satellites = tles["satellites"]
+        epoch = tles["epoch"]
+        satrec_array = create_satrec_array(satellites)
+
+        # Positions at the anchors are exact, in between they are within the reported error
+        position_source = create_position_source(satellites, "sgp4", interpolation_anchor_ns=1000000000)
+        max_deviation_m = 0.0
+        for time_since_epoch_ns in range(0, 5000000000, 10000000):
+            positions_m = create_position_table_from_source(
+                position_source, epoch, time_since_epoch_ns, satellites
+            )["satellite_positions_m"]
+            deviation_m = np.max(np.linalg.norm(
+                positions_m - propagate_satellite_positions_m(satrec_array, epoch, time_since_epoch_ns), axis=1
+            ))
+            if time_since_epoch_ns % 1000000000 == 0:
+                self.assertAlmostEqual(deviation_m, 0.0, places=6)
+            max_deviation_m = max(max_deviation_m, deviation_m)
+        self.assertEqual(position_source["interpolation"]["num_anchor_intervals"], 5)
+        max_error_m = report_interpolation_max_error(position_source)
+        self.assertGreater(max_error_m, 0.0)
+        self.assertLess(max_deviation_m, 0.01)
+        self.assertLess(max_deviation_m, 1.1 * max_error_m)
+
+        # Anchor intervals with an error beyond the bound are rejected
+        position_source = create_position_source(
+            satellites, "sgp4", interpolation_anchor_ns=600 * 1000000000, max_interpolation_error_m=0.001
+        )
+        with self.assertRaises(ValueError):
+            create_position_table_from_source(position_source, epoch, 0, satellites)
+
+        # Only possible with the sgp4 propagator
+        self.assertIsNone(report_interpolation_max_error(create_position_source(satellites, "sgp4")))
+        for propagator in ["ephem", "analytic"]:
+            with self.assertRaises(ValueError):
+                create_position_source(satellites, propagator, interpolation_anchor_ns=1000000000)
+        with self.assertRaises(ValueError):
+            create_position_source(satellites, "sgp4", interpolation_anchor_ns=0)
+
+        local_shell.remove_force_recursive(temp_dir)
+
+    def test_visibility_windows(self):
+        local_shell = exputil.LocalShell()
+        temp_dir = "temp_visibility_windows_test"
+        local_shell.make_full_dir(temp_dir)
+        generate_tles_from_scratch_manual(
+            temp_dir + "/tles.txt", "Kuiper-630", 10, 10, True, 51.9, 0.0000001, 0.0, 14.80
+        )
+        tles = read_tles(temp_dir + "/tles.txt")
+        satellites = tles["satellites"]
+        epoch = tles["epoch"]
+        ground_station_positions_m = np.array([
+            geodetic2cartesian(latitude, longitude, 0.0)
+            for (latitude, longitude) in [(47.3769, 8.5417), (-33.8688, 151.2093), (0.0, -60.0), (60.0, 100.0)]
+        ])
+        max_gsl_length_m = 1089686.4181956202
+        end_ns = 1200 * 1000000000
+
+        for propagator in ["sgp4", "analytic"]:
+            position_source = create_position_source(satellites, propagator)
+            visibility_windows = calculate_visibility_windows(
+                position_source, epoch, satellites, ground_station_positions_m, max_gsl_length_m, 0, end_ns
+            )
+            single_satellite_propagator = create_single_satellite_propagator(position_source, satellites)
+            tolerance_ns = visibility_windows["tolerance_ns"]
+
+            # Windows are visible from rise to set, and not just before or just after
+            num_windows = 0
+            for gs_idx in range(len(visibility_windows["windows"])):
+                for (rise_ns, set_ns, sid) in visibility_windows["windows"][gs_idx]:
+                    num_windows += 1
+                    self.assertLess(rise_ns, set_ns)
+                    for (t, visible) in [(rise_ns, True), (rise_ns - tolerance_ns, False),
+                                         (set_ns - tolerance_ns, True), (set_ns, False)]:
+                        if 0 < t < end_ns:
+                            self.assertEqual(single_satellite_distance_m(
+                                single_satellite_propagator, epoch, ground_station_positions_m[gs_idx], sid, t
+                            ) <= max_gsl_length_m, visible)
+            self.assertGreater(num_windows, 10)
+            change_times_ns = visibility_change_times_ns(visibility_windows)
+            self.assertGreater(len(change_times_ns), 10)
+            self.assertEqual(change_times_ns, sorted(set(change_times_ns)))
+
+            # The satellites in range are exactly the same as without windows
+            for time_since_epoch_ns in range(0, end_ns, 1000000000):
+                satellite_positions_m = satellite_positions_m_from_source(
+                    position_source, epoch, time_since_epoch_ns
+                )
+                self.assertEqual(
+                    satellites_in_range_from_visibility_windows(
+                        visibility_windows, ground_station_positions_m, satellite_positions_m, time_since_epoch_ns
+                    ),
+                    satellites_in_range_of_ground_stations(
+                        ground_station_positions_m, satellite_positions_m, max_gsl_length_m
+                    )
+                )
+            with self.assertRaises(ValueError):
+                satellites_in_range_from_visibility_windows(
+                    visibility_windows, ground_station_positions_m, satellite_positions_m, end_ns + 1
+                )
+
+        # Propagation is required
+        with self.assertRaises(ValueError):
+            calculate_visibility_windows(
+                create_position_source(satellites, "ephem"), epoch, satellites, ground_station_positions_m,
+                max_gsl_length_m, 0, end_ns
+            )
+
+        local_shell.remove_force_recursive(temp_dir)
+
+    def test_ephemeris_file(self):
+        local_shell = exputil.LocalShell()
+        temp_gen_data = "temp_ephemeris_file_test"
+        name = "kuiper_shell"
+        satellite_network_dir = temp_gen_data + "/" + name
+        local_shell.make_full_dir(satellite_network_dir)
+        generate_tles_from_scratch_manual(
+            satellite_network_dir + "/tles.txt", "Kuiper-630", 4, 6, False, 51.9, 0.0000001, 0.0, 14.80
+        )
+        generate_plus_grid_isls(satellite_network_dir + "/isls.txt", 4, 6, isl_shift=0)
+        local_shell.write_file(
+            satellite_network_dir + "/ground_stations.txt",
+            "0,Zurich,47.3769,8.5417,400.000000,4280733.853826,643620.402739,4669127.154291\n"
+            "1,Sydney,-33.8688,151.2093,58.000000,-4646132.811419,2553448.011393,-3534385.289566"
+        )
+        local_shell.write_file(
+            satellite_network_dir + "/gsl_interfaces_info.txt",
+            "\n".join(["%d,1,1.0" % i for i in range(26)])
+        )
+        tles = read_tles(satellite_network_dir + "/tles.txt")
+
+        # Generate and read back
+        help_ephemeris(temp_gen_data, name, 500, 30)
+        ephemeris = read_ephemeris_for_satellite_network(satellite_network_dir, 500, 30, "sgp4")
+        self.assertEqual(ephemeris["epoch_str"], str(tles["epoch"]))
+        self.assertEqual(ephemeris["time_step_ns"], 500 * 1000 * 1000)
+        self.assertEqual(ephemeris["num_time_steps"], 60)
+        self.assertEqual(ephemeris["positions_m"].shape, (60, 24, 3))
+        satrec_array = create_satrec_array(tles["satellites"])
+        for time_since_epoch_ns in [0, 500 * 1000 * 1000, 29500 * 1000 * 1000]:
+            np.testing.assert_array_equal(
+                satellite_positions_m_from_ephemeris(ephemeris, time_since_epoch_ns),
+                propagate_satellite_positions_m(satrec_array, tles["epoch"], time_since_epoch_ns)
+            )
+
+        # Invalid uses
+        with self.assertRaises(ValueError):
+            satellite_positions_m_from_ephemeris(ephemeris, 250 * 1000 * 1000)
+        with self.assertRaises(ValueError):
+            satellite_positions_m_from_ephemeris(ephemeris, 30000 * 1000 * 1000)
+        with self.assertRaises(ValueError):
+            read_ephemeris_for_satellite_network(satellite_network_dir, 500, 30, "ephem")
+        with self.assertRaises(ValueError):
+            create_position_source(tles["satellites"], "ephem", ephemeris)
+        local_shell.write_file(temp_gen_data + "/other_tles.txt", "1 1\n")
+        with self.assertRaises(ValueError):
+            read_ephemeris_file(ephemeris_filename(satellite_network_dir, 500, 30), temp_gen_data + "/other_tles.txt")
+
+        # The dynamic state is the same as when propagating during generation
+        fstates = {}
+        for use_ephemeris_file in [False, True]:
+            help_dynamic_state(
+                temp_gen_data, 2, name, 500, 30, 3000000, 10000000,
+                "algorithm_free_one_only_over_isls", False,
+                propagator="sgp4", use_ephemeris_file=use_ephemeris_file
+            )
+            fstates[use_ephemeris_file] = []
+            for i in range(60):
+                with open(satellite_network_dir + "/dynamic_state_500ms_for_30s/fstate_%d.txt"
+                          % (i * 500 * 1000 * 1000)) as f_in:
+                    fstates[use_ephemeris_file].append(f_in.read())
+        self.assertEqual(fstates[False], fstates[True])
+
+        local_shell.remove_force_recursive(temp_gen_data)
+
+    def test_analytic_propagator(self):
+        local_shell = exputil.LocalShell()
+        temp_dir = "temp_analytic_propagator_test"
+        local_shell.make_full_dir(temp_dir)
+
+        # Generated TLEs can be propagated analytically, within a millimeter of SGP-4 over a week
+        for generate in [generate_tles_from_scratch_manual, generate_tles_from_scratch_with_sgp]:
+            generate(temp_dir + "/tles.txt", "Starlink-550", 6, 11, True, 53.0, 0.0000001, 0.0, 15.19)
+            tles = read_tles(temp_dir + "/tles.txt")
+            self.assertTrue(is_analytic_propagation_possible(tles["satellites"]))
+            self.assertEqual(resolve_propagator(tles["satellites"], "auto"), "analytic")
+            analytic_elements = create_analytic_elements(tles["satellites"])
+            max_deviation_m = calculate_analytic_max_deviation_m(
+                analytic_elements,
+                create_satrec_array(tles["satellites"]),
+                tles["epoch"],
+                [0, 1, 1000000000, 3600 * 1000000000, 86400 * 1000000000, 7 * 86400 * 1000000000]
+            )
+            self.assertLess(max_deviation_m, 0.001)
+
+        # Satellites with drag cannot
+        satellites = [ephem.readtle(
+            "ISS (ZARYA)",
+            "1 25544U 98067A   20001.50000000  .00001264  00000-0  30756-4 0  9996",
+            "2 25544  51.6444 124.6512 0005106 120.9542 340.0738 15.49504834205726"
+        )]
+        self.assertFalse(is_analytic_propagation_possible(satellites))
+        self.assertEqual(resolve_propagator(satellites, "auto"), "sgp4")
+        with self.assertRaises(ValueError):
+            create_analytic_elements(satellites)
+        with self.assertRaises(ValueError):
+            create_position_source(satellites, "analytic")
+
+        local_shell.remove_force_recursive(temp_dir)